@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+El stream SSE de disponibilidad (/api/eventos/disponibilidad/) es una vista async
+que mantiene la conexión abierta: tiene que servirse con este entry point
+(ej: gunicorn -k uvicorn.workers.UvicornWorker PilatesGravity.asgi:application)
+para no bloquear un worker WSGI por cada navegador conectado.
 """
 
 import os
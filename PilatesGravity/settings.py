@@ -59,6 +59,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gravity.cuota_service.CuotaUsuarioMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -113,6 +114,42 @@ else:
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# La cache del catálogo de clases se invalida por versión (ver gravity/cache_service.py),
+# así que todos los procesos tienen que compartirla: en producción se usa la base de datos
+# (crear la tabla con `python manage.py createcachetable`).
+
+if _DB_NAME:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'gravity_cache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Segundos que vive una entrada de la cache de disponibilidad aunque no cambie la versión
+CACHE_DISPONIBILIDAD_TIMEOUT = 300
+
+# Cupos en vivo en la página de reserva: stream SSE (solo bajo ASGI y con un único
+# worker, el broker es en proceso) y, además, recarga del árbol de reserva cada
+# CUPOS_RECARGA_SEGUNDOS
+CUPOS_EN_VIVO_SSE = config('CUPOS_EN_VIVO_SSE', default=True, cast=bool)
+CUPOS_RECARGA_SEGUNDOS = config('CUPOS_RECARGA_SEGUNDOS', default=60, cast=int)
+
+# Clave de la permutación que genera los números de reserva (gravity/numeracion_service.py).
+# Si no se define se usa SECRET_KEY, así las instalaciones existentes mantienen su numeración.
+# Conviene fijarla con el valor actual de SECRET_KEY antes de rotar SECRET_KEY.
+# No cambiarla una vez en producción: los códigos nuevos podrían repetir los existentes.
+NUMERO_RESERVA_CLAVE = config('NUMERO_RESERVA_CLAVE', default=SECRET_KEY)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
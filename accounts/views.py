@@ -11,6 +11,8 @@ from .forms import SignUpForm, ProfileUpdateForm, UserProfileForm, CambiarPasswo
 from .models import UserProfile, Testimonio
 from gravity.email_service import enviar_email_bienvenida_completo, enviar_email_despedida_completo
 from gravity.models import AusenciaTemporal
+from gravity.calendario_service import precargar_ocurrencias
+from gravity.cuota_service import cuota_usuario
 from datetime import date, timedelta
 from django.db import IntegrityError
 import logging
@@ -178,12 +180,12 @@ def cambiar_password(request):
 @login_required
 def mis_reservas(request):
     """Vista para mostrar las reservas del usuario actual"""
-    from gravity.models import Reserva
-
-    reservas_activas = request.user.reservas_pilates.filter(activa=True).select_related('clase')
+    reservas_activas = precargar_ocurrencias(
+        request.user.reservas_pilates.filter(activa=True).select_related('clase'), request=request
+    )
     reservas_inactivas = request.user.reservas_pilates.filter(activa=False).select_related('clase')[:10]
 
-    puede_recuperar, n_recuperos_disponibles, ausencias_recupero = Reserva.usuario_puede_hacer_recupero(request.user)
+    puede_recuperar, n_recuperos_disponibles, ausencias_recupero = cuota_usuario(request.user).recupero
 
     reserva_exitosa = request.session.get('reserva_exitosa', None)
     ausencia_registrada = request.session.get('ausencia_registrada', None)
@@ -255,7 +257,9 @@ def eliminar_cuenta(request):
             messages.error(request, 'Error en la confirmación. Por favor, intenta nuevamente.')
     
     # Obtener información para mostrar en la confirmación
-    reservas_activas = request.user.reservas_pilates.filter(activa=True).select_related('clase')
+    reservas_activas = precargar_ocurrencias(
+        request.user.reservas_pilates.filter(activa=True).select_related('clase'), request=request
+    )
     reservas_historicas = request.user.reservas_pilates.filter(activa=False).select_related('clase')
     total_reservas = request.user.reservas_pilates.count()
     
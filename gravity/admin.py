@@ -1,6 +1,8 @@
 from django.contrib import admin
 from unfold.admin import ModelAdmin
-from .models import AjusteDeudaEspecial, SolicitudCambioPlan
+from .models import (
+    AjusteDeudaEspecial, CierreClase, CreditoRecupero, MovimientoCuenta, ResumenFinancieroMensual, SolicitudCambioPlan, TareaPendiente
+)
 
 
 @admin.register(AjusteDeudaEspecial)
@@ -22,4 +24,68 @@ class SolicitudCambioPlanAdmin(ModelAdmin):
     list_display = ['usuario', 'plan_actual', 'plan_solicitado', 'estado', 'fecha_solicitud']
     list_filter = ['estado']
     search_fields = ['usuario__first_name', 'usuario__last_name', 'usuario__email', 'usuario__username']
-    readonly_fields = ['fecha_solicitud']
\ No newline at end of file
+    readonly_fields = ['fecha_solicitud']
+
+@admin.register(TareaPendiente)
+class TareaPendienteAdmin(ModelAdmin):
+    list_display = ['id', 'tipo', 'usuario', 'estado', 'intentos', 'fecha_creacion', 'fecha_procesada']
+    list_filter = ['estado', 'tipo']
+    search_fields = ['usuario__username', 'usuario__email', 'ultimo_error']
+    readonly_fields = ['tipo', 'usuario', 'datos', 'intentos', 'ultimo_error', 'fecha_creacion', 'fecha_inicio', 'fecha_procesada']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(CierreClase)
+class CierreClaseAdmin(ModelAdmin):
+    list_display = ['fecha', 'direccion', 'clase', 'motivo', 'clases_cerradas', 'ausencias_creadas', 'reservas_canceladas', 'estado_notificacion', 'admin_user']
+    list_filter = ['direccion', 'estado_notificacion']
+    search_fields = ['motivo', 'motivo_detalle']
+    readonly_fields = [
+        'fecha', 'direccion', 'clase', 'motivo', 'motivo_detalle', 'admin_user', 'clases_cerradas',
+        'ausencias_creadas', 'reservas_canceladas', 'estado_notificacion', 'emails_total',
+        'emails_enviados', 'emails_fallidos', 'usuarios_notificados', 'fecha_creacion'
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(CreditoRecupero)
+class CreditoRecuperoAdmin(ModelAdmin):
+    list_display = ['usuario', 'estado', 'fecha_limite', 'ausencia', 'reserva_recupero', 'fecha_otorgado']
+    list_filter = ['estado']
+    search_fields = ['usuario__username', 'usuario__first_name', 'usuario__last_name']
+    readonly_fields = [
+        'usuario', 'ausencia', 'reserva_recupero', 'estado', 'fecha_limite',
+        'fecha_otorgado', 'fecha_consumo', 'fecha_cierre'
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(MovimientoCuenta)
+class MovimientoCuentaAdmin(ModelAdmin):
+    list_display = ['fecha', 'usuario', 'tipo', 'monto', 'saldo_resultante', 'descripcion']
+    list_filter = ['tipo']
+    search_fields = ['usuario__username', 'usuario__first_name', 'usuario__last_name', 'descripcion']
+    readonly_fields = ['usuario', 'tipo', 'monto', 'saldo_resultante', 'deuda', 'pago', 'descripcion', 'fecha']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ResumenFinancieroMensual)
+class ResumenFinancieroMensualAdmin(ModelAdmin):
+    list_display = ['mes', 'origen', 'plan', 'tipo_pago', 'estado', 'cantidad', 'monto_cargado', 'monto_cobrado', 'monto_pendiente', 'monto_descuento']
+    list_filter = ['origen', 'estado', 'tipo_pago', 'plan']
+    date_hierarchy = 'mes'
+    readonly_fields = ['mes', 'origen', 'plan', 'tipo_pago', 'estado', 'cantidad', 'monto_cargado', 'monto_cobrado', 'monto_pendiente', 'monto_descuento', 'fecha_actualizacion']
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,225 @@
+from collections import Counter
+from threading import Lock
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# VERSIÓN GLOBAL DE DISPONIBILIDAD
+# ==============================================================================
+
+CLAVE_VERSION_DISPONIBILIDAD = 'gravity:disponibilidad:version'
+
+# Tiempo máximo que vive una entrada aunque la versión no cambie
+# (la ventana de cupos liberados depende de la hora actual)
+TIMEOUT_CACHE_DISPONIBILIDAD = getattr(settings, 'CACHE_DISPONIBILIDAD_TIMEOUT', 300)
+
+def obtener_version_disponibilidad():
+    """
+    Devuelve la versión actual de disponibilidad de clases.
+    Cambia cada vez que se guarda o elimina una Reserva, AusenciaTemporal o Clase.
+
+    Returns:
+        int: Versión actual
+    """
+    version = cache.get(CLAVE_VERSION_DISPONIBILIDAD)
+    if version is None:
+        # add() no pisa la versión si otro proceso la creó en el medio
+        cache.add(CLAVE_VERSION_DISPONIBILIDAD, 1, timeout=None)
+        version = cache.get(CLAVE_VERSION_DISPONIBILIDAD, 1)
+    return version
+
+def incrementar_version_disponibilidad():
+    """
+    Invalida todo lo cacheado sobre disponibilidad pasando a una nueva versión.
+    Las entradas viejas no se borran: quedan huérfanas y expiran solas.
+    """
+    try:
+        cache.incr(CLAVE_VERSION_DISPONIBILIDAD)
+    except ValueError:
+        # La clave no existía (cache recién iniciada o expulsada)
+        cache.add(CLAVE_VERSION_DISPONIBILIDAD, 2, timeout=None)
+    except Exception as e:
+        logger.error(f"Error incrementando la versión de disponibilidad: {str(e)}")
+
+def invalidar_disponibilidad():
+    """
+    Programa el cambio de versión para cuando se confirme la transacción actual,
+    así ninguna request cachea datos viejos con la versión nueva.
+    """
+    transaction.on_commit(incrementar_version_disponibilidad)
+
+# ==============================================================================
+# CACHE VERSIONADA
+# ==============================================================================
+
+_estadisticas = Counter()
+_estadisticas_lock = Lock()
+
+def _registrar(nombre, resultado):
+    with _estadisticas_lock:
+        _estadisticas[(nombre, resultado)] += 1
+
+def obtener_o_calcular(nombre, calcular, variante=''):
+    """
+    Devuelve el valor cacheado para la versión actual de disponibilidad o,
+    si no existe, lo calcula, lo guarda y lo devuelve.
+
+    Args:
+        nombre: Identificador del contenido (ej: 'clases_disponibles')
+        calcular: Función sin argumentos que genera el valor
+        variante: Texto opcional que se suma a la clave (ej: la fecha de hoy)
+
+    Returns:
+        El valor cacheado o recién calculado
+    """
+    clave = f'gravity:disponibilidad:{obtener_version_disponibilidad()}:{nombre}:{variante}'
+
+    valor = cache.get(clave)
+    if valor is not None:
+        _registrar(nombre, 'hits')
+        return valor
+
+    _registrar(nombre, 'misses')
+    valor = calcular()
+    cache.set(clave, valor, timeout=TIMEOUT_CACHE_DISPONIBILIDAD)
+    return valor
+
+def obtener_estadisticas_cache():
+    """
+    Devuelve los contadores de aciertos y fallos de la cache de disponibilidad.
+    Los contadores son por proceso (cada worker de Gunicorn lleva los suyos).
+
+    Returns:
+        dict: {'version', 'contenidos': {nombre: {'hits', 'misses', 'ratio'}}}
+    """
+    with _estadisticas_lock:
+        copia = dict(_estadisticas)
+
+    contenidos = {}
+    for (nombre, resultado), cantidad in copia.items():
+        contenidos.setdefault(nombre, {'hits': 0, 'misses': 0})[resultado] = cantidad
+
+    for datos in contenidos.values():
+        total = datos['hits'] + datos['misses']
+        datos['ratio'] = round(datos['hits'] / total, 3) if total else 0
+
+    return {
+        'version': obtener_version_disponibilidad(),
+        'contenidos': contenidos,
+    }
+
+# ==============================================================================
+# VALIDADORES PARA GET CONDICIONAL (ETag / Last-Modified)
+# ==============================================================================
+# Se usan con django.views.decorators.http.condition: si el navegador manda
+# If-None-Match con el mismo ETag se responde 304 antes de ejecutar la vista.
+
+def _calcular_etag(*partes):
+    return hashlib.sha256('|'.join(str(parte) for parte in partes).encode()).hexdigest()[:32]
+
+def _identidad_visitante(request):
+    """
+    Las páginas HTML cambian según el usuario logueado (menú, botones de reserva)
+    y llevan el token CSRF, así que ambos forman parte del ETag.
+    """
+    return (
+        request.user.pk if request.user.is_authenticated else 'anonimo',
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    )
+
+def _tramo_actual():
+    """
+    Número de tramo de TIMEOUT_CACHE_DISPONIBILIDAD segundos en curso. Va en los
+    ETags de disponibilidad para que, aunque la versión no cambie, dejen de
+    validar cuando vence la cache (por ejemplo, cuando empieza una clase del día).
+    """
+    return int(timezone.now().timestamp()) // TIMEOUT_CACHE_DISPONIBILIDAD
+
+def _tiene_mensajes_pendientes(request):
+    # len() no marca los mensajes como leídos (iterarlos sí)
+    return len(messages.get_messages(request)) > 0
+
+def etag_disponibilidad_html(request, *args, **kwargs):
+    """ETag de páginas HTML que dependen de la disponibilidad de clases."""
+    if _tiene_mensajes_pendientes(request):
+        # Hay que renderizar la página para mostrar el mensaje
+        return None
+    hoy = timezone.localtime(timezone.now()).date()
+    return _calcular_etag(
+        'disponibilidad', obtener_version_disponibilidad(), hoy, _tramo_actual(),
+        *_identidad_visitante(request)
+    )
+
+def etag_disponibilidad_json(request, *args, **kwargs):
+    """ETag de las APIs JSON de disponibilidad (incluye la ruta y los parámetros GET)."""
+    hoy = timezone.localtime(timezone.now()).date()
+    return _calcular_etag(
+        'disponibilidad', obtener_version_disponibilidad(), hoy, _tramo_actual(),
+        request.get_full_path()
+    )
+
+def _validadores_modelo(request, atributo, queryset, campo_fecha, filtro):
+    """
+    Calcula (y guarda en la request) la última modificación y la cantidad de
+    registros visibles con una sola consulta, para ETag y Last-Modified.
+    """
+    if not hasattr(request, atributo):
+        datos = queryset.aggregate(
+            ultima=Max(campo_fecha),
+            visibles=Count('pk', filter=filtro),
+            total=Count('pk'),
+        )
+        setattr(request, atributo, datos)
+    return getattr(request, atributo)
+
+def _validadores_planes(request):
+    from .models import PlanPago
+    return _validadores_modelo(
+        request, '_validadores_planes', PlanPago.objects.all(),
+        'fecha_modificacion', Q(activo=True)
+    )
+
+def _validadores_testimonios(request):
+    from accounts.models import Testimonio
+    return _validadores_modelo(
+        request, '_validadores_testimonios', Testimonio.objects.all(),
+        'fecha_actualizacion', Q(aprobado=True)
+    )
+
+def etag_planes(request, *args, **kwargs):
+    """ETag de la página pública de precios (cambia con cualquier cambio en PlanPago)."""
+    if _tiene_mensajes_pendientes(request):
+        return None
+    datos = _validadores_planes(request)
+    return _calcular_etag(
+        'planes', datos['ultima'], datos['visibles'], datos['total'],
+        *_identidad_visitante(request)
+    )
+
+def ultima_modificacion_planes(request, *args, **kwargs):
+    if _tiene_mensajes_pendientes(request):
+        return None
+    return _validadores_planes(request)['ultima']
+
+def etag_testimonios(request, *args, **kwargs):
+    """ETag de la página 'Conocé más' (cambia con cualquier cambio en Testimonio)."""
+    if _tiene_mensajes_pendientes(request):
+        return None
+    datos = _validadores_testimonios(request)
+    return _calcular_etag(
+        'testimonios', datos['ultima'], datos['visibles'], datos['total'],
+        *_identidad_visitante(request)
+    )
+
+def ultima_modificacion_testimonios(request, *args, **kwargs):
+    if _tiene_mensajes_pendientes(request):
+        return None
+    return _validadores_testimonios(request)['ultima']
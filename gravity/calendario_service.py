@@ -0,0 +1,276 @@
+from datetime import datetime, timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import AusenciaTemporal, Clase, ClaseOcurrencia, NUMERO_DIA_SEMANA
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# CALENDARIO DE CLASES
+# ==============================================================================
+# Único lugar donde se calcula "cuándo es la próxima clase". Antes cada vista y
+# cada método de Reserva repetía el cálculo de días hasta el próximo día de la
+# semana (con su propio timezone.localtime y su propio mapa de días), y
+# get_proxima_clase_info hacía hasta 10 exists() por reserva para saltear
+# ausencias. Acá se calcula para una lista entera de reservas en una pasada,
+# con un mismo "ahora" y una sola consulta de ausencias.
+
+# Semanas hacia adelante en que se busca una fecha sin ausencia
+SEMANAS_BUSQUEDA_AUSENCIAS = 10
+
+# Semanas hacia adelante que cubre la tabla ClaseOcurrencia
+SEMANAS_CALENDARIO = 8
+
+def ahora_local(request=None):
+    """
+    Fecha y hora local de referencia. Con request, se fija la primera vez y se
+    reutiliza durante todo el request (todas las fechas se calculan contra el mismo instante).
+    """
+    if request is None:
+        return timezone.localtime(timezone.now())
+    return request.__dict__.setdefault('_ahora_calendario', timezone.localtime(timezone.now()))
+
+def proxima_ocurrencia(dia, horario, ahora=None, anticipacion=None):
+    """
+    Próxima fecha en que se dicta una clase semanal: hoy si todavía no empezó
+    (o si falta más que `anticipacion` para que empiece), si no la semana siguiente.
+
+    Args:
+        dia: Nombre del día de la clase ('Lunes', ...)
+        horario: time de inicio de la clase
+        ahora: datetime local de referencia (por defecto, ahora)
+        anticipacion: timedelta antes del inicio en que hoy deja de contar (por defecto, 0)
+
+    Returns:
+        date: Fecha de la próxima clase, o None si el día es inválido
+    """
+    numero_dia = NUMERO_DIA_SEMANA.get(dia)
+    if numero_dia is None:
+        return None
+
+    ahora = ahora or timezone.localtime(timezone.now())
+    dias_hasta = (numero_dia - ahora.weekday()) % 7
+    if dias_hasta == 0 and ahora >= inicio_clase(ahora.date(), horario, ahora) - (anticipacion or timedelta(0)):
+        dias_hasta = 7
+    return ahora.date() + timedelta(days=dias_hasta)
+
+def inicio_clase(fecha, horario, ahora=None):
+    """Datetime local (aware) de inicio de la clase en `fecha`."""
+    tz = (ahora or timezone.localtime(timezone.now())).tzinfo
+    return datetime.combine(fecha, horario).replace(tzinfo=tz)
+
+def describir_fecha(fecha, clase, hoy):
+    """Texto 'Hoy / Mañana / El dd/mm (Día)' con horario y sede, como lo muestran los templates."""
+    horario = clase.horario.strftime('%H:%M')
+    sede = clase.get_direccion_corta()
+    dias_hasta = (fecha - hoy).days
+    if dias_hasta == 0:
+        return f"Hoy a las {horario} en {sede}"
+    elif dias_hasta == 1:
+        return f"Mañana a las {horario} en {sede}"
+    return f"El {fecha.strftime('%d/%m')} ({clase.dia}) a las {horario} en {sede}"
+
+def calcular_ocurrencias(reservas, ahora=None):
+    """
+    Próximas ocurrencias de muchas reservas en una pasada, con una sola consulta
+    de ausencias para todas las reservas permanentes.
+
+    Args:
+        reservas: Iterable de Reserva (con la clase precargada: select_related('clase'))
+        ahora: datetime local de referencia (por defecto, ahora)
+
+    Returns:
+        dict: {reserva_id: {
+            'hoy': date de referencia,
+            'proxima_fecha': próxima ocurrencia natural (fecha_unica si es de fecha única),
+            'ausencia_proxima': True si esa ocurrencia tiene una ausencia registrada,
+            'proxima_asistencia': primera fecha sin ausencia (None si no hay en 10 semanas)
+        }}
+    """
+    ahora = ahora or timezone.localtime(timezone.now())
+    hoy = ahora.date()
+
+    ocurrencias = {}
+    permanentes = {}
+    for reserva in reservas:
+        if reserva.fecha_unica:
+            ocurrencias[reserva.pk] = {
+                'hoy': hoy,
+                'proxima_fecha': reserva.fecha_unica,
+                'ausencia_proxima': False,
+                'proxima_asistencia': reserva.fecha_unica,
+            }
+            continue
+        proxima = proxima_ocurrencia(reserva.clase.dia, reserva.clase.horario, ahora)
+        ocurrencias[reserva.pk] = {
+            'hoy': hoy,
+            'proxima_fecha': proxima,
+            'ausencia_proxima': False,
+            'proxima_asistencia': proxima,
+        }
+        if proxima is not None:
+            permanentes[reserva.pk] = proxima
+
+    if not permanentes:
+        return ocurrencias
+
+    # 1 sola consulta: ausencias de todas las permanentes en la ventana de búsqueda
+    ausencias = set(
+        AusenciaTemporal.objects.filter(
+            reserva_id__in=list(permanentes),
+            fecha__gte=min(permanentes.values()),
+            fecha__lt=max(permanentes.values()) + timedelta(weeks=SEMANAS_BUSQUEDA_AUSENCIAS),
+        ).values_list('reserva_id', 'fecha')
+    )
+
+    for reserva_id, proxima in permanentes.items():
+        ocurrencia = ocurrencias[reserva_id]
+        ocurrencia['ausencia_proxima'] = (reserva_id, proxima) in ausencias
+        ocurrencia['proxima_asistencia'] = None
+        for semana in range(SEMANAS_BUSQUEDA_AUSENCIAS):
+            fecha = proxima + timedelta(weeks=semana)
+            if (reserva_id, fecha) not in ausencias:
+                ocurrencia['proxima_asistencia'] = fecha
+                break
+
+    return ocurrencias
+
+def precargar_ocurrencias(reservas, request=None):
+    """
+    Calcula las próximas ocurrencias de las reservas y las deja en cada objeto,
+    para que get_proxima_clase_info / get_aclaracion_ausencia / tiene_ausencia_proxima
+    no consulten la base al renderizar listas. Con request, las ya calculadas en
+    el mismo request no se vuelven a calcular.
+
+    Args:
+        reservas: Iterable de Reserva (un queryset se evalúa y conserva su cache)
+        request: HttpRequest opcional para memoizar
+
+    Returns:
+        Las mismas reservas recibidas
+    """
+    memo = request.__dict__.setdefault('_ocurrencias_reservas', {}) if request is not None else {}
+    pendientes = [reserva for reserva in reservas if reserva.pk not in memo]
+    if pendientes:
+        memo.update(calcular_ocurrencias(pendientes, ahora_local(request)))
+
+    for reserva in reservas:
+        reserva._ocurrencia = memo[reserva.pk]
+    return reservas
+
+def ocurrencia_de(reserva):
+    """Ocurrencia precargada de la reserva, o calculada en el momento (1 consulta como máximo)."""
+    ocurrencia = getattr(reserva, '_ocurrencia', None)
+    if ocurrencia is None:
+        ocurrencia = calcular_ocurrencias([reserva])[reserva.pk]
+        reserva._ocurrencia = ocurrencia
+    return ocurrencia
+
+# ==============================================================================
+# CALENDARIO MATERIALIZADO (ClaseOcurrencia)
+# ==============================================================================
+
+def fechas_clase(dia, desde, hasta):
+    """Fechas entre desde y hasta (inclusive) que caen en el día de la semana de la clase."""
+    numero_dia = NUMERO_DIA_SEMANA.get(dia)
+    if numero_dia is None:
+        return []
+    fecha = desde + timedelta(days=(numero_dia - desde.weekday()) % 7)
+    fechas = []
+    while fecha <= hasta:
+        fechas.append(fecha)
+        fecha += timedelta(weeks=1)
+    return fechas
+
+def generar_ocurrencias(semanas=SEMANAS_CALENDARIO, desde=None, clase_ids=None, aplicar=True):
+    """
+    Sincroniza ClaseOcurrencia con las clases activas desde hoy hasta `semanas`
+    semanas adelante: crea las fechas que faltan, corrige el inicio si cambió el
+    horario y borra las de clases inactivas o que cambiaron de día.
+    Las fechas anteriores a `desde` no se tocan (historial).
+
+    Args:
+        semanas: Semanas hacia adelante a cubrir
+        desde: Primera fecha (date), por defecto hoy
+        clase_ids: Limitar a estas clases (None = todas)
+        aplicar: False = solo informar qué cambiaría (dry-run)
+
+    Returns:
+        dict: {'desde', 'hasta', 'creadas', 'actualizadas', 'eliminadas'}
+    """
+    ahora = timezone.localtime(timezone.now())
+    desde = desde or ahora.date()
+    hasta = desde + timedelta(weeks=semanas) - timedelta(days=1)
+
+    clases = Clase.objects.filter(activa=True).only('id', 'dia', 'horario')
+    existentes_qs = ClaseOcurrencia.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+    if clase_ids is not None:
+        clases = clases.filter(id__in=clase_ids)
+        existentes_qs = existentes_qs.filter(clase_id__in=clase_ids)
+
+    esperadas = {}
+    for clase in clases:
+        for fecha in fechas_clase(clase.dia, desde, hasta):
+            esperadas[(clase.id, fecha)] = inicio_clase(fecha, clase.horario, ahora)
+
+    with transaction.atomic():
+        existentes = {
+            (clase_id, fecha): (ocurrencia_id, inicio)
+            for ocurrencia_id, clase_id, fecha, inicio in existentes_qs.values_list('id', 'clase_id', 'fecha', 'inicio')
+        }
+        crear = [
+            ClaseOcurrencia(clase_id=clase_id, fecha=fecha, inicio=inicio)
+            for (clase_id, fecha), inicio in esperadas.items()
+            if (clase_id, fecha) not in existentes
+        ]
+        actualizar = [
+            ClaseOcurrencia(id=ocurrencia_id, inicio=esperadas[clave])
+            for clave, (ocurrencia_id, inicio) in existentes.items()
+            if clave in esperadas and inicio != esperadas[clave]
+        ]
+        eliminar = [
+            ocurrencia_id for clave, (ocurrencia_id, _) in existentes.items() if clave not in esperadas
+        ]
+
+        if aplicar:
+            ClaseOcurrencia.objects.bulk_create(crear, batch_size=500, ignore_conflicts=True)
+            ClaseOcurrencia.objects.bulk_update(actualizar, ['inicio'], batch_size=500)
+            ClaseOcurrencia.objects.filter(id__in=eliminar).delete()
+
+    resultado = {
+        'desde': desde,
+        'hasta': hasta,
+        'creadas': len(crear),
+        'actualizadas': len(actualizar),
+        'eliminadas': len(eliminar),
+    }
+    if aplicar and (crear or actualizar or eliminar):
+        logger.info(
+            f"Ocurrencias {desde} a {hasta}: {len(crear)} creadas, "
+            f"{len(actualizar)} actualizadas, {len(eliminar)} eliminadas"
+        )
+    return resultado
+
+def clases_del_dia(fecha, direccion=None):
+    """
+    Clases que se dictan en una fecha, según el calendario materializado.
+    Si esa fecha todavía no fue generada (o es anterior al calendario), se usa
+    el día de la semana de las clases activas.
+
+    Args:
+        fecha: date
+        direccion: Sede opcional (Clase.DIRECCIONES)
+
+    Returns:
+        QuerySet de Clase ordenado por sede y horario
+    """
+    clases = Clase.objects.all()
+    if direccion:
+        clases = clases.filter(direccion=direccion)
+
+    if ClaseOcurrencia.objects.filter(fecha=fecha).exists():
+        return clases.filter(ocurrencias__fecha=fecha).order_by('direccion', 'horario')
+
+    dias_por_numero = {numero: dia for dia, numero in NUMERO_DIA_SEMANA.items()}
+    return clases.filter(activa=True, dia=dias_por_numero.get(fecha.weekday())).order_by('direccion', 'horario')
@@ -0,0 +1,194 @@
+from collections import Counter
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, TextField, Value, When
+from django.db.models.functions import Concat
+from django.utils import timezone
+from .cache_service import invalidar_disponibilidad
+from .models import (
+    AusenciaTemporal, CancelacionAdmin, CierreClase, Clase, ClaseCerrada, Reserva, NUMERO_DIA_SEMANA
+)
+from .ocupacion_service import _aplicar_deltas, _bloquear_ocupacion_clase
+from .recuperos_service import liberar_creditos_de_reservas, otorgar_creditos
+from .tareas_service import encolar_tarea
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# CIERRE DE CLASES POR FECHA
+# ==============================================================================
+# Un cierre (feriado, ausencia de la instructora...) afecta una clase o todas las
+# clases de una sede en una fecha. Las reservas permanentes reciben una ausencia
+# (conservan el derecho a recupero) y las de fecha única se cancelan. Todo se
+# escribe con bulk_create / update en una transacción y los emails se envían
+# después, en una tarea con una sola conexión SMTP.
+
+DIAS_POR_NUMERO = {numero: dia for dia, numero in NUMERO_DIA_SEMANA.items()}
+
+def planificar_cierre(fecha, direccion, clase_id=None):
+    """
+    Calcula qué afectaría cerrar una clase (o toda la sede) en una fecha, sin modificar nada.
+
+    Args:
+        fecha: Fecha del cierre (date)
+        direccion: Sede (Clase.DIRECCIONES)
+        clase_id: ID de una clase puntual; None = todas las clases de la sede ese día
+
+    Returns:
+        dict: {
+            'clases': [Clase a cerrar], 'ya_cerradas': [Clase cerradas antes],
+            'ausencias': [(reserva_id, usuario_id, clase_id)] permanentes que reciben ausencia,
+            'cancelaciones': [(reserva_id, usuario_id, clase_id)] reservas de fecha única a cancelar,
+            'usuarios': set de IDs de usuarios afectados
+        }
+    """
+    plan = {'clases': [], 'ya_cerradas': [], 'ausencias': [], 'cancelaciones': [], 'usuarios': set()}
+
+    dia = DIAS_POR_NUMERO.get(fecha.weekday())
+    if dia is None:
+        return plan
+
+    clases = Clase.objects.filter(activa=True, direccion=direccion, dia=dia).order_by('horario')
+    if clase_id:
+        clases = clases.filter(pk=clase_id)
+    clases = clases.annotate(
+        cerrada=Exists(ClaseCerrada.objects.filter(clase=OuterRef('pk'), fecha=fecha))
+    )
+    for clase in clases:
+        (plan['ya_cerradas'] if clase.cerrada else plan['clases']).append(clase)
+
+    ids = [clase.id for clase in plan['clases']]
+    if not ids:
+        return plan
+
+    # Permanentes activas que todavía no avisaron ausencia ese día
+    plan['ausencias'] = list(
+        Reserva.objects.filter(
+            clase_id__in=ids, activa=True, fecha_unica__isnull=True
+        ).exclude(
+            Exists(AusenciaTemporal.objects.filter(reserva=OuterRef('pk'), fecha=fecha))
+        ).values_list('id', 'usuario_id', 'clase_id')
+    )
+    plan['cancelaciones'] = list(
+        Reserva.objects.filter(
+            clase_id__in=ids, activa=True, fecha_unica=fecha
+        ).values_list('id', 'usuario_id', 'clase_id')
+    )
+    plan['usuarios'] = {usuario_id for _, usuario_id, _ in plan['ausencias'] + plan['cancelaciones']}
+    return plan
+
+def cerrar_clases(fecha, direccion, motivo, motivo_detalle='', clase_id=None,
+                  admin_user=None, notificar=True, confirmar=False):
+    """
+    Cierra una clase o una sede completa en una fecha.
+
+    Args:
+        fecha: Fecha del cierre (date, hoy o futura)
+        direccion: Sede (Clase.DIRECCIONES)
+        motivo: Motivo del cierre
+        motivo_detalle: Detalle opcional para el email
+        clase_id: ID de una clase puntual; None = toda la sede
+        admin_user: Administrador que realiza el cierre
+        notificar: Encolar el email a los alumnos afectados
+        confirmar: False = solo informa qué afectaría (dry-run)
+
+    Returns:
+        dict: El plan de planificar_cierre más {'confirmado': bool, 'cierre': CierreClase o None}
+
+    Raises:
+        ValidationError: Si la fecha ya pasó, falta el motivo o no hay clases para cerrar
+    """
+    if fecha < timezone.localtime(timezone.now()).date():
+        raise ValidationError('No se puede cerrar una fecha que ya pasó.')
+    if direccion not in dict(Clase.DIRECCIONES):
+        raise ValidationError('Sede inválida.')
+    if not (motivo or '').strip():
+        raise ValidationError('Debes indicar el motivo del cierre.')
+
+    if not confirmar:
+        return {**planificar_cierre(fecha, direccion, clase_id), 'confirmado': False, 'cierre': None}
+
+    with transaction.atomic():
+        # Bloquear la ocupación de las clases del día antes de planificar:
+        # nadie puede reservar en ellas mientras se cierra
+        dia = DIAS_POR_NUMERO.get(fecha.weekday())
+        candidatas = Clase.objects.filter(activa=True, direccion=direccion, dia=dia)
+        if clase_id:
+            candidatas = candidatas.filter(pk=clase_id)
+        for id_clase in sorted(candidatas.values_list('id', flat=True)):
+            _bloquear_ocupacion_clase(id_clase)
+
+        plan = planificar_cierre(fecha, direccion, clase_id)
+        if not plan['clases']:
+            raise ValidationError('No hay clases para cerrar en esa fecha (o ya estaban cerradas).')
+
+        cierre = CierreClase.objects.create(
+            fecha=fecha,
+            direccion=direccion,
+            clase_id=clase_id,
+            motivo=motivo.strip(),
+            motivo_detalle=(motivo_detalle or '').strip(),
+            admin_user=admin_user,
+            clases_cerradas=len(plan['clases']),
+            ausencias_creadas=len(plan['ausencias']),
+            reservas_canceladas=len(plan['cancelaciones']),
+        )
+        ClaseCerrada.objects.bulk_create([
+            ClaseCerrada(cierre=cierre, clase=clase, fecha=fecha) for clase in plan['clases']
+        ])
+
+        ausencias = AusenciaTemporal.objects.bulk_create([
+            AusenciaTemporal(reserva_id=reserva_id, fecha=fecha, cierre=cierre)
+            for reserva_id, _, _ in plan['ausencias']
+        ])
+
+        if plan['cancelaciones']:
+            nota = f"Cancelada por cierre del {fecha.strftime('%d/%m/%Y')} - Motivo: {cierre.motivo}"
+            Reserva.objects.filter(
+                id__in=[reserva_id for reserva_id, _, _ in plan['cancelaciones']]
+            ).update(
+                activa=False,
+                notas=Case(
+                    When(notas='', then=Value(nota)),
+                    default=Concat(F('notas'), Value('\n' + nota), output_field=TextField()),
+                    output_field=TextField(),
+                )
+            )
+            CancelacionAdmin.objects.bulk_create([
+                CancelacionAdmin(
+                    reserva_id=reserva_id,
+                    admin_user=admin_user,
+                    motivo=cierre.motivo,
+                    motivo_detalle=cierre.motivo_detalle,
+                    cierre=cierre,
+                )
+                for reserva_id, _, _ in plan['cancelaciones']
+            ])
+
+        # bulk_create / update no disparan señales: créditos, ocupación y cache se actualizan acá
+        otorgar_creditos([
+            (ausencia.id, usuario_id, fecha)
+            for ausencia, (_, usuario_id, _) in zip(ausencias, plan['ausencias'])
+        ])
+        liberar_creditos_de_reservas([reserva_id for reserva_id, _, _ in plan['cancelaciones']])
+
+        deltas = Counter()
+        for _, _, id_clase in plan['ausencias']:
+            deltas[(id_clase, fecha, 'ausencias')] += 1
+        for _, _, id_clase in plan['cancelaciones']:
+            deltas[(id_clase, fecha, 'fecha_unica')] -= 1
+        _aplicar_deltas(deltas)
+        invalidar_disponibilidad()
+
+        if notificar and plan['usuarios']:
+            cierre.estado_notificacion = 'pendiente'
+            cierre.emails_total = len(plan['usuarios'])
+            cierre.save(update_fields=['estado_notificacion', 'emails_total'])
+            encolar_tarea('notificar_cierre', datos={'cierre_id': cierre.id})
+
+    logger.info(
+        f"Cierre {cierre.id} ({fecha}, {direccion}): {cierre.clases_cerradas} clases, "
+        f"{cierre.ausencias_creadas} ausencias, {cierre.reservas_canceladas} cancelaciones"
+    )
+    return {**plan, 'confirmado': True, 'cierre': cierre}
@@ -0,0 +1,169 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .cache_service import invalidar_disponibilidad
+from .calendario_service import generar_ocurrencias
+from .models import Clase, ClaseOcupacion
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# GENERADOR DE CRONOGRAMA
+# ==============================================================================
+# Arma muchas clases de una vez a partir de una grilla (sedes × días × horarios
+# con un tipo y un cupo), la compara contra las clases existentes con una sola
+# consulta y, si se confirma, las inserta con bulk_create.
+
+def expandir_grilla(bloques):
+    """
+    Expande los bloques de la grilla en una clase candidata por combinación.
+
+    Args:
+        bloques: Lista de dicts {'sedes', 'dias', 'horarios' (time), 'tipo',
+                 'nombre_personalizado', 'cupo_maximo'}
+
+    Returns:
+        list: dicts con los campos de cada Clase a crear, en el orden de la grilla
+    """
+    candidatas = []
+    for bloque in bloques:
+        nombre = (bloque.get('nombre_personalizado') or '').strip() or None
+        for direccion in bloque.get('sedes') or []:
+            for dia in bloque.get('dias') or []:
+                for horario in bloque.get('horarios') or []:
+                    candidatas.append({
+                        'tipo': bloque.get('tipo'),
+                        'nombre_personalizado': nombre,
+                        'direccion': direccion,
+                        'dia': dia,
+                        'horario': horario,
+                        'cupo_maximo': bloque.get('cupo_maximo'),
+                    })
+    return candidatas
+
+def _clave(campos):
+    """Identidad de una clase (la misma que unique_together de Clase)."""
+    return (campos['tipo'], campos['nombre_personalizado'] or None, campos['direccion'], campos['dia'], campos['horario'])
+
+def _describir(campos, estado, detalle=''):
+    """Fila serializable del informe de diferencias."""
+    clase = Clase(**{k: campos[k] for k in ('tipo', 'nombre_personalizado', 'direccion', 'dia', 'horario')})
+    return {
+        'estado': estado,
+        'tipo': campos['tipo'],
+        'nombre': clase.get_nombre_display() if campos['tipo'] else '',
+        'sede': campos['direccion'],
+        'sede_corta': clase.get_direccion_corta(),
+        'dia': campos['dia'],
+        'horario': campos['horario'].strftime('%H:%M') if campos['horario'] else '',
+        'cupo_maximo': campos['cupo_maximo'],
+        'detalle': detalle,
+    }
+
+def planificar_cronograma(bloques):
+    """
+    Compara la grilla con las clases existentes sin modificar nada (dry-run).
+    Las reglas de cada clase se validan con Clase.clean (sin consultas) y los
+    duplicados se buscan con una única consulta sobre Clase.
+
+    Args:
+        bloques: Ver expandir_grilla
+
+    Returns:
+        dict: {
+            'nuevas': [filas a crear], 'existentes': [filas que ya existen],
+            'invalidas': [filas con error], 'total': cantidad de combinaciones,
+            'a_crear': [dicts de campos de Clase para las nuevas]
+        }
+    """
+    candidatas = expandir_grilla(bloques)
+    resultado = {'nuevas': [], 'existentes': [], 'invalidas': [], 'total': len(candidatas), 'a_crear': []}
+
+    # Reglas del modelo (horario laboral, sábados solo especiales, nombre personalizado...)
+    validas = []
+    vistas = set()
+    for campos in candidatas:
+        try:
+            clase = Clase(**campos)
+            clase.clean_fields(exclude=['activa'])
+            clase.clean()
+        except ValidationError as e:
+            resultado['invalidas'].append(_describir(campos, 'invalida', ' '.join(e.messages)))
+            continue
+        if _clave(campos) in vistas:
+            resultado['invalidas'].append(_describir(campos, 'invalida', 'Repetida en la grilla.'))
+            continue
+        vistas.add(_clave(campos))
+        validas.append(campos)
+
+    if not validas:
+        return resultado
+
+    # 1 sola consulta: todas las clases de esas sedes, días y horarios
+    existentes = {}
+    por_turno = {}
+    for fila in Clase.objects.filter(
+        direccion__in={c['direccion'] for c in validas},
+        dia__in={c['dia'] for c in validas},
+        horario__in={c['horario'] for c in validas},
+    ).values('id', 'tipo', 'nombre_personalizado', 'direccion', 'dia', 'horario', 'cupo_maximo', 'activa'):
+        existentes[_clave(fila)] = fila
+        por_turno.setdefault((fila['direccion'], fila['dia'], fila['horario']), []).append(fila)
+
+    for campos in validas:
+        existente = existentes.get(_clave(campos))
+        if existente:
+            detalles = []
+            if existente['cupo_maximo'] != campos['cupo_maximo']:
+                detalles.append(f"Existe con cupo {existente['cupo_maximo']} (no se modifica).")
+            if not existente['activa']:
+                detalles.append('Existe pero está inactiva.')
+            resultado['existentes'].append(_describir(campos, 'existente', ' '.join(detalles)))
+            continue
+
+        detalle = ''
+        otras = por_turno.get((campos['direccion'], campos['dia'], campos['horario']))
+        if otras:
+            nombres = ', '.join(
+                f['nombre_personalizado'] or dict(Clase.TIPO_CLASES).get(f['tipo'], f['tipo']) for f in otras
+            )
+            detalle = f'En la misma sede y horario ya hay: {nombres}.'
+        resultado['nuevas'].append(_describir(campos, 'nueva', detalle))
+        resultado['a_crear'].append(campos)
+
+    return resultado
+
+def generar_cronograma(bloques, confirmar=False):
+    """
+    Planifica la grilla y, si se confirma, crea todas las clases nuevas con
+    bulk_create junto con sus filas base de ocupación.
+
+    Args:
+        bloques: Ver expandir_grilla
+        confirmar: False = solo informe de diferencias (dry-run)
+
+    Returns:
+        dict: El informe de planificar_cronograma más
+              {'confirmado': bool, 'creadas': [Clase]}
+    """
+    if not confirmar:
+        return {**planificar_cronograma(bloques), 'confirmado': False, 'creadas': []}
+
+    with transaction.atomic():
+        # Se vuelve a planificar dentro de la transacción para no duplicar clases
+        # creadas entre la vista previa y la confirmación
+        plan = planificar_cronograma(bloques)
+        creadas = Clase.objects.bulk_create([
+            Clase(**campos, activa=True) for campos in plan['a_crear']
+        ])
+
+        # bulk_create no dispara señales: fila base de ocupación, calendario y cache se actualizan acá
+        if creadas:
+            ClaseOcupacion.objects.bulk_create([
+                ClaseOcupacion(clase=clase, fecha=None) for clase in creadas
+            ])
+            generar_ocurrencias(clase_ids=[clase.id for clase in creadas])
+            invalidar_disponibilidad()
+
+    logger.info(f"Cronograma generado: {len(creadas)} clases nuevas de {plan['total']} combinaciones")
+    return {**plan, 'confirmado': True, 'creadas': creadas}
@@ -0,0 +1,171 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Sum
+from .models import DeudaMensual, EstadoPagoCliente, MovimientoCuenta, RegistroPago
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# CUENTA CORRIENTE DE CLIENTES
+# ==============================================================================
+# El saldo de cada cliente es un saldo corrido: cada deuda generada o ajustada,
+# cada pago confirmado (o revertido) y cada descuento agrega un MovimientoCuenta
+# y suma su importe a EstadoPagoCliente.saldo_actual, bloqueando solo esa fila.
+# Las señales de DeudaMensual y RegistroPago registran los movimientos, así que
+# saldo_actual siempre vale "pagos confirmados - deudas generadas" sin volver a
+# totalizar la historia. El comando reconciliar_cuentas lo verifica.
+
+def registrar_movimiento(usuario_id, tipo, monto, descripcion='', deuda=None, pago=None):
+    """
+    Agrega un movimiento a la cuenta del cliente y actualiza su saldo (O(1)).
+
+    Args:
+        usuario_id: ID del cliente
+        tipo: 'cargo', 'pago', 'ajuste' o 'descuento' (MovimientoCuenta.TIPOS)
+        monto: Importe con signo (positivo = a favor del cliente)
+        descripcion: Texto para el historial
+        deuda: DeudaMensual que originó el movimiento (opcional)
+        pago: RegistroPago que originó el movimiento (opcional)
+
+    Returns:
+        MovimientoCuenta creado, o None si el monto es cero
+    """
+    monto = Decimal(str(monto))
+    if not usuario_id or monto == 0:
+        return None
+
+    # Sin savepoint propio: se llama desde señales, casi siempre dentro de otra transacción
+    with transaction.atomic(savepoint=False):
+        estado, _ = EstadoPagoCliente.objects.select_for_update().get_or_create(
+            usuario_id=usuario_id, defaults={'activo': True}
+        )
+        saldo = estado.saldo_actual + monto
+        EstadoPagoCliente.objects.filter(pk=estado.pk).update(saldo_actual=saldo)
+        return MovimientoCuenta.objects.create(
+            usuario_id=usuario_id,
+            tipo=tipo,
+            monto=monto,
+            saldo_resultante=saldo,
+            deuda=deuda,
+            pago=pago,
+            descripcion=descripcion[:200],
+        )
+
+def registrar_movimientos_en_lote(movimientos, estados):
+    """
+    Versión en lote de registrar_movimiento, para procesos masivos que usan
+    bulk_create y no disparan señales (ej. generar_deudas_mensuales).
+
+    Args:
+        movimientos: Lista de MovimientoCuenta sin guardar (usuario_id, tipo, monto, ...)
+        estados: {usuario_id: EstadoPagoCliente} ya bloqueados con select_for_update
+
+    Returns:
+        list: Movimientos creados. El saldo_actual de cada estado queda actualizado
+        en memoria; quien llama lo guarda (ej. bulk_update con 'saldo_actual').
+    """
+    for movimiento in movimientos:
+        estado = estados[movimiento.usuario_id]
+        estado.saldo_actual += movimiento.monto
+        movimiento.saldo_resultante = estado.saldo_actual
+    return MovimientoCuenta.objects.bulk_create(movimientos)
+
+def saldo_cuenta(usuario):
+    """
+    Saldo corrido del cliente: lectura de una sola fila.
+
+    Args:
+        usuario: User
+
+    Returns:
+        Decimal: Positivo = crédito a favor, Negativo = deuda
+    """
+    saldo = EstadoPagoCliente.objects.filter(usuario_id=usuario.pk).values_list(
+        'saldo_actual', flat=True
+    ).first()
+    return saldo if saldo is not None else Decimal('0')
+
+def saldos_historicos(usuario_ids=None):
+    """
+    Saldo de cada cliente recalculado desde toda la historia
+    (pagos confirmados - deudas generadas), en dos consultas agrupadas.
+
+    Args:
+        usuario_ids: Limitar a estos clientes (None = todos)
+
+    Returns:
+        dict: {usuario_id: Decimal}
+    """
+    pagos = RegistroPago.objects.filter(estado='confirmado', cliente__isnull=False)
+    deudas = DeudaMensual.objects.all()
+    if usuario_ids is not None:
+        pagos = pagos.filter(cliente_id__in=usuario_ids)
+        deudas = deudas.filter(usuario_id__in=usuario_ids)
+
+    saldos = {}
+    for usuario_id, total in pagos.values('cliente_id').annotate(total=Sum('monto')).values_list('cliente_id', 'total'):
+        saldos[usuario_id] = saldos.get(usuario_id, Decimal('0')) + total
+    for usuario_id, total in deudas.values('usuario_id').annotate(total=Sum('monto_original')).values_list('usuario_id', 'total'):
+        saldos[usuario_id] = saldos.get(usuario_id, Decimal('0')) - total
+    return saldos
+
+def reconciliar_cuentas(usuario_ids=None, aplicar=False):
+    """
+    Compara el saldo corrido de cada cliente con el recalculado desde la historia
+    y, si aplicar=True, registra un movimiento de ajuste por cada diferencia
+    (el libro nunca se edita hacia atrás).
+
+    Args:
+        usuario_ids: Limitar a estos clientes (None = todos)
+        aplicar: Si False solo informa las diferencias
+
+    Returns:
+        list: Diferencias [{'usuario_id', 'saldo_actual', 'saldo_libro', 'esperado'}]
+    """
+    esperados = saldos_historicos(usuario_ids)
+
+    estados = EstadoPagoCliente.objects.all()
+    if usuario_ids is not None:
+        estados = estados.filter(usuario_id__in=usuario_ids)
+    actuales = dict(estados.values_list('usuario_id', 'saldo_actual'))
+
+    movimientos = MovimientoCuenta.objects.all()
+    if usuario_ids is not None:
+        movimientos = movimientos.filter(usuario_id__in=usuario_ids)
+    libro = dict(
+        movimientos.values('usuario_id').annotate(total=Sum('monto')).values_list('usuario_id', 'total')
+    )
+
+    diferencias = []
+    for usuario_id in sorted(set(esperados) | set(actuales) | set(libro)):
+        esperado = esperados.get(usuario_id, Decimal('0'))
+        actual = actuales.get(usuario_id, Decimal('0'))
+        saldo_libro = libro.get(usuario_id, Decimal('0'))
+        if actual == esperado and saldo_libro == esperado:
+            continue
+        diferencias.append({
+            'usuario_id': usuario_id,
+            'saldo_actual': actual,
+            'saldo_libro': saldo_libro,
+            'esperado': esperado,
+        })
+
+    if aplicar:
+        for diferencia in diferencias:
+            usuario_id = diferencia['usuario_id']
+            with transaction.atomic():
+                # El saldo guardado se alinea con el libro y el libro con la historia
+                EstadoPagoCliente.objects.filter(usuario_id=usuario_id).update(
+                    saldo_actual=diferencia['saldo_libro']
+                )
+                registrar_movimiento(
+                    usuario_id,
+                    'ajuste',
+                    diferencia['esperado'] - diferencia['saldo_libro'],
+                    descripcion='Ajuste de reconciliación'
+                )
+        if diferencias:
+            logger.warning(f"Reconciliación de cuentas: {len(diferencias)} clientes corregidos")
+
+    return diferencias
@@ -0,0 +1,115 @@
+from contextvars import ContextVar
+from functools import cached_property
+from django.contrib.auth.models import User
+from django.utils import timezone
+from .elegibilidad_service import anotaciones_usuario
+from .models import PlanUsuario, Reserva
+
+# ==============================================================================
+# CUOTA DEL USUARIO POR REQUEST
+# ==============================================================================
+# Plan vigente, reservas de la semana y créditos de recupero de un usuario se
+# calculan una sola vez por request, sin importar cuántas vistas, formularios o
+# métodos de modelo los pidan. CuotaUsuarioMiddleware abre el registro al
+# empezar el request y lo descarta al terminar; las señales de Reserva,
+# AusenciaTemporal y PlanUsuario invalidan la cuota del usuario afectado.
+# Fuera de un request (comandos, tareas) no hay registro y se calcula siempre.
+
+_cuotas = ContextVar('cuotas_usuario', default=None)
+
+class CuotaUsuario:
+    """Cuota semanal de un usuario, calculada de forma perezosa y memoizada."""
+
+    def __init__(self, usuario):
+        self.usuario = usuario
+
+    @cached_property
+    def _resumen(self):
+        # 1 sola consulta: clases del plan vigente + reservas que cuentan esta semana
+        hoy = timezone.localtime(timezone.now()).date()
+        fila = User.objects.filter(pk=self.usuario.pk).annotate(
+            **anotaciones_usuario(self.usuario, hoy)
+        ).values('elegibilidad_clases_plan', 'elegibilidad_permanentes', 'elegibilidad_temporales').get()
+        return {
+            'clases_plan': fila['elegibilidad_clases_plan'],
+            'reservas_semana': fila['elegibilidad_permanentes'] + fila['elegibilidad_temporales'],
+        }
+
+    def sembrar(self, clases_plan, reservas_semana):
+        """Guarda valores ya obtenidos por otra consulta (ej. elegibilidad_service) para no repetirla."""
+        self.__dict__['_resumen'] = {'clases_plan': clases_plan, 'reservas_semana': reservas_semana}
+
+    @property
+    def clases_plan(self):
+        """Clases por semana del plan vigente (0 si no tiene plan)."""
+        return self._resumen['clases_plan']
+
+    @property
+    def reservas_semana(self):
+        """Reservas que cuentan contra el límite semanal (permanentes + cupos temporales)."""
+        return self._resumen['reservas_semana']
+
+    @property
+    def clases_restantes(self):
+        return max(0, self.clases_plan - self.reservas_semana)
+
+    @cached_property
+    def planes_vigentes(self):
+        """QuerySet (perezoso) de los planes activos y vigentes hoy."""
+        hoy = timezone.localtime(timezone.now()).date()
+        return PlanUsuario.objects.filter(
+            usuario=self.usuario,
+            activo=True,
+            fecha_inicio__lte=hoy,
+            fecha_fin__gte=hoy
+        )
+
+    @cached_property
+    def recupero(self):
+        """(puede_recuperar, recuperos_disponibles, ausencias_con_credito) — el saldo es una sola fila."""
+        from .recuperos_service import ausencias_con_credito, saldo_recupero
+        disponibles = saldo_recupero(self.usuario)
+        return disponibles > 0, disponibles, ausencias_con_credito(self.usuario)
+
+def cuota_usuario(usuario):
+    """
+    Cuota del usuario para el request en curso (la misma instancia en cada llamada).
+    Fuera de un request devuelve una cuota nueva, sin memoizar.
+
+    Args:
+        usuario: User
+
+    Returns:
+        CuotaUsuario
+    """
+    registro = _cuotas.get()
+    if registro is None:
+        return CuotaUsuario(usuario)
+    cuota = registro.get(usuario.pk)
+    if cuota is None:
+        cuota = registro[usuario.pk] = CuotaUsuario(usuario)
+    return cuota
+
+def invalidar_cuota(usuario_id):
+    """Descarta la cuota memoizada de un usuario (tras crear o modificar reservas, ausencias o planes)."""
+    registro = _cuotas.get()
+    if registro:
+        registro.pop(usuario_id, None)
+
+def invalidar_cuota_reserva(reserva_id):
+    """Como invalidar_cuota, a partir de una reserva (solo consulta si hay cuotas memoizadas)."""
+    if _cuotas.get():
+        invalidar_cuota(Reserva.objects.filter(pk=reserva_id).values_list('usuario_id', flat=True).first())
+
+class CuotaUsuarioMiddleware:
+    """Abre un registro de cuotas vacío por request (ver cuota_usuario)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _cuotas.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            _cuotas.reset(token)
@@ -0,0 +1,244 @@
+from datetime import date
+from decimal import Decimal
+from time import perf_counter
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .cuenta_service import registrar_movimientos_en_lote
+from .models import DeudaMensual, EstadoPagoCliente, MovimientoCuenta
+from .tareas_service import encolar_tareas
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# GENERACIÓN MASIVA DE DEUDAS MENSUALES
+# ==============================================================================
+# Las deudas del mes se generan por lotes: una consulta (anti-join) encuentra a
+# los clientes con plan que todavía no tienen deuda ese mes, y cada lote se
+# escribe en su propia transacción con bulk_create (deudas y movimientos de
+# cuenta) y un bulk_update de EstadoPagoCliente. Si el proceso se corta, volver
+# a ejecutarlo retoma desde los clientes que quedaron sin deuda.
+
+TAMAÑO_LOTE_DEUDAS = 500
+
+def clientes_a_facturar(primer_dia_mes, force=False):
+    """
+    Estados de pago de clientes activos con plan que deben recibir la deuda del mes.
+
+    Args:
+        primer_dia_mes: date (día 1 del mes)
+        force: True = también los que ya tienen deuda ese mes (se regenera)
+
+    Returns:
+        QuerySet de EstadoPagoCliente anotado con `tiene_deuda`, ordenado por ID
+    """
+    estados = EstadoPagoCliente.objects.filter(
+        plan_actual__isnull=False,
+        activo=True
+    ).annotate(
+        tiene_deuda=Exists(
+            DeudaMensual.objects.filter(usuario_id=OuterRef('usuario_id'), mes_año=primer_dia_mes)
+        )
+    )
+    if not force:
+        estados = estados.filter(tiene_deuda=False)
+    return estados.order_by('id')
+
+def generar_deudas_mes(primer_dia_mes, tamaño_lote=TAMAÑO_LOTE_DEUDAS, force=False, aplicar=True):
+    """
+    Genera la deuda del mes para todos los clientes con plan, por lotes.
+    Es un generador: devuelve el resultado de cada lote apenas se confirma.
+
+    Args:
+        primer_dia_mes: date (día 1 del mes)
+        tamaño_lote: Clientes por lote (una transacción por lote)
+        force: Regenerar la deuda de quienes ya la tienen
+        aplicar: False = solo calcular (dry-run)
+
+    Yields:
+        dict: {'lote', 'generadas', 'reemplazadas', 'monto', 'segundos',
+               'detalle': [(username, monto, nombre_plan, reemplazada)]}
+    """
+    fecha_vencimiento = date(primer_dia_mes.year, primer_dia_mes.month, 10)
+    ids = list(clientes_a_facturar(primer_dia_mes, force).values_list('id', flat=True))
+
+    for numero, inicio in enumerate(range(0, len(ids), tamaño_lote), start=1):
+        comienzo = perf_counter()
+        ids_lote = ids[inicio:inicio + tamaño_lote]
+
+        with transaction.atomic():
+            # Releer el lote con el anti-join: si otra ejecución ya lo facturó, se saltea
+            estados = list(
+                clientes_a_facturar(primer_dia_mes, force).filter(id__in=ids_lote).select_related(
+                    'usuario', 'plan_actual'
+                )
+            )
+            reemplazar = [estado.usuario_id for estado in estados if estado.tiene_deuda]
+
+            if aplicar and reemplazar:
+                # Pocas filas y solo con --force: el borrado pasa por las señales del libro de cuenta
+                DeudaMensual.objects.filter(usuario_id__in=reemplazar, mes_año=primer_dia_mes).delete()
+
+            if aplicar:
+                # Bloquear los estados del lote y leer el saldo ya con las deudas reemplazadas
+                bloqueados = EstadoPagoCliente.objects.select_for_update().in_bulk([e.id for e in estados])
+                for estado in estados:
+                    estado.saldo_actual = bloqueados[estado.id].saldo_actual
+
+            deudas = [
+                DeudaMensual(
+                    usuario_id=estado.usuario_id,
+                    mes_año=primer_dia_mes,
+                    plan_aplicado=estado.plan_actual,
+                    monto_original=estado.plan_actual.precio_mensual,
+                    monto_pendiente=estado.plan_actual.precio_mensual,
+                    es_medio_mes=False,
+                    estado='pendiente',
+                    fecha_vencimiento=fecha_vencimiento,
+                    observaciones=f'Deuda mensual generada automáticamente - Plan: {estado.plan_actual.nombre}'
+                )
+                for estado in estados
+            ]
+
+            if aplicar and deudas:
+                deudas = DeudaMensual.objects.bulk_create(deudas, batch_size=tamaño_lote)
+
+                # bulk_create no dispara señales: el cargo se registra acá en el libro de cuenta
+                registrar_movimientos_en_lote(
+                    [
+                        MovimientoCuenta(
+                            usuario_id=deuda.usuario_id,
+                            tipo='cargo',
+                            monto=-deuda.monto_original,
+                            deuda=deuda,
+                            descripcion=f'Cuota {primer_dia_mes.strftime("%m/%Y")}',
+                        )
+                        for deuda in deudas
+                    ],
+                    {estado.usuario_id: estado for estado in estados}
+                )
+                for estado in estados:
+                    estado.monto_deuda_mensual = estado.plan_actual.precio_mensual
+                    estado.fecha_limite_pago = fecha_vencimiento
+                    estado.puede_reservar = True  # Empieza el mes pudiendo reservar
+                EstadoPagoCliente.objects.bulk_update(
+                    estados,
+                    ['saldo_actual', 'monto_deuda_mensual', 'fecha_limite_pago', 'puede_reservar'],
+                    batch_size=tamaño_lote
+                )
+
+        resultado = {
+            'lote': numero,
+            'generadas': len(deudas),
+            'reemplazadas': len(reemplazar),
+            'monto': sum((deuda.monto_original for deuda in deudas), Decimal('0')),
+            'segundos': perf_counter() - comienzo,
+            'detalle': [
+                (estado.usuario.username, estado.plan_actual.precio_mensual, estado.plan_actual.nombre, estado.tiene_deuda)
+                for estado in estados
+            ],
+        }
+        if aplicar:
+            logger.info(
+                f"Deudas {primer_dia_mes.strftime('%m/%Y')} lote {numero}: "
+                f"{resultado['generadas']} generadas ({resultado['reemplazadas']} reemplazadas) "
+                f"en {resultado['segundos']:.2f}s"
+            )
+        yield resultado
+
+# ==============================================================================
+# VENCIMIENTO DE DEUDAS
+# ==============================================================================
+# Las deudas pendientes que pasaron su fecha de vencimiento se marcan 'vencido'
+# con un único UPDATE, y los clientes afectados quedan sin poder reservar con
+# otro UPDATE sobre EstadoPagoCliente (subconsulta a esas mismas deudas).
+
+def _deudas_por_vencer(hoy):
+    return DeudaMensual.objects.filter(
+        estado__in=['pendiente', 'parcial'],
+        fecha_vencimiento__lt=hoy
+    )
+
+def vencer_deudas(hoy=None, aplicar=True, enviar_emails=False, informar=None):
+    """
+    Marca como vencidas las deudas pendientes cuya fecha de vencimiento ya pasó
+    y bloquea las reservas de sus clientes.
+
+    Args:
+        hoy: Fecha de referencia (por defecto, hoy)
+        aplicar: False = solo informar (dry-run)
+        enviar_emails: Encolar un aviso por email para cada cliente afectado
+        informar: Función opcional que recibe cada deuda afectada (dict) a medida
+            que se lee, para reportar sin cargar todas en memoria
+
+    Returns:
+        dict: {'deudas', 'usuarios', 'bloqueados', 'emails', 'monto'}
+    """
+    hoy = hoy or timezone.localtime(timezone.now()).date()
+    resultado = {'deudas': 0, 'usuarios': 0, 'bloqueados': 0, 'emails': 0, 'monto': Decimal('0')}
+    deudas_por_usuario = {}
+
+    with transaction.atomic():
+        filas = _deudas_por_vencer(hoy).annotate(
+            tiene_estado=Exists(EstadoPagoCliente.objects.filter(usuario_id=OuterRef('usuario_id')))
+        ).order_by('usuario__username', 'mes_año').values(
+            'id', 'usuario_id', 'usuario__username', 'monto_pendiente',
+            'fecha_vencimiento', 'mes_año', 'tiene_estado'
+        )
+        for fila in filas.iterator(chunk_size=TAMAÑO_LOTE_DEUDAS):
+            resultado['deudas'] += 1
+            resultado['monto'] += fila['monto_pendiente']
+            deudas_por_usuario.setdefault(fila['usuario_id'], []).append(fila['id'])
+            if informar:
+                informar(fila)
+        resultado['usuarios'] = len(deudas_por_usuario)
+
+        if not aplicar or not deudas_por_usuario:
+            return resultado
+
+        # Primero el bloqueo (la subconsulta todavía distingue las deudas por vencer)
+        resultado['bloqueados'] = EstadoPagoCliente.objects.filter(
+            puede_reservar=True
+        ).filter(
+            Exists(_deudas_por_vencer(hoy).filter(usuario_id=OuterRef('usuario_id')))
+        ).update(puede_reservar=False)
+        _deudas_por_vencer(hoy).update(estado='vencido')
+
+        if enviar_emails:
+            encolar_tareas('email_deuda_vencida', [
+                (usuario_id, {'deuda_ids': deuda_ids})
+                for usuario_id, deuda_ids in deudas_por_usuario.items()
+            ])
+            resultado['emails'] = len(deudas_por_usuario)
+
+    logger.info(
+        f"Deudas vencidas al {hoy}: {resultado['deudas']} de {resultado['usuarios']} clientes, "
+        f"{resultado['bloqueados']} bloqueados, {resultado['emails']} avisos encolados"
+    )
+    return resultado
+
+def desbloquear_sin_deuda_vencida(aplicar=True):
+    """
+    Devuelve la posibilidad de reservar a los clientes bloqueados que ya no
+    tienen deudas vencidas con saldo pendiente (un solo UPDATE).
+
+    Args:
+        aplicar: False = solo informar (dry-run)
+
+    Returns:
+        list: Usernames de los clientes desbloqueados
+    """
+    desbloqueables = EstadoPagoCliente.objects.filter(
+        puede_reservar=False,
+        activo=True
+    ).exclude(
+        Exists(DeudaMensual.objects.filter(
+            usuario_id=OuterRef('usuario_id'), estado='vencido', monto_pendiente__gt=0
+        ))
+    )
+    with transaction.atomic():
+        usernames = list(desbloqueables.order_by('usuario__username').values_list('usuario__username', flat=True))
+        if aplicar and usernames:
+            desbloqueables.update(puede_reservar=True)
+    return usernames
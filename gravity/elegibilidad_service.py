@@ -0,0 +1,223 @@
+from datetime import timedelta
+from django.db.models import Count, Exists, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .calendario_service import ahora_local, proxima_ocurrencia
+from .models import Clase, ClaseCerrada, ClaseOcupacion, PlanUsuario, Reserva, NUMERO_DIA_SEMANA
+
+# ==============================================================================
+# ELEGIBILIDAD PARA RESERVAR
+# ==============================================================================
+# Todo lo que hace falta para decidir si un usuario puede reservar una clase
+# (cuota del plan, uso semanal, duplicados y cupos de la próxima fecha) se
+# obtiene con UNA sola consulta anotada, en lugar de los varios COUNT que
+# hacían el formulario y la vista por separado. El resultado se guarda en el
+# request para que formulario, vista y endpoints AJAX no lo vuelvan a calcular.
+
+# Horas antes del inicio de la clase en que la fecha de hoy deja de ser reservable
+HORAS_ANTICIPACION_RESERVA = 3
+
+def inicio_semana_reservas(hoy=None):
+    """
+    Lunes de la semana que cuenta para el límite del plan
+    (los domingos, la semana que arranca mañana).
+    """
+    hoy = hoy or timezone.localtime(timezone.now()).date()
+    if hoy.weekday() == 6:
+        return hoy + timedelta(days=1)
+    return hoy - timedelta(days=hoy.weekday())
+
+def proxima_fecha_reservable(dia, horario, ahora=None):
+    """
+    Próxima fecha de la clase que todavía se puede reservar: hoy si faltan
+    más de HORAS_ANTICIPACION_RESERVA horas para que empiece, si no la semana siguiente.
+
+    Args:
+        dia: Nombre del día de la clase ('Lunes', ...)
+        horario: time de inicio de la clase
+        ahora: datetime local de referencia (por defecto, ahora)
+
+    Returns:
+        date: Fecha de la próxima clase reservable
+    """
+    return proxima_ocurrencia(dia, horario, ahora, anticipacion=timedelta(hours=HORAS_ANTICIPACION_RESERVA))
+
+def _contar(queryset):
+    """Subconsulta COUNT(*) escalar (0 si no hay filas)."""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values('usuario').annotate(total=Count('pk')).values('total')[:1],
+            output_field=IntegerField()
+        ),
+        Value(0)
+    )
+
+def anotaciones_usuario(usuario, hoy):
+    """
+    Cuota del plan vigente y reservas de la semana del usuario, como subconsultas
+    para annotate() (las usan evaluar_elegibilidad_reserva y cuota_service).
+
+    Args:
+        usuario: User
+        hoy: Fecha de referencia (date)
+
+    Returns:
+        dict: {'elegibilidad_clases_plan', 'elegibilidad_permanentes', 'elegibilidad_temporales'}
+    """
+    inicio_semana = inicio_semana_reservas(hoy)
+    plan_vigente = PlanUsuario.objects.filter(
+        usuario=usuario.pk,
+        activo=True,
+        fecha_inicio__lte=hoy,
+        fecha_fin__gte=hoy
+    ).order_by('-fecha_creacion').values('plan__clases_por_semana')[:1]
+
+    return {
+        'elegibilidad_clases_plan': Coalesce(
+            Subquery(plan_vigente, output_field=IntegerField()), Value(0)
+        ),
+        # Reservas permanentes (siempre cuentan contra el límite)
+        'elegibilidad_permanentes': _contar(Reserva.objects.filter(
+            usuario=usuario.pk,
+            activa=True,
+            clase__dia__in=list(NUMERO_DIA_SEMANA),
+            fecha_unica__isnull=True
+        )),
+        # Cupos temporales tomados esta semana (cuentan, los recuperos NO)
+        'elegibilidad_temporales': _contar(Reserva.objects.filter(
+            usuario=usuario.pk,
+            activa=True,
+            es_recupero=False,
+            fecha_unica__gte=inicio_semana,
+            fecha_unica__lte=inicio_semana + timedelta(days=5)
+        )),
+    }
+
+def _anotaciones_clase(usuario, fecha):
+    """Ocupación de la clase en `fecha` y reserva duplicada del usuario, como subconsultas."""
+    ocupacion = ClaseOcupacion.objects.filter(clase=OuterRef('pk'))
+    anotaciones = {
+        'elegibilidad_base': Coalesce(
+            Subquery(ocupacion.filter(fecha__isnull=True).values('permanentes')[:1]), Value(0)
+        ),
+        'elegibilidad_ausencias': Coalesce(
+            Subquery(ocupacion.filter(fecha=fecha).values('ausencias')[:1]), Value(0)
+        ),
+        'elegibilidad_fecha_unica': Coalesce(
+            Subquery(ocupacion.filter(fecha=fecha).values('fecha_unica')[:1]), Value(0)
+        ),
+        # Las ausencias de un cierre del estudio no liberan cupos
+        'elegibilidad_cerrada': Exists(ClaseCerrada.objects.filter(clase=OuterRef('pk'), fecha=fecha)),
+    }
+    if usuario is not None:
+        # Una permanente en la clase o una de fecha única ese día impiden otra reserva
+        anotaciones['elegibilidad_duplicado'] = Exists(Reserva.objects.filter(
+            Q(fecha_unica__isnull=True) | Q(fecha_unica=fecha),
+            usuario=usuario.pk,
+            clase=OuterRef('pk'),
+            activa=True
+        ))
+    return anotaciones
+
+def _resultado_usuario(clases_plan, reservas_semana):
+    """Arma la parte del resultado que depende solo del usuario (mismos mensajes que Reserva.usuario_puede_reservar)."""
+    resultado = {
+        'clases_plan': clases_plan,
+        'reservas_semana': reservas_semana,
+        'clases_restantes': max(0, clases_plan - reservas_semana),
+        'puede_reservar': True,
+        'mensaje': f"Puedes reservar. Tienes {clases_plan - reservas_semana} clases disponibles esta semana.",
+    }
+    if clases_plan == 0:
+        resultado['puede_reservar'] = False
+        resultado['mensaje'] = "No tienes un plan activo. Debes seleccionar un plan antes de reservar."
+    elif reservas_semana >= clases_plan:
+        resultado['puede_reservar'] = False
+        resultado['mensaje'] = (
+            f"Ya tienes {reservas_semana} reservas esta semana. "
+            f"Tu plan permite máximo {clases_plan} clases semanales."
+        )
+    return resultado
+
+def _evaluar(usuario, tipo, dia, horario, sede, ahora):
+    from .cuota_service import cuota_usuario
+
+    hoy = ahora.date()
+    resultado = {'clase': None, 'fecha': None, 'duplicado': False, 'cupos_disponibles': None}
+
+    if all([tipo, dia, horario, sede]):
+        fecha = proxima_fecha_reservable(dia, horario, ahora)
+        anotaciones = _anotaciones_clase(usuario, fecha)
+        if usuario is not None:
+            anotaciones.update(anotaciones_usuario(usuario, hoy))
+
+        clase = Clase.objects.filter(
+            tipo=tipo,
+            dia=dia,
+            horario=horario,
+            direccion=sede,
+            activa=True
+        ).annotate(**anotaciones).first()
+
+        if clase is not None:
+            ocupados = clase.elegibilidad_base - clase.elegibilidad_ausencias + clase.elegibilidad_fecha_unica
+            resultado.update({
+                'clase': clase,
+                'fecha': fecha,
+                'duplicado': getattr(clase, 'elegibilidad_duplicado', False),
+                'cupos_disponibles': 0 if clase.elegibilidad_cerrada else max(0, clase.cupo_maximo - ocupados),
+            })
+            if usuario is not None:
+                reservas_semana = clase.elegibilidad_permanentes + clase.elegibilidad_temporales
+                resultado.update(_resultado_usuario(clase.elegibilidad_clases_plan, reservas_semana))
+                # La cuota del request ya queda calculada para el resto de los llamadores
+                cuota_usuario(usuario).sembrar(clase.elegibilidad_clases_plan, reservas_semana)
+            return resultado
+
+    if usuario is None:
+        return resultado
+
+    # Sin clase (criterios incompletos o inexistente): solo la parte del usuario
+    cuota = cuota_usuario(usuario)
+    resultado.update(_resultado_usuario(cuota.clases_plan, cuota.reservas_semana))
+    return resultado
+
+def evaluar_elegibilidad_reserva(usuario, tipo=None, dia=None, horario=None, sede=None, request=None):
+    """
+    Evalúa si un usuario puede reservar y, si se indica la clase, sus cupos
+    para la próxima fecha reservable, con una sola consulta.
+
+    Args:
+        usuario: User (o None para consultar solo la clase, sin datos del plan)
+        tipo, dia, horario, sede: Criterios de la clase (horario como time)
+        request: Si se pasa, el resultado se guarda en el request y las llamadas
+                 siguientes con los mismos criterios no vuelven a consultar
+
+    Returns:
+        dict: {
+            'clase', 'fecha', 'duplicado', 'cupos_disponibles',
+            'clases_plan', 'reservas_semana', 'clases_restantes',
+            'puede_reservar', 'mensaje'
+        }
+        Los datos del plan solo están si hay usuario; 'clase' es None si no existe.
+    """
+    usuario_id = usuario.pk if usuario is not None else None
+    criterios = (tipo, dia, horario, sede) if all([tipo, dia, horario, sede]) else None
+
+    memo = None
+    if request is not None:
+        memo = request.__dict__.setdefault('_elegibilidad_reserva', {})
+        if (usuario_id, criterios) in memo:
+            return memo[(usuario_id, criterios)]
+        if criterios is None and usuario_id is not None:
+            # La parte del usuario ya se obtuvo junto con alguna clase en este request
+            for (memo_usuario_id, _), previo in memo.items():
+                if memo_usuario_id == usuario_id and 'clases_plan' in previo:
+                    resultado = dict(previo, clase=None, fecha=None, duplicado=False, cupos_disponibles=None)
+                    memo[(usuario_id, None)] = resultado
+                    return resultado
+
+    resultado = _evaluar(usuario, tipo, dia, horario, sede, ahora_local(request))
+    if memo is not None:
+        memo[(usuario_id, criterios)] = resultado
+    return resultado
@@ -1618,32 +1618,26 @@ def enviar_recordatorios_clases_manana_completo():
     """
     from django.utils import timezone
     from datetime import timedelta
-    from .models import Reserva
-    
-    # Obtener mañana como día de la semana
-    manana = timezone.now() + timedelta(days=1)
-    dia_manana = manana.strftime('%A')
-    
-    # Mapear días en inglés a español
-    dias_mapping = {
-        'Monday': 'Lunes',
-        'Tuesday': 'Martes',
-        'Wednesday': 'Miércoles',
-        'Thursday': 'Jueves',
-        'Friday': 'Viernes',
-        'Saturday': 'Sábado',
-        'Sunday': 'Domingo'
-    }
+    from django.db.models import Exists, OuterRef, Q
+    from .calendario_service import generar_ocurrencias
+    from .models import AusenciaTemporal, Reserva
     
-    dia_manana_es = dias_mapping.get(dia_manana, dia_manana)
+    # Fecha real de mañana: se cruza con el calendario de clases (ClaseOcurrencia)
+    manana = timezone.localtime(timezone.now()).date() + timedelta(days=1)
+    dias_es = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+    dia_manana_es = dias_es[manana.weekday()]
+    generar_ocurrencias(semanas=1, desde=manana)
     
-    # Obtener todas las reservas activas para mañana
+    # Reservas que asisten mañana: permanentes sin ausencia avisada + fecha única de mañana
     reservas_manana = Reserva.objects.filter(
+        Q(fecha_unica__isnull=True) | Q(fecha_unica=manana),
         activa=True,
-        clase__dia=dia_manana_es,
         clase__activa=True,
+        clase__ocurrencias__fecha=manana,
         usuario__email__isnull=False,
         usuario__is_active=True
+    ).exclude(
+        Exists(AusenciaTemporal.objects.filter(reserva=OuterRef('pk'), fecha=manana))
     ).select_related('usuario', 'clase')
     
     # Estadísticas
@@ -2339,3 +2333,259 @@ def enviar_email_cambio_plan_aprobado(solicitud):
     except Exception as e:
         logger.error(f"Error enviando email de cambio de plan aprobado (solicitud {solicitud.id}): {str(e)}")
         return False
+
+# ==============================================================================
+# EMAIL DE CONFIRMACIÓN DE RESERVAS CREADAS EN LOTE
+# ==============================================================================
+
+def enviar_email_confirmacion_reservas_lote(usuario, reservas):
+    """
+    Envía un único email al usuario con todas las reservas que el estudio le creó
+    en una carga masiva (ver ocupacion_service.reservar_cupos_en_lote).
+
+    Args:
+        usuario: Usuario destinatario
+        reservas: Lista de objetos Reserva (con la clase precargada)
+
+    Returns:
+        Boolean: True si el email se envió exitosamente, False en caso contrario
+    """
+    try:
+        if not usuario.email:
+            logger.warning(f"Usuario {usuario.username} no tiene email configurado")
+            return False
+
+        domain_url = getattr(settings, 'SITE_URL', 'https://pilatesgravity.com.ar')
+
+        context = {
+            'usuario': usuario,
+            'reservas': reservas,
+            'domain_url': domain_url,
+        }
+
+        subject = render_to_string(
+            'gravity/emails/reservas_lote_subject.txt',
+            context
+        ).strip()
+
+        html_message = render_to_string(
+            'gravity/emails/reservas_lote_email.html',
+            context
+        )
+
+        nombre = usuario.first_name or usuario.username
+        lineas = []
+        for reserva in reservas:
+            cuando = (
+                f"el {reserva.fecha_unica.strftime('%d/%m/%Y')}" if reserva.fecha_unica
+                else f"todos los {reserva.clase.dia}"
+            )
+            lineas.append(
+                f"  {reserva.numero_reserva} · {reserva.clase.get_nombre_display()} — {cuando} "
+                f"a las {reserva.clase.horario.strftime('%H:%M')} en {reserva.clase.get_direccion_corta()}"
+            )
+        text_message = (
+            f"Tus reservas fueron confirmadas\n\n"
+            f"Hola {nombre},\n\n"
+            f"El estudio registró las siguientes reservas a tu nombre:\n\n"
+            + '\n'.join(lineas) +
+            f"\n\nPodés ver el detalle desde tu cuenta en {domain_url}\n\n"
+            f"Pilates Gravity · La Rioja 3044 y 9 de Julio 3698, Santa Fe\n"
+            f"pilatesgravity@gmail.com · +54 342 511 4448"
+        )
+
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=text_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[usuario.email],
+        )
+        email.attach_alternative(html_message, 'text/html')
+        email.send(fail_silently=False)
+
+        logger.info(f"Email de confirmación de {len(reservas)} reserva(s) enviado a {usuario.email}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error enviando email de confirmación de reservas a {usuario.username}: {str(e)}")
+        return False
+
+def enviar_email_deuda_vencida(usuario, deudas, connection=None):
+    """
+    Avisa al usuario que tiene cuotas vencidas (una o más, en un único email)
+    y que no puede reservar hasta regularizarlas.
+
+    Args:
+        usuario: Usuario destinatario
+        deudas: Lista de DeudaMensual vencidas (con plan_aplicado precargado)
+        connection: Conexión SMTP opcional para reutilizar entre varios envíos
+
+    Returns:
+        Boolean: True si el email se envió exitosamente, False en caso contrario
+    """
+    try:
+        if not usuario.email:
+            logger.warning(f"Usuario {usuario.username} no tiene email configurado")
+            return False
+
+        domain_url = getattr(settings, 'SITE_URL', 'https://pilatesgravity.com.ar')
+        total = sum(deuda.monto_pendiente for deuda in deudas)
+
+        context = {
+            'usuario': usuario,
+            'deudas': deudas,
+            'total': total,
+            'domain_url': domain_url,
+        }
+
+        subject = render_to_string(
+            'gravity/emails/deuda_vencida_subject.txt',
+            context
+        ).strip()
+
+        html_message = render_to_string(
+            'gravity/emails/deuda_vencida_email.html',
+            context
+        )
+
+        nombre = usuario.first_name or usuario.username
+        lineas = [
+            f"  {deuda.mes_año.strftime('%m/%Y')} · {deuda.plan_aplicado.nombre} — ${deuda.monto_pendiente:,.0f} "
+            f"(venció el {deuda.fecha_vencimiento.strftime('%d/%m/%Y')})"
+            for deuda in deudas
+        ]
+        text_message = (
+            f"Tenés una cuota vencida\n\n"
+            f"Hola {nombre},\n\n"
+            f"Las siguientes cuotas vencieron y siguen pendientes de pago:\n\n"
+            + '\n'.join(lineas) +
+            f"\n\nTotal adeudado: ${total:,.0f}\n\n"
+            f"Mientras tanto no vas a poder reservar ni modificar clases. Apenas se registre "
+            f"el pago vas a poder volver a reservar desde tu cuenta en {domain_url}\n\n"
+            f"Pilates Gravity · La Rioja 3044 y 9 de Julio 3698, Santa Fe\n"
+            f"pilatesgravity@gmail.com · +54 342 511 4448"
+        )
+
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=text_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[usuario.email],
+            connection=connection,
+        )
+        email.attach_alternative(html_message, 'text/html')
+        email.send(fail_silently=False)
+
+        logger.info(f"Aviso de {len(deudas)} cuota(s) vencida(s) enviado a {usuario.email}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error enviando aviso de deuda vencida a {usuario.username}: {str(e)}")
+        return False
+
+# ==============================================================================
+# EMAILS DE CIERRE DE CLASES (UNA SOLA CONEXIÓN SMTP)
+# ==============================================================================
+
+def _mensaje_cierre(cierre, usuario, afectadas, domain_url, connection):
+    """Arma el email de un alumno con todas sus clases afectadas por el cierre."""
+    context = {
+        'usuario': usuario,
+        'cierre': cierre,
+        'afectadas': afectadas,
+        'domain_url': domain_url,
+    }
+
+    subject = render_to_string('gravity/emails/cierre_clase_subject.txt', context).strip()
+    html_message = render_to_string('gravity/emails/cierre_clase_email.html', context)
+
+    nombre = usuario.first_name or usuario.username
+    lineas = [
+        f"  {reserva.clase.get_nombre_display()} a las {reserva.clase.horario.strftime('%H:%M')} "
+        f"en {reserva.clase.get_direccion_corta()}"
+        + (" — tenés una semana para recuperarla" if recupero else " — reserva cancelada")
+        for reserva, recupero in afectadas
+    ]
+    text_message = (
+        f"Clase suspendida el {cierre.fecha.strftime('%d/%m/%Y')}\n\n"
+        f"Hola {nombre},\n\n"
+        f"El {cierre.fecha.strftime('%d/%m/%Y')} no se dictarán las siguientes clases:\n\n"
+        + '\n'.join(lineas) +
+        f"\n\nMotivo: {cierre.motivo}\n"
+        + (f"{cierre.motivo_detalle}\n" if cierre.motivo_detalle else "")
+        + f"\nPodés reservar un recupero desde tu cuenta en {domain_url}\n\n"
+        f"Pilates Gravity · La Rioja 3044 y 9 de Julio 3698, Santa Fe\n"
+        f"pilatesgravity@gmail.com · +54 342 511 4448"
+    )
+
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=text_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[usuario.email],
+        connection=connection,
+    )
+    email.attach_alternative(html_message, 'text/html')
+    return email
+
+def enviar_emails_cierre(cierre):
+    """
+    Avisa a todos los alumnos afectados por un cierre de clases (un email por alumno,
+    con todas sus clases de ese día) usando una única conexión SMTP.
+    Cada envío exitoso se registra en cierre.usuarios_notificados en el momento:
+    si la tarea se corta y se reintenta, esos alumnos no reciben el email otra vez.
+
+    Args:
+        cierre: Objeto CierreClase
+
+    Returns:
+        dict: {'enviados': int, 'fallidos': int} (enviados incluye los de intentos anteriores)
+    """
+    from django.core.mail import get_connection
+    from .models import CancelacionAdmin, CierreClase
+
+    # Reservas afectadas: permanentes con ausencia (recuperables) y fecha única canceladas
+    por_usuario = {}
+    for ausencia in cierre.ausencias.select_related('reserva__usuario', 'reserva__clase'):
+        por_usuario.setdefault(ausencia.reserva.usuario, []).append((ausencia.reserva, True))
+    for cancelacion in cierre.cancelaciones.select_related('reserva__usuario', 'reserva__clase'):
+        por_usuario.setdefault(cancelacion.reserva.usuario, []).append((cancelacion.reserva, False))
+
+    domain_url = getattr(settings, 'SITE_URL', 'https://pilatesgravity.com.ar')
+    notificados = list(
+        CierreClase.objects.filter(pk=cierre.pk).values_list('usuarios_notificados', flat=True).first() or []
+    )
+    ya_notificados = set(notificados)
+    fallidos = 0
+
+    with get_connection() as connection:
+        for usuario, afectadas in por_usuario.items():
+            if usuario.id in ya_notificados:
+                continue
+            enviado = False
+            if not usuario.email:
+                logger.warning(f"Usuario {usuario.username} no tiene email configurado")
+            else:
+                try:
+                    afectadas.sort(key=lambda item: item[0].clase.horario)
+                    _mensaje_cierre(cierre, usuario, afectadas, domain_url, connection).send(fail_silently=False)
+                    enviado = True
+                except Exception as e:
+                    logger.error(f"Error enviando email de cierre {cierre.id} a {usuario.email}: {str(e)}")
+
+            if enviado:
+                notificados.append(usuario.id)
+                CierreClase.objects.filter(pk=cierre.pk).update(
+                    usuarios_notificados=notificados, emails_enviados=len(notificados)
+                )
+            else:
+                fallidos += 1
+                CierreClase.objects.filter(pk=cierre.pk).update(emails_fallidos=fallidos)
+
+    CancelacionAdmin.objects.filter(
+        cierre=cierre, reserva__usuario_id__in=notificados
+    ).update(email_enviado=True)
+
+    enviados = len(notificados)
+    logger.info(f"Emails del cierre {cierre.id}: {enviados} enviados, {fallidos} fallidos")
+    return {'enviados': enviados, 'fallidos': fallidos}
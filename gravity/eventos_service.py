@@ -0,0 +1,144 @@
+from threading import Lock
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.utils import timezone
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# BROKER EN PROCESO DE EVENTOS DE DISPONIBILIDAD
+# ==============================================================================
+# Los eventos se reparten entre las conexiones SSE abiertas en el mismo proceso
+# (no necesita Redis ni otro servicio). Por eso los cupos en vivo requieren un
+# único worker (ver "Despliegue" en el README): con varios procesos, cada uno
+# notifica solo los cambios que se hicieron en él y el resto recién llega cuando
+# la página vuelve a pedir /api/arbol-reserva/<tipo>/ cada CUPOS_RECARGA_SEGUNDOS.
+# El stream solo se abre bajo ASGI: en un worker WSGI cada conexión ocuparía un
+# hilo mientras dure, así que ahí la página se queda solo con la recarga.
+
+# Eventos que puede acumular una conexión lenta antes de empezar a descartarlos
+MAX_EVENTOS_PENDIENTES = 100
+
+class BrokerDisponibilidad:
+    """Reparte los cambios de cupos entre los suscriptores (una cola asyncio por conexión)."""
+
+    def __init__(self):
+        self._suscriptores = set()
+        self._ultimos_cupos = {}
+        self._podado_el = None
+        self._lock = Lock()
+
+    def hay_suscriptores(self):
+        return bool(self._suscriptores)
+
+    def suscribir(self):
+        """
+        Registra una conexión nueva. Debe llamarse desde el event loop de la conexión.
+
+        Returns:
+            asyncio.Queue: Cola de la que la conexión lee sus eventos
+        """
+        cola = asyncio.Queue(maxsize=MAX_EVENTOS_PENDIENTES)
+        with self._lock:
+            self._suscriptores.add((asyncio.get_running_loop(), cola))
+        return cola
+
+    def desuscribir(self, cola):
+        with self._lock:
+            self._suscriptores = {s for s in self._suscriptores if s[1] is not cola}
+
+    def publicar(self, clase_id, fecha, cupos_disponibles):
+        """
+        Publica el valor actual de cupos de una clase (y fecha, si aplica) junto
+        con la diferencia respecto del último valor publicado.
+        Se puede llamar desde cualquier hilo.
+        """
+        clave = (clase_id, fecha)
+        with self._lock:
+            self._podar_fechas_pasadas()
+            anterior = self._ultimos_cupos.get(clave)
+            self._ultimos_cupos[clave] = cupos_disponibles
+            suscriptores = list(self._suscriptores)
+
+        if anterior == cupos_disponibles:
+            return
+
+        evento = {
+            'clase_id': clase_id,
+            'fecha': fecha.isoformat() if fecha else None,
+            'cupos_disponibles': cupos_disponibles,
+            'delta': cupos_disponibles - anterior if anterior is not None else None,
+        }
+        for loop, cola in suscriptores:
+            try:
+                loop.call_soon_threadsafe(self._encolar, cola, evento)
+            except RuntimeError:
+                # El loop de esa conexión ya se cerró
+                self.desuscribir(cola)
+
+    def _podar_fechas_pasadas(self):
+        """Descarta los últimos cupos de fechas ya pasadas (una vez por día). Requiere el lock."""
+        hoy = timezone.localdate()
+        if self._podado_el == hoy:
+            return
+        self._ultimos_cupos = {
+            clave: cupos for clave, cupos in self._ultimos_cupos.items()
+            if clave[1] is None or clave[1] >= hoy
+        }
+        self._podado_el = hoy
+
+    @staticmethod
+    def _encolar(cola, evento):
+        try:
+            cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            logger.warning("Conexión SSE saturada: se descarta un evento de disponibilidad")
+
+broker_disponibilidad = BrokerDisponibilidad()
+
+def cupos_en_vivo_habilitados(request):
+    """
+    Indica si la página puede abrir el stream SSE de cupos: requiere que el
+    request llegue por ASGI y que CUPOS_EN_VIVO_SSE esté activo.
+    """
+    return settings.CUPOS_EN_VIVO_SSE and isinstance(request, ASGIRequest)
+
+# ==============================================================================
+# PUBLICACIÓN DE CAMBIOS DE OCUPACIÓN
+# ==============================================================================
+
+def publicar_cambios_ocupacion(pares):
+    """
+    Calcula los cupos actuales de las clases/fechas modificadas y los publica.
+    Una consulta de ocupación por fecha distinta (normalmente una o dos).
+
+    Args:
+        pares: Iterable de (clase_id, fecha|None) que cambiaron
+    """
+    if not broker_disponibilidad.hay_suscriptores():
+        return
+
+    from .models import Clase
+    from .ocupacion_service import calcular_ocupacion
+
+    try:
+        por_fecha = {}
+        for clase_id, fecha in pares:
+            por_fecha.setdefault(fecha, set()).add(clase_id)
+
+        clases = Clase.objects.in_bulk(set().union(*por_fecha.values()))
+        for fecha, clase_ids in por_fecha.items():
+            seleccion = [clases[clase_id] for clase_id in clase_ids if clase_id in clases]
+            for clase_id, datos in calcular_ocupacion(seleccion, fecha=fecha).items():
+                broker_disponibilidad.publicar(clase_id, fecha, datos['cupos_disponibles'])
+    except Exception as e:
+        logger.error(f"Error publicando cambios de ocupación: {str(e)}")
+
+def notificar_cambios_ocupacion(pares):
+    """Programa la publicación para cuando se confirme la transacción actual."""
+    pares = set(pares)
+    if pares:
+        transaction.on_commit(lambda: publicar_cambios_ocupacion(pares))
@@ -0,0 +1,306 @@
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import DeudaMensual, MovimientoCuenta, PlanPago, RegistroPago, ResumenFinancieroMensual
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# RESUMEN FINANCIERO MENSUAL
+# ==============================================================================
+# ResumenFinancieroMensual guarda los totales de cada mes agrupados por plan,
+# tipo de pago y estado: lo cargado, lo pendiente y el descuento por efectivo
+# (desde DeudaMensual) y lo cobrado (desde RegistroPago). Los reportes leen ese
+# cubo, así una tendencia de 12 meses son unas pocas filas por mes en lugar de
+# recorrer todos los pagos y deudas. El comando actualizar_resumen_financiero
+# recalcula solo los meses que cambiaron desde la última actualización.
+
+MESES_TENDENCIA = 12
+
+def _mes(fecha):
+    return fecha.replace(day=1)
+
+def _mes_siguiente(mes):
+    return (mes + timedelta(days=32)).replace(day=1)
+
+def _rango_meses(campo, meses):
+    """Q que cubre las fechas de `campo` dentro de los meses dados (usa el índice de la fecha)."""
+    return reduce(or_, [
+        Q(**{f'{campo}__gte': mes, f'{campo}__lt': _mes_siguiente(mes)}) for mes in meses
+    ])
+
+def ultima_actualizacion():
+    """Inicio de la última actualización del resumen, o None si nunca se calculó."""
+    return ResumenFinancieroMensual.objects.aggregate(ultima=Max('fecha_actualizacion'))['ultima']
+
+def meses_con_datos():
+    """Todos los meses con deudas o pagos registrados."""
+    meses = set(
+        DeudaMensual.objects.annotate(mes=TruncMonth('mes_año')).order_by().values_list('mes', flat=True).distinct()
+    )
+    meses.update(
+        RegistroPago.objects.annotate(mes=TruncMonth('fecha_pago')).order_by().values_list('mes', flat=True).distinct()
+    )
+    return meses
+
+def meses_modificados(desde):
+    """
+    Meses cuyo resumen pudo cambiar desde `desde`:
+    - meses de los pagos creados o modificados
+    - meses de las deudas y pagos de clientes con movimientos de cuenta
+      (deudas generadas, ajustadas o pagadas, descuentos)
+    - meses de las deudas que vencieron en el período (el paso a 'vencido' no
+      deja movimiento)
+    - el mes en curso
+
+    Args:
+        desde: datetime de la última actualización
+
+    Returns:
+        set de date (día 1 de cada mes)
+    """
+    hoy = timezone.localtime(timezone.now()).date()
+    meses = {_mes(hoy)}
+
+    meses.update(
+        RegistroPago.objects.filter(fecha_modificacion__gte=desde).annotate(
+            mes=TruncMonth('fecha_pago')
+        ).order_by().values_list('mes', flat=True).distinct()
+    )
+
+    usuarios = MovimientoCuenta.objects.filter(fecha__gte=desde).values('usuario_id')
+    meses.update(
+        DeudaMensual.objects.filter(usuario_id__in=usuarios).annotate(
+            mes=TruncMonth('mes_año')
+        ).order_by().values_list('mes', flat=True).distinct()
+    )
+    meses.update(
+        RegistroPago.objects.filter(cliente_id__in=usuarios).annotate(
+            mes=TruncMonth('fecha_pago')
+        ).order_by().values_list('mes', flat=True).distinct()
+    )
+
+    meses.update(
+        DeudaMensual.objects.filter(
+            fecha_vencimiento__gte=timezone.localtime(desde).date() - timedelta(days=1),
+            fecha_vencimiento__lt=hoy
+        ).annotate(mes=TruncMonth('mes_año')).order_by().values_list('mes', flat=True).distinct()
+    )
+    return meses
+
+def calcular_resumen(meses):
+    """
+    Calcula las filas del resumen de los meses dados (4 consultas agrupadas).
+
+    Args:
+        meses: Iterable de date (día 1 de cada mes)
+
+    Returns:
+        list: ResumenFinancieroMensual sin guardar
+    """
+    meses = sorted(set(meses))
+    if not meses:
+        return []
+
+    filas = {}
+
+    def fila(mes, origen, plan_id, tipo_pago, estado):
+        clave = (mes, origen, plan_id, tipo_pago, estado)
+        if clave not in filas:
+            filas[clave] = ResumenFinancieroMensual(
+                mes=mes, origen=origen, plan_id=plan_id, tipo_pago=tipo_pago, estado=estado
+            )
+        return filas[clave]
+
+    # Deudas: cargado y pendiente por mes × plan × estado
+    deudas = DeudaMensual.objects.filter(_rango_meses('mes_año', meses)).annotate(
+        mes=TruncMonth('mes_año')
+    ).order_by().values('mes', 'plan_aplicado_id', 'estado').annotate(
+        total=Count('id'),
+        cargado=Sum('monto_original'),
+        pendiente=Sum('monto_pendiente'),
+    )
+    for grupo in deudas:
+        resumen = fila(grupo['mes'], 'deuda', grupo['plan_aplicado_id'], '', grupo['estado'])
+        resumen.cantidad = grupo['total']
+        resumen.monto_cargado = grupo['cargado'] or Decimal('0')
+        resumen.monto_pendiente = grupo['pendiente'] or Decimal('0')
+
+    # Descuentos por efectivo (movimientos de cuenta), en la fila de la deuda descontada
+    descuentos = MovimientoCuenta.objects.filter(
+        _rango_meses('deuda__mes_año', meses), tipo='descuento'
+    ).annotate(
+        mes=TruncMonth('deuda__mes_año')
+    ).order_by().values('mes', 'deuda__plan_aplicado_id', 'deuda__estado').annotate(total=Sum('monto'))
+    for grupo in descuentos:
+        resumen = fila(grupo['mes'], 'deuda', grupo['deuda__plan_aplicado_id'], '', grupo['deuda__estado'])
+        resumen.monto_descuento = grupo['total'] or Decimal('0')
+
+    # Pagos: cobrado por mes × plan (el de la deuda del cliente en ese mes) × tipo de pago × estado
+    plan_del_mes = DeudaMensual.objects.filter(
+        usuario_id=OuterRef('cliente_id'),
+        mes_año=OuterRef('mes')
+    ).order_by('es_medio_mes', '-id').values('plan_aplicado_id')[:1]
+    pagos = RegistroPago.objects.filter(_rango_meses('fecha_pago', meses)).annotate(
+        mes=TruncMonth('fecha_pago')
+    ).annotate(
+        plan_id=Subquery(plan_del_mes)
+    ).order_by().values('mes', 'plan_id', 'tipo_pago', 'estado').annotate(
+        total=Count('id'),
+        cobrado=Sum('monto'),
+    )
+    for grupo in pagos:
+        resumen = fila(grupo['mes'], 'pago', grupo['plan_id'], grupo['tipo_pago'], grupo['estado'])
+        resumen.cantidad = grupo['total']
+        resumen.monto_cobrado = grupo['cobrado'] or Decimal('0')
+
+    return list(filas.values())
+
+def actualizar_resumen_financiero(meses=None, completo=False, aplicar=True):
+    """
+    Recalcula el resumen financiero. Sin argumentos es incremental: solo los
+    meses modificados desde la última actualización (o todos, la primera vez).
+
+    Args:
+        meses: Recalcular exactamente estos meses (date, día 1)
+        completo: Reconstruir el resumen de todos los meses con datos
+        aplicar: False = solo calcular (dry-run)
+
+    Returns:
+        dict: {'meses': [date], 'filas': int, 'incremental': bool}
+    """
+    inicio = timezone.now()
+    ultima = ultima_actualizacion()
+    incremental = meses is None and not completo and ultima is not None
+
+    if meses is not None:
+        meses = {_mes(mes) for mes in meses}
+    elif incremental:
+        meses = meses_modificados(ultima)
+    else:
+        meses = meses_con_datos()
+
+    filas = calcular_resumen(meses)
+    for resumen in filas:
+        resumen.fecha_actualizacion = inicio
+
+    if aplicar:
+        with transaction.atomic():
+            if completo:
+                ResumenFinancieroMensual.objects.all().delete()
+            else:
+                ResumenFinancieroMensual.objects.filter(mes__in=meses).delete()
+            ResumenFinancieroMensual.objects.bulk_create(filas, batch_size=500)
+        logger.info(
+            f"Resumen financiero {'incremental' if incremental else 'completo'}: "
+            f"{len(meses)} meses, {len(filas)} filas"
+        )
+
+    return {'meses': sorted(meses), 'filas': len(filas), 'incremental': incremental}
+
+# ==============================================================================
+# LECTURA DEL RESUMEN (REPORTES)
+# ==============================================================================
+
+def tendencia_mensual(meses=MESES_TENDENCIA, hasta=None):
+    """
+    Totales por mes de los últimos `meses` meses, leídos del resumen.
+
+    Args:
+        meses: Cantidad de meses
+        hasta: Último mes incluido (por defecto, el mes en curso)
+
+    Returns:
+        list: [{'mes', 'cargado', 'cobrado', 'pendiente', 'descuento', 'deudas', 'pagos'}]
+        en orden cronológico, con ceros en los meses sin datos
+    """
+    hasta = _mes(hasta or timezone.localtime(timezone.now()).date())
+    lista_meses = [hasta]
+    for _ in range(meses - 1):
+        lista_meses.insert(0, _mes(lista_meses[0] - timedelta(days=1)))
+
+    totales = {
+        grupo['mes']: grupo
+        for grupo in ResumenFinancieroMensual.objects.filter(
+            mes__gte=lista_meses[0], mes__lte=hasta
+        ).order_by().values('mes').annotate(
+            cargado=Sum('monto_cargado', filter=Q(origen='deuda')),
+            pendiente=Sum('monto_pendiente', filter=Q(origen='deuda')),
+            descuento=Sum('monto_descuento', filter=Q(origen='deuda')),
+            cobrado=Sum('monto_cobrado', filter=Q(origen='pago', estado='confirmado')),
+            deudas=Sum('cantidad', filter=Q(origen='deuda')),
+            pagos=Sum('cantidad', filter=Q(origen='pago', estado='confirmado')),
+        )
+    }
+
+    tendencia = []
+    for mes in lista_meses:
+        grupo = totales.get(mes, {})
+        tendencia.append({
+            'mes': mes,
+            'cargado': grupo.get('cargado') or Decimal('0'),
+            'cobrado': grupo.get('cobrado') or Decimal('0'),
+            'pendiente': grupo.get('pendiente') or Decimal('0'),
+            'descuento': grupo.get('descuento') or Decimal('0'),
+            'deudas': grupo.get('deudas') or 0,
+            'pagos': grupo.get('pagos') or 0,
+        })
+    return tendencia
+
+def desglose_por_plan(desde, hasta):
+    """
+    Cargado, cobrado y pendiente por plan entre dos meses (inclusive).
+
+    Returns:
+        list: [{'plan', 'cargado', 'cobrado', 'pendiente', 'descuento'}] de mayor a menor cargado
+    """
+    grupos = ResumenFinancieroMensual.objects.filter(
+        mes__gte=_mes(desde), mes__lte=_mes(hasta)
+    ).order_by().values('plan_id').annotate(
+        cargado=Sum('monto_cargado', filter=Q(origen='deuda')),
+        pendiente=Sum('monto_pendiente', filter=Q(origen='deuda')),
+        descuento=Sum('monto_descuento', filter=Q(origen='deuda')),
+        cobrado=Sum('monto_cobrado', filter=Q(origen='pago', estado='confirmado')),
+    )
+    nombres = dict(PlanPago.objects.values_list('id', 'nombre'))
+    desglose = [
+        {
+            'plan': nombres.get(grupo['plan_id'], 'Sin plan'),
+            'cargado': grupo['cargado'] or Decimal('0'),
+            'cobrado': grupo['cobrado'] or Decimal('0'),
+            'pendiente': grupo['pendiente'] or Decimal('0'),
+            'descuento': grupo['descuento'] or Decimal('0'),
+        }
+        for grupo in grupos
+    ]
+    return sorted(desglose, key=lambda fila: (-fila['cargado'], -fila['cobrado'], fila['plan']))
+
+def desglose_por_tipo_pago(desde, hasta):
+    """
+    Cobrado (pagos confirmados) por tipo de pago entre dos meses (inclusive).
+
+    Returns:
+        list: [{'tipo_pago', 'nombre', 'cobrado', 'pagos'}] de mayor a menor cobrado
+    """
+    nombres = dict(RegistroPago.TIPOS_PAGO)
+    grupos = ResumenFinancieroMensual.objects.filter(
+        mes__gte=_mes(desde), mes__lte=_mes(hasta), origen='pago', estado='confirmado'
+    ).order_by().values('tipo_pago').annotate(
+        cobrado=Sum('monto_cobrado'),
+        pagos=Sum('cantidad'),
+    ).order_by('-cobrado')
+    return [
+        {
+            'tipo_pago': grupo['tipo_pago'],
+            'nombre': nombres.get(grupo['tipo_pago'], grupo['tipo_pago']),
+            'cobrado': grupo['cobrado'] or Decimal('0'),
+            'pagos': grupo['pagos'] or 0,
+        }
+        for grupo in grupos
+    ]
@@ -8,6 +8,7 @@ from django.core.validators import RegexValidator
 import re
 from .models import PlanPago, EstadoPagoCliente, RegistroPago
 from decimal import Decimal
+from .elegibilidad_service import evaluar_elegibilidad_reserva
 from django.utils import timezone
 
 
@@ -70,6 +71,8 @@ class ReservaForm(forms.Form):
     
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)  # Usuario actual
+        self.request = kwargs.pop('request', None)  # Para compartir la elegibilidad con la vista
+        self.elegibilidad = None
         super().__init__(*args, **kwargs)
         
         # Obtener tipos únicos de clases activas disponibles
@@ -142,16 +145,17 @@ class ReservaForm(forms.Form):
                 horario_obj = datetime.strptime(horario, '%H:%M').time()
                 horario_str = horario_obj.strftime('%H:%M')
                 
-                # Buscar la clase correspondiente
-                try:
-                    clase = Clase.objects.get(
-                        tipo=tipo_clase,
-                        dia=dia,
-                        horario=horario_obj,
-                        direccion=sede,
-                        activa=True
-                    )
-                except Clase.DoesNotExist:
+                # Clase, cuota del plan, duplicados y cupos de la próxima fecha en una sola consulta
+                self.elegibilidad = evaluar_elegibilidad_reserva(
+                    self.user,
+                    tipo=tipo_clase,
+                    dia=dia,
+                    horario=horario_obj,
+                    sede=sede,
+                    request=self.request
+                )
+                clase = self.elegibilidad['clase']
+                if clase is None:
                     sede_display = dict(Clase.DIRECCIONES).get(sede, sede)
                     raise ValidationError(
                         f'No existe una clase de {tipo_clase} los {dia} a las {horario_str} '
@@ -159,44 +163,20 @@ class ReservaForm(forms.Form):
                     )
                 
                 # **NUEVA VALIDACIÓN DE PLANES**
-                puede_reservar, mensaje = Reserva.usuario_puede_reservar(self.user, clase)
-                if not puede_reservar:
-                    raise ValidationError(mensaje)
-                
-                # Verificar cupos disponibles para la próxima fecha real de la clase
-                ahora_form = timezone.localtime(timezone.now())
-                hoy_form = ahora_form.date()
-                dias_map_form = {
-                    'Lunes': 0, 'Martes': 1, 'Miércoles': 2,
-                    'Jueves': 3, 'Viernes': 4, 'Sábado': 5
-                }
-                dia_num_form = dias_map_form.get(clase.dia, 0)
-                dias_hasta_form = (dia_num_form - hoy_form.weekday()) % 7
-                if dias_hasta_form == 0:
-                    clase_hoy_form = ahora_form.replace(
-                        hour=clase.horario.hour,
-                        minute=clase.horario.minute,
-                        second=0, microsecond=0
-                    )
-                    if ahora_form >= clase_hoy_form - timedelta(hours=3):
-                        dias_hasta_form = 7
-                proxima_fecha_form = hoy_form + timedelta(days=dias_hasta_form)
+                if not self.elegibilidad['puede_reservar']:
+                    raise ValidationError(self.elegibilidad['mensaje'])
 
-                if clase.cupos_disponibles(fecha=proxima_fecha_form) <= 0:
+                if self.elegibilidad['duplicado']:
                     raise ValidationError(
-                        f'La clase de {clase.get_nombre_display()} los {dia} a las {horario_str} '
-                        f'en {clase.get_direccion_corta()} está completa. No hay cupos disponibles.'
+                        'Ya tienes una reserva activa para esta clase. '
+                        'Cancela la reserva actual antes de crear una nueva.'
                     )
                 
-                # Verificar duplicados
-                if Reserva.objects.filter(
-                    usuario=self.user, 
-                    clase=clase, 
-                    activa=True
-                ).exists():
+                # Cupos disponibles para la próxima fecha real de la clase
+                if self.elegibilidad['cupos_disponibles'] <= 0:
                     raise ValidationError(
-                        'Ya tienes una reserva activa para esta clase. '
-                        'No puedes reservar la misma clase dos veces.'
+                        f'La clase de {clase.get_nombre_display()} los {dia} a las {horario_str} '
+                        f'en {clase.get_direccion_corta()} está completa. No hay cupos disponibles.'
                     )
                 
                 # Agregar la clase al cleaned_data para usar en la vista
@@ -0,0 +1,83 @@
+"""
+Comando Django: actualizar_resumen_financiero
+Recalcula el resumen financiero mensual (ResumenFinancieroMensual) que usan los
+reportes de pagos. Por defecto es incremental: solo recalcula los meses con
+pagos, deudas o movimientos de cuenta nuevos desde la última actualización.
+Se recomienda ejecutarlo todas las noches mediante un cron job.
+
+Uso:
+    python manage.py actualizar_resumen_financiero [--dry-run]
+    python manage.py actualizar_resumen_financiero --completo
+    python manage.py actualizar_resumen_financiero --mes 2025-01 2025-02
+"""
+
+from datetime import datetime
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gravity.finanzas_service import actualizar_resumen_financiero, ultima_actualizacion
+
+
+class Command(BaseCommand):
+    help = 'Actualiza el resumen financiero mensual de deudas y pagos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--completo',
+            action='store_true',
+            help='Reconstruir el resumen de todos los meses',
+        )
+        parser.add_argument(
+            '--mes',
+            nargs='+',
+            help='Recalcular solo estos meses (formato YYYY-MM)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo calcular, sin guardar el resumen',
+        )
+
+    def handle(self, *args, **options):
+        meses = None
+        if options['mes']:
+            try:
+                meses = [datetime.strptime(mes, '%Y-%m').date() for mes in options['mes']]
+            except ValueError:
+                raise CommandError('Formato de mes inválido. Usar YYYY-MM (ej: 2025-01)')
+
+        ultima = ultima_actualizacion()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'ACTUALIZACIÓN DEL RESUMEN FINANCIERO MENSUAL\n'
+                f'{"="*70}\n'
+                f'Última actualización: {ultima.strftime("%d/%m/%Y %H:%M") if ultima else "nunca"}\n'
+                f'Modo: {"SIMULACIÓN (dry-run)" if options["dry_run"] else "PRODUCCIÓN"}\n'
+                f'{"="*70}\n'
+            )
+        )
+
+        comienzo = perf_counter()
+        resultado = actualizar_resumen_financiero(
+            meses=meses,
+            completo=options['completo'],
+            aplicar=not options['dry_run']
+        )
+        segundos = perf_counter() - comienzo
+
+        tipo = 'incremental' if resultado['incremental'] else ('por mes' if meses else 'completa')
+        self.stdout.write(f'🔄 Actualización:        {tipo}')
+        self.stdout.write(f'📅 Meses recalculados:   {len(resultado["meses"])}')
+        if resultado['meses']:
+            self.stdout.write(
+                f'   {", ".join(mes.strftime("%m/%Y") for mes in resultado["meses"])}'
+            )
+        self.stdout.write(f'🧮 Filas del resumen:    {resultado["filas"]}')
+        self.stdout.write(f'⏱️ Tiempo total:         {segundos:.2f}s')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('\n[DRY-RUN] No se modificó el resumen.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('\n✅ Resumen financiero actualizado.'))
@@ -0,0 +1,150 @@
+"""
+Comando Django: benchmark_numero_reserva
+Mide el costo del generador de números de reserva (gravity/numeracion_service.py)
+y verifica que no repita códigos.
+
+1. Genera N códigos en memoria (por defecto 1.000.000) e informa el costo por tramo:
+   el costo no depende de cuántos números se hayan emitido antes, porque no se
+   consulta la tabla de reservas.
+2. Pide números reales a la base (dentro de una transacción que se deshace)
+   e informa cuántas consultas cuesta cada uno.
+
+Uso:
+    python manage.py benchmark_numero_reserva [--cantidad N] [--tramo N] [--desde N] [--muestras-db N]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+import re
+import time as reloj
+
+from gravity.numeracion_service import (
+    CANTIDAD_NUMEROS_RESERVA,
+    LONGITUD_NUMERO_RESERVA,
+    _clave_permutacion,
+    numero_reserva_para_valor,
+    siguiente_numero_reserva,
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark del generador de números de reserva (costo constante, sin colisiones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cantidad',
+            type=int,
+            default=1_000_000,
+            help='Cantidad de códigos a generar en memoria',
+        )
+        parser.add_argument(
+            '--tramo',
+            type=int,
+            default=100_000,
+            help='Cada cuántos códigos informar el costo',
+        )
+        parser.add_argument(
+            '--desde',
+            type=int,
+            default=0,
+            help='Valor inicial del contador (para medir con la secuencia avanzada)',
+        )
+        parser.add_argument(
+            '--muestras-db',
+            type=int,
+            default=1000,
+            help='Cantidad de números a pedir a la base de datos',
+        )
+
+    def handle(self, *args, **options):
+        cantidad = options['cantidad']
+        tramo = options['tramo']
+        desde = options['desde']
+        if cantidad < 1 or tramo < 1 or desde < 0:
+            raise CommandError('--cantidad y --tramo deben ser mayores a 0, y --desde no negativo')
+        if desde + cantidad > CANTIDAD_NUMEROS_RESERVA:
+            raise CommandError(f'El rango supera los {CANTIDAD_NUMEROS_RESERVA} códigos posibles')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'BENCHMARK DE NÚMEROS DE RESERVA\n'
+                f'{"="*70}\n'
+                f'Códigos en memoria: {cantidad:,} (contador desde {desde:,})\n'
+                f'Base de datos: {connection.vendor}\n'
+                f'{"="*70}\n'
+            )
+        )
+
+        # ------------------------------------------------------------------
+        # 1. Generación en memoria
+        # ------------------------------------------------------------------
+        clave = _clave_permutacion()
+        formato = re.compile(rf'^[0-9A-Z]{{{LONGITUD_NUMERO_RESERVA}}}$')
+        vistos = set()
+        invalidos = 0
+        costos = []
+
+        inicio_total = reloj.perf_counter()
+        for inicio_tramo in range(desde, desde + cantidad, tramo):
+            fin_tramo = min(inicio_tramo + tramo, desde + cantidad)
+            inicio = reloj.perf_counter()
+            codigos = [numero_reserva_para_valor(valor, clave) for valor in range(inicio_tramo, fin_tramo)]
+            duracion = reloj.perf_counter() - inicio
+
+            vistos.update(codigos)
+            invalidos += sum(1 for codigo in codigos if not formato.match(codigo))
+            costo = duracion / len(codigos) * 1_000_000
+            costos.append(costo)
+            self.stdout.write(
+                f'  📊 {fin_tramo - desde:>12,} códigos | {costo:6.2f} µs/código'
+            )
+        duracion_total = reloj.perf_counter() - inicio_total
+
+        repetidos = cantidad - len(vistos)
+        variacion = (max(costos) - min(costos)) / min(costos) * 100 if min(costos) else 0
+
+        # ------------------------------------------------------------------
+        # 2. Números reales desde la base (la transacción se deshace)
+        # ------------------------------------------------------------------
+        muestras_db = options['muestras_db']
+        consultas = 0
+        duracion_db = 0
+        if muestras_db > 0:
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as capturadas:
+                    inicio = reloj.perf_counter()
+                    for _ in range(muestras_db):
+                        siguiente_numero_reserva()
+                    duracion_db = reloj.perf_counter() - inicio
+                consultas = len(capturadas)
+                transaction.set_rollback(True)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'RESUMEN\n'
+                f'{"="*70}\n'
+                f'🔢 Códigos generados:          {cantidad:,}\n'
+                f'♻️  Códigos repetidos:          {repetidos}\n'
+                f'❌ Códigos con formato inválido: {invalidos}\n'
+                f'⏱️  Costo por código:           {min(costos):.2f} – {max(costos):.2f} µs '
+                f'(variación {variacion:.1f}%)\n'
+                f'⏱️  Duración total:             {duracion_total:.2f} s\n'
+            )
+        )
+        if muestras_db > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'🗄️  Números pedidos a la base:  {muestras_db:,}\n'
+                    f'🗄️  Consultas por número:       {consultas / muestras_db:.2f} '
+                    f'(ninguna busca en la tabla de reservas)\n'
+                    f'🗄️  Costo por número:           {duracion_db / muestras_db * 1_000_000:.1f} µs\n'
+                )
+            )
+        self.stdout.write(self.style.SUCCESS(f'{"="*70}\n'))
+
+        if repetidos or invalidos:
+            raise CommandError('El generador produjo códigos repetidos o inválidos')
+        self.stdout.write(self.style.SUCCESS('✅ Sin colisiones.'))
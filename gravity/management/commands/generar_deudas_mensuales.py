@@ -2,23 +2,28 @@
 Comando Django: generar_deudas_mensuales
 Genera automáticamente las deudas mensuales para todos los usuarios con planes activos.
 Se debe ejecutar el día 1 de cada mes mediante un cron job.
+Procesa los clientes por lotes (una transacción por lote): si se interrumpe,
+volver a ejecutarlo continúa con los clientes que quedaron sin deuda.
 
 Uso:
-    python manage.py generar_deudas_mensuales [--mes YYYY-MM] [--force]
+    python manage.py generar_deudas_mensuales [--mes YYYY-MM] [--force] [--lote N] [--dry-run]
 
 Opciones:
     --mes YYYY-MM : Generar deudas para un mes específico (por defecto: mes actual)
     --force       : Regenerar deudas incluso si ya existen (usar con precaución)
+    --lote N      : Clientes por lote (por defecto 500)
+    --dry-run     : Simular sin hacer cambios en la base de datos
+    -v 2          : Mostrar el detalle por cliente
 """
 
 from django.core.management.base import BaseCommand, CommandError
-from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db import transaction
 from datetime import date, datetime
 from decimal import Decimal
+from time import perf_counter
 
-from gravity.models import EstadoPagoCliente, DeudaMensual, PlanPago
+from gravity.deudas_service import TAMAÑO_LOTE_DEUDAS, generar_deudas_mes
+from gravity.models import EstadoPagoCliente
 
 
 class Command(BaseCommand):
@@ -35,6 +40,12 @@ class Command(BaseCommand):
             action='store_true',
             help='Forzar generación incluso si ya existen deudas para el mes',
         )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMAÑO_LOTE_DEUDAS,
+            help=f'Clientes por lote, cada uno en su propia transacción (por defecto {TAMAÑO_LOTE_DEUDAS})',
+        )
         parser.add_argument(
             '--dry-run',
             action='store_true',
@@ -53,6 +64,9 @@ class Command(BaseCommand):
             hoy = timezone.now().date()
             primer_dia_mes = date(hoy.year, hoy.month, 1)
 
+        if options['lote'] < 1:
+            raise CommandError('El tamaño de lote debe ser mayor a cero.')
+
         # Fecha de vencimiento: día 10 del mes
         fecha_vencimiento = date(primer_dia_mes.year, primer_dia_mes.month, 10)
 
@@ -68,11 +82,11 @@ class Command(BaseCommand):
             )
         )
 
-        # Obtener usuarios con planes activos
+        # Clientes con plan: los que ya tienen la deuda del mes se saltean (salvo --force)
         estados_con_plan = EstadoPagoCliente.objects.filter(
             plan_actual__isnull=False,
             activo=True
-        ).select_related('usuario', 'plan_actual')
+        )
 
         if not estados_con_plan.exists():
             self.stdout.write(
@@ -80,74 +94,49 @@ class Command(BaseCommand):
             )
             return
 
+        deudas_existentes = 0 if options['force'] else estados_con_plan.filter(
+            usuario__deudas_mensuales__mes_año=primer_dia_mes
+        ).count()
+
         deudas_generadas = 0
-        deudas_existentes = 0
+        deudas_reemplazadas = 0
         errores = 0
         monto_total_generado = Decimal('0')
-
-        for estado_cliente in estados_con_plan:
-            usuario = estado_cliente.usuario
-            plan = estado_cliente.plan_actual
-
-            try:
-                # Verificar si ya existe una deuda para este mes
-                deuda_existente = DeudaMensual.objects.filter(
-                    usuario=usuario,
-                    mes_año=primer_dia_mes
-                ).first()
-
-                if deuda_existente and not options['force']:
-                    deudas_existentes += 1
-                    self.stdout.write(
-                        f'  ⏭️  {usuario.username:20s} | Ya tiene deuda del mes (${deuda_existente.monto_original})'
-                    )
-                    continue
-
-                # Calcular monto a cobrar
-                monto_a_cobrar = plan.precio_mensual
-
-                if not options['dry_run']:
-                    with transaction.atomic():
-                        # Si existe y es force, eliminar la anterior
-                        if deuda_existente and options['force']:
-                            deuda_existente.delete()
-
-                        # Crear nueva deuda
-                        nueva_deuda = DeudaMensual.objects.create(
-                            usuario=usuario,
-                            mes_año=primer_dia_mes,
-                            plan_aplicado=plan,
-                            monto_original=monto_a_cobrar,
-                            monto_pendiente=monto_a_cobrar,
-                            es_medio_mes=False,
-                            estado='pendiente',
-                            fecha_vencimiento=fecha_vencimiento,
-                            observaciones=f'Deuda mensual generada automáticamente - Plan: {plan.nombre}'
+        detallar = options['verbosity'] >= 2
+        comienzo = perf_counter()
+
+        try:
+            for lote in generar_deudas_mes(
+                primer_dia_mes,
+                tamaño_lote=options['lote'],
+                force=options['force'],
+                aplicar=not options['dry_run'],
+            ):
+                deudas_generadas += lote['generadas']
+                deudas_reemplazadas += lote['reemplazadas']
+                monto_total_generado += lote['monto']
+
+                if detallar:
+                    for username, monto, plan_nombre, reemplazada in lote['detalle']:
+                        self.stdout.write(
+                            self.style.SUCCESS(
+                                f'  ✅ {username:20s} | ${monto:>8.2f} | Plan: {plan_nombre}'
+                                f'{" (reemplaza la anterior)" if reemplazada else ""}'
+                            )
                         )
-
-                        # Actualizar estado del cliente
-                        estado_cliente.saldo_actual -= monto_a_cobrar
-                        estado_cliente.monto_deuda_mensual = monto_a_cobrar
-                        estado_cliente.fecha_limite_pago = fecha_vencimiento
-                        estado_cliente.puede_reservar = True  # Empieza el mes pudiendo reservar
-                        estado_cliente.save()
-
-                deudas_generadas += 1
-                monto_total_generado += monto_a_cobrar
-
                 self.stdout.write(
-                    self.style.SUCCESS(
-                        f'  ✅ {usuario.username:20s} | ${monto_a_cobrar:>8.2f} | Plan: {plan.nombre}'
-                    )
+                    f'  📦 Lote {lote["lote"]:>4d} | {lote["generadas"]:>5d} deudas | '
+                    f'{lote["segundos"]:.2f}s'
                 )
-
-            except Exception as e:
-                errores += 1
-                self.stdout.write(
-                    self.style.ERROR(
-                        f'  ❌ {usuario.username:20s} | Error: {str(e)}'
-                    )
+        except Exception as e:
+            # Los lotes ya confirmados quedan guardados: volver a ejecutar retoma desde acá
+            errores += 1
+            self.stdout.write(
+                self.style.ERROR(
+                    f'  ❌ Error en el lote siguiente: {str(e)}\n'
+                    f'     Los lotes anteriores quedaron guardados; vuelva a ejecutar el comando para continuar.'
                 )
+            )
 
         # Resumen final
         self.stdout.write(
@@ -156,9 +145,11 @@ class Command(BaseCommand):
                 f'RESUMEN\n'
                 f'{"="*70}\n'
                 f'✅ Deudas generadas:     {deudas_generadas}\n'
+                f'🔁 Deudas reemplazadas:  {deudas_reemplazadas}\n'
                 f'⏭️  Deudas ya existentes: {deudas_existentes}\n'
                 f'❌ Errores:              {errores}\n'
                 f'💰 Monto total generado: ${monto_total_generado:,.2f}\n'
+                f'⏱️  Tiempo total:         {perf_counter() - comienzo:.2f}s\n'
                 f'{"="*70}\n'
             )
         )
@@ -0,0 +1,64 @@
+"""
+Comando Django: generar_ocurrencias
+Genera el calendario materializado de clases (ClaseOcurrencia) desde hoy
+hasta N semanas adelante y elimina las fechas futuras de clases inactivas
+o que cambiaron de día. Se recomienda ejecutarlo diariamente mediante un cron job.
+
+Uso:
+    python manage.py generar_ocurrencias [--semanas N] [--dry-run] [--clase ID ...]
+"""
+
+from django.core.management.base import BaseCommand
+
+from gravity.calendario_service import SEMANAS_CALENDARIO, generar_ocurrencias
+
+
+class Command(BaseCommand):
+    help = 'Genera las fechas concretas de las clases para las próximas semanas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--semanas',
+            type=int,
+            default=SEMANAS_CALENDARIO,
+            help=f'Semanas hacia adelante a generar (por defecto {SEMANAS_CALENDARIO})',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo informar qué cambiaría, sin modificar la tabla',
+        )
+        parser.add_argument(
+            '--clase',
+            type=int,
+            nargs='+',
+            help='Limitar la generación a estos IDs de clase',
+        )
+
+    def handle(self, *args, **options):
+        resultado = generar_ocurrencias(
+            semanas=options['semanas'],
+            clase_ids=options['clase'],
+            aplicar=not options['dry_run'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'CALENDARIO DE CLASES\n'
+                f'{"="*70}\n'
+                f'Período: {resultado["desde"].strftime("%d/%m/%Y")} al {resultado["hasta"].strftime("%d/%m/%Y")}\n'
+                f'Modo: {"SIMULACIÓN (dry-run)" if options["dry_run"] else "PRODUCCIÓN"}\n'
+                f'{"="*70}\n'
+            )
+        )
+        self.stdout.write(f'📅 Ocurrencias creadas:      {resultado["creadas"]}')
+        self.stdout.write(f'🕒 Horarios actualizados:    {resultado["actualizadas"]}')
+        self.stdout.write(f'🗑️  Ocurrencias eliminadas:   {resultado["eliminadas"]}')
+
+        if not any((resultado['creadas'], resultado['actualizadas'], resultado['eliminadas'])):
+            self.stdout.write(self.style.SUCCESS('\n✅ El calendario ya estaba al día.'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING('\n[DRY-RUN] No se modificó la tabla.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('\n✅ Calendario actualizado.'))
@@ -8,12 +8,15 @@ Uso:
     python manage.py limpiar_reservas_fecha_unica [--dry-run]
 """
 
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
 
-from gravity.models import Reserva
+from gravity.calendario_service import generar_ocurrencias
+from gravity.models import ClaseOcurrencia, Reserva
+from gravity.ocupacion_service import reconstruir_ocupacion
 
 
 class Command(BaseCommand):
@@ -30,36 +33,26 @@ class Command(BaseCommand):
         ahora = timezone.localtime(timezone.now())
         hoy = ahora.date()
 
-        # Reservas de fecha única de días anteriores (siempre vencidas)
-        anteriores = Reserva.objects.filter(activa=True, fecha_unica__lt=hoy)
+        # Asegura que las ocurrencias de hoy estén en el calendario
+        generar_ocurrencias(semanas=1, desde=hoy, aplicar=not options['dry_run'])
 
-        # Reservas de fecha única de hoy cuyo horario pasó hace más de 1 hora
-        candidatas_hoy = Reserva.objects.filter(
-            activa=True,
-            fecha_unica=hoy,
-        ).select_related('clase')
-
-        ids_vencidas_hoy = [
-            r.id for r in candidatas_hoy
-            if ahora >= timezone.make_aware(
-                datetime.combine(hoy, r.clase.horario)
-            ) + timedelta(hours=1)
-        ]
-
-        total = anteriores.count() + len(ids_vencidas_hoy)
+        # Vencidas: de días anteriores, o de hoy cuya clase empezó hace más de 1 hora
+        # (se cruza con la fecha real de la clase en ClaseOcurrencia)
+        vencidas = Reserva.objects.filter(activa=True, fecha_unica__lte=hoy).filter(
+            Q(fecha_unica__lt=hoy) |
+            Q(Exists(ClaseOcurrencia.objects.filter(
+                clase=OuterRef('clase'),
+                fecha=OuterRef('fecha_unica'),
+                inicio__lte=ahora - timedelta(hours=1),
+            )))
+        ).select_related('usuario', 'clase')
 
         if options['dry_run']:
+            vencidas = list(vencidas)
             self.stdout.write(self.style.WARNING(
-                f'[DRY-RUN] Se cancelarían {total} reserva(s) de fecha única:'
+                f'[DRY-RUN] Se cancelarían {len(vencidas)} reserva(s) de fecha única:'
             ))
-            for r in anteriores:
-                self.stdout.write(
-                    f'  - {r.usuario.get_full_name()} | {r.clase.get_nombre_display()} '
-                    f'{r.clase.dia} {r.clase.horario.strftime("%H:%M")} | '
-                    f'fecha_unica={r.fecha_unica} | '
-                    f'{"recupero" if r.es_recupero else "clase única"}'
-                )
-            for r in candidatas_hoy.filter(id__in=ids_vencidas_hoy):
+            for r in vencidas:
                 self.stdout.write(
                     f'  - {r.usuario.get_full_name()} | {r.clase.get_nombre_display()} '
                     f'{r.clase.dia} {r.clase.horario.strftime("%H:%M")} | '
@@ -68,13 +61,18 @@ class Command(BaseCommand):
                 )
             return
 
+        filas = list(vencidas.values_list('id', 'clase_id'))
+        total = len(filas)
+
         if total == 0:
             self.stdout.write('No hay reservas de fecha única vencidas.')
             return
 
-        anteriores.update(activa=False)
-        if ids_vencidas_hoy:
-            Reserva.objects.filter(id__in=ids_vencidas_hoy).update(activa=False)
+        clases_afectadas = {clase_id for _, clase_id in filas}
+        Reserva.objects.filter(id__in=[reserva_id for reserva_id, _ in filas]).update(activa=False)
+
+        # update() no dispara señales: recalcular la ocupación de las clases afectadas
+        reconstruir_ocupacion(list(clases_afectadas))
 
         self.stdout.write(self.style.SUCCESS(
             f'✅ {total} reserva(s) de fecha única canceladas.'
@@ -0,0 +1,111 @@
+"""
+Comando Django: procesar_tareas
+Procesa la cola de tareas en segundo plano (TareaPendiente): actualización de
+estado de pago, plan y deuda del mes después de cambios en las reservas.
+Las tareas del mismo usuario dentro de un lote se resuelven una sola vez.
+
+Uso:
+    python manage.py procesar_tareas [--lote N] [--continuo] [--intervalo SEG] [--purgar-dias N]
+
+Ejemplos:
+    # Cron cada minuto: vaciar la cola y terminar
+    * * * * * python manage.py procesar_tareas
+
+    # Worker permanente (systemd/supervisor)
+    python manage.py procesar_tareas --continuo --intervalo 5
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+import time as reloj
+
+from gravity.tareas_service import (
+    liberar_tareas_abandonadas,
+    procesar_lote,
+    purgar_tareas_completadas,
+)
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de tareas en segundo plano (estado de pago por reservas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=100,
+            help='Cantidad máxima de tareas por lote',
+        )
+        parser.add_argument(
+            '--continuo',
+            action='store_true',
+            help='No terminar al vaciar la cola: seguir esperando tareas nuevas',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5,
+            help='Segundos de espera entre consultas cuando la cola está vacía (con --continuo)',
+        )
+        parser.add_argument(
+            '--purgar-dias',
+            type=int,
+            default=7,
+            help='Eliminar tareas completadas hace más de N días (0 = no purgar)',
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor a 0')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'PROCESAMIENTO DE TAREAS EN SEGUNDO PLANO\n'
+                f'{"="*70}\n'
+                f'Lote: {options["lote"]} | Modo: {"CONTINUO" if options["continuo"] else "vaciar y terminar"}\n'
+                f'{"="*70}\n'
+            )
+        )
+
+        liberadas = liberar_tareas_abandonadas()
+        if liberadas:
+            self.stdout.write(self.style.WARNING(f'  ⚠️  {liberadas} tarea(s) abandonada(s) devuelta(s) a la cola'))
+
+        totales = {'tareas': 0, 'grupos': 0, 'completadas': 0, 'reintentos': 0, 'errores': 0}
+        try:
+            while True:
+                resultado = procesar_lote(options['lote'])
+                for clave, valor in resultado.items():
+                    totales[clave] += valor
+
+                if resultado['tareas']:
+                    self.stdout.write(
+                        f'  ⚙️  Lote: {resultado["tareas"]} tarea(s) en {resultado["grupos"]} grupo(s) | '
+                        f'✅ {resultado["completadas"]} | 🔁 {resultado["reintentos"]} | ❌ {resultado["errores"]}'
+                    )
+                    continue
+
+                if not options['continuo']:
+                    break
+                close_old_connections()
+                reloj.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\n⚠️  Interrumpido por el usuario.'))
+
+        purgadas = purgar_tareas_completadas(options['purgar_dias']) if options['purgar_dias'] > 0 else 0
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'RESUMEN\n'
+                f'{"="*70}\n'
+                f'📥 Tareas tomadas:          {totales["tareas"]}\n'
+                f'🧩 Grupos (usuario/tipo):   {totales["grupos"]}\n'
+                f'✅ Completadas:             {totales["completadas"]}\n'
+                f'🔁 Reintentos pendientes:   {totales["reintentos"]}\n'
+                f'❌ Con error definitivo:    {totales["errores"]}\n'
+                f'🗑️  Completadas purgadas:    {purgadas}\n'
+                f'{"="*70}\n'
+            )
+        )
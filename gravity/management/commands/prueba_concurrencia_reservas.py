@@ -0,0 +1,160 @@
+"""
+Comando Django: prueba_concurrencia_reservas
+Prueba de estrés del circuito de reservas: muchos hilos intentan reservar a la vez
+la misma clase y se verifica que nunca se reserven más lugares que el cupo máximo.
+Crea una clase y usuarios temporales y los elimina al terminar.
+NO ejecutar contra la base de producción.
+
+Uso:
+    python manage.py prueba_concurrencia_reservas [--hilos N] [--cupo N] [--fecha-unica] [--sin-bloqueo]
+
+Opciones:
+    --hilos N      : Cantidad de usuarios reservando en simultáneo (por defecto: 30)
+    --cupo N       : Cupo máximo de la clase de prueba (por defecto: 5)
+    --fecha-unica  : Reservar un cupo de fecha única en lugar de uno permanente
+    --sin-bloqueo  : Usar el circuito viejo (verificar cupos y después crear) para comparar
+"""
+
+from datetime import time, timedelta
+from threading import Barrier, Lock, Thread
+import time as reloj
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from gravity.models import Clase, Reserva, NUMERO_DIA_SEMANA
+from gravity.ocupacion_service import reservar_cupo
+
+
+class Command(BaseCommand):
+    help = 'Prueba de estrés: reservas concurrentes sobre una misma clase, sin sobreventa'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=30,
+            help='Cantidad de usuarios reservando en simultáneo',
+        )
+        parser.add_argument(
+            '--cupo',
+            type=int,
+            default=5,
+            help='Cupo máximo de la clase de prueba',
+        )
+        parser.add_argument(
+            '--fecha-unica',
+            action='store_true',
+            help='Reservar un cupo de fecha única en lugar de uno permanente',
+        )
+        parser.add_argument(
+            '--sin-bloqueo',
+            action='store_true',
+            help='Usar el circuito sin bloqueo (verificar y después crear) para comparar',
+        )
+
+    def handle(self, *args, **options):
+        hilos = options['hilos']
+        cupo = options['cupo']
+        if hilos < 1 or cupo < 1:
+            raise CommandError('--hilos y --cupo deben ser mayores a 0')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'PRUEBA DE CONCURRENCIA DE RESERVAS\n'
+                f'{"="*70}\n'
+                f'Hilos: {hilos} | Cupo: {cupo} | '
+                f'Tipo: {"fecha única" if options["fecha_unica"] else "permanente"}\n'
+                f'Modo: {"SIN BLOQUEO (circuito anterior)" if options["sin_bloqueo"] else "reservar_cupo()"}\n'
+                f'{"="*70}\n'
+            )
+        )
+
+        sufijo = get_random_string(6).lower()
+        clase = Clase.objects.create(
+            tipo='Especial',
+            nombre_personalizado=f'Prueba de concurrencia {sufijo}',
+            dia='Sábado',
+            horario=time(21, 0),
+            cupo_maximo=cupo,
+        )
+        usuarios = [
+            User.objects.create_user(username=f'stress_{sufijo}_{i}', password=None)
+            for i in range(hilos)
+        ]
+
+        fecha_unica = None
+        if options['fecha_unica']:
+            hoy = timezone.localtime(timezone.now()).date()
+            dias_hasta = (NUMERO_DIA_SEMANA[clase.dia] - hoy.weekday()) % 7 or 7
+            fecha_unica = hoy + timedelta(days=dias_hasta)
+
+        resultados = {'exitosas': 0, 'sin_cupo': 0, 'errores': 0}
+        errores = []
+        lock_resultados = Lock()
+        largada = Barrier(hilos)
+
+        def reservar(usuario):
+            try:
+                largada.wait()
+                if options['sin_bloqueo']:
+                    if clase.cupos_disponibles(fecha=fecha_unica) <= 0:
+                        raise ValidationError('Sin cupo')
+                    Reserva(usuario=usuario, clase=clase, fecha_unica=fecha_unica).save()
+                else:
+                    reservar_cupo(usuario, clase, fecha_unica=fecha_unica)
+                resultado = 'exitosas'
+            except ValidationError:
+                resultado = 'sin_cupo'
+            except Exception as e:
+                resultado = 'errores'
+                errores.append(str(e))
+            finally:
+                connection.close()
+            with lock_resultados:
+                resultados[resultado] += 1
+
+        try:
+            trabajadores = [Thread(target=reservar, args=(usuario,)) for usuario in usuarios]
+            inicio = reloj.perf_counter()
+            for trabajador in trabajadores:
+                trabajador.start()
+            for trabajador in trabajadores:
+                trabajador.join()
+            duracion = reloj.perf_counter() - inicio
+
+            reservadas = Reserva.objects.filter(clase=clase, activa=True).count()
+            sobreventa = max(0, reservadas - cupo)
+
+            for error in sorted(set(errores)):
+                self.stdout.write(self.style.ERROR(f'  ❌ {error}'))
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'\n{"="*70}\n'
+                    f'RESUMEN\n'
+                    f'{"="*70}\n'
+                    f'✅ Reservas exitosas:       {resultados["exitosas"]}\n'
+                    f'🚫 Rechazadas sin cupo:     {resultados["sin_cupo"]}\n'
+                    f'❌ Errores:                 {resultados["errores"]}\n'
+                    f'🪑 Reservas activas en DB:  {reservadas} / {cupo}\n'
+                    f'⚠️  Sobreventa:              {sobreventa}\n'
+                    f'⏱️  Duración:                {duracion:.3f} s\n'
+                    f'🚀 Intentos por segundo:    {hilos / duracion:.1f}\n'
+                    f'🚀 Reservas por segundo:    {resultados["exitosas"] / duracion:.1f}\n'
+                    f'{"="*70}\n'
+                )
+            )
+        finally:
+            # Limpiar datos de prueba (las reservas se eliminan en cascada)
+            User.objects.filter(id__in=[usuario.id for usuario in usuarios]).delete()
+            clase.delete()
+
+        if sobreventa:
+            raise CommandError(f'Se vendieron {sobreventa} lugar(es) de más')
+        self.stdout.write(self.style.SUCCESS('✅ Sin sobreventa.'))
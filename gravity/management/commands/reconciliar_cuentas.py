@@ -0,0 +1,85 @@
+"""
+Comando Django: reconciliar_cuentas
+Verifica el saldo corrido de cada cliente (EstadoPagoCliente.saldo_actual y
+el libro MovimientoCuenta) contra el recalculado desde toda la historia
+(pagos confirmados - deudas generadas) y registra un ajuste por cada diferencia.
+Se recomienda ejecutarlo diariamente mediante un cron job.
+
+Uso:
+    python manage.py reconciliar_cuentas [--dry-run] [--cliente ID ...]
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gravity.cuenta_service import reconciliar_cuentas
+
+
+class Command(BaseCommand):
+    help = 'Verifica los saldos corridos de los clientes contra la historia de pagos y deudas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo informar diferencias, sin registrar ajustes',
+        )
+        parser.add_argument(
+            '--cliente',
+            type=int,
+            nargs='+',
+            help='Limitar la reconciliación a estos IDs de cliente',
+        )
+
+    def handle(self, *args, **options):
+        hoy = timezone.localtime(timezone.now()).date()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'RECONCILIACIÓN DE CUENTAS DE CLIENTES\n'
+                f'{"="*70}\n'
+                f'Fecha: {hoy.strftime("%d/%m/%Y")}\n'
+                f'Modo: {"SIMULACIÓN (dry-run)" if options["dry_run"] else "PRODUCCIÓN"}\n'
+                f'{"="*70}\n'
+            )
+        )
+
+        diferencias = reconciliar_cuentas(options['cliente'], aplicar=not options['dry_run'])
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS('✅ Los saldos corridos coinciden con la historia de pagos y deudas.'))
+            return
+
+        usuarios = User.objects.in_bulk({d['usuario_id'] for d in diferencias})
+        for diferencia in diferencias:
+            usuario = usuarios.get(diferencia['usuario_id'])
+            nombre = usuario.username if usuario else f'Usuario #{diferencia["usuario_id"]}'
+            self.stdout.write(
+                self.style.WARNING(
+                    f'  ⚠️  {nombre:20s} | saldo ${diferencia["saldo_actual"]:>10.2f} | '
+                    f'libro ${diferencia["saldo_libro"]:>10.2f} | '
+                    f'historia ${diferencia["esperado"]:>10.2f}'
+                )
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'RESUMEN\n'
+                f'{"="*70}\n'
+                f'⚠️  Clientes con diferencias:   {len(diferencias)}\n'
+                f'{"="*70}\n'
+            )
+        )
+
+        if options['dry_run']:
+            self.stdout.write(
+                self.style.WARNING(
+                    '\n⚠️  MODO SIMULACIÓN: No se realizaron cambios en la base de datos.\n'
+                    'Ejecute sin --dry-run para registrar los ajustes.\n'
+                )
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Ajustes de reconciliación registrados.'))
@@ -0,0 +1,92 @@
+"""
+Comando Django: reconciliar_ocupacion
+Reconstruye la tabla ClaseOcupacion desde Reserva y AusenciaTemporal
+e informa cualquier diferencia (drift) con lo que estaba guardado.
+Se recomienda ejecutarlo diariamente mediante un cron job.
+
+Uso:
+    python manage.py reconciliar_ocupacion [--dry-run] [--clase ID ...]
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gravity.models import Clase
+from gravity.ocupacion_service import reconstruir_ocupacion
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la ocupación materializada de las clases e informa diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo informar diferencias, sin corregir la tabla',
+        )
+        parser.add_argument(
+            '--clase',
+            type=int,
+            nargs='+',
+            help='Limitar la reconciliación a estos IDs de clase',
+        )
+
+    def handle(self, *args, **options):
+        hoy = timezone.localtime(timezone.now()).date()
+        clase_ids = options['clase']
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'RECONCILIACIÓN DE OCUPACIÓN DE CLASES\n'
+                f'{"="*70}\n'
+                f'Fecha: {hoy.strftime("%d/%m/%Y")}\n'
+                f'Modo: {"SIMULACIÓN (dry-run)" if options["dry_run"] else "PRODUCCIÓN"}\n'
+                f'{"="*70}\n'
+            )
+        )
+
+        diferencias = reconstruir_ocupacion(clase_ids, aplicar=not options['dry_run'])
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS('✅ La ocupación materializada coincide con las reservas.'))
+            return
+
+        clases = Clase.objects.in_bulk({d['clase_id'] for d in diferencias})
+        for diferencia in diferencias:
+            clase = clases.get(diferencia['clase_id'])
+            nombre = (
+                f'{clase.get_nombre_display()} {clase.dia} {clase.horario.strftime("%H:%M")}'
+                if clase else f'Clase #{diferencia["clase_id"]}'
+            )
+            fecha = diferencia['fecha'].strftime('%d/%m/%Y') if diferencia['fecha'] else 'base'
+            actual = diferencia['actual'] or {}
+            esperado = diferencia['esperado']
+            self.stdout.write(
+                self.style.WARNING(
+                    f'  ⚠️  {nombre:35s} | {fecha:10s} | '
+                    f'permanentes {actual.get("permanentes", 0)}→{esperado["permanentes"]} | '
+                    f'ausencias {actual.get("ausencias", 0)}→{esperado["ausencias"]} | '
+                    f'fecha única {actual.get("fecha_unica", 0)}→{esperado["fecha_unica"]}'
+                )
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'RESUMEN\n'
+                f'{"="*70}\n'
+                f'⚠️  Filas con diferencias:   {len(diferencias)}\n'
+                f'{"="*70}\n'
+            )
+        )
+
+        if options['dry_run']:
+            self.stdout.write(
+                self.style.WARNING(
+                    '\n⚠️  MODO SIMULACIÓN: No se realizaron cambios en la base de datos.\n'
+                    'Ejecute sin --dry-run para corregir la tabla.\n'
+                )
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Tabla de ocupación corregida.'))
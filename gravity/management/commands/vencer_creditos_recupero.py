@@ -0,0 +1,47 @@
+"""
+Comando Django: vencer_creditos_recupero
+Marca como vencidos los créditos de recupero cuya fecha límite ya pasó y
+actualiza el saldo de los usuarios afectados. Se recomienda ejecutarlo
+todas las noches mediante un cron job.
+
+Uso:
+    python manage.py vencer_creditos_recupero [--dry-run]
+"""
+
+from django.core.management.base import BaseCommand
+
+from gravity.recuperos_service import vencer_creditos
+
+
+class Command(BaseCommand):
+    help = 'Vence los créditos de recupero que superaron su fecha límite'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo contar los créditos a vencer, sin modificarlos',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n{"="*70}\n'
+                f'VENCIMIENTO DE CRÉDITOS DE RECUPERO\n'
+                f'{"="*70}\n'
+                f'Modo: {"SIMULACIÓN (dry-run)" if options["dry_run"] else "PRODUCCIÓN"}\n'
+                f'{"="*70}\n'
+            )
+        )
+
+        resultado = vencer_creditos(aplicar=not options['dry_run'])
+
+        self.stdout.write(f'⌛ Créditos vencidos:     {resultado["vencidos"]}')
+        self.stdout.write(f'👥 Usuarios afectados:    {resultado["usuarios"]}')
+
+        if not resultado['vencidos']:
+            self.stdout.write(self.style.SUCCESS('\n✅ No había créditos para vencer.'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING('\n[DRY-RUN] No se modificaron créditos.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('\n✅ Créditos vencidos y saldos actualizados.'))
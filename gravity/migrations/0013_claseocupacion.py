@@ -0,0 +1,77 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def poblar_ocupacion(apps, schema_editor):
+    """Carga inicial de ClaseOcupacion desde las reservas y ausencias existentes."""
+    Clase = apps.get_model('gravity', 'Clase')
+    Reserva = apps.get_model('gravity', 'Reserva')
+    AusenciaTemporal = apps.get_model('gravity', 'AusenciaTemporal')
+    ClaseOcupacion = apps.get_model('gravity', 'ClaseOcupacion')
+
+    permanentes = dict(
+        Reserva.objects.filter(activa=True, fecha_unica__isnull=True).values('clase_id').annotate(
+            total=Count('id')
+        ).order_by().values_list('clase_id', 'total')
+    )
+    filas = {
+        (clase_id, None): {'permanentes': permanentes.get(clase_id, 0), 'ausencias': 0, 'fecha_unica': 0}
+        for clase_id in Clase.objects.values_list('id', flat=True)
+    }
+
+    def fila(clase_id, fecha):
+        return filas.setdefault(
+            (clase_id, fecha),
+            {'permanentes': permanentes.get(clase_id, 0), 'ausencias': 0, 'fecha_unica': 0}
+        )
+
+    for clase_id, fecha, total in Reserva.objects.filter(
+        activa=True, fecha_unica__isnull=False
+    ).values('clase_id', 'fecha_unica').annotate(total=Count('id')).order_by().values_list(
+        'clase_id', 'fecha_unica', 'total'
+    ):
+        fila(clase_id, fecha)['fecha_unica'] = total
+
+    for clase_id, fecha, total in AusenciaTemporal.objects.filter(
+        reserva__activa=True, reserva__fecha_unica__isnull=True
+    ).values('reserva__clase_id', 'fecha').annotate(total=Count('id')).order_by().values_list(
+        'reserva__clase_id', 'fecha', 'total'
+    ):
+        fila(clase_id, fecha)['ausencias'] = total
+
+    ClaseOcupacion.objects.bulk_create([
+        ClaseOcupacion(clase_id=clase_id, fecha=fecha, **valores)
+        for (clase_id, fecha), valores in filas.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0012_solicitudcambioplan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaseOcupacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(blank=True, help_text='Vacía para la fila base de la clase (solo permanentes)', null=True, verbose_name='Fecha')),
+                ('permanentes', models.IntegerField(default=0, verbose_name='Reservas permanentes')),
+                ('ausencias', models.IntegerField(default=0, verbose_name='Ausencias del día')),
+                ('fecha_unica', models.IntegerField(default=0, verbose_name='Reservas de fecha única del día')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+                ('clase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupaciones', to='gravity.clase', verbose_name='Clase')),
+            ],
+            options={
+                'verbose_name': 'Ocupación de Clase',
+                'verbose_name_plural': 'Ocupaciones de Clases',
+                'ordering': ['clase', 'fecha'],
+                'constraints': [models.UniqueConstraint(fields=('clase', 'fecha'), name='unique_ocupacion_clase_fecha'), models.UniqueConstraint(condition=models.Q(('fecha__isnull', True)), fields=('clase',), name='unique_ocupacion_base_clase')],
+            },
+        ),
+        migrations.RunPython(poblar_ocupacion, migrations.RunPython.noop),
+    ]
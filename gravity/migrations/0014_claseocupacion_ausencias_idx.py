@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0013_claseocupacion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='claseocupacion',
+            index=models.Index(condition=models.Q(('ausencias__gt', 0)), fields=['fecha', 'clase'], name='ocupacion_ausencias_fecha_idx'),
+        ),
+    ]
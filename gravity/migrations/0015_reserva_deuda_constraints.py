@@ -0,0 +1,124 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Max
+
+
+def reconstruir_ocupacion(apps, clase_ids):
+    """
+    Vuelve a calcular ClaseOcupacion de estas clases desde las reservas y ausencias
+    (el queryset.update de las reservas duplicadas no dispara las señales).
+    """
+    Reserva = apps.get_model('gravity', 'Reserva')
+    AusenciaTemporal = apps.get_model('gravity', 'AusenciaTemporal')
+    ClaseOcupacion = apps.get_model('gravity', 'ClaseOcupacion')
+
+    reservas = Reserva.objects.filter(activa=True, clase_id__in=clase_ids)
+    permanentes = dict(
+        reservas.filter(fecha_unica__isnull=True).values('clase_id').annotate(
+            total=Count('id')
+        ).order_by().values_list('clase_id', 'total')
+    )
+    filas = {
+        (clase_id, None): {'permanentes': permanentes.get(clase_id, 0), 'ausencias': 0, 'fecha_unica': 0}
+        for clase_id in clase_ids
+    }
+
+    def fila(clase_id, fecha):
+        return filas.setdefault(
+            (clase_id, fecha),
+            {'permanentes': permanentes.get(clase_id, 0), 'ausencias': 0, 'fecha_unica': 0}
+        )
+
+    for clase_id, fecha, total in reservas.filter(
+        fecha_unica__isnull=False
+    ).values('clase_id', 'fecha_unica').annotate(total=Count('id')).order_by().values_list(
+        'clase_id', 'fecha_unica', 'total'
+    ):
+        fila(clase_id, fecha)['fecha_unica'] = total
+
+    for clase_id, fecha, total in AusenciaTemporal.objects.filter(
+        reserva__activa=True, reserva__fecha_unica__isnull=True, reserva__clase_id__in=clase_ids
+    ).values('reserva__clase_id', 'fecha').annotate(total=Count('id')).order_by().values_list(
+        'reserva__clase_id', 'fecha', 'total'
+    ):
+        fila(clase_id, fecha)['ausencias'] = total
+
+    ClaseOcupacion.objects.filter(clase_id__in=clase_ids).delete()
+    ClaseOcupacion.objects.bulk_create([
+        ClaseOcupacion(clase_id=clase_id, fecha=fecha, **valores)
+        for (clase_id, fecha), valores in filas.items()
+    ])
+
+
+def limpiar_datos_inconsistentes(apps, schema_editor):
+    """
+    Deja los datos existentes en condiciones de cumplir los nuevos constraints.
+    Las reservas duplicadas se desactivan conservando la más reciente y se
+    reconstruye la ocupación de las clases afectadas.
+    """
+    Reserva = apps.get_model('gravity', 'Reserva')
+    DeudaMensual = apps.get_model('gravity', 'DeudaMensual')
+
+    duplicados = (
+        Reserva.objects.filter(activa=True)
+        .values('usuario_id', 'clase_id', 'fecha_unica')
+        .annotate(cantidad=Count('id'), ultima=Max('id'))
+        .filter(cantidad__gt=1)
+        .order_by()
+    )
+    clases_afectadas = set()
+    for grupo in duplicados:
+        clases_afectadas.add(grupo['clase_id'])
+        Reserva.objects.filter(
+            activa=True,
+            usuario_id=grupo['usuario_id'],
+            clase_id=grupo['clase_id'],
+            fecha_unica=grupo['fecha_unica'],
+        ).exclude(id=grupo['ultima']).update(activa=False)
+    if clases_afectadas:
+        reconstruir_ocupacion(apps, clases_afectadas)
+
+    Reserva.objects.filter(es_recupero=True, fecha_unica__isnull=True).update(es_recupero=False)
+
+    DeudaMensual.objects.filter(monto_pendiente__lt=0).update(monto_pendiente=0)
+    DeudaMensual.objects.filter(monto_pendiente__gt=F('monto_original')).update(
+        monto_pendiente=F('monto_original')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0014_claseocupacion_ausencias_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(limpiar_datos_inconsistentes, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='reserva',
+            options={'ordering': ['-fecha_reserva'], 'permissions': [('can_manage_all_reservas', 'Puede gestionar todas las reservas'), ('can_view_all_reservas', 'Puede ver todas las reservas')], 'verbose_name': 'Reserva', 'verbose_name_plural': 'Reservas'},
+        ),
+        migrations.AddConstraint(
+            model_name='deudamensual',
+            constraint=models.CheckConstraint(condition=models.Q(('monto_pendiente__gte', 0)), name='deuda_monto_pendiente_no_negativo', violation_error_message='El monto pendiente no puede ser negativo.'),
+        ),
+        migrations.AddConstraint(
+            model_name='deudamensual',
+            constraint=models.CheckConstraint(condition=models.Q(('monto_pendiente__lte', models.F('monto_original'))), name='deuda_monto_pendiente_hasta_original', violation_error_message='El monto pendiente no puede ser mayor al monto original.'),
+        ),
+        migrations.AddConstraint(
+            model_name='reserva',
+            constraint=models.UniqueConstraint(condition=models.Q(('activa', True), ('fecha_unica__isnull', True)), fields=('usuario', 'clase'), name='unique_active_reservation_per_user_class', violation_error_message='Ya tienes una reserva activa para esta clase. Cancela la reserva actual antes de crear una nueva.'),
+        ),
+        migrations.AddConstraint(
+            model_name='reserva',
+            constraint=models.UniqueConstraint(condition=models.Q(('activa', True), ('fecha_unica__isnull', False)), fields=('usuario', 'clase', 'fecha_unica'), name='unique_active_reservation_per_user_class_fecha', violation_error_message='Ya tienes una reserva activa para esta clase en esa fecha. Cancela la reserva actual antes de crear una nueva.'),
+        ),
+        migrations.AddConstraint(
+            model_name='reserva',
+            constraint=models.CheckConstraint(condition=models.Q(('es_recupero', False), ('fecha_unica__isnull', False), _connector='OR'), name='reserva_recupero_con_fecha_unica', violation_error_message='Un recupero debe tener fecha única.'),
+        ),
+    ]
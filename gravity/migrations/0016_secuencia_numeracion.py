@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+def crear_secuencia_reservas(apps, schema_editor):
+    """
+    Crea el contador de números de reserva: una SEQUENCE nativa en PostgreSQL
+    (con bloques de 50 valores por nextval) o una fila de SecuenciaNumeracion.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE SEQUENCE IF NOT EXISTS gravity_numero_reserva_seq INCREMENT BY 50 START WITH 1'
+        )
+    SecuenciaNumeracion = apps.get_model('gravity', 'SecuenciaNumeracion')
+    SecuenciaNumeracion.objects.get_or_create(nombre='numero_reserva')
+
+
+def eliminar_secuencia_reservas(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP SEQUENCE IF EXISTS gravity_numero_reserva_seq')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0015_reserva_deuda_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaNumeracion',
+            fields=[
+                ('nombre', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Nombre')),
+                ('valor', models.BigIntegerField(default=0, verbose_name='Último valor entregado')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Numeración',
+                'verbose_name_plural': 'Secuencias de Numeración',
+            },
+        ),
+        migrations.RunPython(crear_secuencia_reservas, eliminar_secuencia_reservas),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0016_secuencia_numeracion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('actualizar_estado_pago', 'Actualizar estado de pago por reservas')], max_length=50, verbose_name='Tipo de tarea')),
+                ('datos', models.JSONField(blank=True, default=dict, verbose_name='Datos')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completada', 'Completada'), ('error', 'Error')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('intentos', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('ultimo_error', models.TextField(blank=True, verbose_name='Último error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True, verbose_name='Inicio del procesamiento')),
+                ('fecha_procesada', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de procesamiento')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tareas_pendientes', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Tarea Pendiente',
+                'verbose_name_plural': 'Tareas Pendientes',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['estado', 'id'], name='tarea_estado_idx')],
+            },
+        ),
+    ]
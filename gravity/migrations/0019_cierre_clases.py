@@ -0,0 +1,71 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0018_tarea_email_reservas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tareapendiente',
+            name='tipo',
+            field=models.CharField(choices=[('actualizar_estado_pago', 'Actualizar estado de pago por reservas'), ('email_confirmacion_reservas', 'Email de confirmación de reservas'), ('notificar_cierre', 'Emails de cierre de clases')], max_length=50, verbose_name='Tipo de tarea'),
+        ),
+        migrations.CreateModel(
+            name='CierreClase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha del cierre')),
+                ('direccion', models.CharField(choices=[('sede_principal', 'Sede Principal - La Rioja 3044'), ('sede_2', 'Sede 2 - 9 de julio 3696')], max_length=20, verbose_name='Sede')),
+                ('motivo', models.CharField(max_length=100, verbose_name='Motivo')),
+                ('motivo_detalle', models.TextField(blank=True, verbose_name='Detalle del motivo')),
+                ('clases_cerradas', models.PositiveIntegerField(default=0, verbose_name='Clases cerradas')),
+                ('ausencias_creadas', models.PositiveIntegerField(default=0, verbose_name='Ausencias registradas')),
+                ('reservas_canceladas', models.PositiveIntegerField(default=0, verbose_name='Reservas canceladas')),
+                ('estado_notificacion', models.CharField(choices=[('no_aplica', 'Sin notificación'), ('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('completada', 'Completada')], default='no_aplica', max_length=20, verbose_name='Notificación')),
+                ('emails_total', models.PositiveIntegerField(default=0, verbose_name='Emails a enviar')),
+                ('emails_enviados', models.PositiveIntegerField(default=0, verbose_name='Emails enviados')),
+                ('emails_fallidos', models.PositiveIntegerField(default=0, verbose_name='Emails fallidos')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('admin_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cierres_realizados', to=settings.AUTH_USER_MODEL, verbose_name='Administrador')),
+                ('clase', models.ForeignKey(blank=True, help_text='Vacío si se cerró la sede completa', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cierres_puntuales', to='gravity.clase', verbose_name='Clase')),
+            ],
+            options={
+                'verbose_name': 'Cierre de Clases',
+                'verbose_name_plural': 'Cierres de Clases',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+        migrations.AddField(
+            model_name='ausenciatemporal',
+            name='cierre',
+            field=models.ForeignKey(blank=True, help_text='Cierre del estudio que generó la ausencia (vacío si la avisó el cliente)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ausencias', to='gravity.cierreclase', verbose_name='Cierre'),
+        ),
+        migrations.AddField(
+            model_name='cancelacionadmin',
+            name='cierre',
+            field=models.ForeignKey(blank=True, help_text='Cierre del estudio que generó la cancelación', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cancelaciones', to='gravity.cierreclase', verbose_name='Cierre'),
+        ),
+        migrations.CreateModel(
+            name='ClaseCerrada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('cierre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clases', to='gravity.cierreclase', verbose_name='Cierre')),
+                ('clase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierres', to='gravity.clase', verbose_name='Clase')),
+            ],
+            options={
+                'verbose_name': 'Clase Cerrada',
+                'verbose_name_plural': 'Clases Cerradas',
+                'ordering': ['fecha', 'clase'],
+                'constraints': [models.UniqueConstraint(fields=('clase', 'fecha'), name='unique_clase_cerrada_fecha')],
+            },
+        ),
+    ]
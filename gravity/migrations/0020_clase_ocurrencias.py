@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0019_cierre_clases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaseOcurrencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('inicio', models.DateTimeField(help_text='Fecha y hora de inicio de la clase ese día', verbose_name='Inicio')),
+                ('clase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocurrencias', to='gravity.clase', verbose_name='Clase')),
+            ],
+            options={
+                'verbose_name': 'Ocurrencia de Clase',
+                'verbose_name_plural': 'Ocurrencias de Clases',
+                'ordering': ['fecha', 'inicio'],
+                'indexes': [models.Index(fields=['fecha', 'clase'], name='ocurrencia_fecha_clase_idx')],
+                'constraints': [models.UniqueConstraint(fields=('clase', 'fecha'), name='unique_clase_ocurrencia_fecha')],
+            },
+        ),
+    ]
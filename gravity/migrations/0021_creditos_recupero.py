@@ -0,0 +1,104 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:09
+
+import django.db.models.deletion
+from django.conf import settings
+from datetime import timedelta
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def poblar_creditos(apps, schema_editor):
+    """
+    Carga inicial del libro de créditos con el mismo criterio que el conteo anterior:
+    un crédito por ausencia vigente de una reserva permanente activa, consumidos
+    (el que vence primero) por los recuperos activos desde hoy.
+    """
+    AusenciaTemporal = apps.get_model('gravity', 'AusenciaTemporal')
+    Reserva = apps.get_model('gravity', 'Reserva')
+    CreditoRecupero = apps.get_model('gravity', 'CreditoRecupero')
+    SaldoRecupero = apps.get_model('gravity', 'SaldoRecupero')
+
+    hoy = timezone.localtime(timezone.now()).date()
+    creditos = CreditoRecupero.objects.bulk_create([
+        CreditoRecupero(usuario_id=usuario_id, ausencia_id=ausencia_id, fecha_limite=fecha + timedelta(days=6))
+        for ausencia_id, usuario_id, fecha in AusenciaTemporal.objects.filter(
+            reserva__activa=True,
+            reserva__fecha_unica__isnull=True,
+            fecha__gte=hoy - timedelta(days=6),
+        ).order_by('fecha', 'id').values_list('id', 'reserva__usuario_id', 'fecha')
+    ])
+
+    por_usuario = {}
+    for credito in creditos:
+        por_usuario.setdefault(credito.usuario_id, []).append(credito)
+
+    consumidos = []
+    for reserva_id, usuario_id, fecha_unica in Reserva.objects.filter(
+        activa=True, es_recupero=True, fecha_unica__gte=hoy
+    ).order_by('fecha_unica', 'id').values_list('id', 'usuario_id', 'fecha_unica'):
+        disponibles = por_usuario.get(usuario_id)
+        if not disponibles:
+            continue
+        # Preferir un crédito que cubra la fecha del recupero; si no, el que vence primero
+        credito = next((c for c in disponibles if c.fecha_limite >= fecha_unica), disponibles[0])
+        disponibles.remove(credito)
+        credito.estado = 'consumido'
+        credito.reserva_recupero_id = reserva_id
+        credito.fecha_consumo = timezone.now()
+        consumidos.append(credito)
+    CreditoRecupero.objects.bulk_update(consumidos, ['estado', 'reserva_recupero', 'fecha_consumo'])
+
+    SaldoRecupero.objects.bulk_create([
+        SaldoRecupero(
+            usuario_id=usuario_id,
+            disponibles=len(disponibles),
+            proximo_vencimiento=min((c.fecha_limite for c in disponibles), default=None),
+        )
+        for usuario_id, disponibles in por_usuario.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0020_clase_ocurrencias'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoRecupero',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disponibles', models.IntegerField(default=0, verbose_name='Créditos disponibles')),
+                ('proximo_vencimiento', models.DateField(blank=True, help_text='Fecha límite del crédito disponible que vence primero', null=True, verbose_name='Próximo vencimiento')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='saldo_recupero', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Recuperos',
+                'verbose_name_plural': 'Saldos de Recuperos',
+            },
+        ),
+        migrations.CreateModel(
+            name='CreditoRecupero',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('disponible', 'Disponible'), ('consumido', 'Consumido'), ('vencido', 'Vencido'), ('anulado', 'Anulado')], default='disponible', max_length=15, verbose_name='Estado')),
+                ('fecha_limite', models.DateField(help_text='Último día en que se puede usar (fecha de la ausencia + 6 días)', verbose_name='Fecha límite')),
+                ('fecha_otorgado', models.DateTimeField(auto_now_add=True, verbose_name='Otorgado el')),
+                ('fecha_consumo', models.DateTimeField(blank=True, null=True, verbose_name='Consumido el')),
+                ('fecha_cierre', models.DateTimeField(blank=True, null=True, verbose_name='Vencido / anulado el')),
+                ('ausencia', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='credito_recupero', to='gravity.ausenciatemporal', verbose_name='Ausencia que lo otorgó')),
+                ('reserva_recupero', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='creditos_consumidos', to='gravity.reserva', verbose_name='Reserva de recupero')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='creditos_recupero', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Crédito de Recupero',
+                'verbose_name_plural': 'Créditos de Recupero',
+                'ordering': ['-fecha_otorgado'],
+                'indexes': [models.Index(fields=['usuario', 'estado', 'fecha_limite'], name='credito_usuario_estado_idx'), models.Index(condition=models.Q(('estado', 'disponible')), fields=['fecha_limite'], name='credito_disponible_limite_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_creditos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:12
+
+import django.db.models.deletion
+from django.conf import settings
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def poblar_movimientos(apps, schema_editor):
+    """
+    Carga inicial del libro: un cargo por cada deuda generada y un pago por cada
+    pago confirmado, en orden cronológico con su saldo corrido. El saldo final de
+    cada cliente (pagos confirmados - deudas generadas) queda en saldo_actual.
+    """
+    DeudaMensual = apps.get_model('gravity', 'DeudaMensual')
+    RegistroPago = apps.get_model('gravity', 'RegistroPago')
+    EstadoPagoCliente = apps.get_model('gravity', 'EstadoPagoCliente')
+    MovimientoCuenta = apps.get_model('gravity', 'MovimientoCuenta')
+
+    eventos = {}
+    for deuda in DeudaMensual.objects.order_by('id'):
+        eventos.setdefault(deuda.usuario_id, []).append((
+            deuda.fecha_creacion, 'cargo', -deuda.monto_original,
+            {'deuda_id': deuda.id, 'descripcion': f'Cuota {deuda.mes_año.strftime("%m/%Y")}'}
+        ))
+    for pago in RegistroPago.objects.filter(estado='confirmado', cliente__isnull=False).order_by('id'):
+        eventos.setdefault(pago.cliente_id, []).append((
+            pago.fecha_registro, 'pago', pago.monto,
+            {'pago_id': pago.id, 'descripcion': pago.concepto[:200]}
+        ))
+
+    movimientos = []
+    saldos = {}
+    for usuario_id, eventos_usuario in eventos.items():
+        saldo = Decimal('0')
+        for fecha, tipo, monto, extra in sorted(eventos_usuario, key=lambda evento: evento[0]):
+            if not monto:
+                continue
+            saldo += monto
+            movimientos.append(MovimientoCuenta(
+                usuario_id=usuario_id, tipo=tipo, monto=monto, saldo_resultante=saldo, **extra
+            ))
+        saldos[usuario_id] = saldo
+    MovimientoCuenta.objects.bulk_create(movimientos, batch_size=500)
+
+    # fecha es auto_now_add: conservar la fecha original de cada deuda y pago
+    for movimiento in MovimientoCuenta.objects.filter(deuda__isnull=False).select_related('deuda'):
+        movimiento.fecha = movimiento.deuda.fecha_creacion
+        movimiento.save(update_fields=['fecha'])
+    for movimiento in MovimientoCuenta.objects.filter(pago__isnull=False).select_related('pago'):
+        movimiento.fecha = movimiento.pago.fecha_registro
+        movimiento.save(update_fields=['fecha'])
+
+    for usuario_id, saldo in saldos.items():
+        estado, _ = EstadoPagoCliente.objects.get_or_create(usuario_id=usuario_id, defaults={'activo': True})
+        if estado.saldo_actual != saldo:
+            EstadoPagoCliente.objects.filter(pk=estado.pk).update(saldo_actual=saldo)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0021_creditos_recupero'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoCuenta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('cargo', 'Cargo'), ('pago', 'Pago'), ('ajuste', 'Ajuste'), ('descuento', 'Descuento')], max_length=15, verbose_name='Tipo')),
+                ('monto', models.DecimalField(decimal_places=2, help_text='Positivo = a favor del cliente, Negativo = cargo', max_digits=10, verbose_name='Monto')),
+                ('saldo_resultante', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Saldo resultante')),
+                ('descripcion', models.CharField(blank=True, max_length=200, verbose_name='Descripción')),
+                ('fecha', models.DateTimeField(auto_now_add=True, verbose_name='Fecha')),
+                ('deuda', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos', to='gravity.deudamensual', verbose_name='Deuda')),
+                ('pago', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos', to='gravity.registropago', verbose_name='Pago')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_cuenta', to=settings.AUTH_USER_MODEL, verbose_name='Cliente')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Cuenta',
+                'verbose_name_plural': 'Movimientos de Cuenta',
+                'ordering': ['-fecha', '-id'],
+                'indexes': [models.Index(fields=['usuario', 'fecha'], name='movimiento_usuario_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_movimientos, migrations.RunPython.noop),
+    ]
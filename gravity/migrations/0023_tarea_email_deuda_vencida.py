@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0022_movimientos_cuenta'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tareapendiente',
+            name='tipo',
+            field=models.CharField(choices=[('actualizar_estado_pago', 'Actualizar estado de pago por reservas'), ('email_confirmacion_reservas', 'Email de confirmación de reservas'), ('notificar_cierre', 'Emails de cierre de clases'), ('email_deuda_vencida', 'Email de aviso de deuda vencida')], max_length=50, verbose_name='Tipo de tarea'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0023_tarea_email_deuda_vencida'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenFinancieroMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primer día del mes', verbose_name='Mes')),
+                ('origen', models.CharField(choices=[('deuda', 'Deudas'), ('pago', 'Pagos')], max_length=10, verbose_name='Origen')),
+                ('tipo_pago', models.CharField(blank=True, help_text='Vacío en las filas de deudas', max_length=20, verbose_name='Tipo de pago')),
+                ('estado', models.CharField(help_text='Estado de la deuda o del pago', max_length=20, verbose_name='Estado')),
+                ('cantidad', models.IntegerField(default=0, verbose_name='Cantidad')),
+                ('monto_cargado', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Monto cargado')),
+                ('monto_cobrado', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Monto cobrado')),
+                ('monto_pendiente', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Monto pendiente')),
+                ('monto_descuento', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Descuento por efectivo')),
+                ('fecha_actualizacion', models.DateTimeField(help_text='Inicio de la actualización que calculó la fila', verbose_name='Última actualización')),
+                ('plan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='resumenes_financieros', to='gravity.planpago', verbose_name='Plan')),
+            ],
+            options={
+                'verbose_name': 'Resumen Financiero Mensual',
+                'verbose_name_plural': 'Resúmenes Financieros Mensuales',
+                'ordering': ['-mes', 'origen', 'plan', 'tipo_pago', 'estado'],
+                'indexes': [models.Index(fields=['mes', 'origen'], name='resumen_fin_mes_origen_idx')],
+            },
+        ),
+    ]
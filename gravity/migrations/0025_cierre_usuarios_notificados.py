@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gravity', '0024_resumen_financiero_mensual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cierreclase',
+            name='usuarios_notificados',
+            field=models.JSONField(blank=True, default=list, help_text='IDs de los alumnos que ya recibieron el email (no se les reenvía si la tarea se repite)', verbose_name='Alumnos notificados'),
+        ),
+    ]
@@ -1,15 +1,13 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.utils.crypto import get_random_string
 from django.core.validators import RegexValidator
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from datetime import timedelta
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, post_init, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from decimal import Decimal
-from django.db.models import Sum
 from datetime import timedelta
 
 DIAS_SEMANA = [
@@ -30,6 +28,16 @@ DIAS_SEMANA_COMPLETOS = [
     ('Sábado', 'Sábado'),
 ]
 
+# Número de día de la semana (date.weekday()) para cada valor de Clase.dia
+NUMERO_DIA_SEMANA = {
+    'Lunes': 0,
+    'Martes': 1,
+    'Miércoles': 2,
+    'Jueves': 3,
+    'Viernes': 4,
+    'Sábado': 5,
+}
+
 class Clase(models.Model):
     TIPO_CLASES = [
         ('Reformer', 'Pilates Reformer'),
@@ -140,6 +148,18 @@ class Clase(models.Model):
         }
         return direcciones_cortas.get(self.direccion, self.get_direccion_display())
 
+    def get_ocupacion(self, fecha=None):
+        """
+        Devuelve el detalle de ocupación de la clase (ver ocupacion_service).
+        Si la vista ya la precargó en bloque, no vuelve a consultar la base.
+        """
+        precargada = getattr(self, '_ocupacion_precargada', None)
+        if precargada and fecha in precargada:
+            return precargada[fecha]
+
+        from .ocupacion_service import calcular_ocupacion
+        return calcular_ocupacion([self], fecha=fecha)[self.id]
+
     def cupos_disponibles(self, fecha=None):
         """
         Devuelve cupos disponibles.
@@ -149,76 +169,24 @@ class Clase(models.Model):
         if not self.activa:
             return 0
 
-        # Solo las permanentes siempre ocupan cupo
-        reservas_permanentes = self.reserva_set.filter(
-            activa=True,
-            fecha_unica__isnull=True
-        ).count()
-
-        if fecha:
-            ausencias_del_dia = AusenciaTemporal.objects.filter(
-                reserva__clase=self,
-                reserva__activa=True,
-                reserva__fecha_unica__isnull=True,
-                fecha=fecha
-            ).count()
-            reservas_fecha = self.reserva_set.filter(
-                activa=True,
-                fecha_unica=fecha
-            ).count()
-            total = reservas_permanentes - ausencias_del_dia + reservas_fecha
-        else:
-            total = reservas_permanentes
-
-        return max(0, self.cupo_maximo - total)
+        return self.get_ocupacion(fecha=fecha)['cupos_disponibles']
 
     def get_cupo_temporal_semana(self):
         """
         Retorna {fecha, cupos, fecha_str} si en los próximos 10 días hay un
         cupo temporal disponible por ausencia. Retorna None si no hay ninguno.
+        Para varias clases a la vez usar ocupacion_service.primer_cupo_liberado_por_clase().
         """
-        hoy = timezone.now().date()
-        fin_ventana = hoy + timedelta(days=10)
-
-        dias_map = {
-            'Lunes': 0, 'Martes': 1, 'Miércoles': 2,
-            'Jueves': 3, 'Viernes': 4, 'Sábado': 5
-        }
-        dia_objetivo = dias_map.get(self.dia)
-        if dia_objetivo is None:
-            return None
-
-        # Próxima ocurrencia: hoy si la clase todavía no pasó, si no la semana siguiente
-        from django.utils import timezone as tz_local
-        ahora = tz_local.localtime(tz_local.now())
-        dias_hasta = (dia_objetivo - hoy.weekday()) % 7
-        if dias_hasta == 0:
-            clase_hoy = ahora.replace(
-                hour=self.horario.hour,
-                minute=self.horario.minute,
-                second=0,
-                microsecond=0
-            )
-            if clase_hoy <= ahora:
-                dias_hasta = 7
-
-        fecha_clase = hoy + timedelta(days=dias_hasta)
-
-        if fecha_clase > fin_ventana:
-            return None
-
-        # Solo aplica si la clase está permanentemente llena
-        if self.cupos_disponibles() > 0:
+        from .ocupacion_service import buscar_cupos_liberados
+        liberados = buscar_cupos_liberados([self])
+        if not liberados:
             return None
-
-        cupos_fecha = self.cupos_disponibles(fecha=fecha_clase)
-        if cupos_fecha > 0:
-            return {
-                'fecha': fecha_clase,
-                'cupos': cupos_fecha,
-                'fecha_str': fecha_clase.strftime('%Y-%m-%d'),
-            }
-        return None
+        cupo = liberados[0]
+        return {
+            'fecha': cupo['fecha'],
+            'cupos': cupo['cupos'],
+            'fecha_str': cupo['fecha_str'],
+        }
 
     def esta_completa(self):
         """Verifica si la clase está completa"""
@@ -228,8 +196,7 @@ class Clase(models.Model):
         """Devuelve el porcentaje de ocupación de la clase"""
         if self.cupo_maximo == 0:
             return 0
-        reservas_actuales = self.reserva_set.filter(activa=True).count()
-        return round((reservas_actuales / self.cupo_maximo) * 100)
+        return self.get_ocupacion()['porcentaje_ocupacion']
 
     def get_reservas_activas(self):
         """Devuelve todas las reservas activas para esta clase"""
@@ -308,6 +275,43 @@ class Reserva(models.Model):
         help_text="Para recuperos y cupos temporales. Se cancela automáticamente al día siguiente de esta fecha."
     )
 
+    class Meta:
+        verbose_name = "Reserva"
+        verbose_name_plural = "Reservas"
+        constraints = [
+            # Una sola reserva permanente activa por usuario y clase
+            models.UniqueConstraint(
+                fields=['usuario', 'clase'],
+                condition=models.Q(activa=True, fecha_unica__isnull=True),
+                name='unique_active_reservation_per_user_class',
+                violation_error_message=(
+                    'Ya tienes una reserva activa para esta clase. '
+                    'Cancela la reserva actual antes de crear una nueva.'
+                ),
+            ),
+            # Una sola reserva de fecha única activa por usuario, clase y fecha
+            models.UniqueConstraint(
+                fields=['usuario', 'clase', 'fecha_unica'],
+                condition=models.Q(activa=True, fecha_unica__isnull=False),
+                name='unique_active_reservation_per_user_class_fecha',
+                violation_error_message=(
+                    'Ya tienes una reserva activa para esta clase en esa fecha. '
+                    'Cancela la reserva actual antes de crear una nueva.'
+                ),
+            ),
+            # Los recuperos siempre son para una fecha puntual
+            models.CheckConstraint(
+                condition=models.Q(es_recupero=False) | models.Q(fecha_unica__isnull=False),
+                name='reserva_recupero_con_fecha_unica',
+                violation_error_message='Un recupero debe tener fecha única.',
+            ),
+        ]
+        ordering = ['-fecha_reserva']
+        permissions = [
+            ('can_manage_all_reservas', 'Puede gestionar todas las reservas'),
+            ('can_view_all_reservas', 'Puede ver todas las reservas'),
+        ]
+
     def clean(self):
         """Validaciones personalizadas del modelo"""
         super().clean()
@@ -318,102 +322,63 @@ class Reserva(models.Model):
                 'clase': 'No se puede reservar una clase inactiva'
             })
         
-        # Validar duplicados (las reservas de fecha única se permiten mientras no choquen con otra del mismo día o con una permanente)
-        if self.activa and self.usuario and self.clase:
-            if self.fecha_unica:
-                tiene_permanente = Reserva.objects.filter(
-                    usuario=self.usuario,
-                    clase=self.clase,
-                    activa=True,
-                    fecha_unica__isnull=True
-                ).exclude(pk=self.pk).exists()
-                tiene_misma_fecha = Reserva.objects.filter(
-                    usuario=self.usuario,
-                    clase=self.clase,
-                    activa=True,
-                    fecha_unica=self.fecha_unica
-                ).exclude(pk=self.pk).exists()
-                if tiene_permanente or tiene_misma_fecha:
+        # Validar duplicados entre tipos de reserva. Los duplicados del mismo tipo
+        # (dos permanentes, o dos de fecha única el mismo día) los rechaza la base
+        # de datos con los índices únicos parciales de Meta.constraints.
+        if self.activa and self.usuario_id and self.clase_id:
+            choca_con_otro_tipo = Reserva.objects.filter(
+                usuario_id=self.usuario_id,
+                clase_id=self.clase_id,
+                activa=True,
+                fecha_unica__isnull=bool(self.fecha_unica)
+            ).exclude(pk=self.pk).exists()
+            if choca_con_otro_tipo:
+                if self.fecha_unica:
                     raise ValidationError(
                         'Ya tienes una reserva activa para esta clase en esa fecha. '
                         'Cancela la reserva actual antes de crear una nueva.'
                     )
-            else:
-                existing_reserva = Reserva.objects.filter(
-                    usuario=self.usuario,
-                    clase=self.clase,
-                    activa=True
-                ).exclude(pk=self.pk)
-                if existing_reserva.exists():
-                    raise ValidationError(
-                        'Ya tienes una reserva activa para esta clase. '
-                        'Cancela la reserva actual antes de crear una nueva.'
-                    )
+                raise ValidationError(
+                    'Ya tienes una reserva activa para esta clase. '
+                    'Cancela la reserva actual antes de crear una nueva.'
+                )
 
     def save(self, *args, **kwargs):
         # Generar número de reserva único
         if not self.numero_reserva:
             self.numero_reserva = self.generar_numero_reserva()
         
-        # Ejecutar validaciones
-        self.full_clean()
-        super().save(*args, **kwargs)
+        # Ejecutar validaciones. La unicidad y los constraints los garantiza la base de
+        # datos (IntegrityError), así no se consulta una vez por cada constraint.
+        self.full_clean(validate_unique=False, validate_constraints=False)
+        # Atómico junto con las señales que mantienen ClaseOcupacion: si la ocupación
+        # no se puede actualizar, la reserva tampoco se guarda
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
 
     def generar_numero_reserva(self):
-        """Genera un número de reserva único"""
-        while True:
-            numero = get_random_string(8, allowed_chars='0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ')
-            if not Reserva.objects.filter(numero_reserva=numero).exists():
-                return numero
+        """Genera un número de reserva único (sin consultar los ya usados)"""
+        from .numeracion_service import siguiente_numero_reserva
+        return siguiente_numero_reserva()
 
     def puede_modificarse(self):
         """
         Verifica si la reserva puede modificarse (3 horas de anticipación).
         Calcula basándose en el próximo día de clase.
         """
+        from .calendario_service import inicio_clase, proxima_ocurrencia
+
         if not self.activa:
             return False, "La reserva está cancelada"
         
         if not self.clase.activa:
             return False, "La clase ya no está disponible"
         
-        # Obtener el día de la semana actual
         hoy = timezone.localtime(timezone.now())
-        dias_semana = {
-            'Lunes': 0, 'Martes': 1, 'Miércoles': 2, 'Jueves': 3, 'Viernes': 4, 'Sábado': 5
-        }
-        
-        dia_clase = dias_semana.get(self.clase.dia)
-        if dia_clase is None:
+        proxima_fecha = proxima_ocurrencia(self.clase.dia, self.clase.horario, hoy)
+        if proxima_fecha is None:
             return False, "Día de clase inválido"
-        
-        # Encontrar la próxima fecha de esta clase
-        dias_hasta_clase = (dia_clase - hoy.weekday()) % 7
-        if dias_hasta_clase == 0:  # Es hoy
-            proxima_clase = hoy.replace(
-                hour=self.clase.horario.hour, 
-                minute=self.clase.horario.minute, 
-                second=0, 
-                microsecond=0
-            )
-            if proxima_clase <= hoy:  # La clase ya pasó hoy
-                dias_hasta_clase = 7
-        
-        if dias_hasta_clase == 0:
-            proxima_fecha_clase = hoy.replace(
-                hour=self.clase.horario.hour, 
-                minute=self.clase.horario.minute, 
-                second=0, 
-                microsecond=0
-            )
-        else:
-            proxima_fecha_clase = hoy + timedelta(days=dias_hasta_clase)
-            proxima_fecha_clase = proxima_fecha_clase.replace(
-                hour=self.clase.horario.hour, 
-                minute=self.clase.horario.minute, 
-                second=0, 
-                microsecond=0
-            )
+        proxima_fecha_clase = inicio_clase(proxima_fecha, self.clase.horario, hoy)
         
         # Verificar si faltan más de 3 horas
         tiempo_limite = proxima_fecha_clase - timedelta(hours=3)
@@ -425,91 +390,36 @@ class Reserva(models.Model):
         return True, "Puedes modificar tu reserva"
 
     def get_proxima_clase_info(self):
-        """Devuelve información sobre cuándo es la próxima clase, respetando ausencias y fecha_unica."""
-        hoy = timezone.localtime(timezone.now())
-        horario = self.clase.horario.strftime('%H:%M')
-        sede = self.clase.get_direccion_corta()
-
-        # Caso 1: reserva de fecha única (recupero o cupo temporal)
-        if self.fecha_unica:
-            dias_hasta = (self.fecha_unica - hoy.date()).days
-            if dias_hasta == 0:
-                return f"Hoy a las {horario} en {sede}"
-            elif dias_hasta == 1:
-                return f"Mañana a las {horario} en {sede}"
-            else:
-                return f"El {self.fecha_unica.strftime('%d/%m')} ({self.clase.dia}) a las {horario} en {sede}"
+        """
+        Devuelve información sobre cuándo es la próxima clase, respetando ausencias y fecha_unica.
+        En listas, usar calendario_service.precargar_ocurrencias() para no consultar por reserva.
+        """
+        from .calendario_service import describir_fecha, ocurrencia_de
 
-        # Caso 2: reserva recurrente
-        dias_semana = {
-            'Lunes': 0, 'Martes': 1, 'Miércoles': 2,
-            'Jueves': 3, 'Viernes': 4, 'Sábado': 5
-        }
-        dia_clase = dias_semana.get(self.clase.dia)
-        if dia_clase is None:
+        if not self.fecha_unica and self.clase.dia not in NUMERO_DIA_SEMANA:
             return "Día inválido"
 
-        dias_hasta_clase = (dia_clase - hoy.weekday()) % 7
-        if dias_hasta_clase == 0:
-            proxima_hoy = hoy.replace(
-                hour=self.clase.horario.hour,
-                minute=self.clase.horario.minute,
-                second=0, microsecond=0
-            )
-            if proxima_hoy <= hoy:
-                dias_hasta_clase = 7
-
-        proxima_fecha = None
-        for _ in range(10):
-            fecha_candidata = (hoy + timedelta(days=dias_hasta_clase)).date()
-            if not self.ausencias_temporales.filter(fecha=fecha_candidata).exists():
-                proxima_fecha = fecha_candidata
-                break
-            dias_hasta_clase += 7
-
-        if not proxima_fecha:
+        ocurrencia = ocurrencia_de(self)
+        if not ocurrencia['proxima_asistencia']:
             return "Sin próximas clases programadas"
-
-        dias_hasta = (proxima_fecha - hoy.date()).days
-        if dias_hasta == 0:
-            return f"Hoy a las {horario} en {sede}"
-        elif dias_hasta == 1:
-            return f"Mañana a las {horario} en {sede}"
-        else:
-            return f"El {proxima_fecha.strftime('%d/%m')} ({self.clase.dia}) a las {horario} en {sede}"
+        return describir_fecha(ocurrencia['proxima_asistencia'], self.clase, ocurrencia['hoy'])
 
     def get_aclaracion_ausencia(self):
         """
         Si la próxima ocurrencia natural tiene una ausencia registrada,
         devuelve un string descriptivo para mostrar en el template. Si no, devuelve None.
         """
-        if self.fecha_unica:
-            return None
+        from .calendario_service import ocurrencia_de
 
-        hoy = timezone.localtime(timezone.now())
-        dias_semana = {
-            'Lunes': 0, 'Martes': 1, 'Miércoles': 2,
-            'Jueves': 3, 'Viernes': 4, 'Sábado': 5
-        }
-        dia_clase = dias_semana.get(self.clase.dia)
-        if dia_clase is None:
+        if self.fecha_unica:
             return None
 
-        dias_hasta_clase = (dia_clase - hoy.weekday()) % 7
-        if dias_hasta_clase == 0:
-            proxima_hoy = hoy.replace(
-                hour=self.clase.horario.hour,
-                minute=self.clase.horario.minute,
-                second=0, microsecond=0
-            )
-            if proxima_hoy <= hoy:
-                dias_hasta_clase = 7
-
-        primera_fecha = (hoy + timedelta(days=dias_hasta_clase)).date()
-        if not self.ausencias_temporales.filter(fecha=primera_fecha).exists():
+        ocurrencia = ocurrencia_de(self)
+        if not ocurrencia['ausencia_proxima']:
             return None
 
-        dias_ausencia = (primera_fecha - hoy.date()).days
+        primera_fecha = ocurrencia['proxima_fecha']
+        dias_ausencia = (primera_fecha - ocurrencia['hoy']).days
         if dias_ausencia == 0:
             ref = "hoy"
         elif dias_ausencia == 1:
@@ -521,34 +431,21 @@ class Reserva(models.Model):
 
     def get_proxima_fecha(self):
         """Devuelve la fecha (date) de la próxima ocurrencia de esta clase."""
-        hoy = timezone.localtime(timezone.now())
-        dias_semana = {
-            'Lunes': 0, 'Martes': 1, 'Miércoles': 2,
-            'Jueves': 3, 'Viernes': 4, 'Sábado': 5
-        }
-        dia_clase = dias_semana.get(self.clase.dia)
-        if dia_clase is None:
-            return None
-
-        dias_hasta_clase = (dia_clase - hoy.weekday()) % 7
-        if dias_hasta_clase == 0:
-            proxima_clase_hoy = hoy.replace(
-                hour=self.clase.horario.hour,
-                minute=self.clase.horario.minute,
-                second=0, microsecond=0
-            )
-            if proxima_clase_hoy <= hoy:
-                dias_hasta_clase = 7
+        ocurrencia = getattr(self, '_ocurrencia', None)
+        if ocurrencia is not None and not self.fecha_unica:
+            return ocurrencia['proxima_fecha']
 
-        proxima_fecha = (hoy + timedelta(days=dias_hasta_clase)).date()
-        return proxima_fecha
+        from .calendario_service import proxima_ocurrencia
+        return proxima_ocurrencia(self.clase.dia, self.clase.horario)
 
     def tiene_ausencia_proxima(self):
         """Verifica si ya existe una ausencia temporal registrada para la próxima clase."""
-        proxima = self.get_proxima_fecha()
-        if not proxima:
-            return False
-        return self.ausencias_temporales.filter(fecha=proxima).exists()
+        from .calendario_service import ocurrencia_de
+
+        if self.fecha_unica:
+            proxima = self.get_proxima_fecha()
+            return bool(proxima) and self.ausencias_temporales.filter(fecha=proxima).exists()
+        return ocurrencia_de(self)['ausencia_proxima']
 
     def get_nombre_completo_usuario(self):
         """Devuelve el nombre completo del usuario"""
@@ -564,14 +461,12 @@ class Reserva(models.Model):
     @staticmethod
     def contar_reservas_usuario_semana(usuario, fecha_inicio_semana=None):
         """
-        Cuenta las reservas activas de un usuario en una semana específica
+        Cuenta las reservas activas de un usuario en una semana específica.
+        Para la semana actual usa la cuota memoizada del request (ver cuota_service).
         """
         if fecha_inicio_semana is None:
-            hoy = timezone.localtime(timezone.now()).date()
-            if hoy.weekday() == 6:  # Domingo: pertenece a la semana que arranca mañana
-                fecha_inicio_semana = hoy + timedelta(days=1)
-            else:
-                fecha_inicio_semana = hoy - timedelta(days=hoy.weekday())
+            from .cuota_service import cuota_usuario
+            return cuota_usuario(usuario).reservas_semana
 
         fecha_fin_semana = fecha_inicio_semana + timedelta(days=5)
         dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado']
@@ -601,14 +496,17 @@ class Reserva(models.Model):
         """
         Verifica si un usuario puede hacer una nueva reserva según sus planes
         """
+        from .cuota_service import cuota_usuario
+        cuota = cuota_usuario(usuario)
+
         # Verificar si tiene planes activos
-        clases_disponibles, planes = PlanUsuario.obtener_clases_disponibles_usuario(usuario)
+        clases_disponibles = cuota.clases_plan
         
         if clases_disponibles == 0:
             return False, "No tienes un plan activo. Debes seleccionar un plan antes de reservar."
         
         # Contar reservas actuales de la semana
-        reservas_actuales = Reserva.contar_reservas_usuario_semana(usuario)
+        reservas_actuales = cuota.reservas_semana
         
         # Si ya tiene el máximo de reservas
         if reservas_actuales >= clases_disponibles:
@@ -627,48 +525,14 @@ class Reserva(models.Model):
         
         return True, f"Puedes reservar. Tienes {clases_disponibles - reservas_actuales} clases disponibles esta semana."
 
-        class Meta:
-            verbose_name = "Reserva"
-            verbose_name_plural = "Reservas"
-            constraints = [
-                models.UniqueConstraint(
-                    fields=['usuario', 'clase'],
-                    condition=models.Q(activa=True),
-                    name='unique_active_reservation_per_user_class'
-                )
-            ]
-            ordering = ['-fecha_reserva']
-            permissions = [
-                ('can_manage_all_reservas', 'Puede gestionar todas las reservas'),
-                ('can_view_all_reservas', 'Puede ver todas las reservas'),
-            ]
-
     @staticmethod
     def usuario_puede_hacer_recupero(usuario):
-        hoy = timezone.localtime(timezone.now()).date()
-
-        # Ausencias vigentes: cuya ventana de recupero no venció (fecha + 6 días >= hoy)
-        ausencias = AusenciaTemporal.objects.filter(
-            reserva__usuario=usuario,
-            reserva__activa=True,
-            reserva__fecha_unica__isnull=True,
-            fecha__gte=hoy - timedelta(days=6),
-        ).select_related('reserva__clase')
-
-        n_ausencias = ausencias.count()
-        if n_ausencias == 0:
-            return False, 0, ausencias
-
-        # Recuperos ya reservados activos a partir de hoy
-        recuperos_usados = Reserva.objects.filter(
-            usuario=usuario,
-            activa=True,
-            es_recupero=True,
-            fecha_unica__gte=hoy,
-        ).count()
-
-        disponibles = n_ausencias - recuperos_usados
-        return disponibles > 0, disponibles, ausencias
+        """
+        Devuelve (puede_recuperar, recuperos_disponibles, ausencias_vigentes),
+        memoizado por request (ver cuota_service).
+        """
+        from .cuota_service import cuota_usuario
+        return cuota_usuario(usuario).recupero
 
 class AusenciaTemporal(models.Model):
     """
@@ -694,6 +558,15 @@ class AusenciaTemporal(models.Model):
         verbose_name="Notificación de vencimiento vista",
         help_text="True cuando el usuario ya vio el aviso de que perdió el plazo de recupero"
     )
+    cierre = models.ForeignKey(
+        'CierreClase',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ausencias',
+        verbose_name="Cierre",
+        help_text="Cierre del estudio que generó la ausencia (vacío si la avisó el cliente)"
+    )
 
     class Meta:
         verbose_name = "Ausencia Temporal"
@@ -701,6 +574,11 @@ class AusenciaTemporal(models.Model):
         unique_together = ['reserva', 'fecha']
         ordering = ['-fecha']
 
+    def save(self, *args, **kwargs):
+        # Atómico junto con la señal que suma la ausencia a ClaseOcupacion
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
     @property
     def fecha_limite_recupero(self):
         """
@@ -722,6 +600,253 @@ class AusenciaTemporal(models.Model):
             f"el {self.fecha.strftime('%d/%m/%Y')}"
         )
 
+class CreditoRecupero(models.Model):
+    """
+    Crédito de recupero: cada ausencia a una reserva permanente otorga uno,
+    válido hasta su fecha límite. Registra su ciclo de vida (otorgado,
+    consumido por una reserva de recupero, vencido o anulado).
+    Se administra desde recuperos_service.
+    """
+    ESTADOS = [
+        ('disponible', 'Disponible'),
+        ('consumido', 'Consumido'),
+        ('vencido', 'Vencido'),
+        ('anulado', 'Anulado'),
+    ]
+
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='creditos_recupero',
+        verbose_name="Usuario"
+    )
+    ausencia = models.OneToOneField(
+        AusenciaTemporal,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='credito_recupero',
+        verbose_name="Ausencia que lo otorgó"
+    )
+    reserva_recupero = models.ForeignKey(
+        Reserva,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='creditos_consumidos',
+        verbose_name="Reserva de recupero"
+    )
+    estado = models.CharField(
+        max_length=15,
+        choices=ESTADOS,
+        default='disponible',
+        verbose_name="Estado"
+    )
+    fecha_limite = models.DateField(
+        verbose_name="Fecha límite",
+        help_text="Último día en que se puede usar (fecha de la ausencia + 6 días)"
+    )
+    fecha_otorgado = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Otorgado el"
+    )
+    fecha_consumo = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Consumido el"
+    )
+    fecha_cierre = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Vencido / anulado el"
+    )
+
+    class Meta:
+        verbose_name = "Crédito de Recupero"
+        verbose_name_plural = "Créditos de Recupero"
+        ordering = ['-fecha_otorgado']
+        indexes = [
+            # Créditos disponibles de un usuario, del que vence antes al último
+            models.Index(fields=['usuario', 'estado', 'fecha_limite'], name='credito_usuario_estado_idx'),
+            # Vencimiento nocturno
+            models.Index(
+                fields=['fecha_limite'],
+                condition=models.Q(estado='disponible'),
+                name='credito_disponible_limite_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Crédito de {self.usuario.username} ({self.get_estado_display()}, hasta {self.fecha_limite.strftime('%d/%m/%Y')})"
+
+class SaldoRecupero(models.Model):
+    """
+    Saldo de créditos de recupero disponibles de un usuario (una fila por usuario).
+    Consultar si puede recuperar es leer esta fila. Lo recalcula recuperos_service
+    cada vez que cambia un crédito del usuario.
+    """
+    usuario = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='saldo_recupero',
+        verbose_name="Usuario"
+    )
+    disponibles = models.IntegerField(
+        default=0,
+        verbose_name="Créditos disponibles"
+    )
+    proximo_vencimiento = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name="Próximo vencimiento",
+        help_text="Fecha límite del crédito disponible que vence primero"
+    )
+    fecha_actualizacion = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Última actualización"
+    )
+
+    class Meta:
+        verbose_name = "Saldo de Recuperos"
+        verbose_name_plural = "Saldos de Recuperos"
+
+    def __str__(self):
+        return f"{self.usuario.username}: {self.disponibles} recupero(s)"
+
+class ClaseOcupacion(models.Model):
+    """
+    Ocupación desnormalizada de una clase, mantenida de forma incremental
+    por señales de Reserva y AusenciaTemporal.
+    La fila con fecha vacía guarda la base semanal (solo reservas permanentes);
+    las filas con fecha guardan ausencias y reservas de fecha única de ese día.
+    Las altas y bajas de permanentes solo actualizan la base y las filas desde hoy:
+    las filas de fechas pasadas conservan la ocupación que tuvieron.
+    Se reconstruye con: python manage.py reconciliar_ocupacion
+    """
+    clase = models.ForeignKey(
+        Clase,
+        on_delete=models.CASCADE,
+        related_name='ocupaciones',
+        verbose_name="Clase"
+    )
+    fecha = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name="Fecha",
+        help_text="Vacía para la fila base de la clase (solo permanentes)"
+    )
+    permanentes = models.IntegerField(
+        default=0,
+        verbose_name="Reservas permanentes"
+    )
+    ausencias = models.IntegerField(
+        default=0,
+        verbose_name="Ausencias del día"
+    )
+    fecha_unica = models.IntegerField(
+        default=0,
+        verbose_name="Reservas de fecha única del día"
+    )
+    fecha_actualizacion = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Última actualización"
+    )
+
+    class Meta:
+        verbose_name = "Ocupación de Clase"
+        verbose_name_plural = "Ocupaciones de Clases"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['clase', 'fecha'],
+                name='unique_ocupacion_clase_fecha'
+            ),
+            models.UniqueConstraint(
+                fields=['clase'],
+                condition=models.Q(fecha__isnull=True),
+                name='unique_ocupacion_base_clase'
+            ),
+        ]
+        indexes = [
+            # Búsqueda de cupos liberados por ausencias (ver buscar_cupos_liberados)
+            models.Index(
+                fields=['fecha', 'clase'],
+                condition=models.Q(ausencias__gt=0),
+                name='ocupacion_ausencias_fecha_idx'
+            ),
+        ]
+        ordering = ['clase', 'fecha']
+
+    def cupos_disponibles(self):
+        """Cupos libres de la clase para esta fecha (o en general, si es la fila base)"""
+        if not self.clase.activa:
+            return 0
+        ocupados = self.permanentes - self.ausencias + self.fecha_unica
+        return max(0, self.clase.cupo_maximo - ocupados)
+
+    def __str__(self):
+        fecha = self.fecha.strftime('%d/%m/%Y') if self.fecha else 'base'
+        return f"Ocupación {self.clase.get_nombre_display()} {self.clase.dia} ({fecha})"
+
+class ClaseOcurrencia(models.Model):
+    """
+    Fecha concreta en que se dicta una clase semanal. Las genera
+    `python manage.py generar_ocurrencias` con varias semanas de anticipación
+    (y se sincronizan al crear o modificar una clase), para que asistencia,
+    recordatorios y limpiezas consulten por fecha real en lugar de
+    recalcular el día de la semana en Python. Las pasadas se conservan como historial.
+    """
+    clase = models.ForeignKey(
+        Clase,
+        on_delete=models.CASCADE,
+        related_name='ocurrencias',
+        verbose_name="Clase"
+    )
+    fecha = models.DateField(
+        verbose_name="Fecha"
+    )
+    inicio = models.DateTimeField(
+        verbose_name="Inicio",
+        help_text="Fecha y hora de inicio de la clase ese día"
+    )
+
+    class Meta:
+        verbose_name = "Ocurrencia de Clase"
+        verbose_name_plural = "Ocurrencias de Clases"
+        ordering = ['fecha', 'inicio']
+        constraints = [
+            models.UniqueConstraint(fields=['clase', 'fecha'], name='unique_clase_ocurrencia_fecha'),
+        ]
+        indexes = [
+            # "Qué clases se dictan tal día" (asistencia, recordatorios, limpieza de fecha única)
+            models.Index(fields=['fecha', 'clase'], name='ocurrencia_fecha_clase_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.clase} - {self.fecha.strftime('%d/%m/%Y')}"
+
+class SecuenciaNumeracion(models.Model):
+    """
+    Contador persistente para numeraciones (ej: números de reserva) en bases
+    de datos sin secuencias nativas. En PostgreSQL se usa una SEQUENCE real.
+    Ver gravity/numeracion_service.py
+    """
+    nombre = models.CharField(
+        max_length=50,
+        primary_key=True,
+        verbose_name="Nombre"
+    )
+    valor = models.BigIntegerField(
+        default=0,
+        verbose_name="Último valor entregado"
+    )
+
+    class Meta:
+        verbose_name = "Secuencia de Numeración"
+        verbose_name_plural = "Secuencias de Numeración"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
+
 class Inasistencia(models.Model):
     """
     Registra que un cliente NO asistió a su clase sin haber avisado previamente.
@@ -1042,6 +1167,39 @@ class EstadoPagoCliente(models.Model):
         help_text="Monto adeudado del mes actual"
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._saldo_leido = instancia.__dict__.get('saldo_actual')
+        return instancia
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._saldo_leido = self.__dict__.get('saldo_actual')
+
+    def save(self, *args, **kwargs):
+        # saldo_actual lo mantiene el libro de movimientos (cuenta_service): no se
+        # escribe desde save(). Un save() completo de una instancia leída antes de
+        # un movimiento no lo pisa, y cambiarlo a mano es un error (no se descarta
+        # en silencio): las correcciones van por pagos o ajustes de deuda.
+        if not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            saldo_modificado = (
+                'saldo_actual' in self.__dict__
+                and self.saldo_actual != getattr(self, '_saldo_leido', self.saldo_actual)
+            )
+            if saldo_modificado or (update_fields is not None and 'saldo_actual' in update_fields):
+                raise ValidationError({
+                    'saldo_actual': 'El saldo lo calcula el libro de movimientos de cuenta. '
+                                    'Para corregirlo registrá un pago o ajustá la deuda correspondiente.'
+                })
+            if update_fields is None:
+                kwargs['update_fields'] = [
+                    campo.name for campo in self._meta.concrete_fields
+                    if not campo.primary_key and campo.name != 'saldo_actual'
+                ]
+        super().save(*args, **kwargs)
+
     def clean(self):
         """Validaciones personalizadas del modelo"""
         super().clean()
@@ -1112,66 +1270,18 @@ class EstadoPagoCliente(models.Model):
 
     def calcular_saldo_actual(self):
         """
-        Calcula el saldo basado en:
-        1. Total pagado históricamente
-        2. Menos: costo mensual × meses que debe haber pagado
-        """
-        if not self.plan_actual:
-            return Decimal('0')
-        
-        # Total pagado por el cliente (histórico completo)
-        total_pagado = RegistroPago.objects.filter(
-            cliente=self.usuario,
-            estado='confirmado'
-        ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-        
-        # Calcular cuántos meses debe
-        meses_que_debe = self._calcular_meses_que_debe()
-        
-        # Total que debería haber pagado
-        total_que_debe = self.plan_actual.precio_mensual * meses_que_debe
-        
-        # Saldo = Total pagado - Total que debe
-        return total_pagado - total_que_debe
-
-    def _calcular_meses_que_debe(self):
-        """
-        Calcula cuántos meses debe haber pagado el cliente
+        Saldo corrido del cliente (pagos confirmados - deudas generadas), tal como
+        lo deja el libro MovimientoCuenta: lectura de una sola fila.
         """
-        if not self.plan_actual:
-            return 0
-        
-        # Buscar el primer pago o cuando se asignó el plan
-        primer_pago = RegistroPago.objects.filter(
-            cliente=self.usuario,
-            estado='confirmado'
-        ).order_by('fecha_pago').first()
-        
-        # Si no hay pagos, usar fecha de creación del estado de pago
-        fecha_inicio = primer_pago.fecha_pago if primer_pago else self.fecha_creacion.date()
-
-        hoy = timezone.localtime(timezone.now()).date()
-        
-        # Calcular meses transcurridos
-        meses_transcurridos = (hoy.year - fecha_inicio.year) * 12 + (hoy.month - fecha_inicio.month)
-        
-        # Si ya pasó el día 10 del mes actual, contar este mes también
-        if hoy.day > 10:
-            meses_transcurridos += 1
-        
-        return max(0, meses_transcurridos)
+        from .cuenta_service import saldo_cuenta
+        return saldo_cuenta(self.usuario)
 
     def actualizar_saldo_automatico(self):
         """
-        Actualiza el saldo recalculando desde el histórico completo
+        Refresca en esta instancia el saldo que mantiene el libro de movimientos
         """
-        nuevo_saldo = self.calcular_saldo_actual()
-        
-        if self.saldo_actual != nuevo_saldo:
-            self.saldo_actual = nuevo_saldo
-            self.save()
-        
-        return nuevo_saldo
+        self.saldo_actual = self._saldo_leido = self.calcular_saldo_actual()
+        return self.saldo_actual
     
     def generar_deuda_mes_actual(self):
         """
@@ -1242,11 +1352,11 @@ class EstadoPagoCliente(models.Model):
             observaciones=f"Deuda generada automáticamente al {'registrarse' if es_medio_mes else 'seleccionar plan'}"
         )
         
-        # Actualizar el saldo actual (deuda = saldo negativo)
-        self.saldo_actual -= monto_a_cobrar
+        # El cargo al saldo lo registra el libro de movimientos al crear la deuda
         self.monto_deuda_mensual = monto_a_cobrar
         self.fecha_limite_pago = fecha_vencimiento
-        
+        self.actualizar_saldo_automatico()
+
         self.save()
 
         return nueva_deuda
@@ -1318,17 +1428,10 @@ class EstadoPagoCliente(models.Model):
                 observaciones='Deuda generada por aprobación de cambio de plan'
             )
 
-        # Recalcular saldo desde el histórico completo (pagos confirmados - deudas generadas)
-        total_pagado = RegistroPago.objects.filter(
-            cliente=self.usuario, estado='confirmado'
-        ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-        total_deudas = DeudaMensual.objects.filter(
-            usuario=self.usuario
-        ).aggregate(total=Sum('monto_original'))['total'] or Decimal('0')
-
-        self.saldo_actual = total_pagado - total_deudas
+        # El saldo ya lo actualizó el libro de movimientos al guardar la deuda
+        self.actualizar_saldo_automatico()
         self.monto_deuda_mensual = deuda_actual.monto_pendiente
-        self.save(update_fields=['saldo_actual', 'monto_deuda_mensual'])
+        self.save(update_fields=['monto_deuda_mensual'])
 
         return deuda_actual
 
@@ -1558,6 +1661,7 @@ class RegistroPago(models.Model):
                                 Decimal('0'),
                                 deuda.monto_pendiente - diferencia
                             )
+                            deuda._tipo_movimiento = 'descuento'
                             deuda.save(update_fields=['monto_original', 'monto_pendiente'])
                     except Exception:
                         pass  # Si falla el ajuste, continuar con el monto original
@@ -1566,19 +1670,10 @@ class RegistroPago(models.Model):
                 monto_aplicado = deuda.aplicar_pago_parcial(monto_restante)
                 monto_restante -= Decimal(str(monto_aplicado))
 
-            # 📊 PASO 2: Recalcular el saldo DESDE CERO
-            # Saldo = Total pagado - Total de deudas generadas (monto_original ajustado)
-
-            total_pagado = RegistroPago.objects.filter(
-                cliente=self.cliente,
-                estado='confirmado'
-            ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-
-            total_deudas_generadas = DeudaMensual.objects.filter(
-                usuario=self.cliente
-            ).aggregate(total=Sum('monto_original'))['total'] or Decimal('0')
-
-            estado_cliente.saldo_actual = total_pagado - total_deudas_generadas
+            # 📊 PASO 2: Leer el saldo corrido
+            # El pago, la deuda del mes y el descuento por efectivo ya se registraron
+            # en el libro de movimientos (Saldo = Total pagado - Total de deudas generadas)
+            estado_cliente.actualizar_saldo_automatico()
 
             # Si no quedan deudas vencidas pendientes, desbloquear reservas
             if not estado_cliente.puede_reservar:
@@ -1607,49 +1702,195 @@ class RegistroPago(models.Model):
 # Señales para actualizar automáticamente el estado de pagos cuando cambian las reservas
 @receiver(post_save, sender=Reserva)
 def actualizar_estado_pago_por_reserva(sender, instance, created, raw=False, **kwargs):
-    if raw:
-        return
     """
-    Actualiza el estado de pago cuando se crea o modifica una reserva.
-    Genera deuda automática al asignar un plan nuevo.
+    Encola la actualización del estado de pago (plan y deuda del mes) cuando se crea
+    o modifica una reserva. La procesa `python manage.py procesar_tareas`, fuera del
+    request, agrupando los cambios de un mismo usuario.
     """
+    if raw:
+        return
 
     # Las reservas de fecha única (cupos temporales y recuperos) no cambian el plan
     if instance.fecha_unica:
         return
 
-    try:
-        estado_cliente, created_estado = EstadoPagoCliente.objects.get_or_create(
-            usuario=instance.usuario,
-            defaults={'activo': True}
-        )
-        
-        # Guardar el plan anterior para detectar cambios
-        plan_anterior = estado_cliente.plan_actual
-        
-        # Actualizar plan según reservas actuales
-        nuevo_plan = estado_cliente.actualizar_plan_automatico()
-        
-        # Si es una nueva reserva Y se asignó un plan nuevo (o es la primera vez)
-        if created and nuevo_plan and (not plan_anterior or plan_anterior != nuevo_plan):
-            # Generar deuda del mes actual automáticamente
-            deuda_generada = estado_cliente.generar_deuda_mes_actual()
-            
-            if deuda_generada:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.info(
-                    f"Deuda generada automáticamente para {instance.usuario.username}: "
-                    f"${deuda_generada.monto_original} - Plan: {nuevo_plan.nombre}"
-                )
-        
-    except Exception as e:
-        # Log del error pero no fallar la operación
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"Error actualizando estado de pago por reserva {instance.id}: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
+    from .tareas_service import encolar_tarea
+    encolar_tarea(
+        'actualizar_estado_pago',
+        usuario_id=instance.usuario_id,
+        datos={'reserva_id': instance.id, 'nueva_reserva': created}
+    )
+
+# Señales para mantener ClaseOcupacion al día cuando cambian reservas y ausencias
+@receiver(post_init, sender=Reserva)
+def guardar_estado_ocupacion_reserva(sender, instance, **kwargs):
+    """Recuerda el estado original de la reserva para calcular la diferencia al guardar."""
+    if instance.pk:
+        instance._estado_ocupacion = (instance.activa, instance.clase_id, instance.fecha_unica)
+    else:
+        instance._estado_ocupacion = None
+
+@receiver(post_save, sender=Reserva)
+def actualizar_ocupacion_por_reserva(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    from .ocupacion_service import aplicar_cambio_reserva
+
+    anterior = None if created else getattr(instance, '_estado_ocupacion', None)
+    actual = (instance.activa, instance.clase_id, instance.fecha_unica)
+    if anterior != actual:
+        aplicar_cambio_reserva(instance, anterior, actual)
+    instance._estado_ocupacion = actual
+
+@receiver(post_delete, sender=Reserva)
+def actualizar_ocupacion_por_reserva_eliminada(sender, instance, **kwargs):
+    from .ocupacion_service import aplicar_cambio_reserva
+
+    anterior = getattr(instance, '_estado_ocupacion', None)
+    if anterior:
+        aplicar_cambio_reserva(instance, anterior, None)
+
+@receiver(post_save, sender=AusenciaTemporal)
+def actualizar_ocupacion_por_ausencia(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from .ocupacion_service import aplicar_cambio_ausencia
+    aplicar_cambio_ausencia(instance, 1)
+
+@receiver(post_delete, sender=AusenciaTemporal)
+def actualizar_ocupacion_por_ausencia_eliminada(sender, instance, **kwargs):
+    from .ocupacion_service import aplicar_cambio_ausencia
+    aplicar_cambio_ausencia(instance, -1)
+
+# Las ocurrencias futuras de una clase siguen a su día, horario y estado
+@receiver(post_save, sender=Clase)
+def sincronizar_ocurrencias_clase(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .calendario_service import generar_ocurrencias
+    generar_ocurrencias(clase_ids=[instance.id])
+
+# Créditos de recupero: las ausencias los otorgan y las cancelaciones los reintegran o anulan
+@receiver(post_init, sender=Reserva)
+def guardar_estado_credito_reserva(sender, instance, **kwargs):
+    instance._activa_credito = instance.activa if instance.pk else None
+
+@receiver(post_save, sender=Reserva)
+def actualizar_creditos_por_reserva(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created and getattr(instance, '_activa_credito', None) and not instance.activa:
+        from .recuperos_service import liberar_creditos_de_reservas
+        liberar_creditos_de_reservas([instance.pk])
+    instance._activa_credito = instance.activa
+
+@receiver(post_save, sender=AusenciaTemporal)
+def otorgar_credito_por_ausencia(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    reserva = instance.reserva
+    if reserva.activa and reserva.fecha_unica is None:
+        from .recuperos_service import otorgar_creditos
+        otorgar_creditos([(instance.pk, reserva.usuario_id, instance.fecha)])
+
+@receiver(pre_delete, sender=AusenciaTemporal)
+def anular_credito_por_ausencia(sender, instance, **kwargs):
+    from .recuperos_service import anular_credito_de_ausencia
+    anular_credito_de_ausencia(instance.pk)
+
+# Cuenta corriente: cada cambio de deudas y pagos confirmados agrega un movimiento al libro
+def _borrado_por_usuario(origin):
+    """True si el borrado es la cascada de eliminar el usuario (su cuenta desaparece con él)."""
+    return isinstance(origin, User) or getattr(origin, 'model', None) is User
+
+@receiver(post_init, sender='gravity.DeudaMensual')
+def guardar_monto_deuda_cuenta(sender, instance, **kwargs):
+    instance._monto_cuenta = instance.monto_original if instance.pk else None
+
+@receiver(post_save, sender='gravity.DeudaMensual')
+def registrar_movimiento_deuda(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    from .cuenta_service import registrar_movimiento
+    mes = instance.mes_año.strftime('%m/%Y')
+    if created:
+        registrar_movimiento(instance.usuario_id, 'cargo', -instance.monto_original,
+                             descripcion=f'Cuota {mes}', deuda=instance)
+    elif instance._monto_cuenta is not None and instance.monto_original != instance._monto_cuenta:
+        diferencia = instance._monto_cuenta - instance.monto_original
+        # Quien baja el monto puede indicar que es un descuento (ej. precio en efectivo)
+        tipo = getattr(instance, '_tipo_movimiento', None) or ('cargo' if diferencia < 0 else 'ajuste')
+        registrar_movimiento(instance.usuario_id, tipo, diferencia,
+                             descripcion=f'Cuota {mes}: ${instance._monto_cuenta} → ${instance.monto_original}',
+                             deuda=instance)
+    instance._monto_cuenta = instance.monto_original
+
+@receiver(post_delete, sender='gravity.DeudaMensual')
+def registrar_movimiento_deuda_eliminada(sender, instance, origin=None, **kwargs):
+    if _borrado_por_usuario(origin):
+        return
+    from .cuenta_service import registrar_movimiento
+    registrar_movimiento(instance.usuario_id, 'ajuste', instance.monto_original,
+                         descripcion=f'Cuota {instance.mes_año.strftime("%m/%Y")} eliminada')
+
+@receiver(post_init, sender=RegistroPago)
+def guardar_estado_pago_cuenta(sender, instance, **kwargs):
+    instance._aporte_cuenta = (
+        (instance.cliente_id, instance.monto if instance.estado == 'confirmado' else Decimal('0'))
+        if instance.pk else None
+    )
+
+@receiver(post_save, sender=RegistroPago)
+def registrar_movimiento_pago(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    from .cuenta_service import registrar_movimiento
+    anterior = instance._aporte_cuenta or (instance.cliente_id, Decimal('0'))
+    actual = (instance.cliente_id, instance.monto if instance.estado == 'confirmado' else Decimal('0'))
+    if anterior != actual:
+        if anterior[0] != actual[0]:
+            registrar_movimiento(anterior[0], 'ajuste', -anterior[1],
+                                 descripcion=f'Pago #{instance.pk} reasignado', pago=instance)
+            anterior = (actual[0], Decimal('0'))
+        diferencia = actual[1] - anterior[1]
+        registrar_movimiento(actual[0], 'pago' if diferencia > 0 else 'ajuste', diferencia,
+                             descripcion=instance.concepto if diferencia > 0 else f'Pago #{instance.pk} revertido',
+                             pago=instance)
+    instance._aporte_cuenta = actual
+
+@receiver(post_delete, sender=RegistroPago)
+def registrar_movimiento_pago_eliminado(sender, instance, origin=None, **kwargs):
+    if _borrado_por_usuario(origin) or instance.estado != 'confirmado':
+        return
+    from .cuenta_service import registrar_movimiento
+    registrar_movimiento(instance.cliente_id, 'ajuste', -instance.monto,
+                         descripcion=f'Pago #{instance.pk} eliminado')
+
+# Los cambios en reservas, ausencias o planes invalidan la cuota memoizada del usuario
+@receiver([post_save, post_delete], sender=Reserva)
+@receiver([post_save, post_delete], sender='gravity.PlanUsuario')
+def invalidar_cuota_usuario(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .cuota_service import invalidar_cuota
+    invalidar_cuota(instance.usuario_id)
+
+@receiver([post_save, post_delete], sender=AusenciaTemporal)
+def invalidar_cuota_usuario_por_ausencia(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .cuota_service import invalidar_cuota_reserva
+    invalidar_cuota_reserva(instance.reserva_id)
+
+# Cualquier cambio en clases, reservas o ausencias invalida la cache de disponibilidad
+@receiver([post_save, post_delete], sender=Clase)
+@receiver([post_save, post_delete], sender=Reserva)
+@receiver([post_save, post_delete], sender=AusenciaTemporal)
+def invalidar_cache_disponibilidad(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .cache_service import invalidar_disponibilidad
+    invalidar_disponibilidad()
 
 # función para crear estados de pago para usuarios existentes
 def crear_estados_pago_usuarios_existentes():
@@ -1870,28 +2111,11 @@ class PlanUsuario(models.Model):
     def obtener_clases_disponibles_usuario(usuario, fecha_inicio_semana=None):
         """
         Método estático para obtener el total de clases disponibles 
-        para un usuario en una semana específica
+        para un usuario (plan vigente hoy), memoizado por request (ver cuota_service).
         """
-        if fecha_inicio_semana is None:
-            # Obtener el lunes de la semana actual (los domingos, la semana que arranca mañana)
-            hoy = timezone.localtime(timezone.now()).date()
-            if hoy.weekday() == 6:
-                fecha_inicio_semana = hoy + timedelta(days=1)
-            else:
-                fecha_inicio_semana = hoy - timedelta(days=hoy.weekday())
-
-        # Obtener el plan activo y vigente del usuario (solo puede haber uno)
-        hoy_local = timezone.localtime(timezone.now()).date()
-        planes_vigentes = PlanUsuario.objects.filter(
-            usuario=usuario,
-            activo=True,
-            fecha_inicio__lte=hoy_local,
-            fecha_fin__gte=hoy_local
-        )
-
-        plan_vigente = planes_vigentes.first()
-        total_clases = plan_vigente.plan.clases_por_semana if plan_vigente else 0
-        return total_clases, planes_vigentes
+        from .cuota_service import cuota_usuario
+        cuota = cuota_usuario(usuario)
+        return cuota.clases_plan, cuota.planes_vigentes
 
 class SolicitudCambioPlan(models.Model):
     """
@@ -2116,6 +2340,18 @@ class DeudaMensual(models.Model):
         verbose_name = "Deuda Mensual"
         verbose_name_plural = "Deudas Mensuales"
         unique_together = ['usuario', 'mes_año']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(monto_pendiente__gte=0),
+                name='deuda_monto_pendiente_no_negativo',
+                violation_error_message='El monto pendiente no puede ser negativo.',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(monto_pendiente__lte=models.F('monto_original')),
+                name='deuda_monto_pendiente_hasta_original',
+                violation_error_message='El monto pendiente no puede ser mayor al monto original.',
+            ),
+        ]
         ordering = ['-mes_año']
 
 class NotificacionCancelacionPlan(models.Model):
@@ -2222,6 +2458,15 @@ class CancelacionAdmin(models.Model):
         default=False,
         verbose_name="Email enviado al usuario"
     )
+    cierre = models.ForeignKey(
+        'CierreClase',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='cancelaciones',
+        verbose_name="Cierre",
+        help_text="Cierre del estudio que generó la cancelación"
+    )
     fecha_creacion = models.DateTimeField(
         auto_now_add=True,
         verbose_name="Fecha de cancelación"
@@ -2241,6 +2486,139 @@ class CancelacionAdmin(models.Model):
             f"{self.reserva.clase.dia} {self.reserva.clase.horario.strftime('%H:%M')}"
         )
 
+class CierreClase(models.Model):
+    """
+    Cierre del estudio en una fecha (feriado, ausencia de instructora...):
+    una clase puntual o todas las clases de una sede ese día.
+    Las reservas permanentes reciben una ausencia (con derecho a recupero) y las
+    de fecha única se cancelan. Ver gravity/cierres_service.py.
+    """
+    ESTADOS_NOTIFICACION = [
+        ('no_aplica', 'Sin notificación'),
+        ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
+        ('completada', 'Completada'),
+    ]
+
+    fecha = models.DateField(
+        verbose_name="Fecha del cierre"
+    )
+    direccion = models.CharField(
+        max_length=20,
+        choices=Clase.DIRECCIONES,
+        verbose_name="Sede"
+    )
+    clase = models.ForeignKey(
+        Clase,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='cierres_puntuales',
+        verbose_name="Clase",
+        help_text="Vacío si se cerró la sede completa"
+    )
+    motivo = models.CharField(
+        max_length=100,
+        verbose_name="Motivo"
+    )
+    motivo_detalle = models.TextField(
+        blank=True,
+        verbose_name="Detalle del motivo"
+    )
+    admin_user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='cierres_realizados',
+        verbose_name="Administrador"
+    )
+    clases_cerradas = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Clases cerradas"
+    )
+    ausencias_creadas = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Ausencias registradas"
+    )
+    reservas_canceladas = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Reservas canceladas"
+    )
+    estado_notificacion = models.CharField(
+        max_length=20,
+        choices=ESTADOS_NOTIFICACION,
+        default='no_aplica',
+        verbose_name="Notificación"
+    )
+    emails_total = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Emails a enviar"
+    )
+    emails_enviados = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Emails enviados"
+    )
+    emails_fallidos = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Emails fallidos"
+    )
+    usuarios_notificados = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name="Alumnos notificados",
+        help_text="IDs de los alumnos que ya recibieron el email (no se les reenvía si la tarea se repite)"
+    )
+    fecha_creacion = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Fecha de creación"
+    )
+
+    class Meta:
+        verbose_name = "Cierre de Clases"
+        verbose_name_plural = "Cierres de Clases"
+        ordering = ['-fecha_creacion']
+
+    def get_alcance_display(self):
+        """Describe qué se cerró: la clase puntual o la sede completa"""
+        if self.clase_id:
+            return f"{self.clase.get_nombre_display()} {self.clase.horario.strftime('%H:%M')}"
+        return f"Toda la sede {dict(Clase.DIRECCIONES).get(self.direccion, self.direccion)}"
+
+    def __str__(self):
+        return f"Cierre {self.fecha.strftime('%d/%m/%Y')} — {self.get_alcance_display()} ({self.motivo})"
+
+class ClaseCerrada(models.Model):
+    """
+    Clase que no se dicta en una fecha por un CierreClase.
+    No se aceptan reservas de fecha única para esa clase y fecha.
+    """
+    cierre = models.ForeignKey(
+        CierreClase,
+        on_delete=models.CASCADE,
+        related_name='clases',
+        verbose_name="Cierre"
+    )
+    clase = models.ForeignKey(
+        Clase,
+        on_delete=models.CASCADE,
+        related_name='cierres',
+        verbose_name="Clase"
+    )
+    fecha = models.DateField(
+        verbose_name="Fecha"
+    )
+
+    class Meta:
+        verbose_name = "Clase Cerrada"
+        verbose_name_plural = "Clases Cerradas"
+        ordering = ['fecha', 'clase']
+        constraints = [
+            models.UniqueConstraint(fields=['clase', 'fecha'], name='unique_clase_cerrada_fecha'),
+        ]
+
+    def __str__(self):
+        return f"{self.clase} cerrada el {self.fecha.strftime('%d/%m/%Y')}"
+
 class AjusteDeudaEspecial(models.Model):
     """
     Registro de auditoría de ajustes de deuda acordados con el cliente.
@@ -2292,3 +2670,251 @@ class AjusteDeudaEspecial(models.Model):
         mes = self.deuda.mes_año.strftime('%B %Y')
         return f"Ajuste {mes} — {self.usuario_cliente.get_full_name() or self.usuario_cliente.username} — ${self.monto_ajustado}"
 
+
+# ==============================================================================
+# LIBRO DE MOVIMIENTOS DE CUENTA
+# ==============================================================================
+
+class MovimientoCuenta(models.Model):
+    """
+    Movimiento de la cuenta corriente de un cliente (libro de solo escritura).
+    Cada cargo, pago, ajuste o descuento guarda el saldo resultante, así el
+    saldo del cliente (EstadoPagoCliente.saldo_actual) se actualiza sumando un
+    importe en lugar de volver a totalizar pagos y deudas de toda la historia.
+    """
+    TIPOS = [
+        ('cargo', 'Cargo'),
+        ('pago', 'Pago'),
+        ('ajuste', 'Ajuste'),
+        ('descuento', 'Descuento'),
+    ]
+
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='movimientos_cuenta',
+        verbose_name="Cliente"
+    )
+    tipo = models.CharField(
+        max_length=15,
+        choices=TIPOS,
+        verbose_name="Tipo"
+    )
+    monto = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name="Monto",
+        help_text="Positivo = a favor del cliente, Negativo = cargo"
+    )
+    saldo_resultante = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name="Saldo resultante"
+    )
+    deuda = models.ForeignKey(
+        DeudaMensual,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos',
+        verbose_name="Deuda"
+    )
+    pago = models.ForeignKey(
+        RegistroPago,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos',
+        verbose_name="Pago"
+    )
+    descripcion = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name="Descripción"
+    )
+    fecha = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Fecha"
+    )
+
+    class Meta:
+        verbose_name = "Movimiento de Cuenta"
+        verbose_name_plural = "Movimientos de Cuenta"
+        ordering = ['-fecha', '-id']
+        indexes = [
+            models.Index(fields=['usuario', 'fecha'], name='movimiento_usuario_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} ${self.monto} — {self.usuario.username} (saldo ${self.saldo_resultante})"
+
+# ==============================================================================
+# RESUMEN FINANCIERO MENSUAL (CUBO)
+# ==============================================================================
+
+class ResumenFinancieroMensual(models.Model):
+    """
+    Totales financieros agregados por mes × plan × tipo de pago × estado.
+    Las filas de origen 'deuda' resumen DeudaMensual (cargado, pendiente y
+    descuento por efectivo); las de origen 'pago' resumen RegistroPago (cobrado).
+    Los reportes leen esta tabla en lugar de recorrer pagos y deudas.
+    Se actualiza con: python manage.py actualizar_resumen_financiero
+    """
+    ORIGENES = [
+        ('deuda', 'Deudas'),
+        ('pago', 'Pagos'),
+    ]
+
+    mes = models.DateField(
+        verbose_name="Mes",
+        help_text="Primer día del mes"
+    )
+    origen = models.CharField(
+        max_length=10,
+        choices=ORIGENES,
+        verbose_name="Origen"
+    )
+    plan = models.ForeignKey(
+        PlanPago,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='resumenes_financieros',
+        verbose_name="Plan"
+    )
+    tipo_pago = models.CharField(
+        max_length=20,
+        blank=True,
+        verbose_name="Tipo de pago",
+        help_text="Vacío en las filas de deudas"
+    )
+    estado = models.CharField(
+        max_length=20,
+        verbose_name="Estado",
+        help_text="Estado de la deuda o del pago"
+    )
+    cantidad = models.IntegerField(
+        default=0,
+        verbose_name="Cantidad"
+    )
+    monto_cargado = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Monto cargado"
+    )
+    monto_cobrado = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Monto cobrado"
+    )
+    monto_pendiente = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Monto pendiente"
+    )
+    monto_descuento = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Descuento por efectivo"
+    )
+    fecha_actualizacion = models.DateTimeField(
+        verbose_name="Última actualización",
+        help_text="Inicio de la actualización que calculó la fila"
+    )
+
+    class Meta:
+        verbose_name = "Resumen Financiero Mensual"
+        verbose_name_plural = "Resúmenes Financieros Mensuales"
+        ordering = ['-mes', 'origen', 'plan', 'tipo_pago', 'estado']
+        indexes = [
+            models.Index(fields=['mes', 'origen'], name='resumen_fin_mes_origen_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.mes.strftime('%m/%Y')} {self.get_origen_display()} — {self.estado} ({self.cantidad})"
+
+# ==============================================================================
+# COLA DE TAREAS EN SEGUNDO PLANO
+# ==============================================================================
+
+class TareaPendiente(models.Model):
+    """
+    Tarea encolada para procesar fuera del request (ver gravity/tareas_service.py).
+    Las procesa el comando: python manage.py procesar_tareas
+    """
+    TIPOS = [
+        ('actualizar_estado_pago', 'Actualizar estado de pago por reservas'),
+        ('email_confirmacion_reservas', 'Email de confirmación de reservas'),
+        ('notificar_cierre', 'Emails de cierre de clases'),
+        ('email_deuda_vencida', 'Email de aviso de deuda vencida'),
+    ]
+
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completada', 'Completada'),
+        ('error', 'Error'),
+    ]
+
+    tipo = models.CharField(
+        max_length=50,
+        choices=TIPOS,
+        verbose_name="Tipo de tarea"
+    )
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name="Usuario",
+        related_name='tareas_pendientes'
+    )
+    datos = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Datos"
+    )
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADOS,
+        default='pendiente',
+        verbose_name="Estado"
+    )
+    intentos = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Intentos"
+    )
+    ultimo_error = models.TextField(
+        blank=True,
+        verbose_name="Último error"
+    )
+    fecha_creacion = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Fecha de creación"
+    )
+    fecha_inicio = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Inicio del procesamiento"
+    )
+    fecha_procesada = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Fecha de procesamiento"
+    )
+
+    class Meta:
+        verbose_name = "Tarea Pendiente"
+        verbose_name_plural = "Tareas Pendientes"
+        indexes = [
+            models.Index(fields=['estado', 'id'], name='tarea_estado_idx'),
+        ]
+        ordering = ['id']
+
+    def __str__(self):
+        usuario = self.usuario.username if self.usuario else '-'
+        return f"{self.get_tipo_display()} ({usuario}) - {self.get_estado_display()}"
@@ -0,0 +1,160 @@
+from threading import Lock
+from django.conf import settings
+from django.db import connection
+import hashlib
+
+# ==============================================================================
+# NÚMEROS DE RESERVA SIN COLISIONES
+# ==============================================================================
+# Cada número de reserva sale de un contador que nunca repite valores, pasado por
+# una permutación con clave (red de Feistel) del espacio de códigos de 8 caracteres.
+# Una permutación es biyectiva: valores distintos del contador dan siempre códigos
+# distintos, así que no hace falta consultar si el código ya existe. Sin la clave,
+# los códigos no se pueden adivinar a partir de otros.
+#
+# IMPORTANTE: no cambiar NUMERO_RESERVA_CLAVE (por defecto, SECRET_KEY) una vez
+# en producción: con otra clave los códigos nuevos podrían repetir viejos. Para
+# rotar SECRET_KEY, fijar antes NUMERO_RESERVA_CLAVE con su valor actual.
+
+ALFABETO_NUMERO_RESERVA = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+LONGITUD_NUMERO_RESERVA = 8
+CANTIDAD_NUMEROS_RESERVA = len(ALFABETO_NUMERO_RESERVA) ** LONGITUD_NUMERO_RESERVA
+
+# 36^8 ≈ 2^41.4: se permuta sobre 42 bits y se descartan los valores fuera de rango
+BITS_MITAD = 21
+MASCARA_MITAD = (1 << BITS_MITAD) - 1
+RONDAS_FEISTEL = 4
+
+NOMBRE_SECUENCIA_RESERVA = 'numero_reserva'
+SECUENCIA_POSTGRES_RESERVA = 'gravity_numero_reserva_seq'
+# Valores que toma cada proceso por cada nextval() (INCREMENT BY de la secuencia)
+BLOQUE_SECUENCIA_RESERVA = 50
+
+def _clave_permutacion():
+    clave = getattr(settings, 'NUMERO_RESERVA_CLAVE', None) or settings.SECRET_KEY
+    return hashlib.sha256(f'gravity.numero_reserva:{clave}'.encode()).digest()
+
+def _ronda(clave, ronda, mitad):
+    datos = bytes((ronda,)) + mitad.to_bytes(3, 'big')
+    resumen = hashlib.blake2b(datos, key=clave, digest_size=3).digest()
+    return int.from_bytes(resumen, 'big') & MASCARA_MITAD
+
+def permutar_valor(valor, clave=None):
+    """
+    Transforma un valor del contador en otro del mismo rango, de forma biyectiva.
+
+    Args:
+        valor: Entero entre 0 y CANTIDAD_NUMEROS_RESERVA - 1
+        clave: Clave de la permutación (por defecto, la de settings)
+
+    Returns:
+        int: Valor permutado, en el mismo rango
+    """
+    if not 0 <= valor < CANTIDAD_NUMEROS_RESERVA:
+        raise ValueError(f'Valor fuera del rango de números de reserva: {valor}')
+
+    clave = clave or _clave_permutacion()
+    # "Cycle walking": si el resultado cae fuera de rango se vuelve a permutar;
+    # sigue siendo una biyección sobre [0, CANTIDAD_NUMEROS_RESERVA)
+    while True:
+        izquierda, derecha = valor >> BITS_MITAD, valor & MASCARA_MITAD
+        for ronda in range(RONDAS_FEISTEL):
+            izquierda, derecha = derecha, izquierda ^ _ronda(clave, ronda, derecha)
+        valor = (izquierda << BITS_MITAD) | derecha
+        if valor < CANTIDAD_NUMEROS_RESERVA:
+            return valor
+
+def codificar_numero_reserva(valor):
+    """Convierte un entero del rango en un código de 8 caracteres [0-9A-Z]"""
+    caracteres = []
+    for _ in range(LONGITUD_NUMERO_RESERVA):
+        valor, resto = divmod(valor, len(ALFABETO_NUMERO_RESERVA))
+        caracteres.append(ALFABETO_NUMERO_RESERVA[resto])
+    return ''.join(reversed(caracteres))
+
+def numero_reserva_para_valor(valor, clave=None):
+    """Código de reserva que corresponde a un valor del contador"""
+    return codificar_numero_reserva(permutar_valor(valor % CANTIDAD_NUMEROS_RESERVA, clave))
+
+# ==============================================================================
+# CONTADOR
+# ==============================================================================
+
+class _BloqueSecuencia:
+    """Bloque de valores de la secuencia de PostgreSQL ya reservado por este proceso."""
+
+    def __init__(self):
+        self.siguiente = 0
+        self.limite = 0
+        self.lock = Lock()
+
+_bloque_postgres = _BloqueSecuencia()
+
+def _siguiente_valor_postgres():
+    # nextval() no se deshace con un rollback, así que el bloque se puede usar
+    # aunque la transacción que lo pidió falle: nunca se entrega dos veces
+    with _bloque_postgres.lock:
+        if _bloque_postgres.siguiente >= _bloque_postgres.limite:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT nextval(%s)', [SECUENCIA_POSTGRES_RESERVA])
+                inicio = cursor.fetchone()[0]
+            _bloque_postgres.siguiente = inicio
+            _bloque_postgres.limite = inicio + BLOQUE_SECUENCIA_RESERVA
+        valor = _bloque_postgres.siguiente
+        _bloque_postgres.siguiente += 1
+        return valor
+
+def _siguiente_valor_tabla(cantidad=1):
+    # Sin secuencias nativas (SQLite): un UPDATE ... RETURNING sobre SecuenciaNumeracion,
+    # dentro de la transacción actual (si se deshace, el valor vuelve a quedar libre).
+    # Reserva `cantidad` valores seguidos y devuelve el último.
+    from .models import SecuenciaNumeracion
+
+    tabla = connection.ops.quote_name(SecuenciaNumeracion._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {tabla} SET valor = valor + %s WHERE nombre = %s RETURNING valor',
+            [cantidad, NOMBRE_SECUENCIA_RESERVA]
+        )
+        fila = cursor.fetchone()
+    if fila is None:
+        # La fila la crea la migración; solo falta si se borró a mano
+        SecuenciaNumeracion.objects.get_or_create(nombre=NOMBRE_SECUENCIA_RESERVA)
+        return _siguiente_valor_tabla(cantidad)
+    return fila[0]
+
+def siguiente_numero_reserva():
+    """
+    Devuelve un número de reserva nuevo, sin consultar los ya usados.
+    En PostgreSQL cuesta una consulta cada BLOQUE_SECUENCIA_RESERVA reservas;
+    en otras bases, un UPDATE por reserva.
+
+    Returns:
+        str: Código de 8 caracteres [0-9A-Z]
+    """
+    if connection.vendor == 'postgresql':
+        valor = _siguiente_valor_postgres()
+    else:
+        valor = _siguiente_valor_tabla()
+    return numero_reserva_para_valor(valor)
+
+def siguientes_numeros_reserva(cantidad):
+    """
+    Devuelve `cantidad` números de reserva nuevos de una vez (para bulk_create).
+    En bases sin secuencias nativas cuesta un solo UPDATE para todo el lote.
+
+    Args:
+        cantidad: Cantidad de números a generar
+
+    Returns:
+        list[str]: Códigos de 8 caracteres [0-9A-Z]
+    """
+    if cantidad <= 0:
+        return []
+    if connection.vendor == 'postgresql':
+        valores = [_siguiente_valor_postgres() for _ in range(cantidad)]
+    else:
+        ultimo = _siguiente_valor_tabla(cantidad)
+        valores = range(ultimo - cantidad + 1, ultimo + 1)
+    clave = _clave_permutacion()
+    return [numero_reserva_para_valor(valor, clave) for valor in valores]
@@ -0,0 +1,953 @@
+from collections import Counter
+from datetime import timedelta
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Sum, UniqueConstraint
+from django.utils import timezone
+from .cache_service import invalidar_disponibilidad
+from .calendario_service import proxima_ocurrencia
+from .eventos_service import notificar_cambios_ocupacion
+from .models import Clase, ClaseCerrada, ClaseOcupacion, Reserva, AusenciaTemporal, NUMERO_DIA_SEMANA
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Días hacia adelante en los que se ofrecen cupos liberados por ausencias
+DIAS_VENTANA_CUPOS_LIBERADOS = 10
+
+# ==============================================================================
+# CÁLCULO AGRUPADO DE OCUPACIÓN
+# ==============================================================================
+
+def calcular_ocupacion(clases, fecha=None):
+    """
+    Calcula la ocupación de varias clases con una sola consulta agrupada sobre
+    ClaseOcupacion, en lugar de ejecutar varios COUNT por cada clase.
+
+    Sin fecha: solo cuentan las reservas permanentes (igual que el display general).
+    Con fecha: permanentes - ausencias de ese día + reservas de fecha única de ese día.
+    Una clase cerrada esa fecha (ClaseCerrada) queda sin cupos: las ausencias que
+    genera el cierre no liberan lugares.
+
+    Args:
+        clases: QuerySet o lista de objetos Clase
+        fecha: Fecha opcional (date) para la que se calcula la ocupación real
+
+    Returns:
+        dict: {clase_id: {
+            'permanentes', 'ausencias', 'fecha_unica', 'total_activas', 'ocupados',
+            'cupos_disponibles', 'esta_completa', 'porcentaje_ocupacion', 'cerrada'
+        }}
+    """
+    clases = list(clases)
+    if not clases:
+        return {}
+
+    ids = [clase.id for clase in clases]
+
+    # 1 sola consulta agrupada sobre la tabla materializada ClaseOcupacion
+    agregados = {
+        'permanentes': Max('permanentes', filter=Q(fecha__isnull=True)),
+        'fecha_unica_total': Sum('fecha_unica'),
+    }
+    if fecha:
+        agregados['ausencias'] = Sum('ausencias', filter=Q(fecha=fecha))
+        agregados['fecha_unica'] = Sum('fecha_unica', filter=Q(fecha=fecha))
+
+    conteos = {
+        fila['clase_id']: fila
+        for fila in ClaseOcupacion.objects.filter(
+            clase_id__in=ids
+        ).values('clase_id').annotate(**agregados).order_by()
+    }
+
+    cerradas = set()
+    if fecha:
+        cerradas = set(ClaseCerrada.objects.filter(
+            clase_id__in=ids, fecha=fecha
+        ).values_list('clase_id', flat=True))
+
+    resultado = {}
+    for clase in clases:
+        fila = conteos.get(clase.id, {})
+        permanentes = fila.get('permanentes') or 0
+        fecha_unica = fila.get('fecha_unica') or 0
+        ausencias = fila.get('ausencias') or 0
+        # Activas = permanentes + todas las reservas de fecha única vigentes
+        total_activas = permanentes + (fila.get('fecha_unica_total') or 0)
+
+        if fecha:
+            ocupados = permanentes - ausencias + fecha_unica
+        else:
+            ocupados = permanentes
+
+        if clase.activa and clase.id not in cerradas:
+            cupos = max(0, clase.cupo_maximo - ocupados)
+        else:
+            cupos = 0
+
+        if clase.cupo_maximo:
+            porcentaje = round((total_activas / clase.cupo_maximo) * 100)
+        else:
+            porcentaje = 0
+
+        resultado[clase.id] = {
+            'permanentes': permanentes,
+            'ausencias': ausencias,
+            'fecha_unica': fecha_unica,
+            'total_activas': total_activas,
+            'ocupados': ocupados,
+            'cupos_disponibles': cupos,
+            'esta_completa': cupos <= 0,
+            'porcentaje_ocupacion': porcentaje,
+            'cerrada': clase.id in cerradas,
+        }
+
+    return resultado
+
+def precargar_ocupacion(clases, fecha=None):
+    """
+    Calcula la ocupación de todas las clases y la deja guardada en cada instancia,
+    para que Clase.cupos_disponibles(), esta_completa() y get_porcentaje_ocupacion()
+    (incluso llamados desde los templates) no vuelvan a consultar la base.
+
+    Args:
+        clases: QuerySet o lista de objetos Clase
+        fecha: Fecha opcional (date) a precargar
+
+    Returns:
+        list: Las clases evaluadas, en el mismo orden recibido
+    """
+    clases = list(clases)
+    ocupacion = calcular_ocupacion(clases, fecha=fecha)
+
+    for clase in clases:
+        precargada = getattr(clase, '_ocupacion_precargada', None)
+        if precargada is None:
+            precargada = {}
+            clase._ocupacion_precargada = precargada
+        precargada[fecha] = ocupacion[clase.id]
+
+    return clases
+
+def calcular_grilla_ocupacion(clases, desde, hasta):
+    """
+    Arma la grilla clase × fecha de ocupación para todas las ocurrencias
+    de las clases entre desde y hasta (inclusive).
+    Usa una consulta sobre ClaseOcupacion y otra sobre ClaseCerrada, sin importar
+    cuántas clases o semanas abarque el rango. Las ocurrencias cerradas quedan en
+    la grilla con cerrada=True y sin cupos.
+
+    Args:
+        clases: QuerySet o lista de objetos Clase
+        desde: Fecha inicial (date)
+        hasta: Fecha final (date)
+
+    Returns:
+        dict: {clase_id: [{'fecha', 'permanentes', 'ausencias', 'fecha_unica',
+                           'ocupados', 'cupos_disponibles', 'cerrada'}, ...]}
+    """
+    clases = list(clases)
+    if not clases:
+        return {}
+
+    ids = [clase.id for clase in clases]
+    filas = ClaseOcupacion.objects.filter(
+        Q(fecha__isnull=True) | Q(fecha__gte=desde, fecha__lte=hasta),
+        clase_id__in=ids
+    ).values_list('clase_id', 'fecha', 'permanentes', 'ausencias', 'fecha_unica')
+    cerradas = set(ClaseCerrada.objects.filter(
+        clase_id__in=ids, fecha__gte=desde, fecha__lte=hasta
+    ).values_list('clase_id', 'fecha'))
+
+    base = {}
+    por_fecha = {}
+    for clase_id, fecha, permanentes, ausencias, fecha_unica in filas:
+        if fecha is None:
+            base[clase_id] = permanentes
+        else:
+            por_fecha[(clase_id, fecha)] = (ausencias, fecha_unica)
+
+    grilla = {}
+    for clase in clases:
+        ocurrencias = []
+        dia_objetivo = NUMERO_DIA_SEMANA.get(clase.dia)
+        if dia_objetivo is not None:
+            fecha = desde + timedelta(days=(dia_objetivo - desde.weekday()) % 7)
+            permanentes = base.get(clase.id, 0)
+            while fecha <= hasta:
+                ausencias, fecha_unica = por_fecha.get((clase.id, fecha), (0, 0))
+                ocupados = permanentes - ausencias + fecha_unica
+                cerrada = (clase.id, fecha) in cerradas
+                cupos = max(0, clase.cupo_maximo - ocupados) if clase.activa and not cerrada else 0
+                ocurrencias.append({
+                    'fecha': fecha,
+                    'permanentes': permanentes,
+                    'ausencias': ausencias,
+                    'fecha_unica': fecha_unica,
+                    'ocupados': ocupados,
+                    'cupos_disponibles': cupos,
+                    'cerrada': cerrada,
+                })
+                fecha += timedelta(days=7)
+        grilla[clase.id] = ocurrencias
+
+    return grilla
+
+def buscar_cupos_liberados(clases=None, desde=None, hasta=None, solo_completas=True):
+    """
+    Busca con una sola consulta todas las ocurrencias (clase, fecha) en las que
+    una ausencia temporal libera al menos un cupo dentro de la ventana.
+    Recorre las filas con fecha de ClaseOcupacion que tienen ausencias
+    (índice parcial ocupacion_ausencias_fecha_idx), en lugar de evaluar
+    cupos_disponibles() clase por clase.
+
+    Args:
+        clases: QuerySet o lista de objetos Clase (None = todas las activas)
+        desde: Fecha inicial (date), por defecto hoy
+        hasta: Fecha final (date), por defecto hoy + DIAS_VENTANA_CUPOS_LIBERADOS
+        solo_completas: Si es True, solo clases permanentemente llenas
+                        (donde el cupo existe únicamente gracias a la ausencia)
+
+    Returns:
+        list: [{'clase', 'fecha', 'fecha_str', 'cupos'}, ...] ordenado por fecha y horario
+    """
+    ahora = timezone.localtime(timezone.now())
+    hoy = ahora.date()
+    desde = max(desde or hoy, hoy)
+    hasta = hasta or hoy + timedelta(days=DIAS_VENTANA_CUPOS_LIBERADOS)
+
+    filas = ClaseOcupacion.objects.filter(
+        fecha__gte=desde,
+        fecha__lte=hasta,
+        ausencias__gt=0,
+        clase__activa=True,
+    )
+
+    instancias = {}
+    if clases is not None:
+        instancias = {clase.id: clase for clase in clases}
+        filas = filas.filter(clase_id__in=list(instancias))
+
+    filas = filas.annotate(
+        cupos=F('clase__cupo_maximo') - F('permanentes') + F('ausencias') - F('fecha_unica')
+    ).filter(cupos__gt=0)
+
+    if solo_completas:
+        filas = filas.filter(permanentes__gte=F('clase__cupo_maximo'))
+
+    # Las ausencias que genera un cierre del estudio no liberan cupos para recupero
+    filas = filas.exclude(Exists(ClaseCerrada.objects.filter(
+        clase_id=OuterRef('clase_id'), fecha=OuterRef('fecha')
+    )))
+
+    liberados = []
+    for fila in filas.select_related('clase').order_by('fecha', 'clase__horario'):
+        clase = instancias.get(fila.clase_id, fila.clase)
+        # Las clases de hoy que ya comenzaron no se ofrecen
+        if fila.fecha == hoy and clase.horario <= ahora.time():
+            continue
+        liberados.append({
+            'clase': clase,
+            'fecha': fila.fecha,
+            'fecha_str': fila.fecha.strftime('%Y-%m-%d'),
+            'cupos': fila.cupos,
+        })
+
+    return liberados
+
+def primer_cupo_liberado_por_clase(clases=None, desde=None, hasta=None):
+    """
+    Devuelve el primer cupo liberado de cada clase permanentemente llena
+    (ver buscar_cupos_liberados), para mostrarlo en el catálogo.
+
+    Returns:
+        dict: {clase_id: {'clase', 'fecha', 'fecha_str', 'cupos'}}
+    """
+    primeros = {}
+    for cupo in buscar_cupos_liberados(clases, desde=desde, hasta=hasta):
+        primeros.setdefault(cupo['clase'].id, cupo)
+    return primeros
+
+def calcular_arbol_reserva(clases):
+    """
+    Arma el árbol tipo → sede → día → horario con los cupos de cada clase,
+    para que el formulario de reserva recorra la cascada sin pedir nada al servidor.
+    Usa una única consulta de ocupación para todas las clases.
+
+    Args:
+        clases: QuerySet o lista de objetos Clase activos
+
+    Returns:
+        dict: {tipo: {'tipo', 'sedes': [{'value', 'text', 'dias': [
+                  {'value', 'horarios': [{'id', 'value', 'text', 'cupos', 'cupo_maximo',
+                                          'disponible', 'sede', 'sede_display'}]}]}]}}
+    """
+    clases = sorted(
+        precargar_ocupacion(clases),
+        key=lambda clase: (
+            clase.tipo, clase.direccion,
+            NUMERO_DIA_SEMANA.get(clase.dia, 99), clase.horario
+        )
+    )
+    nombres_sedes = dict(Clase.DIRECCIONES)
+
+    arbol = {}
+    for clase in clases:
+        nodo_tipo = arbol.setdefault(clase.tipo, {'tipo': clase.tipo, 'sedes': []})
+
+        sedes = nodo_tipo['sedes']
+        if not sedes or sedes[-1]['value'] != clase.direccion:
+            sedes.append({
+                'value': clase.direccion,
+                'text': nombres_sedes.get(clase.direccion, clase.direccion),
+                'dias': [],
+            })
+
+        dias = sedes[-1]['dias']
+        if not dias or dias[-1]['value'] != clase.dia:
+            dias.append({'value': clase.dia, 'horarios': []})
+
+        cupos = clase.cupos_disponibles()
+        sede_corta = clase.get_direccion_corta()
+        dias[-1]['horarios'].append({
+            'id': clase.id,
+            'value': clase.horario.strftime('%H:%M'),
+            'text': f"{clase.horario.strftime('%H:%M')} - {sede_corta} ({cupos} cupos)",
+            'cupos': cupos,
+            'cupo_maximo': clase.cupo_maximo,
+            'disponible': cupos > 0,
+            'sede': clase.direccion,
+            'sede_display': sede_corta,
+        })
+
+    return arbol
+
+# ==============================================================================
+# RESERVA ATÓMICA DE CUPOS
+# ==============================================================================
+
+# Índices únicos de Reserva que significan "el usuario ya tiene esta reserva activa"
+CONSTRAINTS_RESERVA_ACTIVA = {
+    'unique_active_reservation_per_user_class',
+    'unique_active_reservation_per_user_class_fecha',
+}
+
+def _constraint_violado(error, modelo):
+    """
+    Nombre del constraint que provocó un IntegrityError, o None si no se puede saber.
+    PostgreSQL lo informa directamente; SQLite solo lista las columnas, así que se
+    busca el UniqueConstraint del modelo con esas mismas columnas.
+    """
+    diag = getattr(error.__cause__, 'diag', None)
+    if diag is not None:
+        return diag.constraint_name
+
+    prefijo = 'UNIQUE constraint failed: '
+    mensaje = str(error)
+    if not mensaje.startswith(prefijo):
+        return None
+    columnas = [columna.strip().split('.')[-1] for columna in mensaje[len(prefijo):].split(',')]
+    for constraint in modelo._meta.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.fields:
+            if [modelo._meta.get_field(campo).column for campo in constraint.fields] == columnas:
+                return constraint.name
+    return None
+
+def _bloquear_ocupacion_clase(clase_id):
+    """
+    Bloquea la fila base de ClaseOcupacion de la clase hasta el fin de la transacción.
+    Un UPDATE sin cambios toma el lock de fila en PostgreSQL y el lock de escritura
+    en SQLite (donde select_for_update no tiene efecto), así que sirve en ambos.
+    """
+    bloqueadas = ClaseOcupacion.objects.filter(
+        clase_id=clase_id, fecha__isnull=True
+    ).update(permanentes=F('permanentes'))
+
+    if not bloqueadas:
+        ClaseOcupacion.objects.get_or_create(clase_id=clase_id, fecha=None)
+        ClaseOcupacion.objects.filter(
+            clase_id=clase_id, fecha__isnull=True
+        ).update(permanentes=F('permanentes'))
+
+def reservar_cupo(usuario, clase, fecha_unica=None, **campos):
+    """
+    Crea una reserva solo si la clase todavía tiene cupo, sin posibilidad de sobreventa.
+    Todas las reservas de una misma clase se serializan sobre el lock de su fila de
+    ocupación: el cupo se verifica y la reserva se guarda dentro de la misma transacción.
+
+    Args:
+        usuario: Usuario que reserva
+        clase: Objeto Clase
+        fecha_unica: Fecha (date) para recuperos y cupos temporales; None = permanente
+        **campos: Otros campos de Reserva (es_recupero, notas, ...)
+
+    Returns:
+        Reserva: La reserva creada
+
+    Raises:
+        ValidationError: Si no hay cupo, si el usuario ya tiene esa reserva (índice único)
+            o si la reserva no pasa las validaciones del modelo
+        IntegrityError: Si falla otro índice único (ej. numero_reserva repetido)
+    """
+    with transaction.atomic():
+        _bloquear_ocupacion_clase(clase.id)
+
+        # Releer la clase ya con el lock tomado (cupo_maximo o activa pudieron cambiar)
+        clase = Clase.objects.get(pk=clase.pk)
+        if fecha_unica and ClaseCerrada.objects.filter(clase=clase, fecha=fecha_unica).exists():
+            raise ValidationError(
+                f'La clase no se dicta el {fecha_unica.strftime("%d/%m/%Y")} (cierre del estudio).'
+            )
+        cupos = calcular_ocupacion([clase], fecha=fecha_unica)[clase.id]['cupos_disponibles']
+        if cupos <= 0:
+            if fecha_unica:
+                raise ValidationError(
+                    f'Ya no hay cupos disponibles para esta clase el {fecha_unica.strftime("%d/%m/%Y")}.'
+                )
+            raise ValidationError('Ya no hay cupos disponibles para esta clase.')
+
+        reserva = Reserva(usuario=usuario, clase=clase, fecha_unica=fecha_unica, **campos)
+        try:
+            # Savepoint propio: si choca con un índice único, la transacción sigue usable
+            with transaction.atomic():
+                reserva.save()
+        except IntegrityError as e:
+            if _constraint_violado(e, Reserva) not in CONSTRAINTS_RESERVA_ACTIVA:
+                # Otro índice (ej. numero_reserva): no es un duplicado del usuario
+                raise
+            if fecha_unica:
+                raise ValidationError(
+                    'Ya tienes una reserva activa para esta clase en esa fecha. '
+                    'Cancela la reserva actual antes de crear una nueva.'
+                )
+            raise ValidationError(
+                'Ya tienes una reserva activa para esta clase. '
+                'Cancela la reserva actual antes de crear una nueva.'
+            )
+
+    return reserva
+
+# ==============================================================================
+# RESERVA MASIVA (ADMINISTRACIÓN)
+# ==============================================================================
+
+TIPOS_RESERVA_LOTE = ('recurrente', 'temporal', 'recupero')
+
+def proxima_fecha_clase(clase, ahora=None):
+    """
+    Próxima fecha en que se dicta la clase: hoy si todavía no empezó,
+    si no la semana siguiente.
+
+    Args:
+        clase: Objeto Clase
+        ahora: datetime local de referencia (por defecto, ahora)
+
+    Returns:
+        date: Fecha de la próxima clase
+    """
+    return proxima_ocurrencia(clase.dia, clase.horario, ahora)
+
+def reservar_cupos_en_lote(filas, notificar=False):
+    """
+    Crea muchas reservas (alumnos × clases) en una sola transacción.
+    Cupos y duplicados se validan para todo el lote con consultas agrupadas
+    (una de reservas existentes y una de ocupación por fecha distinta) y las
+    reservas válidas se insertan con bulk_create. Las filas rechazadas no
+    impiden que se creen las demás.
+
+    Args:
+        filas: Lista de dicts {'usuario_id', 'clase_id', 'tipo', 'fecha' (opcional)}
+            tipo: 'recurrente', 'temporal' o 'recupero'
+            fecha: date para temporal/recupero (por defecto, la próxima clase)
+        notificar: Encolar un email de confirmación por alumno con sus reservas nuevas
+
+    Returns:
+        dict: {'creadas': [Reserva], 'rechazadas': [{'fila', 'usuario_id', 'clase_id', 'tipo', 'error'}]}
+    """
+    from django.contrib.auth.models import User
+    from .numeracion_service import siguientes_numeros_reserva
+    from .recuperos_service import consumir_credito
+    from .tareas_service import encolar_tarea
+
+    rechazadas = []
+
+    def rechazar(indice, fila, error):
+        rechazadas.append({
+            'fila': indice,
+            'usuario_id': fila.get('usuario_id'),
+            'clase_id': fila.get('clase_id'),
+            'tipo': fila.get('tipo'),
+            'error': error,
+        })
+
+    # Normalizar filas
+    normalizadas = []
+    for indice, fila in enumerate(filas):
+        try:
+            usuario_id = int(fila.get('usuario_id'))
+            clase_id = int(fila.get('clase_id'))
+        except (TypeError, ValueError):
+            rechazar(indice, fila, 'Alumno o clase inválidos.')
+            continue
+        tipo = fila.get('tipo') or 'recurrente'
+        if tipo not in TIPOS_RESERVA_LOTE:
+            rechazar(indice, fila, f'Tipo de reserva inválido: {tipo}.')
+            continue
+        normalizadas.append((indice, fila, usuario_id, clase_id, tipo, fila.get('fecha')))
+
+    usuarios = User.objects.filter(
+        id__in={n[2] for n in normalizadas}, is_active=True, is_staff=False
+    ).in_bulk()
+
+    ahora = timezone.localtime(timezone.now())
+    creadas = []
+
+    with transaction.atomic():
+        clase_ids = sorted(Clase.objects.filter(
+            id__in={n[3] for n in normalizadas}
+        ).values_list('id', flat=True))
+        # Locks siempre en el mismo orden (por ID): dos lotes no se bloquean entre sí
+        for clase_id in clase_ids:
+            _bloquear_ocupacion_clase(clase_id)
+        # Releer ya con los locks tomados (cupo_maximo o activa pudieron cambiar)
+        clases = Clase.objects.filter(id__in=clase_ids, activa=True).in_bulk()
+
+        # Fechas de cada fila de fecha única
+        pendientes = []
+        for indice, fila, usuario_id, clase_id, tipo, fecha in normalizadas:
+            usuario = usuarios.get(usuario_id)
+            clase = clases.get(clase_id)
+            if usuario is None:
+                rechazar(indice, fila, 'El alumno no existe o no está activo.')
+                continue
+            if clase is None:
+                rechazar(indice, fila, 'La clase no existe o no está activa.')
+                continue
+            if tipo != 'recurrente':
+                fecha = fecha or proxima_fecha_clase(clase, ahora)
+                if fecha.weekday() != NUMERO_DIA_SEMANA[clase.dia]:
+                    rechazar(indice, fila, f'La fecha {fecha.strftime("%d/%m/%Y")} no es {clase.dia}.')
+                    continue
+                if fecha < ahora.date():
+                    rechazar(indice, fila, f'La fecha {fecha.strftime("%d/%m/%Y")} ya pasó.')
+                    continue
+            else:
+                fecha = None
+            pendientes.append((indice, fila, usuario, clase, tipo, fecha))
+
+        # Clases cerradas en alguna de las fechas del lote (una consulta)
+        fechas_lote = {p[5] for p in pendientes if p[5]}
+        if fechas_lote:
+            cerradas = set(ClaseCerrada.objects.filter(
+                clase_id__in={p[3].id for p in pendientes if p[5]},
+                fecha__in=fechas_lote
+            ).values_list('clase_id', 'fecha'))
+            abiertas = []
+            for pendiente in pendientes:
+                indice, fila, _, clase, _, fecha = pendiente
+                if (clase.id, fecha) in cerradas:
+                    rechazar(indice, fila, f'La clase no se dicta el {fecha.strftime("%d/%m/%Y")} (cierre del estudio).')
+                else:
+                    abiertas.append(pendiente)
+            pendientes = abiertas
+
+        # Ocupación actual: base semanal + una consulta por cada fecha distinta
+        clases_lote = list({p[3].id: p[3] for p in pendientes}.values())
+        cupos_base = {
+            clase_id: datos['cupos_disponibles']
+            for clase_id, datos in calcular_ocupacion(clases_lote).items()
+        }
+        cupos_fecha = {}
+        clases_por_fecha = {}
+        for _, _, _, clase, _, fecha in pendientes:
+            if fecha:
+                clases_por_fecha.setdefault(fecha, {})[clase.id] = clase
+        for fecha, clases_fecha in clases_por_fecha.items():
+            for clase_id, datos in calcular_ocupacion(list(clases_fecha.values()), fecha=fecha).items():
+                cupos_fecha[(clase_id, fecha)] = datos['cupos_disponibles']
+
+        # Reservas activas existentes de esos alumnos en esas clases (una consulta)
+        permanentes = set()
+        fecha_unica = set()
+        con_fecha_unica = set()
+        for usuario_id, clase_id, fecha in Reserva.objects.filter(
+            activa=True,
+            usuario_id__in={p[2].id for p in pendientes},
+            clase_id__in={p[3].id for p in pendientes},
+        ).values_list('usuario_id', 'clase_id', 'fecha_unica'):
+            if fecha:
+                fecha_unica.add((usuario_id, clase_id, fecha))
+                con_fecha_unica.add((usuario_id, clase_id))
+            else:
+                permanentes.add((usuario_id, clase_id))
+
+        nuevas_permanentes = Counter()
+        nuevas_fecha = Counter()
+        aceptadas = []
+        for indice, fila, usuario, clase, tipo, fecha in pendientes:
+            par = (usuario.id, clase.id)
+            descripcion = f'{clase.get_nombre_display()} {clase.dia} {clase.horario.strftime("%H:%M")}'
+            if fecha is None:
+                if par in permanentes or par in con_fecha_unica:
+                    rechazar(indice, fila, f'Ya tiene una reserva activa en {descripcion}.')
+                    continue
+                if cupos_base[clase.id] - nuevas_permanentes[clase.id] <= 0:
+                    rechazar(indice, fila, f'{descripcion} no tiene cupos disponibles.')
+                    continue
+                permanentes.add(par)
+                nuevas_permanentes[clase.id] += 1
+            else:
+                if par in permanentes or (*par, fecha) in fecha_unica:
+                    rechazar(indice, fila, f'Ya tiene una reserva activa en {descripcion} el {fecha.strftime("%d/%m/%Y")}.')
+                    continue
+                libres = (
+                    cupos_fecha[(clase.id, fecha)]
+                    - nuevas_permanentes[clase.id]
+                    - nuevas_fecha[(clase.id, fecha)]
+                )
+                if libres <= 0:
+                    rechazar(indice, fila, f'{descripcion} no tiene cupos el {fecha.strftime("%d/%m/%Y")}.')
+                    continue
+                fecha_unica.add((*par, fecha))
+                con_fecha_unica.add(par)
+                nuevas_fecha[(clase.id, fecha)] += 1
+            aceptadas.append((usuario, clase, tipo, fecha))
+
+        if aceptadas:
+            numeros = siguientes_numeros_reserva(len(aceptadas))
+            reservas = [
+                Reserva(
+                    numero_reserva=numero,
+                    usuario=usuario,
+                    clase=clase,
+                    fecha_unica=fecha,
+                    es_recupero=(tipo == 'recupero'),
+                    notas=(
+                        f'{"Recupero" if tipo == "recupero" else "Cupo temporal"} — {fecha.strftime("%d/%m/%Y")}'
+                        if fecha else ''
+                    ),
+                )
+                for numero, (usuario, clase, tipo, fecha) in zip(numeros, aceptadas)
+            ]
+            try:
+                with transaction.atomic():
+                    creadas = Reserva.objects.bulk_create(reservas)
+            except IntegrityError as e:
+                if _constraint_violado(e, Reserva) not in CONSTRAINTS_RESERVA_ACTIVA:
+                    raise
+                raise ValidationError(
+                    'Otra operación creó reservas para estos alumnos mientras se procesaba el lote. '
+                    'Volvé a intentarlo.'
+                )
+
+            # bulk_create no dispara señales: ocupación, cache y tareas se actualizan acá
+            deltas = Counter()
+            for reserva in creadas:
+                deltas.update(_aporte_reserva(
+                    reserva, (True, reserva.clase_id, reserva.fecha_unica), fechas_ausencia=[]
+                ))
+            _aplicar_deltas(deltas)
+            invalidar_disponibilidad()
+
+            # Los recuperos usan el crédito del alumno si lo tiene (como en la reserva individual del admin)
+            for reserva in creadas:
+                if reserva.es_recupero:
+                    consumir_credito(reserva)
+
+            por_usuario = {}
+            for reserva in creadas:
+                por_usuario.setdefault(reserva.usuario_id, []).append(reserva)
+            for usuario_id, reservas_usuario in por_usuario.items():
+                if any(reserva.fecha_unica is None for reserva in reservas_usuario):
+                    encolar_tarea('actualizar_estado_pago', usuario_id=usuario_id, datos={'nueva_reserva': True})
+                if notificar:
+                    encolar_tarea(
+                        'email_confirmacion_reservas',
+                        usuario_id=usuario_id,
+                        datos={'reserva_ids': [reserva.id for reserva in reservas_usuario]}
+                    )
+
+    rechazadas.sort(key=lambda r: r['fila'])
+    return {'creadas': creadas, 'rechazadas': rechazadas}
+
+# ==============================================================================
+# MANTENIMIENTO INCREMENTAL DE ClaseOcupacion
+# ==============================================================================
+
+def _aporte_reserva(reserva, estado, fechas_ausencia=None):
+    """
+    Devuelve cuánto aporta una reserva (en un estado dado) a la tabla de ocupación.
+
+    Args:
+        reserva: Objeto Reserva
+        estado: Tupla (activa, clase_id, fecha_unica) o None
+        fechas_ausencia: Fechas de ausencia de la reserva (se consultan si hacen falta)
+
+    Returns:
+        Counter: {(clase_id, fecha, campo): cantidad}
+    """
+    aporte = Counter()
+    if not estado:
+        return aporte
+
+    activa, clase_id, fecha_unica = estado
+    if not activa or not clase_id:
+        return aporte
+
+    if fecha_unica:
+        aporte[(clase_id, fecha_unica, 'fecha_unica')] += 1
+        return aporte
+
+    aporte[(clase_id, None, 'permanentes')] += 1
+
+    # Las ausencias solo liberan cupo mientras la reserva permanente está activa
+    if fechas_ausencia is None and reserva.pk:
+        fechas_ausencia = AusenciaTemporal.objects.filter(
+            reserva_id=reserva.pk
+        ).values_list('fecha', flat=True)
+    for fecha in fechas_ausencia or []:
+        aporte[(clase_id, fecha, 'ausencias')] += 1
+
+    return aporte
+
+def _aplicar_deltas(deltas):
+    """
+    Aplica variaciones {(clase_id, fecha, campo): delta} con UPDATEs atómicos (F()).
+    Solo las variaciones positivas crean filas nuevas: una resta sobre una fila
+    inexistente no hace nada (la fila ya vale 0, o la clase se está eliminando).
+    """
+    deltas = {clave: delta for clave, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        for (clase_id, fecha, campo), delta in deltas.items():
+            if campo == 'permanentes':
+                # La cantidad de permanentes se replica en la fila base y en las filas
+                # desde hoy; las fechas pasadas no se reescriben
+                if delta > 0:
+                    ClaseOcupacion.objects.get_or_create(clase_id=clase_id, fecha=None)
+                ClaseOcupacion.objects.filter(
+                    Q(fecha__isnull=True) | Q(fecha__gte=timezone.localdate()),
+                    clase_id=clase_id
+                ).update(
+                    permanentes=F('permanentes') + delta
+                )
+                continue
+
+            actualizadas = ClaseOcupacion.objects.filter(
+                clase_id=clase_id, fecha=fecha
+            ).update(**{campo: F(campo) + delta})
+
+            if not actualizadas and delta > 0:
+                base = ClaseOcupacion.objects.filter(
+                    clase_id=clase_id, fecha__isnull=True
+                ).values_list('permanentes', flat=True).first() or 0
+                fila, creada = ClaseOcupacion.objects.get_or_create(
+                    clase_id=clase_id,
+                    fecha=fecha,
+                    defaults={'permanentes': base, campo: delta}
+                )
+                if not creada:
+                    ClaseOcupacion.objects.filter(pk=fila.pk).update(
+                        **{campo: F(campo) + delta}
+                    )
+
+    # Avisar a las conexiones en vivo (SSE) qué cupos cambiaron
+    notificar_cambios_ocupacion(
+        (clase_id, None if campo == 'permanentes' else fecha)
+        for clase_id, fecha, campo in deltas
+    )
+
+def aplicar_cambio_reserva(reserva, anterior, actual):
+    """
+    Actualiza la ocupación cuando una reserva se crea, cancela, cambia de clase
+    o se elimina.
+
+    Args:
+        reserva: Objeto Reserva
+        anterior: Estado previo (activa, clase_id, fecha_unica) o None si es nueva
+        actual: Estado nuevo (activa, clase_id, fecha_unica) o None si se eliminó
+
+    Los errores no se capturan: reservar_cupo controla el cupo contra estos
+    contadores, así que si no se pueden actualizar la operación se revierte.
+    """
+    fechas_ausencia = None
+    if reserva.pk and any(
+        estado and estado[0] and not estado[2] for estado in (anterior, actual)
+    ):
+        fechas_ausencia = list(
+            AusenciaTemporal.objects.filter(reserva_id=reserva.pk).values_list('fecha', flat=True)
+        )
+
+    deltas = _aporte_reserva(reserva, actual, fechas_ausencia)
+    deltas.subtract(_aporte_reserva(reserva, anterior, fechas_ausencia))
+    _aplicar_deltas(deltas)
+
+def aplicar_cambio_ausencia(ausencia, delta):
+    """
+    Suma (delta=1) o resta (delta=-1) una ausencia en la ocupación de su fecha,
+    solo si la reserva es permanente y está activa. Como aplicar_cambio_reserva,
+    deja pasar los errores para que se revierta la operación.
+    """
+    estado = Reserva.objects.filter(pk=ausencia.reserva_id).values_list(
+        'activa', 'clase_id', 'fecha_unica'
+    ).first()
+    if not estado:
+        return
+    activa, clase_id, fecha_unica = estado
+    if not activa or fecha_unica:
+        return
+    _aplicar_deltas({(clase_id, ausencia.fecha, 'ausencias'): delta})
+
+# ==============================================================================
+# RECONSTRUCCIÓN / RECONCILIACIÓN
+# ==============================================================================
+
+def calcular_ocupacion_esperada(clase_ids=None):
+    """
+    Recalcula desde Reserva y AusenciaTemporal cómo debería verse ClaseOcupacion.
+
+    Args:
+        clase_ids: Limitar a estas clases (None = todas)
+
+    Returns:
+        dict: {(clase_id, fecha): {'permanentes', 'ausencias', 'fecha_unica'}}
+    """
+    clases = Clase.objects.all()
+    reservas = Reserva.objects.filter(activa=True)
+    ausencias = AusenciaTemporal.objects.filter(
+        reserva__activa=True,
+        reserva__fecha_unica__isnull=True
+    )
+    if clase_ids is not None:
+        clases = clases.filter(id__in=clase_ids)
+        reservas = reservas.filter(clase_id__in=clase_ids)
+        ausencias = ausencias.filter(reserva__clase_id__in=clase_ids)
+
+    permanentes = dict(
+        reservas.filter(fecha_unica__isnull=True).values('clase_id').annotate(
+            total=Count('id')
+        ).order_by().values_list('clase_id', 'total')
+    )
+
+    esperada = {
+        (clase_id, None): {'permanentes': permanentes.get(clase_id, 0), 'ausencias': 0, 'fecha_unica': 0}
+        for clase_id in clases.values_list('id', flat=True)
+    }
+
+    def fila(clase_id, fecha):
+        clave = (clase_id, fecha)
+        if clave not in esperada:
+            esperada[clave] = {
+                'permanentes': permanentes.get(clase_id, 0),
+                'ausencias': 0,
+                'fecha_unica': 0,
+            }
+        return esperada[clave]
+
+    for clase_id, fecha, total in reservas.filter(
+        fecha_unica__isnull=False
+    ).values('clase_id', 'fecha_unica').annotate(
+        total=Count('id')
+    ).order_by().values_list('clase_id', 'fecha_unica', 'total'):
+        fila(clase_id, fecha)['fecha_unica'] = total
+
+    for clase_id, fecha, total in ausencias.values('reserva__clase_id', 'fecha').annotate(
+        total=Count('id')
+    ).order_by().values_list('reserva__clase_id', 'fecha', 'total'):
+        fila(clase_id, fecha)['ausencias'] = total
+
+    return esperada
+
+def reconstruir_ocupacion(clase_ids=None, aplicar=True):
+    """
+    Compara ClaseOcupacion con lo calculado desde las tablas de origen y,
+    si aplicar=True, corrige las diferencias.
+    Se usa desde el comando reconciliar_ocupacion y después de actualizaciones
+    masivas (queryset.update) que no disparan señales.
+
+    Args:
+        clase_ids: Limitar a estas clases (None = todas)
+        aplicar: Si False solo informa las diferencias
+
+    Returns:
+        list: Diferencias encontradas [{'clase_id', 'fecha', 'esperado', 'actual'}]
+    """
+    campos = ('permanentes', 'ausencias', 'fecha_unica')
+    vacia = {campo: 0 for campo in campos}
+
+    hoy = timezone.localdate()
+
+    with transaction.atomic():
+        esperada = calcular_ocupacion_esperada(clase_ids)
+
+        filas = ClaseOcupacion.objects.all()
+        if clase_ids is not None:
+            filas = filas.filter(clase_id__in=clase_ids)
+        if aplicar:
+            filas = filas.select_for_update()
+        actual = {
+            (fila.clase_id, fila.fecha): fila
+            for fila in filas
+        }
+
+        diferencias = []
+        crear = []
+        actualizar = []
+        eliminar = []
+
+        for clave, valores in esperada.items():
+            fila = actual.get(clave)
+            if fila is None:
+                if clave[1] is None or valores['ausencias'] or valores['fecha_unica']:
+                    crear.append(ClaseOcupacion(clase_id=clave[0], fecha=clave[1], **valores))
+                    if valores['permanentes'] or valores['ausencias'] or valores['fecha_unica']:
+                        diferencias.append({
+                            'clase_id': clave[0], 'fecha': clave[1],
+                            'esperado': valores, 'actual': None,
+                        })
+                continue
+
+            if clave[1] is not None and clave[1] < hoy:
+                # Las fechas pasadas conservan las permanentes que tuvieron ese día
+                valores = dict(valores, permanentes=fila.permanentes)
+
+            valores_actuales = {campo: getattr(fila, campo) for campo in campos}
+            if valores_actuales != valores:
+                diferencias.append({
+                    'clase_id': clave[0], 'fecha': clave[1],
+                    'esperado': valores, 'actual': valores_actuales,
+                })
+                for campo in campos:
+                    setattr(fila, campo, valores[campo])
+                actualizar.append(fila)
+
+        # Filas que sobran: con fecha y sin ausencias ni reservas de ese día
+        for clave, fila in actual.items():
+            if clave in esperada:
+                continue
+            valores_actuales = {campo: getattr(fila, campo) for campo in campos}
+            if valores_actuales['ausencias'] or valores_actuales['fecha_unica']:
+                diferencias.append({
+                    'clase_id': clave[0], 'fecha': clave[1],
+                    'esperado': vacia, 'actual': valores_actuales,
+                })
+            eliminar.append(fila.pk)
+
+        if aplicar:
+            if eliminar:
+                ClaseOcupacion.objects.filter(pk__in=eliminar).delete()
+            if actualizar:
+                ClaseOcupacion.objects.bulk_update(actualizar, list(campos))
+            if crear:
+                ClaseOcupacion.objects.bulk_create(crear)
+            if diferencias:
+                # Las actualizaciones masivas no disparan señales
+                invalidar_disponibilidad()
+                notificar_cambios_ocupacion(
+                    (diferencia['clase_id'], diferencia['fecha']) for diferencia in diferencias
+                )
+
+    return diferencias
@@ -0,0 +1,245 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+from .calendario_service import inicio_clase
+from .cuota_service import invalidar_cuota
+from .models import AusenciaTemporal, CreditoRecupero, SaldoRecupero
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# CRÉDITOS DE RECUPERO
+# ==============================================================================
+# Cada ausencia a una reserva permanente otorga un crédito válido hasta su
+# fecha límite (ausencia + 6 días). Reservar un recupero consume el crédito que
+# vence primero; cancelarlo antes de la clase lo reintegra. El saldo de cada
+# usuario vive en una fila de SaldoRecupero, así que saber si puede recuperar
+# es una lectura de una sola fila en lugar de contar ausencias y recuperos.
+# Los vencidos los marca el comando nocturno vencer_creditos_recupero.
+
+DIAS_VIGENCIA_CREDITO = 6
+
+def _recalcular_saldos(usuario_ids):
+    """Recalcula la fila de SaldoRecupero de los usuarios (1 consulta + 1 upsert)."""
+    usuario_ids = {usuario_id for usuario_id in usuario_ids if usuario_id}
+    if not usuario_ids:
+        return
+
+    resumen = {
+        fila['usuario_id']: fila
+        for fila in CreditoRecupero.objects.filter(
+            usuario_id__in=usuario_ids, estado='disponible'
+        ).values('usuario_id').annotate(total=Count('id'), proximo=Min('fecha_limite'))
+    }
+    SaldoRecupero.objects.bulk_create(
+        [
+            SaldoRecupero(
+                usuario_id=usuario_id,
+                disponibles=resumen.get(usuario_id, {}).get('total', 0),
+                proximo_vencimiento=resumen.get(usuario_id, {}).get('proximo'),
+            )
+            for usuario_id in usuario_ids
+        ],
+        update_conflicts=True,
+        unique_fields=['usuario'],
+        update_fields=['disponibles', 'proximo_vencimiento', 'fecha_actualizacion'],
+    )
+    for usuario_id in usuario_ids:
+        invalidar_cuota(usuario_id)
+
+def otorgar_creditos(filas):
+    """
+    Otorga un crédito por cada ausencia (se ignoran las que ya tienen uno o ya vencieron).
+
+    Args:
+        filas: Iterable de (ausencia_id, usuario_id, fecha_ausencia)
+
+    Returns:
+        int: Cantidad de créditos otorgados
+    """
+    hoy = timezone.localtime(timezone.now()).date()
+    filas = [
+        (ausencia_id, usuario_id, fecha + timedelta(days=DIAS_VIGENCIA_CREDITO))
+        for ausencia_id, usuario_id, fecha in filas
+        if fecha + timedelta(days=DIAS_VIGENCIA_CREDITO) >= hoy
+    ]
+    if not filas:
+        return 0
+
+    with transaction.atomic():
+        ya_otorgados = set(
+            CreditoRecupero.objects.filter(
+                ausencia_id__in=[ausencia_id for ausencia_id, _, _ in filas]
+            ).values_list('ausencia_id', flat=True)
+        )
+        nuevos = CreditoRecupero.objects.bulk_create([
+            CreditoRecupero(usuario_id=usuario_id, ausencia_id=ausencia_id, fecha_limite=fecha_limite)
+            for ausencia_id, usuario_id, fecha_limite in filas
+            if ausencia_id not in ya_otorgados
+        ])
+        _recalcular_saldos({credito.usuario_id for credito in nuevos})
+    return len(nuevos)
+
+def consumir_credito(reserva):
+    """
+    Consume, para una reserva de recupero, el crédito disponible que vence primero
+    y todavía cubre la fecha de la reserva.
+
+    Args:
+        reserva: Reserva de recupero (con fecha_unica)
+
+    Returns:
+        CreditoRecupero consumido, o None si el usuario no tiene créditos
+    """
+    hoy = timezone.localtime(timezone.now()).date()
+    with transaction.atomic():
+        # Serializa los consumos del mismo usuario
+        SaldoRecupero.objects.select_for_update().filter(usuario_id=reserva.usuario_id).first()
+
+        credito = CreditoRecupero.objects.select_for_update().filter(
+            usuario_id=reserva.usuario_id,
+            estado='disponible',
+            fecha_limite__gte=max(hoy, reserva.fecha_unica or hoy),
+        ).order_by('fecha_limite', 'id').first()
+        if credito is None:
+            return None
+
+        credito.estado = 'consumido'
+        credito.reserva_recupero = reserva
+        credito.fecha_consumo = timezone.now()
+        credito.save(update_fields=['estado', 'reserva_recupero', 'fecha_consumo'])
+        _recalcular_saldos([reserva.usuario_id])
+    return credito
+
+def liberar_creditos_de_reservas(reserva_ids):
+    """
+    Ajusta los créditos después de cancelar reservas (una o muchas, ej. con update()):
+    - Recuperos cancelados antes de empezar la clase: el crédito vuelve a estar
+      disponible (o vence, si ya pasó su fecha límite).
+    - Reservas permanentes canceladas: sus créditos disponibles se anulan.
+
+    Args:
+        reserva_ids: IDs de las reservas canceladas
+
+    Returns:
+        dict: {'reintegrados': int, 'anulados': int}
+    """
+    reserva_ids = list(reserva_ids)
+    resultado = {'reintegrados': 0, 'anulados': 0}
+    if not reserva_ids:
+        return resultado
+
+    ahora = timezone.localtime(timezone.now())
+    usuarios = set()
+    with transaction.atomic():
+        for credito in CreditoRecupero.objects.select_for_update().filter(
+            estado='consumido',
+            reserva_recupero_id__in=reserva_ids,
+            reserva_recupero__activa=False,
+        ).select_related('reserva_recupero__clase'):
+            reserva = credito.reserva_recupero
+            if inicio_clase(reserva.fecha_unica, reserva.clase.horario, ahora) <= ahora:
+                continue  # La clase ya se dictó: el crédito quedó usado
+            if credito.fecha_limite >= ahora.date():
+                credito.estado = 'disponible'
+                credito.fecha_consumo = None
+                resultado['reintegrados'] += 1
+            else:
+                credito.estado = 'vencido'
+                credito.fecha_cierre = timezone.now()
+            credito.reserva_recupero = None
+            credito.save(update_fields=['estado', 'reserva_recupero', 'fecha_consumo', 'fecha_cierre'])
+            usuarios.add(credito.usuario_id)
+
+        anulables = CreditoRecupero.objects.filter(
+            estado='disponible',
+            ausencia__reserva_id__in=reserva_ids,
+            ausencia__reserva__activa=False,
+        )
+        usuarios.update(anulables.values_list('usuario_id', flat=True))
+        resultado['anulados'] = anulables.update(estado='anulado', fecha_cierre=timezone.now())
+
+        _recalcular_saldos(usuarios)
+    return resultado
+
+def anular_credito_de_ausencia(ausencia_id):
+    """Anula el crédito disponible de una ausencia que se elimina (si ya se consumió, se conserva)."""
+    filas = CreditoRecupero.objects.filter(ausencia_id=ausencia_id, estado='disponible')
+    usuarios = set(filas.values_list('usuario_id', flat=True))
+    if usuarios:
+        filas.update(estado='anulado', fecha_cierre=timezone.now())
+        _recalcular_saldos(usuarios)
+
+def vencer_creditos(hoy=None, usuario_ids=None, aplicar=True):
+    """
+    Marca como vencidos los créditos disponibles cuya fecha límite ya pasó.
+
+    Args:
+        hoy: Fecha de referencia (por defecto, hoy)
+        usuario_ids: Limitar a estos usuarios (None = todos)
+        aplicar: False = solo contar (dry-run)
+
+    Returns:
+        dict: {'vencidos': int, 'usuarios': int}
+    """
+    hoy = hoy or timezone.localtime(timezone.now()).date()
+    vencibles = CreditoRecupero.objects.filter(estado='disponible', fecha_limite__lt=hoy)
+    if usuario_ids is not None:
+        vencibles = vencibles.filter(usuario_id__in=usuario_ids)
+
+    usuarios = set(vencibles.values_list('usuario_id', flat=True))
+    if not aplicar:
+        return {'vencidos': vencibles.count(), 'usuarios': len(usuarios)}
+
+    with transaction.atomic():
+        vencidos = vencibles.update(estado='vencido', fecha_cierre=timezone.now())
+        _recalcular_saldos(usuarios)
+
+    if vencidos:
+        logger.info(f"Créditos de recupero vencidos: {vencidos} de {len(usuarios)} usuarios")
+    return {'vencidos': vencidos, 'usuarios': len(usuarios)}
+
+def saldo_recupero(usuario):
+    """
+    Créditos de recupero disponibles del usuario: lectura de una sola fila.
+    Si el crédito más próximo ya venció (y el comando nocturno todavía no corrió),
+    se vencen los del usuario antes de responder.
+
+    Args:
+        usuario: User
+
+    Returns:
+        int: Créditos disponibles
+    """
+    fila = SaldoRecupero.objects.filter(usuario_id=usuario.pk).values_list(
+        'disponibles', 'proximo_vencimiento'
+    ).first()
+    if fila is None:
+        return 0
+
+    disponibles, proximo_vencimiento = fila
+    if proximo_vencimiento and proximo_vencimiento < timezone.localtime(timezone.now()).date():
+        vencer_creditos(usuario_ids=[usuario.pk])
+        disponibles = SaldoRecupero.objects.filter(usuario_id=usuario.pk).values_list(
+            'disponibles', flat=True
+        ).first() or 0
+    return disponibles
+
+def credito_disponible_para(usuario, fecha):
+    """True si el usuario tiene un crédito disponible que cubre esa fecha."""
+    return CreditoRecupero.objects.filter(
+        usuario_id=usuario.pk,
+        estado='disponible',
+        fecha_limite__gte=max(fecha, timezone.localtime(timezone.now()).date()),
+    ).exists()
+
+def ausencias_con_credito(usuario):
+    """QuerySet (perezoso) de las ausencias del usuario con crédito disponible, para mostrar en pantalla."""
+    hoy = timezone.localtime(timezone.now()).date()
+    return AusenciaTemporal.objects.filter(
+        credito_recupero__usuario=usuario,
+        credito_recupero__estado='disponible',
+        credito_recupero__fecha_limite__gte=hoy,
+    ).select_related('reserva__clase').order_by('fecha')
@@ -0,0 +1,298 @@
+from collections import OrderedDict
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# COLA DE TAREAS EN BASE DE DATOS
+# ==============================================================================
+# Efectos secundarios que no tienen que demorar la respuesta al usuario (estado
+# de pago, plan, deuda del mes) se encolan en TareaPendiente al confirmar la
+# transacción y los procesa el comando `procesar_tareas` en lotes.
+
+# Intentos antes de dejar una tarea en estado 'error'
+MAX_INTENTOS_TAREA = 5
+
+# Una tarea 'procesando' más vieja que esto se considera abandonada (worker caído)
+MINUTOS_TAREA_ABANDONADA = 10
+
+def encolar_tarea(tipo, usuario_id=None, datos=None):
+    """
+    Encola una tarea para cuando se confirme la transacción actual.
+    Si la transacción se deshace, la tarea no se crea.
+
+    Args:
+        tipo: Uno de TareaPendiente.TIPOS
+        usuario_id: ID del usuario afectado (las tareas se agrupan por usuario)
+        datos: dict serializable a JSON con información extra
+    """
+    from .models import TareaPendiente
+
+    def crear():
+        try:
+            TareaPendiente.objects.create(tipo=tipo, usuario_id=usuario_id, datos=datos or {})
+        except Exception as e:
+            logger.error(f"Error encolando tarea {tipo} (usuario {usuario_id}): {str(e)}")
+
+    transaction.on_commit(crear)
+
+def encolar_tareas(tipo, filas):
+    """
+    Encola muchas tareas del mismo tipo con un solo bulk_create al confirmar
+    la transacción (para procesos masivos, ej. verificar_deudas_vencidas).
+
+    Args:
+        tipo: Uno de TareaPendiente.TIPOS
+        filas: Iterable de (usuario_id, datos)
+    """
+    from .models import TareaPendiente
+
+    tareas = [
+        TareaPendiente(tipo=tipo, usuario_id=usuario_id, datos=datos or {})
+        for usuario_id, datos in filas
+    ]
+    if not tareas:
+        return
+
+    def crear():
+        try:
+            TareaPendiente.objects.bulk_create(tareas, batch_size=500)
+        except Exception as e:
+            logger.error(f"Error encolando {len(tareas)} tareas {tipo}: {str(e)}")
+
+    transaction.on_commit(crear)
+
+# ==============================================================================
+# MANEJADORES
+# ==============================================================================
+
+def _actualizar_estado_pago(usuario_id, lista_datos):
+    """
+    Recalcula plan y estado de pago de un usuario según sus reservas actuales
+    y genera la deuda del mes si alguna reserva nueva le asignó un plan nuevo.
+    Varios eventos del mismo usuario se resuelven con un solo recálculo.
+    """
+    from .models import EstadoPagoCliente
+
+    estado_cliente, _ = EstadoPagoCliente.objects.get_or_create(
+        usuario_id=usuario_id,
+        defaults={'activo': True}
+    )
+
+    # Guardar el plan anterior para detectar cambios
+    plan_anterior = estado_cliente.plan_actual
+
+    # Actualizar plan según reservas actuales
+    nuevo_plan = estado_cliente.actualizar_plan_automatico()
+
+    # Si hubo una reserva nueva Y se asignó un plan nuevo (o es la primera vez)
+    hubo_reserva_nueva = any(datos.get('nueva_reserva') for datos in lista_datos)
+    if hubo_reserva_nueva and nuevo_plan and (not plan_anterior or plan_anterior != nuevo_plan):
+        deuda_generada = estado_cliente.generar_deuda_mes_actual()
+        if deuda_generada:
+            logger.info(
+                f"Deuda generada automáticamente para {estado_cliente.usuario.username}: "
+                f"${deuda_generada.monto_original} - Plan: {nuevo_plan.nombre}"
+            )
+
+def _enviar_confirmacion_reservas(usuario_id, lista_datos):
+    """
+    Envía un único email de confirmación con todas las reservas nuevas del usuario
+    (las reservas canceladas mientras tanto se omiten).
+    """
+    from django.contrib.auth.models import User
+    from .email_service import enviar_email_confirmacion_reservas_lote
+    from .models import Reserva
+
+    reserva_ids = {reserva_id for datos in lista_datos for reserva_id in datos.get('reserva_ids', [])}
+    reservas = list(
+        Reserva.objects.filter(id__in=reserva_ids, activa=True)
+        .select_related('clase')
+        .order_by('clase__dia', 'clase__horario')
+    )
+    if not reservas:
+        return
+
+    usuario = User.objects.get(pk=usuario_id)
+    if not usuario.email:
+        logger.warning(f"Usuario {usuario.username} no tiene email configurado")
+        return
+
+    if not enviar_email_confirmacion_reservas_lote(usuario, reservas):
+        raise RuntimeError(f'No se pudo enviar el email de confirmación a {usuario.email}')
+
+def _notificar_cierre(usuario_id, lista_datos):
+    """
+    Envía los emails de uno o más cierres de clases (ver cierres_service).
+    Un cierre ya notificado no se vuelve a enviar si la tarea se repite, y en un
+    cierre a medio notificar solo se envía a los alumnos que no lo recibieron.
+    """
+    from .email_service import enviar_emails_cierre
+    from .models import CierreClase
+
+    cierre_ids = {datos.get('cierre_id') for datos in lista_datos}
+    for cierre in CierreClase.objects.filter(id__in=cierre_ids).exclude(estado_notificacion='completada'):
+        CierreClase.objects.filter(pk=cierre.pk).update(estado_notificacion='enviando')
+        resultado = enviar_emails_cierre(cierre)
+        CierreClase.objects.filter(pk=cierre.pk).update(
+            estado_notificacion='completada',
+            emails_enviados=resultado['enviados'],
+            emails_fallidos=resultado['fallidos'],
+        )
+
+def _notificar_deuda_vencida(usuario_id, lista_datos):
+    """
+    Envía el aviso de cuotas vencidas del usuario (un solo email aunque haya varias).
+    Las cuotas que se pagaron mientras la tarea esperaba se omiten.
+    """
+    from django.contrib.auth.models import User
+    from .email_service import enviar_email_deuda_vencida
+    from .models import DeudaMensual
+
+    deuda_ids = {deuda_id for datos in lista_datos for deuda_id in datos.get('deuda_ids', [])}
+    deudas = list(
+        DeudaMensual.objects.filter(id__in=deuda_ids, estado='vencido', monto_pendiente__gt=0)
+        .select_related('plan_aplicado')
+        .order_by('mes_año')
+    )
+    if not deudas:
+        return
+
+    usuario = User.objects.get(pk=usuario_id)
+    if not usuario.email:
+        logger.warning(f"Usuario {usuario.username} no tiene email configurado")
+        return
+
+    if not enviar_email_deuda_vencida(usuario, deudas):
+        raise RuntimeError(f'No se pudo enviar el aviso de deuda vencida a {usuario.email}')
+
+MANEJADORES_TAREAS = {
+    'actualizar_estado_pago': _actualizar_estado_pago,
+    'email_confirmacion_reservas': _enviar_confirmacion_reservas,
+    'notificar_cierre': _notificar_cierre,
+    'email_deuda_vencida': _notificar_deuda_vencida,
+}
+
+# Tareas que guardan su progreso mientras corren: no se envuelven en una transacción
+# (si no, el avance recién sería visible al terminar y un reintento repetiría
+# los emails ya enviados; ver enviar_emails_cierre)
+TAREAS_SIN_TRANSACCION = {'notificar_cierre'}
+
+# ==============================================================================
+# PROCESAMIENTO
+# ==============================================================================
+
+def liberar_tareas_abandonadas():
+    """
+    Devuelve a 'pendiente' las tareas que quedaron 'procesando' porque el
+    worker se cayó a mitad de un lote.
+
+    Returns:
+        int: Cantidad de tareas liberadas
+    """
+    from .models import TareaPendiente
+
+    limite = timezone.now() - timedelta(minutes=MINUTOS_TAREA_ABANDONADA)
+    return TareaPendiente.objects.filter(
+        estado='procesando',
+        fecha_inicio__lt=limite
+    ).update(estado='pendiente', fecha_inicio=None)
+
+def _tomar_lote(limite):
+    """Marca como 'procesando' hasta `limite` tareas pendientes y las devuelve."""
+    from .models import TareaPendiente
+
+    with transaction.atomic():
+        # skip_locked: varios workers en PostgreSQL no toman las mismas tareas
+        ids = list(
+            TareaPendiente.objects.select_for_update(skip_locked=True)
+            .filter(estado='pendiente')
+            .order_by('id')
+            .values_list('id', flat=True)[:limite]
+        )
+        if not ids:
+            return []
+        TareaPendiente.objects.filter(id__in=ids, estado='pendiente').update(
+            estado='procesando',
+            fecha_inicio=timezone.now()
+        )
+    return list(TareaPendiente.objects.filter(id__in=ids, estado='procesando').order_by('id'))
+
+def procesar_lote(limite=100):
+    """
+    Procesa un lote de tareas pendientes. Las tareas del mismo tipo y usuario
+    se agrupan y se resuelven con una sola ejecución del manejador.
+
+    Args:
+        limite: Cantidad máxima de tareas a tomar
+
+    Returns:
+        dict: {'tareas', 'grupos', 'completadas', 'reintentos', 'errores'}
+    """
+    from .models import TareaPendiente
+
+    resultado = {'tareas': 0, 'grupos': 0, 'completadas': 0, 'reintentos': 0, 'errores': 0}
+
+    tareas = _tomar_lote(limite)
+    if not tareas:
+        return resultado
+    resultado['tareas'] = len(tareas)
+
+    grupos = OrderedDict()
+    for tarea in tareas:
+        grupos.setdefault((tarea.tipo, tarea.usuario_id), []).append(tarea)
+    resultado['grupos'] = len(grupos)
+
+    for (tipo, usuario_id), grupo in grupos.items():
+        ids = [tarea.id for tarea in grupo]
+        try:
+            manejador = MANEJADORES_TAREAS.get(tipo)
+            if manejador is None:
+                raise ValueError(f'Tipo de tarea desconocido: {tipo}')
+            if tipo in TAREAS_SIN_TRANSACCION:
+                manejador(usuario_id, [tarea.datos for tarea in grupo])
+            else:
+                with transaction.atomic():
+                    manejador(usuario_id, [tarea.datos for tarea in grupo])
+            TareaPendiente.objects.filter(id__in=ids).update(
+                estado='completada',
+                fecha_procesada=timezone.now(),
+                ultimo_error=''
+            )
+            resultado['completadas'] += len(ids)
+        except Exception as e:
+            logger.error(f"Error procesando tareas {tipo} (usuario {usuario_id}): {str(e)}")
+            for tarea in grupo:
+                tarea.intentos += 1
+                tarea.ultimo_error = str(e)
+                tarea.fecha_inicio = None
+                if tarea.intentos >= MAX_INTENTOS_TAREA:
+                    tarea.estado = 'error'
+                    resultado['errores'] += 1
+                else:
+                    tarea.estado = 'pendiente'
+                    resultado['reintentos'] += 1
+            TareaPendiente.objects.bulk_update(
+                grupo, ['estado', 'intentos', 'ultimo_error', 'fecha_inicio']
+            )
+
+    return resultado
+
+def purgar_tareas_completadas(dias=7):
+    """
+    Elimina las tareas completadas hace más de `dias` días.
+
+    Returns:
+        int: Cantidad de tareas eliminadas
+    """
+    from .models import TareaPendiente
+
+    limite = timezone.now() - timedelta(days=dias)
+    eliminadas, _ = TareaPendiente.objects.filter(
+        estado='completada',
+        fecha_procesada__lt=limite
+    ).delete()
+    return eliminadas
@@ -1,3 +1,989 @@
-from django.test import TestCase
+import asyncio
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache_service import obtener_o_calcular, obtener_version_disponibilidad
+from .calendario_service import (
+    SEMANAS_CALENDARIO, calcular_ocurrencias, clases_del_dia, generar_ocurrencias, proxima_ocurrencia
+)
+from .cierres_service import cerrar_clases
+from .cronograma_service import generar_cronograma
+from .cuenta_service import reconciliar_cuentas
+from .cuota_service import CuotaUsuarioMiddleware, cuota_usuario
+from .deudas_service import desbloquear_sin_deuda_vencida, generar_deudas_mes, vencer_deudas
+from .elegibilidad_service import evaluar_elegibilidad_reserva
+from .email_service import enviar_emails_cierre
+from .eventos_service import BrokerDisponibilidad
+from .finanzas_service import actualizar_resumen_financiero, desglose_por_tipo_pago, tendencia_mensual
+from .models import (
+    AusenciaTemporal, Clase, ClaseOcupacion, ClaseOcurrencia, CreditoRecupero, DeudaMensual,
+    EstadoPagoCliente, PlanPago, PlanUsuario, RegistroPago, Reserva, ResumenFinancieroMensual,
+    TareaPendiente
+)
+from .ocupacion_service import (
+    buscar_cupos_liberados, calcular_grilla_ocupacion, calcular_ocupacion, precargar_ocupacion,
+    reconstruir_ocupacion, reservar_cupo, reservar_cupos_en_lote
+)
+from .recuperos_service import consumir_credito, saldo_recupero, vencer_creditos
+from .tareas_service import MANEJADORES_TAREAS, MAX_INTENTOS_TAREA, procesar_lote
+
+
+def crear_plan(precio='40000'):
+    return PlanPago.objects.create(nombre='Plan 2 clases', clases_por_semana=2, precio_mensual=Decimal(precio))
+
+def crear_cliente(username, plan=None):
+    usuario = User.objects.create_user(username=username, password='clave-de-prueba')
+    EstadoPagoCliente.objects.create(usuario=usuario, plan_actual=plan)
+    return usuario
+
+def saldo(usuario):
+    return EstadoPagoCliente.objects.get(usuario=usuario).saldo_actual
+
+def proximo_lunes():
+    hoy = date.today()
+    return hoy + timedelta(days=(7 - hoy.weekday()))
+
+# ==============================================================================
+# OCUPACIÓN MATERIALIZADA
+# ==============================================================================
+
+class ClaseOcupacionTests(TestCase):
+    def setUp(self):
+        self.clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=5)
+        self.usuarios = [User.objects.create_user(username=f'alumno{i}') for i in range(2)]
+
+    def fila(self, fecha):
+        return ClaseOcupacion.objects.get(clase=self.clase, fecha=fecha)
+
+    def test_reservas_y_ausencias_actualizan_los_contadores(self):
+        reserva = Reserva.objects.create(usuario=self.usuarios[0], clase=self.clase)
+        AusenciaTemporal.objects.create(reserva=reserva, fecha=proximo_lunes())
+
+        self.assertEqual(self.fila(None).permanentes, 1)
+        self.assertEqual(self.fila(proximo_lunes()).ausencias, 1)
+        self.assertEqual(calcular_ocupacion([self.clase], fecha=proximo_lunes())[self.clase.id]['ocupados'], 0)
+
+        reserva.activa = False
+        reserva.save()
+        self.assertEqual(self.fila(None).permanentes, 0)
+        self.assertEqual(self.fila(proximo_lunes()).ausencias, 0)
+        self.assertEqual(reconstruir_ocupacion(aplicar=False), [])
+
+    def test_las_fechas_pasadas_no_se_reescriben(self):
+        reserva = Reserva.objects.create(usuario=self.usuarios[0], clase=self.clase)
+        pasado = proximo_lunes() - timedelta(days=14)
+        AusenciaTemporal.objects.create(reserva=reserva, fecha=pasado)
+
+        Reserva.objects.create(usuario=self.usuarios[1], clase=self.clase)
+
+        self.assertEqual(self.fila(None).permanentes, 2)
+        self.assertEqual(self.fila(pasado).permanentes, 1)
+        self.assertEqual(reconstruir_ocupacion(aplicar=False), [])
+
+class ClaseOcupacionAtomicaTests(TransactionTestCase):
+    """Sin la transacción envolvente de TestCase, como en un request real."""
+
+    def test_si_falla_la_ocupacion_no_se_guarda_la_reserva(self):
+        clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=5)
+        usuarios = [User.objects.create_user(username=f'alumno{i}') for i in range(2)]
+        reserva = Reserva.objects.create(usuario=usuarios[0], clase=clase)
+
+        with mock.patch('gravity.ocupacion_service._aplicar_deltas', side_effect=RuntimeError('sin ocupación')):
+            with self.assertRaises(RuntimeError):
+                Reserva.objects.create(usuario=usuarios[1], clase=clase)
+            with self.assertRaises(RuntimeError):
+                AusenciaTemporal.objects.create(reserva=reserva, fecha=proximo_lunes())
+
+        self.assertEqual(Reserva.objects.count(), 1)
+        self.assertFalse(AusenciaTemporal.objects.exists())
+        self.assertEqual(reconstruir_ocupacion(aplicar=False), [])
+
+class CalcularOcupacionTests(TestCase):
+    def setUp(self):
+        self.clases = [
+            Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(hora, 0), cupo_maximo=3)
+            for hora in (9, 10, 11)
+        ]
+        self.usuarios = [User.objects.create_user(username=f'alumno{i}') for i in range(2)]
+        for usuario in self.usuarios:
+            reservar_cupo(usuario, self.clases[0])
+        reservar_cupo(self.usuarios[0], self.clases[1], fecha_unica=proximo_lunes())
+
+    def cupos(self, ocupacion):
+        return [ocupacion[clase.id]['cupos_disponibles'] for clase in self.clases]
+
+    def test_una_sola_consulta_para_todas_las_clases(self):
+        with self.assertNumQueries(1):
+            ocupacion = calcular_ocupacion(self.clases)
+
+        self.assertEqual(self.cupos(ocupacion), [1, 3, 3])
+        self.assertEqual(ocupacion[self.clases[1].id]['total_activas'], 1)
+
+    def test_con_fecha_suma_las_reservas_de_ese_dia(self):
+        with self.assertNumQueries(2):  # ocupación y cierres
+            ocupacion = calcular_ocupacion(self.clases, fecha=proximo_lunes())
+
+        self.assertEqual(self.cupos(ocupacion), [1, 2, 3])
+
+    def test_precargada_la_clase_no_vuelve_a_consultar(self):
+        clases = precargar_ocupacion(Clase.objects.order_by('horario'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual([clase.cupos_disponibles() for clase in clases], [1, 3, 3])
+            self.assertFalse(clases[0].esta_completa())
+
+class GrillaOcupacionApiTests(TestCase):
+    def setUp(self):
+        self.clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=3)
+        self.alumno = User.objects.create_user(username='alumno')
+        self.url = reverse('gravity:ocupacion_api')
+
+    def test_devuelve_cada_ocurrencia_de_las_semanas_pedidas(self):
+        lunes = proximo_lunes()
+        reservar_cupo(self.alumno, self.clase, fecha_unica=lunes)
+
+        datos = self.client.get(self.url, {'desde': lunes.isoformat(), 'semanas': 2}).json()
+
+        ocupacion = datos['clases'][0]['ocupacion']
+        self.assertEqual(
+            [o['fecha'] for o in ocupacion],
+            [lunes.isoformat(), (lunes + timedelta(days=7)).isoformat()]
+        )
+        self.assertEqual([o['cupos_disponibles'] for o in ocupacion], [2, 3])
+        self.assertEqual(datos['hasta'], (lunes + timedelta(days=13)).isoformat())
+
+    def test_rechaza_parametros_invalidos(self):
+        self.assertEqual(self.client.get(self.url, {'semanas': 13}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'desde': 'mañana'}).status_code, 400)
+
+class CuposLiberadosTests(TestCase):
+    def setUp(self):
+        self.completa = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=1)
+        self.con_lugar = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(11, 0), cupo_maximo=3)
+        for clase in (self.completa, self.con_lugar):
+            reserva = reservar_cupo(User.objects.create_user(username=f'alumno{clase.id}'), clase)
+            AusenciaTemporal.objects.create(reserva=reserva, fecha=proximo_lunes())
+
+    def test_encuentra_los_cupos_que_libera_una_ausencia(self):
+        with self.assertNumQueries(1):
+            liberados = buscar_cupos_liberados()
+
+        self.assertEqual(
+            [(cupo['clase'], cupo['fecha'], cupo['cupos']) for cupo in liberados],
+            [(self.completa, proximo_lunes(), 1)]
+        )
+
+    def test_sin_solo_completas_incluye_las_clases_con_lugar(self):
+        liberados = buscar_cupos_liberados(solo_completas=False)
+
+        self.assertEqual(
+            [(cupo['clase'], cupo['cupos']) for cupo in liberados],
+            [(self.completa, 1), (self.con_lugar, 3)]
+        )
+
+class ArbolReservaApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=2)
+        Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(9, 0), cupo_maximo=2)
+        Clase.objects.create(tipo='Reformer', dia='Miércoles', horario=time(10, 0), direccion='sede_2')
+        Clase.objects.create(tipo='Cadillac', dia='Lunes', horario=time(10, 0))
+        reservar_cupo(User.objects.create_user(username='alumno'), clase)
+
+    def test_arma_sede_dia_y_horario_con_los_cupos(self):
+        arbol = self.client.get(reverse('gravity:arbol_reserva_api', args=['Reformer'])).json()
+
+        self.assertEqual([sede['value'] for sede in arbol['sedes']], ['sede_2', 'sede_principal'])
+        dias = arbol['sedes'][1]['dias']
+        self.assertEqual([dia['value'] for dia in dias], ['Lunes'])
+        self.assertEqual(
+            [(horario['value'], horario['cupos']) for horario in dias[0]['horarios']],
+            [('09:00', 2), ('10:00', 1)]
+        )
+
+    def test_rechaza_un_tipo_inexistente(self):
+        respuesta = self.client.get(reverse('gravity:arbol_reserva_api', args=['Yoga']))
+
+        self.assertEqual(respuesta.status_code, 400)
+
+# ==============================================================================
+# CACHE DE DISPONIBILIDAD Y GET CONDICIONAL
+# ==============================================================================
+
+class CacheDisponibilidadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=3)
+
+    def test_una_reserva_confirmada_invalida_lo_cacheado(self):
+        calcular = mock.Mock(return_value=['clases'])
+        self.assertEqual(obtener_o_calcular('prueba', calcular), ['clases'])
+        obtener_o_calcular('prueba', calcular)
+        self.assertEqual(calcular.call_count, 1)
+
+        version = obtener_version_disponibilidad()
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar_cupo(User.objects.create_user(username='alumno'), self.clase)
+
+        self.assertGreater(obtener_version_disponibilidad(), version)
+        obtener_o_calcular('prueba', calcular)
+        self.assertEqual(calcular.call_count, 2)
+
+    def test_sin_confirmar_la_transaccion_la_version_no_cambia(self):
+        version = obtener_version_disponibilidad()
+
+        reservar_cupo(User.objects.create_user(username='alumno'), self.clase)
+
+        self.assertEqual(obtener_version_disponibilidad(), version)
+
+@mock.patch('gravity.cache_service._tramo_actual', return_value=1)
+class GetCondicionalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=3)
+        self.url = reverse('gravity:ocupacion_api')
+
+    def test_responde_304_hasta_que_cambia_la_disponibilidad(self, _tramo):
+        etag = self.client.get(self.url)['ETag']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar_cupo(User.objects.create_user(username='alumno'), self.clase)
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_el_etag_depende_de_los_parametros(self, _tramo):
+        etag = self.client.get(self.url)['ETag']
+
+        respuesta = self.client.get(self.url, {'semanas': 2}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(respuesta.status_code, 200)
+
+# ==============================================================================
+# CUPOS EN VIVO (SSE)
+# ==============================================================================
+
+class BrokerDisponibilidadTests(TestCase):
+    def test_publica_solo_los_cambios_con_su_diferencia(self):
+        broker = BrokerDisponibilidad()
+
+        async def escuchar():
+            cola = broker.suscribir()
+            broker.publicar(1, None, 3)
+            broker.publicar(1, None, 3)
+            broker.publicar(1, None, 2)
+            await asyncio.sleep(0)
+            broker.desuscribir(cola)
+            return [cola.get_nowait() for _ in range(cola.qsize())]
+
+        eventos = asyncio.run(escuchar())
+
+        self.assertEqual([(e['cupos_disponibles'], e['delta']) for e in eventos], [(3, None), (2, -1)])
+        self.assertFalse(broker.hay_suscriptores())
+
+    def test_descarta_los_cupos_de_fechas_pasadas(self):
+        broker = BrokerDisponibilidad()
+        ayer = timezone.localdate() - timedelta(days=1)
+        broker._podado_el = ayer
+        broker._ultimos_cupos[(1, ayer)] = 3
+
+        broker.publicar(1, None, 3)
+
+        self.assertEqual(list(broker._ultimos_cupos), [(1, None)])
+
+    def test_bajo_wsgi_el_stream_no_se_abre(self):
+        respuesta = self.client.get(reverse('gravity:eventos_disponibilidad'))
+
+        self.assertEqual(respuesta.status_code, 204)
+
+# ==============================================================================
+# RESERVA ATÓMICA DE CUPOS
+# ==============================================================================
+
+class ReservarCupoTests(TestCase):
+    def setUp(self):
+        self.clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=2)
+        self.usuarios = [User.objects.create_user(username=f'alumno{i}') for i in range(3)]
+
+    def test_rechaza_reserva_con_la_clase_completa(self):
+        reservar_cupo(self.usuarios[0], self.clase)
+        reservar_cupo(self.usuarios[1], self.clase)
+
+        with self.assertRaisesMessage(ValidationError, 'Ya no hay cupos disponibles para esta clase.'):
+            reservar_cupo(self.usuarios[2], self.clase)
+        self.assertEqual(Reserva.objects.filter(clase=self.clase, activa=True).count(), 2)
+
+    def test_rechaza_reserva_de_fecha_unica_con_la_clase_completa_ese_dia(self):
+        fecha = date.today() + timedelta(days=(7 - date.today().weekday()))  # próximo lunes
+        reservar_cupo(self.usuarios[0], self.clase)
+        reservar_cupo(self.usuarios[1], self.clase, fecha_unica=fecha)
+
+        with self.assertRaisesMessage(ValidationError, fecha.strftime('%d/%m/%Y')):
+            reservar_cupo(self.usuarios[2], self.clase, fecha_unica=fecha)
+
+    def test_rechaza_reserva_permanente_duplicada(self):
+        reservar_cupo(self.usuarios[0], self.clase)
+
+        with self.assertRaisesMessage(ValidationError, 'Ya tienes una reserva activa para esta clase.'):
+            reservar_cupo(self.usuarios[0], self.clase)
+        self.assertEqual(Reserva.objects.filter(usuario=self.usuarios[0], activa=True).count(), 1)
+
+    def test_rechaza_reserva_de_fecha_unica_duplicada(self):
+        fecha = date.today() + timedelta(days=(7 - date.today().weekday()))
+        reservar_cupo(self.usuarios[0], self.clase, fecha_unica=fecha)
+
+        with self.assertRaisesMessage(ValidationError, 'Ya tienes una reserva activa para esta clase en esa fecha.'):
+            reservar_cupo(self.usuarios[0], self.clase, fecha_unica=fecha)
+
+    def test_otros_indices_unicos_no_se_informan_como_duplicado(self):
+        reserva = reservar_cupo(self.usuarios[0], self.clase)
+
+        with self.assertRaises(IntegrityError):
+            reservar_cupo(self.usuarios[1], self.clase, numero_reserva=reserva.numero_reserva)
+
+class ReservarCuposEnLoteTests(TestCase):
+    def setUp(self):
+        self.clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=2)
+        self.alumnos = [User.objects.create_user(username=f'alumno{i}') for i in range(3)]
+        reservar_cupo(self.alumnos[0], self.clase)
+
+    def test_las_filas_rechazadas_no_impiden_crear_las_demas(self):
+        filas = [{'usuario_id': alumno.id, 'clase_id': self.clase.id} for alumno in self.alumnos] + [
+            {'usuario_id': 'nadie', 'clase_id': self.clase.id},
+            {'usuario_id': self.alumnos[2].id, 'clase_id': self.clase.id, 'tipo': 'temporal',
+             'fecha': proximo_lunes() + timedelta(days=1)},
+        ]
+
+        resultado = reservar_cupos_en_lote(filas)
+
+        self.assertEqual([reserva.usuario_id for reserva in resultado['creadas']], [self.alumnos[1].id])
+        errores = {rechazo['fila']: rechazo['error'] for rechazo in resultado['rechazadas']}
+        self.assertEqual(list(errores), [0, 2, 3, 4])
+        self.assertIn('Ya tiene una reserva activa', errores[0])
+        self.assertIn('no tiene cupos disponibles', errores[2])
+        self.assertEqual(errores[3], 'Alumno o clase inválidos.')
+        self.assertIn('no es Lunes', errores[4])
+        self.assertEqual(reconstruir_ocupacion(aplicar=False), [])
+
+    def test_los_cupos_temporales_usan_la_ocupacion_de_esa_fecha(self):
+        AusenciaTemporal.objects.create(reserva=self.alumnos[0].reservas_pilates.get(), fecha=proximo_lunes())
+        filas = [
+            {'usuario_id': alumno.id, 'clase_id': self.clase.id, 'tipo': 'temporal', 'fecha': proximo_lunes()}
+            for alumno in self.alumnos[1:]
+        ]
+
+        resultado = reservar_cupos_en_lote(filas)
+
+        self.assertEqual(len(resultado['creadas']), 2)
+        self.assertEqual(resultado['rechazadas'], [])
+        self.assertEqual(calcular_ocupacion([self.clase], fecha=proximo_lunes())[self.clase.id]['cupos_disponibles'], 0)
+
+# ==============================================================================
+# ELEGIBILIDAD Y CUOTA SEMANAL
+# ==============================================================================
+
+class ElegibilidadReservaTests(TestCase):
+    def setUp(self):
+        self.plan = crear_plan()
+        self.alumno = User.objects.create_user(username='alumno')
+        self.clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=2)
+        reservar_cupo(User.objects.create_user(username='otro'), self.clase)
+        self.criterios = {'tipo': 'Reformer', 'dia': 'Lunes', 'horario': time(10, 0), 'sede': 'sede_principal'}
+
+    def asignar_plan(self):
+        hoy = timezone.localdate()
+        PlanUsuario.objects.create(
+            usuario=self.alumno, plan=self.plan, fecha_inicio=hoy - timedelta(days=1), fecha_fin=hoy + timedelta(days=30)
+        )
+
+    def test_sin_plan_no_puede_reservar(self):
+        resultado = evaluar_elegibilidad_reserva(self.alumno, **self.criterios)
+
+        self.assertFalse(resultado['puede_reservar'])
+        self.assertIn('No tienes un plan activo', resultado['mensaje'])
+        self.assertEqual(resultado['cupos_disponibles'], 1)
+
+    def test_una_consulta_y_el_resultado_queda_en_el_request(self):
+        self.asignar_plan()
+        reservar_cupo(self.alumno, Clase.objects.create(tipo='Reformer', dia='Martes', horario=time(10, 0)))
+        request = RequestFactory().get('/')
+
+        with self.assertNumQueries(1):
+            resultado = evaluar_elegibilidad_reserva(self.alumno, request=request, **self.criterios)
+        with self.assertNumQueries(0):
+            self.assertIs(evaluar_elegibilidad_reserva(self.alumno, request=request, **self.criterios), resultado)
+            self.assertEqual(evaluar_elegibilidad_reserva(self.alumno, request=request)['clases_restantes'], 1)
+
+        self.assertTrue(resultado['puede_reservar'])
+        self.assertFalse(resultado['duplicado'])
+        self.assertEqual((resultado['clases_plan'], resultado['reservas_semana']), (2, 1))
+
+    def test_detecta_la_reserva_duplicada(self):
+        self.asignar_plan()
+        reservar_cupo(self.alumno, self.clase)
+
+        resultado = evaluar_elegibilidad_reserva(self.alumno, **self.criterios)
+
+        self.assertTrue(resultado['duplicado'])
+        self.assertEqual(resultado['cupos_disponibles'], 0)
+
+class CuotaUsuarioTests(TestCase):
+    def setUp(self):
+        hoy = timezone.localdate()
+        self.alumno = User.objects.create_user(username='alumno')
+        PlanUsuario.objects.create(
+            usuario=self.alumno, plan=crear_plan(), fecha_inicio=hoy - timedelta(days=1), fecha_fin=hoy + timedelta(days=30)
+        )
+        self.clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=2)
+
+    def en_request(self, vista):
+        CuotaUsuarioMiddleware(lambda request: vista())(RequestFactory().get('/'))
+
+    def test_se_calcula_una_vez_por_request(self):
+        def vista():
+            with self.assertNumQueries(1):
+                self.assertEqual(cuota_usuario(self.alumno).clases_restantes, 2)
+                self.assertEqual(cuota_usuario(self.alumno).reservas_semana, 0)
+            self.assertIs(cuota_usuario(self.alumno), cuota_usuario(self.alumno))
+
+            # Una reserva nueva descarta la cuota memoizada
+            reservar_cupo(self.alumno, self.clase)
+            self.assertEqual(cuota_usuario(self.alumno).clases_restantes, 1)
+
+        self.en_request(vista)
+
+    def test_fuera_de_un_request_no_se_memoiza(self):
+        self.assertIsNot(cuota_usuario(self.alumno), cuota_usuario(self.alumno))
+
+# ==============================================================================
+# CIERRES DEL ESTUDIO
+# ==============================================================================
+
+class CierreClasesTests(TestCase):
+    def setUp(self):
+        self.clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=3)
+        self.alumno = User.objects.create_user(username='alumno')
+        reservar_cupo(self.alumno, self.clase)
+        self.fecha = proximo_lunes()
+        cerrar_clases(self.fecha, 'sede_principal', 'Feriado', notificar=False, confirmar=True)
+
+    def test_la_fecha_cerrada_no_ofrece_cupos(self):
+        grilla = calcular_grilla_ocupacion([self.clase], self.fecha, self.fecha + timedelta(days=7))
+        cerrada, siguiente = grilla[self.clase.id]
+
+        self.assertTrue(cerrada['cerrada'])
+        self.assertEqual(cerrada['cupos_disponibles'], 0)
+        self.assertFalse(siguiente['cerrada'])
+        self.assertEqual(siguiente['cupos_disponibles'], 2)
+
+        ocupacion = calcular_ocupacion([self.clase], fecha=self.fecha)[self.clase.id]
+        self.assertTrue(ocupacion['cerrada'])
+        self.assertEqual(ocupacion['cupos_disponibles'], 0)
+
+        self.assertEqual(buscar_cupos_liberados(solo_completas=False, hasta=self.fecha + timedelta(days=7)), [])
+
+    def test_rechaza_reservas_para_la_fecha_cerrada(self):
+        otro = User.objects.create_user(username='otro')
+
+        with self.assertRaisesMessage(ValidationError, 'cierre del estudio'):
+            reservar_cupo(otro, self.clase, fecha_unica=self.fecha)
+
+class NotificarCierreTests(TestCase):
+    def setUp(self):
+        clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=3)
+        self.alumnos = [
+            User.objects.create_user(username=f'alumno{i}', email=f'alumno{i}@example.com') for i in range(2)
+        ]
+        for alumno in self.alumnos:
+            reservar_cupo(alumno, clase)
+        resultado = cerrar_clases(proximo_lunes(), 'sede_principal', 'Feriado', confirmar=True)
+        self.cierre = resultado['cierre']
+
+    def test_un_reintento_no_reenvia_a_los_ya_notificados(self):
+        class Corte(BaseException):
+            pass
+
+        enviar = mail.EmailMessage.send
+        def cortar_en_el_segundo(email, *args, **kwargs):
+            if mail.outbox:
+                raise Corte()
+            return enviar(email, *args, **kwargs)
+
+        with mock.patch.object(mail.EmailMessage, 'send', cortar_en_el_segundo):
+            with self.assertRaises(Corte):
+                enviar_emails_cierre(self.cierre)
+
+        self.cierre.refresh_from_db()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.cierre.emails_enviados, 1)
+
+        resultado = enviar_emails_cierre(self.cierre)
+
+        self.assertEqual(resultado, {'enviados': 2, 'fallidos': 0})
+        self.assertCountEqual([email.to[0] for email in mail.outbox], [a.email for a in self.alumnos])
+        self.cierre.refresh_from_db()
+        self.assertCountEqual(self.cierre.usuarios_notificados, [a.id for a in self.alumnos])
+
+# ==============================================================================
+# COLA DE TAREAS
+# ==============================================================================
+
+class ProcesarLoteTests(TestCase):
+    def setUp(self):
+        self.usuarios = [User.objects.create_user(username=f'alumno{i}') for i in range(2)]
+        for datos in ({'nueva_reserva': True}, {}, {}):
+            TareaPendiente.objects.create(tipo='actualizar_estado_pago', usuario=self.usuarios[0], datos=datos)
+        TareaPendiente.objects.create(tipo='actualizar_estado_pago', usuario=self.usuarios[1])
+
+    def procesar(self, manejador):
+        with mock.patch.dict(MANEJADORES_TAREAS, {'actualizar_estado_pago': manejador}):
+            return procesar_lote()
+
+    def test_agrupa_las_tareas_del_mismo_usuario(self):
+        manejador = mock.Mock()
+
+        resultado = self.procesar(manejador)
+
+        self.assertEqual(resultado, {'tareas': 4, 'grupos': 2, 'completadas': 4, 'reintentos': 0, 'errores': 0})
+        manejador.assert_has_calls([
+            mock.call(self.usuarios[0].id, [{'nueva_reserva': True}, {}, {}]),
+            mock.call(self.usuarios[1].id, [{}]),
+        ])
+        self.assertFalse(TareaPendiente.objects.exclude(estado='completada').exists())
+
+    def test_reintenta_hasta_agotar_los_intentos(self):
+        manejador = mock.Mock(side_effect=RuntimeError('SMTP caído'))
+
+        with self.assertLogs('gravity.tareas_service', 'ERROR'):
+            resultado = self.procesar(manejador)
+
+        self.assertEqual(resultado['reintentos'], 4)
+        tarea = TareaPendiente.objects.get(usuario=self.usuarios[1])
+        self.assertEqual((tarea.estado, tarea.intentos, tarea.ultimo_error), ('pendiente', 1, 'SMTP caído'))
+
+        with self.assertLogs('gravity.tareas_service', 'ERROR'):
+            for _ in range(MAX_INTENTOS_TAREA - 1):
+                self.procesar(manejador)
+
+        self.assertEqual(set(TareaPendiente.objects.values_list('estado', flat=True)), {'error'})
+        self.assertEqual(self.procesar(manejador)['tareas'], 0)
+
+# ==============================================================================
+# CRONOGRAMA Y CALENDARIO DE CLASES
+# ==============================================================================
+
+class GenerarCronogramaTests(TestCase):
+    def setUp(self):
+        Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0), cupo_maximo=2)
+        self.bloques = [{
+            'sedes': ['sede_principal'],
+            'dias': ['Lunes', 'Sábado'],
+            'horarios': [time(9, 0), time(10, 0)],
+            'tipo': 'Reformer',
+            'cupo_maximo': 4,
+        }]
+
+    def test_dry_run_informa_las_diferencias_sin_crear(self):
+        resultado = generar_cronograma(self.bloques)
+
+        self.assertFalse(resultado['confirmado'])
+        self.assertEqual(resultado['total'], 4)
+        self.assertEqual([(f['dia'], f['horario']) for f in resultado['nuevas']], [('Lunes', '09:00')])
+        self.assertEqual([f['horario'] for f in resultado['existentes']], ['10:00'])
+        self.assertIn('Existe con cupo 2', resultado['existentes'][0]['detalle'])
+        self.assertEqual({f['dia'] for f in resultado['invalidas']}, {'Sábado'})
+        self.assertEqual(Clase.objects.count(), 1)
+
+    def test_confirmado_crea_solo_las_nuevas_con_su_ocupacion(self):
+        resultado = generar_cronograma(self.bloques, confirmar=True)
+
+        nueva, = resultado['creadas']
+        self.assertEqual((nueva.horario, nueva.cupo_maximo), (time(9, 0), 4))
+        self.assertEqual(Clase.objects.count(), 2)
+        self.assertTrue(ClaseOcupacion.objects.filter(clase=nueva, fecha__isnull=True).exists())
+        self.assertEqual(ClaseOcurrencia.objects.filter(clase=nueva).count(), SEMANAS_CALENDARIO)
+        self.assertEqual(generar_cronograma(self.bloques, confirmar=True)['creadas'], [])
+
+class ProximaOcurrenciaTests(TestCase):
+    def setUp(self):
+        self.lunes = date(2026, 3, 2)
+
+    def a_las(self, hora, fecha=None):
+        return timezone.make_aware(datetime.combine(fecha or self.lunes, time(hora, 0)))
+
+    def test_hoy_cuenta_hasta_que_empieza_la_clase(self):
+        self.assertEqual(proxima_ocurrencia('Lunes', time(10, 0), self.a_las(9)), self.lunes)
+        self.assertEqual(proxima_ocurrencia('Lunes', time(10, 0), self.a_las(10)), self.lunes + timedelta(days=7))
+        self.assertEqual(
+            proxima_ocurrencia('Lunes', time(10, 0), self.a_las(8), anticipacion=timedelta(hours=3)),
+            self.lunes + timedelta(days=7)
+        )
+        self.assertEqual(proxima_ocurrencia('Miércoles', time(10, 0), self.a_las(9)), self.lunes + timedelta(days=2))
+        self.assertIsNone(proxima_ocurrencia('Domingo', time(10, 0), self.a_las(9)))
+
+    def test_saltea_las_ausencias_con_una_sola_consulta(self):
+        clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0))
+        alumnos = [User.objects.create_user(username=f'alumno{i}') for i in range(2)]
+        permanente = reservar_cupo(alumnos[0], clase)
+        AusenciaTemporal.objects.create(reserva=permanente, fecha=proximo_lunes())
+        temporal = reservar_cupo(alumnos[1], clase, fecha_unica=proximo_lunes())
+        ahora = self.a_las(12, proximo_lunes() - timedelta(days=1))
+        reservas = list(Reserva.objects.select_related('clase'))
+
+        with self.assertNumQueries(1):
+            ocurrencias = calcular_ocurrencias(reservas, ahora)
+
+        self.assertTrue(ocurrencias[permanente.id]['ausencia_proxima'])
+        self.assertEqual(ocurrencias[permanente.id]['proxima_fecha'], proximo_lunes())
+        self.assertEqual(ocurrencias[permanente.id]['proxima_asistencia'], proximo_lunes() + timedelta(days=7))
+        self.assertEqual(ocurrencias[temporal.id]['proxima_asistencia'], proximo_lunes())
+
+class ClaseOcurrenciaTests(TestCase):
+    def setUp(self):
+        self.clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0))
+
+    def dias_de_la_semana(self):
+        return set(ClaseOcurrencia.objects.filter(clase=self.clase).values_list('fecha__week_day', flat=True))
+
+    def test_las_fechas_siguen_al_dia_y_al_estado_de_la_clase(self):
+        self.assertEqual(ClaseOcurrencia.objects.filter(clase=self.clase).count(), SEMANAS_CALENDARIO)
+        self.assertEqual(self.dias_de_la_semana(), {2})  # week_day: domingo = 1
+
+        self.clase.dia = 'Martes'
+        self.clase.save()
+        self.assertEqual(ClaseOcurrencia.objects.filter(clase=self.clase).count(), SEMANAS_CALENDARIO)
+        self.assertEqual(self.dias_de_la_semana(), {3})
+
+        self.clase.activa = False
+        self.clase.save()
+        self.assertFalse(ClaseOcurrencia.objects.filter(clase=self.clase).exists())
+
+    def test_dry_run_no_modifica_y_clases_del_dia_usa_el_dia_de_la_semana(self):
+        ClaseOcurrencia.objects.all().delete()
+
+        resultado = generar_ocurrencias(aplicar=False)
+
+        self.assertEqual(resultado['creadas'], SEMANAS_CALENDARIO)
+        self.assertFalse(ClaseOcurrencia.objects.exists())
+        self.assertEqual(list(clases_del_dia(proximo_lunes())), [self.clase])
+        self.assertEqual(list(clases_del_dia(proximo_lunes() + timedelta(days=1))), [])
+
+# ==============================================================================
+# CRÉDITOS DE RECUPERO
+# ==============================================================================
+
+class CreditosRecuperoTests(TestCase):
+    def setUp(self):
+        self.alumno = User.objects.create_user(username='alumno')
+        clase = Clase.objects.create(tipo='Reformer', dia='Lunes', horario=time(10, 0))
+        self.martes = Clase.objects.create(tipo='Reformer', dia='Martes', horario=time(10, 0))
+        self.reserva = reservar_cupo(self.alumno, clase)
+        self.ausencia = AusenciaTemporal.objects.create(reserva=self.reserva, fecha=proximo_lunes())
+
+    def test_la_ausencia_otorga_un_credito_que_el_recupero_consume(self):
+        self.assertEqual(saldo_recupero(self.alumno), 1)
+
+        recupero = reservar_cupo(
+            self.alumno, self.martes, fecha_unica=proximo_lunes() + timedelta(days=1), es_recupero=True
+        )
+        self.assertIsNotNone(consumir_credito(recupero))
+        self.assertEqual(saldo_recupero(self.alumno), 0)
+
+        # Cancelar el recupero antes de la clase reintegra el crédito
+        recupero.activa = False
+        recupero.save()
+        self.assertEqual(saldo_recupero(self.alumno), 1)
+
+    def test_cancelar_la_reserva_permanente_anula_el_credito(self):
+        self.reserva.activa = False
+        self.reserva.save()
+
+        self.assertEqual(CreditoRecupero.objects.get(ausencia=self.ausencia).estado, 'anulado')
+        self.assertEqual(saldo_recupero(self.alumno), 0)
+
+    def test_vencen_los_creditos_fuera_de_plazo(self):
+        hoy = proximo_lunes() + timedelta(days=7)
+
+        self.assertEqual(vencer_creditos(hoy=hoy, aplicar=False), {'vencidos': 1, 'usuarios': 1})
+        self.assertEqual(saldo_recupero(self.alumno), 1)
+
+        vencer_creditos(hoy=hoy)
+        self.assertEqual(CreditoRecupero.objects.get(ausencia=self.ausencia).estado, 'vencido')
+        self.assertEqual(saldo_recupero(self.alumno), 0)
+
+# ==============================================================================
+# GENERACIÓN Y VENCIMIENTO DE DEUDAS
+# ==============================================================================
+
+class GenerarDeudasMesTests(TestCase):
+    def setUp(self):
+        self.plan = crear_plan()
+        self.clientes = [crear_cliente(f'cliente{i}', self.plan) for i in range(3)]
+        self.mes = date(2026, 1, 1)
+
+    def generar(self, **kwargs):
+        return list(generar_deudas_mes(self.mes, tamaño_lote=2, **kwargs))
+
+    def test_genera_una_deuda_por_cliente(self):
+        lotes = self.generar()
+
+        self.assertEqual(sum(lote['generadas'] for lote in lotes), 3)
+        self.assertEqual(DeudaMensual.objects.filter(mes_año=self.mes).count(), 3)
+        for cliente in self.clientes:
+            self.assertEqual(saldo(cliente), -self.plan.precio_mensual)
+
+    def test_volver_a_ejecutar_no_duplica_deudas_ni_cargos(self):
+        self.generar()
+        lotes = self.generar()
+
+        self.assertEqual(sum(lote['generadas'] for lote in lotes), 0)
+        self.assertEqual(DeudaMensual.objects.filter(mes_año=self.mes).count(), 3)
+        for cliente in self.clientes:
+            self.assertEqual(saldo(cliente), -self.plan.precio_mensual)
+        self.assertEqual(reconciliar_cuentas(), [])
+
+    def test_retoma_los_clientes_que_quedaron_sin_deuda(self):
+        self.generar()
+        DeudaMensual.objects.get(usuario=self.clientes[0], mes_año=self.mes).delete()
+
+        lotes = self.generar()
+
+        self.assertEqual(sum(lote['generadas'] for lote in lotes), 1)
+        self.assertEqual(DeudaMensual.objects.filter(mes_año=self.mes).count(), 3)
+        self.assertEqual(reconciliar_cuentas(), [])
+
+    def test_force_reemplaza_sin_duplicar(self):
+        self.generar()
+        lotes = self.generar(force=True)
+
+        self.assertEqual(sum(lote['reemplazadas'] for lote in lotes), 3)
+        self.assertEqual(DeudaMensual.objects.filter(mes_año=self.mes).count(), 3)
+        for cliente in self.clientes:
+            self.assertEqual(saldo(cliente), -self.plan.precio_mensual)
+        self.assertEqual(reconciliar_cuentas(), [])
+
+    def test_dry_run_no_guarda(self):
+        lotes = self.generar(aplicar=False)
+
+        self.assertEqual(sum(lote['generadas'] for lote in lotes), 3)
+        self.assertFalse(DeudaMensual.objects.exists())
+
+class VencimientoDeudasTests(TestCase):
+    def setUp(self):
+        self.plan = crear_plan()
+        self.moroso = crear_cliente('moroso', self.plan)
+        self.al_dia = crear_cliente('al_dia', self.plan)
+        self.hoy = date(2026, 2, 15)
+        self.deuda_vencida = self.crear_deuda(self.moroso, date(2026, 2, 1))
+        self.deuda_al_dia = self.crear_deuda(self.al_dia, date(2026, 3, 1))
+
+    def crear_deuda(self, usuario, mes):
+        return DeudaMensual.objects.create(
+            usuario=usuario,
+            mes_año=mes,
+            plan_aplicado=self.plan,
+            monto_original=self.plan.precio_mensual,
+            monto_pendiente=self.plan.precio_mensual,
+            fecha_vencimiento=mes.replace(day=10),
+        )
+
+    def test_vence_deudas_y_bloquea_solo_a_los_morosos(self):
+        resultado = vencer_deudas(hoy=self.hoy)
+
+        self.assertEqual(resultado['deudas'], 1)
+        self.assertEqual(resultado['bloqueados'], 1)
+        self.assertEqual(resultado['monto'], self.plan.precio_mensual)
+        self.deuda_vencida.refresh_from_db()
+        self.deuda_al_dia.refresh_from_db()
+        self.assertEqual(self.deuda_vencida.estado, 'vencido')
+        self.assertEqual(self.deuda_al_dia.estado, 'pendiente')
+        self.assertFalse(EstadoPagoCliente.objects.get(usuario=self.moroso).puede_reservar)
+        self.assertTrue(EstadoPagoCliente.objects.get(usuario=self.al_dia).puede_reservar)
+
+    def test_volver_a_vencer_no_cambia_nada(self):
+        vencer_deudas(hoy=self.hoy)
+        resultado = vencer_deudas(hoy=self.hoy)
+
+        self.assertEqual(resultado['deudas'], 0)
+        self.assertEqual(resultado['bloqueados'], 0)
+
+    def test_dry_run_no_modifica(self):
+        resultado = vencer_deudas(hoy=self.hoy, aplicar=False)
+
+        self.assertEqual(resultado['deudas'], 1)
+        self.deuda_vencida.refresh_from_db()
+        self.assertEqual(self.deuda_vencida.estado, 'pendiente')
+        self.assertTrue(EstadoPagoCliente.objects.get(usuario=self.moroso).puede_reservar)
+
+    def test_desbloquea_solo_sin_deuda_vencida_pendiente(self):
+        vencer_deudas(hoy=self.hoy)
+        self.assertEqual(desbloquear_sin_deuda_vencida(), [])
+
+        DeudaMensual.objects.filter(pk=self.deuda_vencida.pk).update(monto_pendiente=0, estado='pagado')
+        self.assertEqual(desbloquear_sin_deuda_vencida(aplicar=False), ['moroso'])
+        self.assertFalse(EstadoPagoCliente.objects.get(usuario=self.moroso).puede_reservar)
+
+        self.assertEqual(desbloquear_sin_deuda_vencida(), ['moroso'])
+        self.assertTrue(EstadoPagoCliente.objects.get(usuario=self.moroso).puede_reservar)
+
+# ==============================================================================
+# CUENTA CORRIENTE
+# ==============================================================================
+
+class ReconciliarCuentasTests(TestCase):
+    def setUp(self):
+        self.plan = crear_plan()
+        self.admin = User.objects.create_user(username='admin', is_staff=True)
+        self.cliente = crear_cliente('cliente')
+        DeudaMensual.objects.create(
+            usuario=self.cliente,
+            mes_año=date(2026, 1, 1),
+            plan_aplicado=self.plan,
+            monto_original=Decimal('40000'),
+            monto_pendiente=Decimal('40000'),
+            fecha_vencimiento=date(2026, 1, 10),
+        )
+        RegistroPago.objects.create(
+            cliente=self.cliente,
+            monto=Decimal('15000'),
+            fecha_pago=date(2026, 1, 5),
+            tipo_pago='transferencia',
+            concepto='Cuota 01/2026',
+            registrado_por=self.admin,
+        )
+
+    def test_deudas_y_pagos_mantienen_el_saldo_corrido(self):
+        self.assertEqual(saldo(self.cliente), Decimal('-25000'))
+        self.assertEqual(reconciliar_cuentas(), [])
+
+    def test_corrige_un_saldo_desalineado_con_un_ajuste(self):
+        EstadoPagoCliente.objects.filter(usuario=self.cliente).update(saldo_actual=Decimal('0'))
+
+        diferencias = reconciliar_cuentas()
+        self.assertEqual(len(diferencias), 1)
+        self.assertEqual(diferencias[0]['esperado'], Decimal('-25000'))
+        self.assertEqual(saldo(self.cliente), Decimal('0'))  # sin aplicar solo informa
+
+        reconciliar_cuentas(aplicar=True)
+        self.assertEqual(saldo(self.cliente), Decimal('-25000'))
+        self.assertEqual(reconciliar_cuentas(), [])
+
+    def test_corrige_el_libro_cuando_falta_un_movimiento(self):
+        self.cliente.movimientos_cuenta.filter(tipo='pago').delete()
+
+        self.assertEqual(len(reconciliar_cuentas()), 1)
+        reconciliar_cuentas(aplicar=True)
+
+        self.assertEqual(saldo(self.cliente), Decimal('-25000'))
+        self.assertTrue(self.cliente.movimientos_cuenta.filter(tipo='ajuste').exists())
+        self.assertEqual(reconciliar_cuentas(), [])
+
+# ==============================================================================
+# PAGOS Y RESUMEN FINANCIERO
+# ==============================================================================
+
+class AdminPagosVistaTests(TestCase):
+    def setUp(self):
+        self.plan = crear_plan()
+        self.clientes = [crear_cliente(f'cliente{i:02d}', self.plan) for i in range(23)]
+        for cliente in self.clientes[:3]:
+            DeudaMensual.objects.create(
+                usuario=cliente,
+                mes_año=date(2026, 1, 1),
+                plan_aplicado=self.plan,
+                monto_original=self.plan.precio_mensual,
+                monto_pendiente=self.plan.precio_mensual,
+                fecha_vencimiento=date(2026, 1, 10),
+            )
+        self.client.force_login(User.objects.create_user(username='admin', is_staff=True, is_superuser=True))
+        self.url = reverse('gravity:admin_pagos_vista_principal')
+
+    def pagina(self, **parametros):
+        return self.client.get(self.url, parametros).context['page_obj']
+
+    def test_pagina_en_la_base_con_los_deudores_primero(self):
+        pagina = self.pagina()
+
+        self.assertEqual(pagina.paginator.count, 23)
+        self.assertEqual([estado.usuario for estado in pagina.object_list[:4]], self.clientes[:4])
+        self.assertEqual(len(pagina.object_list), 20)
+        self.assertEqual(len(self.pagina(page=2).object_list), 3)
+
+    def test_filtra_por_estado_y_nombre(self):
+        respuesta = self.client.get(self.url, {'estado': 'debe'})
+
+        self.assertEqual(respuesta.context['total_clientes'], 3)
+        self.assertEqual(respuesta.context['total_deuda'], 3 * self.plan.precio_mensual)
+        self.assertEqual([estado.usuario for estado in self.pagina(buscar='cliente07').object_list], [self.clientes[7]])
+
+class ResumenFinancieroTests(TestCase):
+    def setUp(self):
+        self.plan = crear_plan()
+        self.admin = User.objects.create_user(username='admin', is_staff=True)
+        self.cliente = crear_cliente('cliente', self.plan)
+        self.mes = date(2026, 1, 1)
+        DeudaMensual.objects.create(
+            usuario=self.cliente,
+            mes_año=self.mes,
+            plan_aplicado=self.plan,
+            monto_original=Decimal('40000'),
+            monto_pendiente=Decimal('40000'),
+            fecha_vencimiento=date(2026, 1, 10),
+        )
+        self.pagar('15000')
+        self.pagar('5000', estado='rechazado')
+
+    def pagar(self, monto, estado='confirmado'):
+        RegistroPago.objects.create(
+            cliente=self.cliente,
+            monto=Decimal(monto),
+            fecha_pago=date(2026, 1, 5),
+            tipo_pago='transferencia',
+            estado=estado,
+            concepto='Cuota 01/2026',
+            registrado_por=self.admin,
+        )
+
+    def totales(self):
+        return tendencia_mensual(meses=1, hasta=self.mes)[0]
+
+    def test_resume_lo_cargado_y_lo_cobrado_del_mes(self):
+        resultado = actualizar_resumen_financiero()
+
+        self.assertFalse(resultado['incremental'])
+        self.assertIn(self.mes, resultado['meses'])
+        totales = self.totales()
+        self.assertEqual((totales['cargado'], totales['cobrado']), (Decimal('40000'), Decimal('15000')))
+        self.assertEqual((totales['deudas'], totales['pagos']), (1, 1))
+        self.assertEqual(desglose_por_tipo_pago(self.mes, self.mes), [{
+            'tipo_pago': 'transferencia', 'nombre': 'Transferencia', 'cobrado': Decimal('15000'), 'pagos': 1
+        }])
+
+    def test_la_actualizacion_incremental_toma_los_pagos_nuevos(self):
+        actualizar_resumen_financiero()
+        self.pagar('25000')
+
+        resultado = actualizar_resumen_financiero()
+
+        self.assertTrue(resultado['incremental'])
+        self.assertIn(self.mes, resultado['meses'])
+        self.assertEqual(self.totales()['cobrado'], Decimal('40000'))
+
+    def test_dry_run_no_guarda(self):
+        resultado = actualizar_resumen_financiero(aplicar=False)
+
+        self.assertGreater(resultado['filas'], 0)
+        self.assertFalse(ResumenFinancieroMensual.objects.exists())
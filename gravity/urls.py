@@ -5,12 +5,12 @@ from .views import (
     verificar_disponibilidad, modificar_reserva,
     reservar_recupero, reservar_cupo_temporal, marcar_vencimiento_visto,
     cancelar_reserva, cancelar_ausencia, buscar_reservas_usuario,
-    clases_disponibles_api, clases_disponibles, detalle_reserva,
+    clases_disponibles_api, clases_disponibles, detalle_reserva, ocupacion_api, arbol_reserva_api, eventos_disponibilidad,
     sedes_disponibles, cerrar_modal_reserva_exitosa, cerrar_modal_ausencia_registrada, 
     # IMPORTACIONES PARA ADMINISTRADOR
-    admin_dashboard, admin_marcar_notificaciones_leidas, admin_clases_lista, admin_clase_crear,
+    admin_dashboard, admin_marcar_notificaciones_leidas, admin_cache_estadisticas, admin_clases_lista, admin_clase_crear, admin_clases_cronograma,
     admin_clase_editar, admin_clase_eliminar, admin_clase_detalle, admin_clase_toggle_status,
-    admin_reservas_lista, admin_reservar_para_usuario, admin_reserva_cancelar, admin_reserva_modificar,
+    admin_reservas_lista, admin_reservar_para_usuario, admin_reservas_masivas, admin_cierre_clases, admin_cierre_clases_estado, admin_reserva_cancelar, admin_reserva_modificar,
     admin_usuarios_lista, admin_usuario_detalle, admin_usuario_toggle_status, admin_usuario_add_note,
     admin_agregar_usuario, admin_reportes, admin_gestionar_admins, admin_crear_admin_restringido,
     admin_eliminar_admin_restringido, admin_historial_actividad,
@@ -19,7 +19,7 @@ from .views import (
     # IMPORTACIONES PARA SISTEMA DE PAGOS
     admin_pagos_registrar_pago, admin_pagos_vista_principal, admin_pagos_registrar_pago, 
     admin_pagos_historial_cliente, admin_pagos_configurar_planes, admin_pagos_editar_estado_cliente, 
-    admin_ajustar_deuda_especial, admin_generar_deuda_manual, admin_cancelar_plan_usuario,
+    admin_ajustar_deuda_especial, admin_generar_deuda_manual, admin_cancelar_plan_usuario, admin_pagos_reportes,
     # IMPORTACIONES PARA PLANES DE PAGO
     mis_planes, seleccionar_plan, cancelar_plan, modificar_plan, elegir_reservas_downgrade,
     # IMPORTACIONES PARA TESTIMONIOS
@@ -65,6 +65,9 @@ urlpatterns = [
     path('api/horarios-disponibles/', horarios_disponibles, name='horarios_disponibles'),
     path('api/verificar-disponibilidad/', verificar_disponibilidad, name='verificar_disponibilidad'),
     path('api/clases-disponibles/', clases_disponibles_api, name='clases_disponibles_api'),
+    path('api/ocupacion/', ocupacion_api, name='ocupacion_api'),
+    path('api/arbol-reserva/<str:tipo>/', arbol_reserva_api, name='arbol_reserva_api'),
+    path('api/eventos/disponibilidad/', eventos_disponibilidad, name='eventos_disponibilidad'),
 
     # ==============================================================================
     # URLS DEL PANEL DE ADMINISTRACIÓN
@@ -73,10 +76,12 @@ urlpatterns = [
     # Dashboard principal del administrador
     path('admin-panel/', admin_dashboard, name='admin_dashboard'),
     path('admin-panel/notificaciones/marcar-leidas/', admin_marcar_notificaciones_leidas, name='admin_marcar_notificaciones_leidas'),
+    path('admin-panel/cache/estadisticas/', admin_cache_estadisticas, name='admin_cache_estadisticas'),
     
     # Gestión de clases
     path('admin-panel/clases/', admin_clases_lista, name='admin_clases_lista'),
     path('admin-panel/clases/crear/', admin_clase_crear, name='admin_clase_crear'),
+    path('admin-panel/clases/cronograma/', admin_clases_cronograma, name='admin_clases_cronograma'),
     path('admin-panel/clases/<int:clase_id>/editar/', admin_clase_editar, name='admin_clase_editar'),
     path('admin-panel/clases/<int:clase_id>/eliminar/', admin_clase_eliminar, name='admin_clase_eliminar'),
     path('admin-panel/clases/<int:clase_id>/detalle/', admin_clase_detalle, name='admin_clase_detalle'),
@@ -86,6 +91,9 @@ urlpatterns = [
     path('admin-panel/reservar-para-usuario/', admin_reservar_para_usuario, name='admin_reservar_para_usuario'),
     path('admin-panel/reservar-para-usuario/clase/<int:clase_id>/', admin_reservar_para_usuario, name='admin_reservar_para_usuario_clase'),
     path('admin-panel/reservar-para-usuario/cliente/<int:usuario_id>/', admin_reservar_para_usuario, name='admin_reservar_para_usuario_cliente'),
+    path('admin-panel/reservas/masivas/', admin_reservas_masivas, name='admin_reservas_masivas'),
+    path('admin-panel/reservas/cierres/', admin_cierre_clases, name='admin_cierre_clases'),
+    path('admin-panel/reservas/cierres/<int:cierre_id>/estado/', admin_cierre_clases_estado, name='admin_cierre_clases_estado'),
     
     # Gestión de reservas
     path('admin-panel/reservas/', admin_reservas_lista, name='admin_reservas_lista'),
@@ -137,6 +145,7 @@ urlpatterns = [
     path('admin-panel/pagos/', admin_pagos_vista_principal, name='admin_pagos_vista_principal'),
     path('admin-panel/pagos/registrar/<int:cliente_id>/', admin_pagos_registrar_pago, name='admin_pagos_registrar_pago'),
     path('admin-panel/pagos/historial/<int:cliente_id>/', admin_pagos_historial_cliente, name='admin_pagos_historial_cliente'),
+    path('admin-panel/pagos/reportes/', admin_pagos_reportes, name='admin_pagos_reportes'),
     path('admin-panel/pagos/configurar-planes/', admin_pagos_configurar_planes, name='admin_pagos_configurar_planes'),
     path('admin-panel/pagos/editar-estado/<int:cliente_id>/', admin_pagos_editar_estado_cliente, name='admin_pagos_editar_estado_cliente'),
     path('admin-panel/pagos/ajustar-deuda/<int:deuda_id>/', admin_ajustar_deuda_especial, name='admin_ajustar_deuda_especial'),
@@ -1,9 +1,11 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.db import IntegrityError
-from django.http import JsonResponse, HttpResponse
-from django.views.decorators.http import require_http_methods
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods, condition
 from .models import (
     Reserva,
     Clase,
@@ -15,6 +17,7 @@ from .models import (
     AjusteDeudaEspecial,
     NotificacionPlanAdicional,
     CancelacionAdmin,
+    CierreClase,
     DIAS_SEMANA,
     DIAS_SEMANA_COMPLETOS
 )
@@ -24,6 +27,7 @@ from .forms import (
     BuscarReservaForm, 
     AjusteDeudaForm
 )
+import asyncio
 import json
 import calendar
 from accounts.models import UserProfile
@@ -46,13 +50,37 @@ from .email_service import (
     enviar_email_cambio_plan_aprobado
 )
 from .models import PlanPago, EstadoPagoCliente, RegistroPago, DeudaMensual, SolicitudCambioPlan
+from .ocupacion_service import (
+    calcular_ocupacion, precargar_ocupacion, reconstruir_ocupacion, calcular_grilla_ocupacion,
+    buscar_cupos_liberados, primer_cupo_liberado_por_clase, calcular_arbol_reserva, reservar_cupo,
+    reservar_cupos_en_lote, TIPOS_RESERVA_LOTE
+)
+from .cache_service import (
+    obtener_o_calcular, obtener_estadisticas_cache, etag_disponibilidad_html, etag_disponibilidad_json,
+    etag_planes, ultima_modificacion_planes, etag_testimonios, ultima_modificacion_testimonios
+)
+from .eventos_service import broker_disponibilidad, cupos_en_vivo_habilitados
+from .elegibilidad_service import evaluar_elegibilidad_reserva
+from .cuenta_service import saldo_cuenta
+from .finanzas_service import (
+    MESES_TENDENCIA, desglose_por_plan, desglose_por_tipo_pago, tendencia_mensual, ultima_actualizacion
+)
+from .cuota_service import cuota_usuario
+from .recuperos_service import consumir_credito, credito_disponible_para, liberar_creditos_de_reservas
+from .calendario_service import ahora_local, clases_del_dia, precargar_ocurrencias, proxima_ocurrencia
+from .cronograma_service import generar_cronograma
+from .cierres_service import cerrar_clases
 from .forms import ( PlanPagoForm, RegistroPagoForm, EstadoPagoClienteForm, FiltrosPagosForm )
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, Q, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
 from decimal import Decimal
 
 # Configurar el logger
 logger = logging.getLogger(__name__)
 
+# Segundos entre comentarios keep-alive del stream SSE de disponibilidad
+SSE_INTERVALO_PING = 25
+
 # Página de inicio (pública)
 def home(request):
     """Vista pública de la página principal"""
@@ -102,17 +130,8 @@ def reservar_clase(request):
         fecha_fin__gte=timezone.localtime(timezone.now()).date()
     ).select_related('plan')
     
-    # Calcular clases disponibles según planes
-    clases_disponibles, _ = PlanUsuario.obtener_clases_disponibles_usuario(request.user)
-    
-    # Contar reservas de esta semana
-    reservas_actuales = Reserva.contar_reservas_usuario_semana(request.user)
-    
-    # Calcular clases restantes
-    clases_restantes = max(0, clases_disponibles - reservas_actuales)
-    
     if request.method == 'POST':
-        form = ReservaForm(request.POST, user=request.user)
+        form = ReservaForm(request.POST, user=request.user, request=request)
         
         if form.is_valid():
             try:
@@ -124,29 +143,10 @@ def reservar_clase(request):
                 fecha_unica = None
 
                 if es_temporal:
-                    ahora = timezone.localtime(timezone.now())
-                    hoy = ahora.date()
-                    dias_map = {
-                        'Lunes': 0, 'Martes': 1, 'Miércoles': 2,
-                        'Jueves': 3, 'Viernes': 4, 'Sábado': 5
-                    }
-                    dia_clase = dias_map.get(clase.dia, 0)
-                    dias_hasta = (dia_clase - hoy.weekday()) % 7
-                    if dias_hasta == 0:
-                        clase_hoy = ahora.replace(
-                            hour=clase.horario.hour,
-                            minute=clase.horario.minute,
-                            second=0, microsecond=0
-                        )
-                        if ahora >= clase_hoy:
-                            dias_hasta = 7
-                    fecha_unica = hoy + timedelta(days=dias_hasta)
+                    fecha_unica = proxima_ocurrencia(clase.dia, clase.horario, ahora_local(request))
 
-                reserva = Reserva.objects.create(
-                    usuario=request.user,
-                    clase=clase,
-                    fecha_unica=fecha_unica
-                )
+                # Verifica el cupo y crea la reserva con la clase bloqueada (sin sobreventa)
+                reserva = reservar_cupo(request.user, clase, fecha_unica=fecha_unica)
 
                 # 📧 ENVIAR EMAIL DE CONFIRMACIÓN DE RESERVA
                 try:
@@ -166,6 +166,9 @@ def reservar_clase(request):
                 }
                 return redirect('accounts:mis_reservas')
                 
+            except ValidationError as e:
+                # Otra reserva ocupó el último cupo entre la validación del form y el guardado
+                messages.error(request, ' '.join(e.messages))
             except IntegrityError:
                 # Error de duplicado - no debería ocurrir por las validaciones del form
                 messages.error(
@@ -176,7 +179,13 @@ def reservar_clase(request):
     else:
         # Permitir preseleccionar tipo de clase desde URL
         initial_data = {'tipo_clase': tipo_preseleccionado} if tipo_preseleccionado else None
-        form = ReservaForm(user=request.user, initial=initial_data)
+        form = ReservaForm(user=request.user, request=request, initial=initial_data)
+
+    # Cuota del plan y reservas de la semana (si el form ya las evaluó, no se vuelven a consultar)
+    elegibilidad = evaluar_elegibilidad_reserva(request.user, request=request)
+    clases_disponibles = elegibilidad['clases_plan']
+    reservas_actuales = elegibilidad['reservas_semana']
+    clases_restantes = elegibilidad['clases_restantes']
 
     # Preparar información del usuario para mostrar en el template
     user_info = {
@@ -197,6 +206,10 @@ def reservar_clase(request):
         'clases_disponibles': clases_disponibles,
         'reservas_actuales': reservas_actuales,
         'clases_restantes': clases_restantes,
+        # Árbol tipo → sede → día → horario para armar la cascada sin AJAX
+        'arbol_reserva': obtener_arbol_reserva(),
+        'cupos_en_vivo': cupos_en_vivo_habilitados(request),
+        'cupos_recarga_segundos': settings.CUPOS_RECARGA_SEGUNDOS,
     })
 
 # Vista para modificar una reserva existente
@@ -542,79 +555,94 @@ def detalle_reserva(request, numero_reserva):
     })
 
 # Vista para mostrar clases disponibles (pública)
+@condition(etag_func=etag_disponibilidad_html)
 def clases_disponibles(request):
     """
     Muestra todas las clases disponibles con información de cupos.
     Vista informativa pública, ahora organizadas por sede.
     """
-    clases = Clase.objects.filter(activa=True).order_by('direccion', 'tipo', 'dia', 'horario')
+    def armar_catalogo():
+        clases = Clase.objects.filter(activa=True).order_by('direccion', 'tipo', 'dia', 'horario')
+        # Ocupación de todas las clases en consultas agrupadas
+        clases = precargar_ocupacion(clases)
+        # Cupos liberados por ausencias en las clases llenas, en una sola consulta
+        cupos_liberados = primer_cupo_liberado_por_clase(clases)
     
-    # Organizar clases por sede
-    clases_por_sede = {}
-    estadisticas_generales = {
-        'disponibles': 0,
-        'limitadas': 0,
-        'completas': 0,
-        'total': 0
-    }
+        # Organizar clases por sede
+        clases_por_sede = {}
+        estadisticas_generales = {
+            'disponibles': 0,
+            'limitadas': 0,
+            'completas': 0,
+            'total': 0
+        }
     
-    for clase in clases:
-        cupos_disponibles = clase.cupos_disponibles()
-        esta_completa = clase.esta_completa()
-        porcentaje_ocupacion = clase.get_porcentaje_ocupacion()
+        for clase in clases:
+            cupos_disponibles = clase.cupos_disponibles()
+            esta_completa = clase.esta_completa()
+            porcentaje_ocupacion = clase.get_porcentaje_ocupacion()
         
-        # Organizar por sede
-        sede_key = clase.direccion
-        sede_display = clase.get_direccion_display()
+            # Organizar por sede
+            sede_key = clase.direccion
+            sede_display = clase.get_direccion_display()
         
-        if sede_key not in clases_por_sede:
-            clases_por_sede[sede_key] = {
-                'nombre': sede_display,
-                'clases': [],
-                'estadisticas': {
-                    'disponibles': 0,
-                    'limitadas': 0,
-                    'completas': 0,
-                    'total': 0
+            if sede_key not in clases_por_sede:
+                clases_por_sede[sede_key] = {
+                    'nombre': sede_display,
+                    'clases': [],
+                    'estadisticas': {
+                        'disponibles': 0,
+                        'limitadas': 0,
+                        'completas': 0,
+                        'total': 0
+                    }
                 }
-            }
         
-        clase_info = {
-            'clase': clase,
-            'cupos_disponibles': cupos_disponibles,
-            'esta_completa': esta_completa,
-            'porcentaje_ocupacion': porcentaje_ocupacion,
-            'cupo_temporal': clase.get_cupo_temporal_semana() if esta_completa else None,
-        }
+            clase_info = {
+                'clase': clase,
+                'cupos_disponibles': cupos_disponibles,
+                'esta_completa': esta_completa,
+                'porcentaje_ocupacion': porcentaje_ocupacion,
+                'cupo_temporal': cupos_liberados.get(clase.id) if esta_completa else None,
+            }
         
-        clases_por_sede[sede_key]['clases'].append(clase_info)
+            clases_por_sede[sede_key]['clases'].append(clase_info)
         
-        # Contar para estadísticas por sede
-        if esta_completa:
-            clases_por_sede[sede_key]['estadisticas']['completas'] += 1
-            estadisticas_generales['completas'] += 1
-        elif cupos_disponibles <= 2:
-            clases_por_sede[sede_key]['estadisticas']['limitadas'] += 1
-            estadisticas_generales['limitadas'] += 1
-        else:
-            clases_por_sede[sede_key]['estadisticas']['disponibles'] += 1
-            estadisticas_generales['disponibles'] += 1
+            # Contar para estadísticas por sede
+            if esta_completa:
+                clases_por_sede[sede_key]['estadisticas']['completas'] += 1
+                estadisticas_generales['completas'] += 1
+            elif cupos_disponibles <= 2:
+                clases_por_sede[sede_key]['estadisticas']['limitadas'] += 1
+                estadisticas_generales['limitadas'] += 1
+            else:
+                clases_por_sede[sede_key]['estadisticas']['disponibles'] += 1
+                estadisticas_generales['disponibles'] += 1
         
-        clases_por_sede[sede_key]['estadisticas']['total'] += 1
-        estadisticas_generales['total'] += 1
+            clases_por_sede[sede_key]['estadisticas']['total'] += 1
+            estadisticas_generales['total'] += 1
     
-    return render(request, 'gravity/clases_disponibles.html', {
-        'clases_por_sede': clases_por_sede,
-        'estadisticas_generales': estadisticas_generales
-    })
+        return {
+            'clases_por_sede': clases_por_sede,
+            'estadisticas_generales': estadisticas_generales
+        }
+
+    # El catálogo se recalcula solo cuando cambia la versión de disponibilidad
+    # (o cambia el día, porque los cupos liberados dependen de la fecha)
+    hoy = timezone.localtime(timezone.now()).date()
+    catalogo = obtener_o_calcular('clases_disponibles', armar_catalogo, variante=hoy.isoformat())
+
+    return render(request, 'gravity/clases_disponibles.html', catalogo)
 
 # Vista para el botón de "Conoce más" (pública)
+@condition(etag_func=etag_testimonios, last_modified_func=ultima_modificacion_testimonios)
 def conoce_mas(request):
     """Vista informativa sobre el estudio"""
     testimonios = Testimonio.objects.filter(aprobado=True).select_related('usuario').order_by('-fecha_actualizacion')
     return render(request, 'gravity/conoce_mas.html', {'testimonios': testimonios})
 
 # Vista para mostrar planes y precios (pública)
+@condition(etag_func=etag_planes, last_modified_func=ultima_modificacion_planes)
 def precios_publicos(request):
     """
     Vista pública para mostrar los planes y precios sin necesidad de login.
@@ -735,7 +763,7 @@ def horarios_disponibles(request):
             filtro['direccion'] = sede
         
         # Obtener horarios para la combinación (solo clases activas)
-        clases = Clase.objects.filter(**filtro).order_by('horario')
+        clases = precargar_ocupacion(Clase.objects.filter(**filtro).order_by('horario'))
         
         horarios_info = []
         for clase in clases:
@@ -778,29 +806,42 @@ def verificar_disponibilidad(request):
         from datetime import datetime
         horario_time = datetime.strptime(horario_str, '%H:%M').time()
         
-        try:
-            clase = Clase.objects.get(
-                tipo=tipo_clase,
-                direccion=sede,
-                dia=dia_clase, 
-                horario=horario_time,
-                activa=True
-            )
-            cupos_disponibles = clase.cupos_disponibles()
-            
-            return JsonResponse({
-                'disponible': cupos_disponibles > 0,
-                'cupos_disponibles': cupos_disponibles,
-                'cupo_maximo': clase.cupo_maximo,
-                'sede': clase.get_direccion_corta(),
-                'mensaje': f'Quedan {cupos_disponibles} cupos disponibles en {clase.get_direccion_corta()}' if cupos_disponibles > 0 else 'Clase completa'
-            })
-            
-        except Clase.DoesNotExist:
+        # Misma evaluación (y misma consulta) que usa ReservaForm al confirmar
+        usuario = request.user if request.user.is_authenticated else None
+        elegibilidad = evaluar_elegibilidad_reserva(
+            usuario,
+            tipo=tipo_clase,
+            dia=dia_clase,
+            horario=horario_time,
+            sede=sede,
+            request=request
+        )
+        clase = elegibilidad['clase']
+        if clase is None:
             return JsonResponse({
                 'disponible': False,
                 'mensaje': 'Esta combinación de clase no existe o no está activa'
             })
+
+        cupos_disponibles = elegibilidad['cupos_disponibles']
+        respuesta = {
+            'disponible': cupos_disponibles > 0,
+            'cupos_disponibles': cupos_disponibles,
+            'cupo_maximo': clase.cupo_maximo,
+            'fecha': elegibilidad['fecha'].isoformat(),
+            'sede': clase.get_direccion_corta(),
+            'mensaje': f'Quedan {cupos_disponibles} cupos disponibles en {clase.get_direccion_corta()}' if cupos_disponibles > 0 else 'Clase completa'
+        }
+        if usuario is not None:
+            respuesta.update({
+                'puede_reservar': elegibilidad['puede_reservar'] and not elegibilidad['duplicado'],
+                'ya_reservada': elegibilidad['duplicado'],
+                'clases_plan': elegibilidad['clases_plan'],
+                'reservas_semana': elegibilidad['reservas_semana'],
+                'clases_restantes': elegibilidad['clases_restantes'],
+                'mensaje_plan': elegibilidad['mensaje'],
+            })
+        return JsonResponse(respuesta)
             
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Datos JSON inválidos'}, status=400)
@@ -810,34 +851,157 @@ def verificar_disponibilidad(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 @require_http_methods(["GET"])
+@condition(etag_func=etag_disponibilidad_json)
 def clases_disponibles_api(request):
     """
     API que devuelve todas las clases disponibles con información de cupos y sede
     """
     try:
-        clases = Clase.objects.filter(activa=True).order_by('direccion', 'tipo', 'dia', 'horario')
+        def armar_clases_data():
+            clases = Clase.objects.filter(activa=True).order_by('direccion', 'tipo', 'dia', 'horario')
+            clases = precargar_ocupacion(clases)
+        
+            clases_data = []
+            for clase in clases:
+                cupos_disponibles = clase.cupos_disponibles()
+                clases_data.append({
+                    'id': clase.id,
+                    'tipo': clase.tipo,
+                    'tipo_display': clase.get_nombre_display(),
+                    'direccion': clase.direccion,
+                    'direccion_display': clase.get_direccion_display(),
+                    'direccion_corta': clase.get_direccion_corta(),
+                    'dia': clase.dia,
+                    'horario': clase.horario.strftime('%H:%M'),
+                    'horario_display': clase.horario.strftime('%H:%M'),
+                    'cupos_disponibles': cupos_disponibles,
+                    'cupo_maximo': clase.cupo_maximo,
+                    'disponible': cupos_disponibles > 0,
+                    'porcentaje_ocupacion': clase.get_porcentaje_ocupacion()
+                })
+            return clases_data
+
+        clases_data = obtener_o_calcular('clases_disponibles_api', armar_clases_data)
+        return JsonResponse(clases_data, safe=False)
         
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+def obtener_arbol_reserva():
+    """Árbol de reserva de todas las clases activas, cacheado por versión de disponibilidad."""
+    return obtener_o_calcular(
+        'arbol_reserva',
+        lambda: calcular_arbol_reserva(Clase.objects.filter(activa=True))
+    )
+
+@require_http_methods(["GET"])
+@condition(etag_func=etag_disponibilidad_json)
+def arbol_reserva_api(request, tipo):
+    """
+    API que devuelve, para un tipo de clase, el árbol completo sede → día → horario
+    con los cupos de cada clase. Reemplaza la cadena sedes → días → horarios →
+    verificar disponibilidad por una sola request GET cacheable.
+    """
+    if tipo not in dict(Clase.TIPO_CLASES):
+        return JsonResponse({'error': 'Tipo de clase inválido'}, status=400)
+
+    try:
+        arbol = obtener_arbol_reserva()
+        return JsonResponse(arbol.get(tipo, {'tipo': tipo, 'sedes': []}))
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@require_http_methods(["GET"])
+async def eventos_disponibilidad(request):
+    """
+    Stream SSE (server-sent events) con los cambios de cupos de cada clase.
+    Cada evento 'cupos' trae {clase_id, fecha, cupos_disponibles, delta};
+    fecha es null para los cupos generales (reservas permanentes).
+    Solo se sirve con el entry point ASGI (PilatesGravity/asgi.py); bajo WSGI o con
+    CUPOS_EN_VIVO_SSE desactivado responde 204, que hace que el navegador no reintente.
+    """
+    if not cupos_en_vivo_habilitados(request):
+        return HttpResponse(status=204)
+
+    async def stream():
+        cola = broker_disponibilidad.suscribir()
+        try:
+            # Si se corta la conexión, el navegador reintenta a los 5 segundos
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    evento = await asyncio.wait_for(cola.get(), timeout=SSE_INTERVALO_PING)
+                except asyncio.TimeoutError:
+                    # Comentario SSE para que proxies y navegador no cierren la conexión
+                    yield ': ping\n\n'
+                    continue
+                yield f'event: cupos\ndata: {json.dumps(evento)}\n\n'
+        finally:
+            broker_disponibilidad.desuscribir(cola)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Nginx: no bufferear el stream
+    return response
+
+@require_http_methods(["GET"])
+@condition(etag_func=etag_disponibilidad_json)
+def ocupacion_api(request):
+    """
+    API que devuelve la grilla clase × fecha de cupos libres para las próximas semanas.
+    Parámetros GET: desde (YYYY-MM-DD, por defecto hoy) y semanas (1 a 12, por defecto 4).
+    Cuenta permanentes, descuenta ausencias y suma reservas de fecha única de cada día.
+    Las fechas en que la clase está cerrada vienen con cerrada=true y sin cupos.
+    """
+    try:
+        desde_str = request.GET.get('desde')
+        if desde_str:
+            desde = datetime.strptime(desde_str, '%Y-%m-%d').date()
+        else:
+            desde = timezone.localtime(timezone.now()).date()
+
+        semanas = int(request.GET.get('semanas', 4))
+        if not 1 <= semanas <= 12:
+            return JsonResponse({'error': 'El parámetro semanas debe estar entre 1 y 12'}, status=400)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos (desde: YYYY-MM-DD, semanas: número)'}, status=400)
+
+    try:
+        hasta = desde + timedelta(days=semanas * 7 - 1)
+        clases = list(Clase.objects.filter(activa=True).order_by('direccion', 'tipo', 'dia', 'horario'))
+        grilla = calcular_grilla_ocupacion(clases, desde, hasta)
+
         clases_data = []
         for clase in clases:
-            cupos_disponibles = clase.cupos_disponibles()
             clases_data.append({
                 'id': clase.id,
                 'tipo': clase.tipo,
                 'tipo_display': clase.get_nombre_display(),
                 'direccion': clase.direccion,
-                'direccion_display': clase.get_direccion_display(),
                 'direccion_corta': clase.get_direccion_corta(),
                 'dia': clase.dia,
                 'horario': clase.horario.strftime('%H:%M'),
-                'horario_display': clase.horario.strftime('%H:%M'),
-                'cupos_disponibles': cupos_disponibles,
                 'cupo_maximo': clase.cupo_maximo,
-                'disponible': cupos_disponibles > 0,
-                'porcentaje_ocupacion': clase.get_porcentaje_ocupacion()
+                'ocupacion': [
+                    {
+                        'fecha': ocurrencia['fecha'].strftime('%Y-%m-%d'),
+                        'cupos_disponibles': ocurrencia['cupos_disponibles'],
+                        'ocupados': ocurrencia['ocupados'],
+                        'ausencias': ocurrencia['ausencias'],
+                        'fecha_unica': ocurrencia['fecha_unica'],
+                        'cerrada': ocurrencia['cerrada'],
+                    }
+                    for ocurrencia in grilla[clase.id]
+                ],
             })
-        
-        return JsonResponse(clases_data, safe=False)
-        
+
+        return JsonResponse({
+            'desde': desde.strftime('%Y-%m-%d'),
+            'hasta': hasta.strftime('%Y-%m-%d'),
+            'semanas': semanas,
+            'clases': clases_data,
+        })
+
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -923,9 +1087,9 @@ def admin_dashboard(request):
         })
     
     # Clases más populares
-    clases_populares = Clase.objects.filter(activa=True).annotate(
+    clases_populares = precargar_ocupacion(Clase.objects.filter(activa=True).annotate(
         total_reservas=Count('reserva', filter=Q(reserva__activa=True))
-    ).order_by('-total_reservas')[:5]
+    ).order_by('-total_reservas')[:5])
     
     # Reservas recientes (últimas 10)
     reservas_recientes = Reserva.objects.filter(activa=True).select_related(
@@ -941,7 +1105,7 @@ def admin_dashboard(request):
     
     # Clases con poco cupo disponible (menos del 20%)
     clases_casi_llenas = []
-    for clase in Clase.objects.filter(activa=True):
+    for clase in precargar_ocupacion(Clase.objects.filter(activa=True)):
         cupos_disponibles = clase.cupos_disponibles()
         porcentaje_ocupacion = clase.get_porcentaje_ocupacion()
         if porcentaje_ocupacion >= 80:  # Más del 80% ocupado
@@ -1082,6 +1246,17 @@ def admin_marcar_notificaciones_leidas(request):
 
     return JsonResponse({'ok': False}, status=400)
 
+@admin_required
+def admin_cache_estadisticas(request):
+    """
+    Devuelve los aciertos y fallos de la cache del catálogo de clases
+    (por proceso) para monitorear su efectividad.
+    """
+    try:
+        return JsonResponse(obtener_estadisticas_cache())
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
 # ==============================================================================
 # GESTIÓN DE CLASES
 # ==============================================================================
@@ -1114,15 +1289,18 @@ def admin_clases_lista(request):
     elif estado_filtro == 'inactivas':
         clases = clases.filter(activa=False)
     
-    # Agregar información de reservas a cada clase
+    # Agregar información de reservas a cada clase (ocupación en consultas agrupadas)
+    clases = list(clases)
+    ocupacion = calcular_ocupacion(clases)
     clases_info = []
     for clase in clases:
+        ocupacion_clase = ocupacion[clase.id]
         clases_info.append({
             'clase': clase,
-            'total_reservas': clase.reserva_set.filter(activa=True).count(),
-            'cupos_disponibles': clase.cupos_disponibles(),
-            'porcentaje_ocupacion': clase.get_porcentaje_ocupacion(),
-            'puede_eliminarse': clase.puede_eliminarse()
+            'total_reservas': ocupacion_clase['total_activas'],
+            'cupos_disponibles': ocupacion_clase['cupos_disponibles'],
+            'porcentaje_ocupacion': ocupacion_clase['porcentaje_ocupacion'],
+            'puede_eliminarse': ocupacion_clase['total_activas'] == 0
         })
     
     # Paginación
@@ -1248,6 +1426,86 @@ def admin_clase_crear(request):
     
     return render(request, 'gravity/admin/clase_form.html', context)
 
+# Máximo de clases que puede generar una grilla
+MAX_CLASES_CRONOGRAMA = 500
+
+@admin_required
+def admin_clases_cronograma(request):
+    """
+    Generador de cronograma: crea muchas clases de una vez a partir de una grilla
+    (sedes × días × horarios, con tipo y cupo) en lugar de cargarlas de a una.
+    - GET: pantalla para armar los bloques de la grilla
+    - POST (JSON): {'bloques': [{'sedes', 'dias', 'horarios', 'tipo', 'nombre_personalizado',
+      'cupo_maximo'}], 'confirmar': bool}
+      Sin confirmar devuelve el informe de diferencias (dry-run); confirmado, crea las clases nuevas
+    """
+    if request.method != 'POST':
+        return render(request, 'gravity/admin/clases_cronograma.html', {
+            'tipos_clases': Clase.TIPO_CLASES,
+            'dias_semana': DIAS_SEMANA_COMPLETOS,
+            'direcciones': Clase.DIRECCIONES,
+            'max_clases': MAX_CLASES_CRONOGRAMA,
+        })
+
+    try:
+        data = json.loads(request.body)
+        bloques = data.get('bloques') or []
+        confirmar = bool(data.get('confirmar'))
+
+        if not isinstance(bloques, list) or not bloques:
+            return JsonResponse({'success': False, 'error': 'La grilla está vacía.'}, status=400)
+
+        # Convertir horarios y cupos antes de llamar al servicio
+        normalizados = []
+        for numero, bloque in enumerate(bloques, start=1):
+            if not isinstance(bloque, dict):
+                return JsonResponse({'success': False, 'error': f'Bloque {numero} inválido.'}, status=400)
+            try:
+                horarios = sorted({
+                    datetime.strptime(horario, '%H:%M').time() for horario in bloque.get('horarios') or []
+                })
+                cupo_maximo = int(bloque.get('cupo_maximo'))
+            except (TypeError, ValueError):
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Bloque {numero}: horarios (HH:MM) o cupo inválidos.'
+                }, status=400)
+            normalizados.append({
+                'sedes': list(bloque.get('sedes') or []),
+                'dias': list(bloque.get('dias') or []),
+                'horarios': horarios,
+                'tipo': bloque.get('tipo'),
+                'nombre_personalizado': bloque.get('nombre_personalizado'),
+                'cupo_maximo': cupo_maximo,
+            })
+
+        combinaciones = sum(len(b['sedes']) * len(b['dias']) * len(b['horarios']) for b in normalizados)
+        if not combinaciones:
+            return JsonResponse({'success': False, 'error': 'La grilla no genera ninguna clase.'}, status=400)
+        if combinaciones > MAX_CLASES_CRONOGRAMA:
+            return JsonResponse({
+                'success': False,
+                'error': f'La grilla genera {combinaciones} clases; el máximo es {MAX_CLASES_CRONOGRAMA} por vez.'
+            }, status=400)
+
+        resultado = generar_cronograma(normalizados, confirmar=confirmar)
+
+        return JsonResponse({
+            'success': True,
+            'confirmado': resultado['confirmado'],
+            'total': resultado['total'],
+            'nuevas': resultado['nuevas'],
+            'existentes': resultado['existentes'],
+            'invalidas': resultado['invalidas'],
+            'creadas': len(resultado['creadas']),
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Datos JSON inválidos'}, status=400)
+    except Exception as e:
+        logger.error(f"Error generando cronograma: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
 @admin_required
 def admin_clase_editar(request, clase_id):
     """
@@ -1400,15 +1658,7 @@ def admin_clase_detalle(request, clase_id):
     clase = get_object_or_404(Clase, id=clase_id)
 
     # Calcular próxima fecha de esta clase
-    hoy = timezone.localtime(timezone.now())
-    dias_semana = {'Lunes': 0, 'Martes': 1, 'Miércoles': 2, 'Jueves': 3, 'Viernes': 4, 'Sábado': 5}
-    dia_num = dias_semana.get(clase.dia, 0)
-    dias_hasta = (dia_num - hoy.weekday()) % 7
-    if dias_hasta == 0:
-        proxima_hoy = hoy.replace(hour=clase.horario.hour, minute=clase.horario.minute, second=0, microsecond=0)
-        if proxima_hoy <= hoy:
-            dias_hasta = 7
-    proxima_fecha_clase = (hoy + timedelta(days=dias_hasta)).date()
+    proxima_fecha_clase = proxima_ocurrencia(clase.dia, clase.horario, ahora_local(request))
 
     # Reservas permanentes (asisten todas las semanas)
     reservas_permanentes = clase.reserva_set.filter(
@@ -1447,6 +1697,7 @@ def admin_clase_detalle(request, clase_id):
         chain(reservas_permanentes, reservas_fecha_unica),
         key=lambda r: (r.usuario.first_name or '', r.usuario.last_name or '')
     )
+    precargar_ocurrencias(reservas, request=request)
 
     total_reservas = reservas_permanentes.count() + reservas_fecha_unica.count()
 
@@ -1535,10 +1786,8 @@ def admin_asistencia(request):
     dias_semana_nombres = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
     dia_nombre = dias_semana_nombres[fecha_seleccionada.weekday()]
 
-    # Clases del día seleccionado
-    clases_qs = Clase.objects.filter(activa=True, dia=dia_nombre).order_by('direccion', 'horario')
-    if sede_seleccionada:
-        clases_qs = clases_qs.filter(direccion=sede_seleccionada)
+    # Clases que se dictaron (o se dictan) en esa fecha, según el calendario de clases
+    clases_qs = clases_del_dia(fecha_seleccionada, direccion=sede_seleccionada)
 
     # Precargar inasistencias y ausencias temporales de esa fecha de una sola vez
     ids_clases = list(clases_qs.values_list('id', flat=True))
@@ -1884,6 +2133,7 @@ def admin_reservas_lista(request):
     paginator = Paginator(reservas, 15)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    precargar_ocurrencias(page_obj, request=request)
     
     context = {
         'page_obj': page_obj,
@@ -2005,6 +2255,92 @@ def admin_reserva_cancelar(request, reserva_id):
     
     return render(request, 'gravity/admin/reserva_cancelar.html', context)
 
+def _estado_cierre_json(cierre):
+    """Resumen serializable de un CierreClase (para el seguimiento del envío de emails)."""
+    return {
+        'id': cierre.id,
+        'fecha': cierre.fecha.strftime('%d/%m/%Y'),
+        'alcance': cierre.get_alcance_display(),
+        'motivo': cierre.motivo,
+        'clases_cerradas': cierre.clases_cerradas,
+        'ausencias_creadas': cierre.ausencias_creadas,
+        'reservas_canceladas': cierre.reservas_canceladas,
+        'estado_notificacion': cierre.estado_notificacion,
+        'estado_notificacion_display': cierre.get_estado_notificacion_display(),
+        'emails_total': cierre.emails_total,
+        'emails_enviados': cierre.emails_enviados,
+        'emails_fallidos': cierre.emails_fallidos,
+    }
+
+@admin_required
+def admin_cierre_clases(request):
+    """
+    Cierre de una clase o de una sede completa en una fecha (feriados, ausencia de
+    la instructora...), en lugar de cancelar las reservas de a una.
+    - GET: formulario y últimos cierres con el avance del envío de emails
+    - POST (JSON): {'fecha', 'direccion', 'clase_id', 'motivo', 'motivo_detalle',
+      'notificar', 'confirmar'}. Sin confirmar devuelve qué afectaría (dry-run)
+    """
+    if request.method != 'POST':
+        return render(request, 'gravity/admin/cierre_clases.html', {
+            'direcciones': Clase.DIRECCIONES,
+            'clases': Clase.objects.filter(activa=True).order_by('direccion', 'dia', 'horario'),
+            'cierres': CierreClase.objects.select_related('clase', 'admin_user')[:20],
+            'hoy_iso': timezone.localtime(timezone.now()).date().isoformat(),
+        })
+
+    try:
+        data = json.loads(request.body)
+        try:
+            fecha = datetime.strptime(data.get('fecha') or '', '%Y-%m-%d').date()
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Fecha inválida (formato AAAA-MM-DD).'}, status=400)
+        try:
+            clase_id = int(data['clase_id']) if data.get('clase_id') else None
+        except (TypeError, ValueError):
+            return JsonResponse({'success': False, 'error': 'Clase inválida.'}, status=400)
+
+        resultado = cerrar_clases(
+            fecha=fecha,
+            direccion=data.get('direccion'),
+            motivo=data.get('motivo'),
+            motivo_detalle=data.get('motivo_detalle', ''),
+            clase_id=clase_id,
+            admin_user=request.user,
+            notificar=bool(data.get('notificar')),
+            confirmar=bool(data.get('confirmar')),
+        )
+
+        return JsonResponse({
+            'success': True,
+            'confirmado': resultado['confirmado'],
+            'clases': [
+                f'{clase.get_nombre_display()} {clase.horario.strftime("%H:%M")}' for clase in resultado['clases']
+            ],
+            'ya_cerradas': [
+                f'{clase.get_nombre_display()} {clase.horario.strftime("%H:%M")}' for clase in resultado['ya_cerradas']
+            ],
+            'ausencias': len(resultado['ausencias']),
+            'cancelaciones': len(resultado['cancelaciones']),
+            'usuarios': len(resultado['usuarios']),
+            'cierre': _estado_cierre_json(resultado['cierre']) if resultado['cierre'] else None,
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Datos JSON inválidos'}, status=400)
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'error': ' '.join(e.messages)}, status=409)
+    except Exception as e:
+        logger.error(f"Error en cierre de clases: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@admin_required
+@require_http_methods(["GET"])
+def admin_cierre_clases_estado(request, cierre_id):
+    """Avance del envío de emails de un cierre de clases."""
+    cierre = get_object_or_404(CierreClase.objects.select_related('clase'), id=cierre_id)
+    return JsonResponse({'success': True, 'cierre': _estado_cierre_json(cierre)})
+
 @admin_required
 def admin_reserva_modificar(request, reserva_id):
     """
@@ -2124,7 +2460,7 @@ def reservar_recupero(request):
     Permite reservar una clase de recupero por ausencia temporal registrada esta semana.
     La reserva es solo para esa fecha. No consume clases del plan.
     """
-    puede, n_disponibles, ausencias = Reserva.usuario_puede_hacer_recupero(request.user)
+    puede, n_disponibles, ausencias = cuota_usuario(request.user).recupero
 
     if not puede:
         messages.error(request, 'No tenés ausencias disponibles para recuperar esta semana.')
@@ -2134,29 +2470,28 @@ def reservar_recupero(request):
     # El plazo máximo es la fecha_limite_recupero más lejana entre las ausencias vigentes
     fin_ventana = max((a.fecha_limite_recupero for a in ausencias), default=hoy)
 
+    # Ocupación de todas las ocurrencias de la ventana en una sola consulta
+    clases = list(Clase.objects.filter(activa=True))
+    grilla = calcular_grilla_ocupacion(clases, hoy, fin_ventana)
+
+    reservas_usuario = Reserva.objects.filter(usuario=request.user, activa=True)
+    clases_permanentes = set(
+        reservas_usuario.filter(fecha_unica__isnull=True).values_list('clase_id', flat=True)
+    )
+    clases_fecha_unica = set(
+        reservas_usuario.filter(
+            fecha_unica__gte=hoy, fecha_unica__lte=fin_ventana
+        ).values_list('clase_id', 'fecha_unica')
+    )
+
     clases_para_recupero = []
-    dias_totales = (fin_ventana - hoy).days + 1
-    for offset in range(dias_totales):
-        fecha_dia = hoy + timedelta(days=offset)
-        dia_nombre = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'][fecha_dia.weekday()]
-        for clase in Clase.objects.filter(activa=True, dia=dia_nombre).order_by('horario'):
-            cupos = clase.cupos_disponibles(fecha=fecha_dia)
-            if cupos <= 0:
-                continue
-            ya_tiene = Reserva.objects.filter(
-                usuario=request.user,
-                clase=clase,
-                activa=True
-            ).filter(
-                fecha_unica=fecha_dia
-            ).exists()
-            ya_tiene_permanente = Reserva.objects.filter(
-                usuario=request.user,
-                clase=clase,
-                activa=True,
-                fecha_unica__isnull=True
-            ).exists()
-            if ya_tiene or ya_tiene_permanente:
+    for clase in clases:
+        if clase.id in clases_permanentes:
+            continue
+        for ocurrencia in grilla[clase.id]:
+            fecha_dia = ocurrencia['fecha']
+            cupos = ocurrencia['cupos_disponibles']
+            if cupos <= 0 or (clase.id, fecha_dia) in clases_fecha_unica:
                 continue
             clases_para_recupero.append({
                 'clase': clase,
@@ -2164,6 +2499,7 @@ def reservar_recupero(request):
                 'fecha_str': fecha_dia.strftime('%Y-%m-%d'),
                 'cupos': cupos,
             })
+    clases_para_recupero.sort(key=lambda item: (item['fecha'], item['clase'].horario))
 
     if request.method == 'POST':
         clase_id = request.POST.get('clase_id')
@@ -2177,24 +2513,17 @@ def reservar_recupero(request):
                 messages.error(request, 'Fecha inválida para el recupero.')
                 return redirect('gravity:reservar_recupero')
 
-            if clase.cupos_disponibles(fecha=fecha_recupero) <= 0:
-                messages.error(request, 'Ya no hay cupos disponibles para esa clase en esa fecha.')
-                return redirect('gravity:reservar_recupero')
-
-            puede, _, _ = Reserva.usuario_puede_hacer_recupero(request.user)
-            if not puede:
-                messages.error(request, 'Ya no tenés recuperos disponibles esta semana.')
-                return redirect('accounts:mis_reservas')
-
-            reserva = Reserva(
-                usuario=request.user,
-                clase=clase,
-                es_recupero=True,
-                fecha_unica=fecha_recupero,
-                notas=f'Recupero por ausencia temporal — {fecha_recupero.strftime("%d/%m/%Y")}'
-            )
-            reserva.full_clean()
-            reserva.save()
+            # El crédito se consume junto con la reserva: si otro request lo usó antes, no se reserva
+            with transaction.atomic():
+                reserva = reservar_cupo(
+                    request.user,
+                    clase,
+                    fecha_unica=fecha_recupero,
+                    es_recupero=True,
+                    notas=f'Recupero por ausencia temporal — {fecha_recupero.strftime("%d/%m/%Y")}'
+                )
+                if consumir_credito(reserva) is None:
+                    raise ValidationError('Ya no tenés recuperos disponibles para esa fecha.')
 
             request.session['reserva_exitosa'] = {
                 'tipo': 'recupero',
@@ -2206,6 +2535,9 @@ def reservar_recupero(request):
             }
             return redirect('accounts:mis_reservas')
 
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
+            return redirect('gravity:reservar_recupero')
         except Exception as e:
             messages.error(request, f'Error al procesar el recupero: {str(e)}')
             return redirect('gravity:reservar_recupero')
@@ -2265,41 +2597,31 @@ def reservar_cupo_temporal(request, clase_id, fecha_str):
         messages.error(request, 'Fecha inválida.')
         return redirect('gravity:clases_disponibles')
 
-    ahora = timezone.localtime(timezone.now())
-    hoy = ahora.date()
+    hoy = timezone.localtime(timezone.now()).date()
 
     if fecha < hoy:
         messages.error(request, 'El cupo temporal ya no está disponible.')
         return redirect('gravity:clases_disponibles')
 
-    # Si la clase es hoy, verificar que todavía no haya comenzado
-    if fecha == hoy:
-        clase_datetime = ahora.replace(
-            hour=clase.horario.hour,
-            minute=clase.horario.minute,
-            second=0,
-            microsecond=0
-        )
-        if ahora >= clase_datetime:
-            messages.error(request, 'El cupo temporal ya no está disponible (la clase ya comenzó).')
-            return redirect('gravity:clases_disponibles')
-
-    cupos = clase.cupos_disponibles(fecha=fecha)
-    if cupos <= 0:
+    # El cupo tiene que seguir liberado por una ausencia (y la clase no haber comenzado)
+    liberados = buscar_cupos_liberados([clase], desde=fecha, hasta=fecha, solo_completas=False)
+    if not liberados:
         messages.error(request, 'Ya no hay cupos disponibles para esta clase en esa fecha.')
         return redirect('gravity:clases_disponibles')
+    cupos = liberados[0]['cupos']
 
-    clases_disponibles_usuario, _ = PlanUsuario.obtener_clases_disponibles_usuario(request.user)
+    cuota = cuota_usuario(request.user)
+    clases_disponibles_usuario = cuota.clases_plan
     if clases_disponibles_usuario == 0:
         messages.error(request, 'Necesitás un plan activo para reservar.')
         return redirect('gravity:mis_planes')
 
-    # Detectar si el usuario tiene una ausencia disponible para usar como recupero
-    puede_recupero, _, _ = Reserva.usuario_puede_hacer_recupero(request.user)
+    # Detectar si el usuario tiene un crédito de recupero que cubra esa fecha
+    puede_recupero = cuota.recupero[0] and credito_disponible_para(request.user, fecha)
 
     if not puede_recupero:
         # Sin ausencia disponible: verificar límite semanal normal
-        reservas_actuales = Reserva.contar_reservas_usuario_semana(request.user)
+        reservas_actuales = cuota.reservas_semana
         if reservas_actuales >= clases_disponibles_usuario:
             messages.error(
                 request,
@@ -2307,25 +2629,20 @@ def reservar_cupo_temporal(request, clase_id, fecha_str):
             )
             return redirect('accounts:mis_reservas')
 
-    ya_tiene = Reserva.objects.filter(
-        usuario=request.user, clase=clase, activa=True
-    ).exists()
-    if ya_tiene:
-        messages.error(request, 'Ya tenés una reserva para esta clase.')
-        return redirect('gravity:clases_disponibles')
-
+    # Las reservas duplicadas las rechaza el índice único de Reserva al guardar
     if request.method == 'POST':
         try:
             tipo_nota = 'Recupero' if puede_recupero else 'Cupo temporal'
-            reserva = Reserva(
-                usuario=request.user,
-                clase=clase,
-                es_recupero=puede_recupero,
-                fecha_unica=fecha,
-                notas=f'{tipo_nota} — {fecha.strftime("%d/%m/%Y")}'
-            )
-            reserva.full_clean()
-            reserva.save()
+            with transaction.atomic():
+                reserva = reservar_cupo(
+                    request.user,
+                    clase,
+                    fecha_unica=fecha,
+                    es_recupero=puede_recupero,
+                    notas=f'{tipo_nota} — {fecha.strftime("%d/%m/%Y")}'
+                )
+                if puede_recupero and consumir_credito(reserva) is None:
+                    raise ValidationError('Ya no tenés recuperos disponibles para esa fecha.')
 
             request.session['reserva_exitosa'] = {
                 'tipo': 'recupero' if puede_recupero else 'temporal',
@@ -2337,6 +2654,8 @@ def reservar_cupo_temporal(request, clase_id, fecha_str):
             }
             return redirect('accounts:mis_reservas')
 
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
         except Exception as e:
             messages.error(request, f'Error al procesar la reserva: {str(e)}')
 
@@ -2372,20 +2691,9 @@ def admin_reservar_para_usuario(request, clase_id=None, usuario_id=None):
     # Cupos reales de la clase preseleccionada (considera ausencias del día)
     cupos_proxima_preseleccionada = None
     if clase_preseleccionada:
-        _ahora = timezone.localtime(timezone.now())
-        _hoy = _ahora.date()
-        _dias_map = {'Lunes': 0, 'Martes': 1, 'Miércoles': 2, 'Jueves': 3, 'Viernes': 4, 'Sábado': 5}
-        _dia_num = _dias_map.get(clase_preseleccionada.dia, 0)
-        _dias_hasta = (_dia_num - _hoy.weekday()) % 7
-        if _dias_hasta == 0:
-            _clase_hoy = _ahora.replace(
-                hour=clase_preseleccionada.horario.hour,
-                minute=clase_preseleccionada.horario.minute,
-                second=0, microsecond=0
-            )
-            if _clase_hoy <= _ahora:
-                _dias_hasta = 7
-        _fecha_proxima = _hoy + timedelta(days=_dias_hasta)
+        _fecha_proxima = proxima_ocurrencia(
+            clase_preseleccionada.dia, clase_preseleccionada.horario, ahora_local(request)
+        )
         cupos_proxima_preseleccionada = clase_preseleccionada.cupos_disponibles(fecha=_fecha_proxima)
 
     hoy_iso = timezone.now().date().isoformat()
@@ -2419,35 +2727,12 @@ def admin_reservar_para_usuario(request, clase_id=None, usuario_id=None):
         clase = get_object_or_404(Clase, id=clase_id_post, activa=True)
         usuario = get_object_or_404(User, id=usuario_id_post, is_staff=False)
 
-        # Para recurrente: no puede haber ninguna reserva activa en esa clase
-        # Para temporal/recupero: el modelo valida duplicados de fecha_unica
-        if tipo_reserva == 'recurrente' and Reserva.objects.filter(usuario=usuario, clase=clase, activa=True).exists():
-            messages.error(
-                request,
-                f'{usuario.get_full_name() or usuario.username} ya tiene una reserva activa '
-                f'en {clase.get_nombre_display()} - {clase.dia} {clase.horario.strftime("%H:%M")}.'
-            )
-            return render(request, 'gravity/admin/admin_reservar_para_usuario.html', {
-                'clases_disponibles': clases_disponibles,
-                'todos_los_usuarios': todos_los_usuarios,
-                'clase_preseleccionada': clase_preseleccionada,
-                'usuario_preseleccionado': usuario_preseleccionado,
-                'hoy_iso': hoy_iso,
-                'cupos_proxima_preseleccionada': cupos_proxima_preseleccionada,
-            })
+        # Los duplicados (misma clase, o misma clase y fecha) los rechaza la base de datos
+        # al guardar; reservar_cupo los devuelve como ValidationError
 
         # Validar cupo disponible (para temporal/recupero se usa la fecha real de la clase)
         if tipo_reserva in ('temporal', 'recupero'):
-            _ahora = timezone.localtime(timezone.now())
-            _hoy = _ahora.date()
-            _dias_map = {'Lunes': 0, 'Martes': 1, 'Miércoles': 2, 'Jueves': 3, 'Viernes': 4, 'Sábado': 5}
-            _dia_num = _dias_map.get(clase.dia, 0)
-            _dias_hasta = (_dia_num - _hoy.weekday()) % 7
-            if _dias_hasta == 0:
-                _clase_hoy = _ahora.replace(hour=clase.horario.hour, minute=clase.horario.minute, second=0, microsecond=0)
-                if _clase_hoy <= _ahora:
-                    _dias_hasta = 7
-            _fecha_validacion = _hoy + timedelta(days=_dias_hasta)
+            _fecha_validacion = proxima_ocurrencia(clase.dia, clase.horario, ahora_local(request))
             _cupos_check = clase.cupos_disponibles(fecha=_fecha_validacion)
         # Nota: el admin no tiene restricción de 3 horas — puede crear reservas retroactivas
         else:
@@ -2474,31 +2759,19 @@ def admin_reservar_para_usuario(request, clase_id=None, usuario_id=None):
                 fecha_unica = None
                 es_recupero = False
                 if tipo_reserva in ('temporal', 'recupero'):
-                    ahora = timezone.localtime(timezone.now())
-                    hoy = ahora.date()
-                    dias_map = {
-                        'Lunes': 0, 'Martes': 1, 'Miércoles': 2,
-                        'Jueves': 3, 'Viernes': 4, 'Sábado': 5
-                    }
-                    dia_num = dias_map.get(clase.dia, 0)
-                    dias_hasta = (dia_num - hoy.weekday()) % 7
-                    if dias_hasta == 0:
-                        clase_hoy = ahora.replace(
-                            hour=clase.horario.hour,
-                            minute=clase.horario.minute,
-                            second=0, microsecond=0
-                        )
-                        if clase_hoy <= ahora:
-                            dias_hasta = 7
-                    fecha_unica = hoy + timedelta(days=dias_hasta)
+                    # Misma fecha con la que se validó el cupo
+                    fecha_unica = _fecha_validacion
                     es_recupero = (tipo_reserva == 'recupero')
 
-                reserva = Reserva.objects.create(
-                    usuario=usuario,
-                    clase=clase,
+                reserva = reservar_cupo(
+                    usuario,
+                    clase,
                     fecha_unica=fecha_unica,
                     es_recupero=es_recupero,
                 )
+                # El administrador puede dar recuperos sin crédito; si el alumno tiene uno, se usa
+                if es_recupero:
+                    consumir_credito(reserva)
 
                 # Email opcional
                 email_enviado = False
@@ -2535,6 +2808,8 @@ def admin_reservar_para_usuario(request, clase_id=None, usuario_id=None):
                     return redirect('gravity:admin_usuario_detalle', usuario_id=usuario.id)
                 return redirect('gravity:admin_clases_lista')
 
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
         except IntegrityError:
             messages.error(request, 'Error: ya existe una reserva para ese alumno en esa clase.')
         except Exception as e:
@@ -2549,6 +2824,112 @@ def admin_reservar_para_usuario(request, clase_id=None, usuario_id=None):
         'cupos_proxima_preseleccionada': cupos_proxima_preseleccionada,
     })
 
+
+# Máximo de filas (alumno × clase) por carga masiva
+MAX_FILAS_RESERVA_MASIVA = 2000
+
+@admin_required
+def admin_reservas_masivas(request):
+    """
+    Carga masiva de reservas: muchos alumnos × muchas clases en una sola operación
+    (ej: reinscripción al comienzo de cada ciclo).
+    - GET: pantalla para armar la matriz de alumnos, clases y tipo de reserva
+    - POST (JSON): {'filas': [{'usuario_id', 'clase_id', 'tipo', 'fecha'}], 'notificar': bool}
+      Devuelve las reservas creadas y un informe de errores por fila
+    """
+    if request.method != 'POST':
+        clases_disponibles = precargar_ocupacion(
+            Clase.objects.filter(activa=True).order_by('direccion', 'tipo', 'dia', 'horario')
+        )
+        todos_los_usuarios = User.objects.filter(
+            is_active=True, is_staff=False
+        ).order_by('last_name', 'first_name', 'username')
+        return render(request, 'gravity/admin/admin_reservas_masivas.html', {
+            'clases_disponibles': clases_disponibles,
+            'todos_los_usuarios': todos_los_usuarios,
+            'max_filas': MAX_FILAS_RESERVA_MASIVA,
+            'hoy_iso': timezone.localtime(timezone.now()).date().isoformat(),
+        })
+
+    try:
+        data = json.loads(request.body)
+        filas = data.get('filas') or []
+        notificar = bool(data.get('notificar'))
+
+        if not isinstance(filas, list) or not filas:
+            return JsonResponse({'success': False, 'error': 'No se recibió ninguna fila para reservar.'}, status=400)
+        if len(filas) > MAX_FILAS_RESERVA_MASIVA:
+            return JsonResponse({
+                'success': False,
+                'error': f'Se pueden cargar como máximo {MAX_FILAS_RESERVA_MASIVA} filas por vez.'
+            }, status=400)
+
+        # Convertir fechas y descartar filas mal formadas antes de llamar al servicio
+        normalizadas = []
+        errores_formato = []
+        for indice, fila in enumerate(filas):
+            if not isinstance(fila, dict):
+                errores_formato.append({'fila': indice, 'usuario_id': None, 'clase_id': None,
+                                        'tipo': None, 'error': 'Fila inválida.'})
+                continue
+            fila = dict(fila)
+            if fila.get('tipo') not in (None, '') + TIPOS_RESERVA_LOTE:
+                errores_formato.append({'fila': indice, 'usuario_id': fila.get('usuario_id'),
+                                        'clase_id': fila.get('clase_id'), 'tipo': fila.get('tipo'),
+                                        'error': 'Tipo de reserva inválido.'})
+                continue
+            if fila.get('fecha'):
+                try:
+                    fila['fecha'] = datetime.strptime(fila['fecha'], '%Y-%m-%d').date()
+                except (TypeError, ValueError):
+                    errores_formato.append({'fila': indice, 'usuario_id': fila.get('usuario_id'),
+                                            'clase_id': fila.get('clase_id'), 'tipo': fila.get('tipo'),
+                                            'error': 'Fecha inválida (formato AAAA-MM-DD).'})
+                    continue
+            else:
+                fila['fecha'] = None
+            normalizadas.append((indice, fila))
+
+        resultado = reservar_cupos_en_lote([fila for _, fila in normalizadas], notificar=notificar)
+
+        # Llevar los índices del servicio a la numeración de filas original
+        rechazadas = errores_formato + [
+            {**rechazo, 'fila': normalizadas[rechazo['fila']][0]}
+            for rechazo in resultado['rechazadas']
+        ]
+        rechazadas.sort(key=lambda r: r['fila'])
+
+        creadas = [
+            {
+                'numero_reserva': reserva.numero_reserva,
+                'usuario_id': reserva.usuario_id,
+                'usuario': reserva.usuario.get_full_name() or reserva.usuario.username,
+                'clase_id': reserva.clase_id,
+                'clase': (
+                    f'{reserva.clase.get_nombre_display()} - {reserva.clase.dia} '
+                    f'{reserva.clase.horario.strftime("%H:%M")} ({reserva.clase.get_direccion_corta()})'
+                ),
+                'fecha': reserva.fecha_unica.strftime('%d/%m/%Y') if reserva.fecha_unica else None,
+                'es_recupero': reserva.es_recupero,
+            }
+            for reserva in resultado['creadas']
+        ]
+
+        return JsonResponse({
+            'success': True,
+            'total_filas': len(filas),
+            'creadas': creadas,
+            'rechazadas': rechazadas,
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Datos JSON inválidos'}, status=400)
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'error': ' '.join(e.messages)}, status=409)
+    except Exception as e:
+        logger.error(f"Error en reserva masiva: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
 # ==============================================================================
 # GESTIÓN DE USUARIOS
 # ==============================================================================
@@ -2629,6 +3010,7 @@ def admin_usuario_detalle(request, usuario_id):
     reservas_activas = usuario.reservas_pilates.filter(activa=True).select_related(
         'clase'
     ).order_by('clase__direccion', 'clase__dia', 'clase__horario')
+    precargar_ocurrencias(reservas_activas, request=request)
     
     reservas_canceladas = usuario.reservas_pilates.filter(activa=False).select_related(
         'clase'
@@ -2890,10 +3272,7 @@ def admin_agregar_usuario(request):
 
                 # Si se seleccionó clase, crear la reserva
                 if clase:
-                    reserva = Reserva.objects.create(
-                        usuario=user,
-                        clase=clase
-                    )
+                    reserva = reservar_cupo(user, clase)
 
                     # Enviar email de confirmación de reserva si se marcó la opción
                     if request.POST.get('enviar_confirmacion') and email:
@@ -2920,6 +3299,8 @@ def admin_agregar_usuario(request):
 
                 return redirect('gravity:admin_usuarios_lista')
 
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
         except IntegrityError as e:
             messages.error(request, f'Error de integridad en la base de datos: {str(e)}')
         except Exception as e:
@@ -3062,88 +3443,93 @@ def admin_pagos_vista_principal(request):
     buscar_nombre = request.GET.get('buscar', '')
     
     # ===== OBTENER TODOS LOS CLIENTES CON ESTADO DE PAGO =====
-    # Crear estados para usuarios que no los tengan
-    usuarios_sin_estado = User.objects.filter(
+    # Crear estados para usuarios que no los tengan (un solo INSERT, normalmente vacío)
+    usuarios_sin_estado = list(User.objects.filter(
         is_staff=False,
         estado_pago__isnull=True
-    )
-    for usuario in usuarios_sin_estado:
-        EstadoPagoCliente.objects.get_or_create(
-            usuario=usuario,
-            defaults={'activo': True}
+    ).values_list('id', flat=True))
+    if usuarios_sin_estado:
+        EstadoPagoCliente.objects.bulk_create(
+            [EstadoPagoCliente(usuario_id=usuario_id, activo=True) for usuario_id in usuarios_sin_estado],
+            ignore_conflicts=True
         )
     
-    # Obtener todos los estados de pago
-    clientes_pagos = EstadoPagoCliente.objects.select_related(
-        'usuario', 'plan_actual'
-    ).prefetch_related('usuario__pagos_realizados')
-    
-    # ===== ACTUALIZAR SALDOS Y OBTENER ÚLTIMO PAGO =====
-    clientes_procesados = []
+    # Último pago confirmado de cada cliente, como subconsulta (sin una consulta por fila)
+    ultimo_pago = RegistroPago.objects.filter(
+        cliente_id=OuterRef('usuario_id'),
+        estado='confirmado'
+    ).order_by('-fecha_pago', '-id')
     
-    for cliente_estado in clientes_pagos:
-        # Obtener último pago para mostrar en la tabla
-        ultimo_pago = RegistroPago.objects.filter(
-            cliente=cliente_estado.usuario,
-            estado='confirmado'
-        ).order_by('-fecha_pago').first()
-        
-        cliente_estado.ultimo_pago_obj = ultimo_pago
-        cliente_estado.planes_activos_lista = list(
-            PlanUsuario.objects.filter(
-                usuario=cliente_estado.usuario,
-                activo=True
-            ).select_related('plan').order_by('fecha_inicio')
-        )
-        cliente_estado.costo_mensual_total = sum(
-            pu.plan.precio_mensual for pu in cliente_estado.planes_activos_lista
+    clientes_pagos = EstadoPagoCliente.objects.select_related(
+        'usuario', 'usuario__profile', 'plan_actual'
+    ).annotate(
+        ultimo_pago_fecha=Subquery(ultimo_pago.values('fecha_pago')[:1]),
+        ultimo_pago_monto=Subquery(ultimo_pago.values('monto')[:1]),
+    ).prefetch_related(
+        Prefetch(
+            'usuario__planes_activos',
+            queryset=PlanUsuario.objects.filter(activo=True).select_related('plan').order_by('fecha_inicio'),
+            to_attr='planes_activos_lista'
         )
-        clientes_procesados.append(cliente_estado)
+    )
     
     # ===== APLICAR FILTROS =====
     if filtro_estado == 'al_dia':
-        clientes_procesados = [c for c in clientes_procesados if c.saldo_actual >= 0 and c.plan_actual]
+        clientes_pagos = clientes_pagos.filter(saldo_actual__gte=0, plan_actual__isnull=False)
     elif filtro_estado == 'debe':
-        clientes_procesados = [c for c in clientes_procesados if c.saldo_actual < 0]
+        clientes_pagos = clientes_pagos.filter(saldo_actual__lt=0)
     elif filtro_estado == 'sin_plan':
-        clientes_procesados = [c for c in clientes_procesados if not c.plan_actual]
+        clientes_pagos = clientes_pagos.filter(plan_actual__isnull=True)
     
     # Filtro por búsqueda de nombre
     if buscar_nombre:
-        clientes_procesados = [c for c in clientes_procesados if (
-            buscar_nombre.lower() in (c.usuario.first_name or '').lower() or
-            buscar_nombre.lower() in (c.usuario.last_name or '').lower() or
-            buscar_nombre.lower() in c.usuario.username.lower()
-        )]
+        clientes_pagos = clientes_pagos.filter(
+            Q(usuario__first_name__icontains=buscar_nombre) |
+            Q(usuario__last_name__icontains=buscar_nombre) |
+            Q(usuario__username__icontains=buscar_nombre)
+        )
     
     # Ordenar por estado (deudores primero, luego por apellido)
-    clientes_procesados.sort(key=lambda x: (x.saldo_actual, x.usuario.last_name or x.usuario.username))
+    clientes_pagos = clientes_pagos.order_by(
+        'saldo_actual',
+        Coalesce(NullIf('usuario__last_name', Value('')), 'usuario__username'),
+        '-fecha_actualizacion',
+        'id'
+    )
     
     # ===== RESUMEN GENERAL =====
     mes_actual = timezone.localtime(timezone.now()).date().replace(day=1)
     
-    total_clientes = len(clientes_procesados)
-    clientes_al_dia = len([c for c in clientes_procesados if c.saldo_actual >= 0 and c.plan_actual])
-    clientes_con_deuda = len([c for c in clientes_procesados if c.saldo_actual < 0])
-    clientes_sin_plan = len([c for c in clientes_procesados if not c.plan_actual])
+    # Un solo aggregate sobre los clientes filtrados
+    resumen = clientes_pagos.order_by().aggregate(
+        total_clientes=Count('id'),
+        clientes_al_dia=Count('id', filter=Q(saldo_actual__gte=0, plan_actual__isnull=False)),
+        clientes_con_deuda=Count('id', filter=Q(saldo_actual__lt=0)),
+        clientes_sin_plan=Count('id', filter=Q(plan_actual__isnull=True)),
+        saldo_deudores=Sum('saldo_actual', filter=Q(saldo_actual__lt=0)),
+    )
+    total_deuda = abs(resumen['saldo_deudores'] or Decimal('0'))
     
     ingresos_mes = RegistroPago.objects.filter(
         fecha_pago__gte=mes_actual,
         estado='confirmado'
     ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
     
-    total_deuda = sum([abs(c.saldo_actual) for c in clientes_procesados if c.saldo_actual < 0])
-    
     # ===== PLANES DE PAGO =====
     planes_activos = PlanPago.objects.filter(activo=True).order_by('clases_por_semana')
     
-    # ===== CREAR PAGINADOR MANUAL =====
-    from django.core.paginator import Paginator
-    
-    # Crear paginador con la lista procesada
-    paginator = Paginator(clientes_procesados, 20)
+    # ===== PAGINADOR =====
+    # El paginador corta el queryset en la base: solo se leen (y prefetchean) los clientes de la página
+    paginator = Paginator(clientes_pagos, 20)
+    paginator.count = resumen['total_clientes']  # Ya contado en el aggregate
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    
+    for cliente_estado in page_obj.object_list:
+        cliente_estado.planes_activos_lista = cliente_estado.usuario.planes_activos_lista
+        cliente_estado.costo_mensual_total = sum(
+            pu.plan.precio_mensual for pu in cliente_estado.planes_activos_lista
+        )
     puede_ver = get_puede_ver_pagos(request.user)
 
     context = {
@@ -3152,10 +3538,10 @@ def admin_pagos_vista_principal(request):
         'filtro_estado': filtro_estado,
         'filtro_mes': filtro_mes,
         'buscar_nombre': buscar_nombre,
-        'total_clientes': total_clientes,
-        'clientes_al_dia': clientes_al_dia,
-        'clientes_con_deuda': clientes_con_deuda,
-        'clientes_sin_plan': clientes_sin_plan,
+        'total_clientes': resumen['total_clientes'],
+        'clientes_al_dia': resumen['clientes_al_dia'],
+        'clientes_con_deuda': resumen['clientes_con_deuda'],
+        'clientes_sin_plan': resumen['clientes_sin_plan'],
         'ingresos_mes': ingresos_mes if puede_ver else None,
         'total_deuda': total_deuda if puede_ver else None,
         'mes_actual': mes_actual,
@@ -3258,6 +3644,43 @@ def admin_pagos_historial_cliente(request, cliente_id):
     
     return render(request, 'gravity/admin/pagos_historial.html', context)
 
+@admin_required
+def admin_pagos_reportes(request):
+    """
+    Reporte financiero de los últimos 12 meses: tendencia de lo cargado y lo
+    cobrado, y desglose por plan y tipo de pago. Lee el resumen mensual
+    materializado (ver finanzas_service), no los pagos y deudas.
+    """
+    if not get_puede_ver_pagos(request.user):
+        messages.error(request, 'No tenés permisos para ver información de pagos.')
+        return redirect('gravity:admin_pagos_vista_principal')
+
+    tendencia = tendencia_mensual(MESES_TENDENCIA)
+    desde, hasta = tendencia[0]['mes'], tendencia[-1]['mes']
+
+    # Alto de las barras del gráfico, relativo al mayor importe del período
+    maximo = max(max(mes['cargado'], mes['cobrado']) for mes in tendencia)
+    for mes in tendencia:
+        mes['alto_cargado'] = round(mes['cargado'] / maximo * 100) if maximo else 0
+        mes['alto_cobrado'] = round(mes['cobrado'] / maximo * 100) if maximo else 0
+
+    totales = {
+        clave: sum((mes[clave] for mes in tendencia), Decimal('0'))
+        for clave in ('cargado', 'cobrado', 'pendiente', 'descuento')
+    }
+
+    context = {
+        'tendencia': tendencia,
+        'totales': totales,
+        'por_plan': desglose_por_plan(desde, hasta),
+        'por_tipo_pago': desglose_por_tipo_pago(desde, hasta),
+        'desde': desde,
+        'hasta': hasta,
+        'ultima_actualizacion': ultima_actualizacion(),
+    }
+
+    return render(request, 'gravity/admin/pagos_reportes.html', context)
+
 @admin_required
 def admin_pagos_configurar_planes(request):
     """
@@ -3394,15 +3817,6 @@ def admin_pagos_editar_estado_cliente(request, cliente_id):
                 # Desactivar PlanUsuario activos
                 PlanUsuario.objects.filter(usuario=cliente, activo=True).update(activo=False)
 
-            # Recalcular saldo siempre, sin importar si cambió el plan
-            total_pagado = RegistroPago.objects.filter(
-                cliente=cliente, estado='confirmado'
-            ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-            total_deudas = DeudaMensual.objects.filter(
-                usuario=cliente
-            ).aggregate(total=Sum('monto_original'))['total'] or Decimal('0')
-            estado_actualizado.saldo_actual = total_pagado - total_deudas
-            estado_actualizado.save(update_fields=['saldo_actual'])
 
             messages.success(
                 request,
@@ -3417,13 +3831,8 @@ def admin_pagos_editar_estado_cliente(request, cliente_id):
         for p in PlanPago.objects.filter(activo=True)
     }
 
-    total_pagado = RegistroPago.objects.filter(
-        cliente=cliente, estado='confirmado'
-    ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-    total_deudas = DeudaMensual.objects.filter(
-        usuario=cliente
-    ).aggregate(total=Sum('monto_original'))['total'] or Decimal('0')
-    saldo_calculado = total_pagado - total_deudas
+    # Saldo corrido del libro de movimientos (pagos confirmados - deudas generadas)
+    saldo_calculado = saldo_cuenta(cliente)
 
     context = {
         'form': form,
@@ -3455,8 +3864,13 @@ def admin_cancelar_plan_usuario(request, plan_id):
 
     # Cancelar todas las reservas activas del usuario
     reservas_canceladas = usuario.reservas_pilates.filter(activa=True)
-    cantidad_canceladas = reservas_canceladas.count()
+    ids_canceladas = list(reservas_canceladas.values_list('id', flat=True))
+    cantidad_canceladas = len(ids_canceladas)
+    clases_afectadas = list(reservas_canceladas.order_by().values_list('clase_id', flat=True).distinct())
     reservas_canceladas.update(activa=False)
+    # update() no dispara señales: recalcular la ocupación y los créditos de recupero
+    reconstruir_ocupacion(clases_afectadas)
+    liberar_creditos_de_reservas(ids_canceladas)
 
     # Desactivar el plan
     plan.activo = False
@@ -3495,16 +3909,6 @@ def admin_cancelar_plan_usuario(request, plan_id):
                         deuda_mes.save()
                 # día >= 10: no tocar la deuda
 
-            # Recalcular saldo desde cero
-            total_pagado = RegistroPago.objects.filter(
-                cliente=usuario, estado='confirmado'
-            ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-            total_deudas = DeudaMensual.objects.filter(
-                usuario=usuario
-            ).aggregate(total=Sum('monto_original'))['total'] or Decimal('0')
-            estado.saldo_actual = total_pagado - total_deudas
-            estado.save(update_fields=['saldo_actual'])
-
     except EstadoPagoCliente.DoesNotExist:
         pass
 
@@ -3590,18 +3994,6 @@ def admin_generar_deuda_manual(request, cliente_id):
                 ).strip()
             )
 
-            total_pagado = RegistroPago.objects.filter(
-                cliente=cliente, estado='confirmado'
-            ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-            total_deudas = DeudaMensual.objects.filter(
-                usuario=cliente
-            ).aggregate(total=Sum('monto_original'))['total'] or Decimal('0')
-            nuevo_saldo = total_pagado - total_deudas
-
-            if estado_pago:
-                estado_pago.saldo_actual = nuevo_saldo
-                estado_pago.save(update_fields=['saldo_actual'])
-
         mes_display = primer_dia_mes.strftime('%B %Y')
         messages.success(
             request,
@@ -3762,16 +4154,9 @@ def admin_ajustar_deuda_especial(request, deuda_id):
 
             deuda.save(update_fields=['monto_original', 'monto_pendiente', 'estado'])
 
-            total_pagado = RegistroPago.objects.filter(
-                cliente=cliente, estado='confirmado'
-            ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-            total_deudas = DeudaMensual.objects.filter(
-                usuario=cliente
-            ).aggregate(total=Sum('monto_original'))['total'] or Decimal('0')
-            nuevo_saldo = total_pagado - total_deudas
-
+            # El libro de movimientos ya registró el ajuste: leer el saldo corrido
             estado_pago, _ = EstadoPagoCliente.objects.get_or_create(usuario=cliente)
-            estado_pago.saldo_actual = nuevo_saldo
+            nuevo_saldo = estado_pago.saldo_actual
 
             tiene_deudas_vencidas = DeudaMensual.objects.filter(
                 usuario=cliente, estado='vencido', monto_pendiente__gt=0
@@ -3781,7 +4166,7 @@ def admin_ajustar_deuda_especial(request, deuda_id):
             elif nuevo_saldo >= Decimal('0'):
                 estado_pago.puede_reservar = True
 
-            estado_pago.save(update_fields=['saldo_actual', 'puede_reservar'])
+            estado_pago.save(update_fields=['puede_reservar'])
 
         nombre_cliente = cliente.get_full_name() or cliente.username
         mes_str = deuda.mes_año.strftime('%B %Y')
@@ -4018,8 +4403,9 @@ def mis_planes(request):
     ).select_related('plan').order_by('-fecha_creacion')[:5]
     
     # Calcular estadísticas de la semana actual
-    clases_disponibles, _ = PlanUsuario.obtener_clases_disponibles_usuario(request.user)
-    reservas_actuales = Reserva.contar_reservas_usuario_semana(request.user)
+    cuota = cuota_usuario(request.user)
+    clases_disponibles = cuota.clases_plan
+    reservas_actuales = cuota.reservas_semana
     
     # Obtener reservas activas
     reservas_activas = request.user.reservas_pilates.filter(activa=True).select_related('clase')
@@ -4128,14 +4514,7 @@ def cancelar_plan(request, plan_id):
                         try:
                             estado = request.user.estado_pago
                             estado.monto_deuda_mensual = Decimal('0')
-                            total_pagado = RegistroPago.objects.filter(
-                                cliente=request.user, estado='confirmado'
-                            ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-                            total_deudas = DeudaMensual.objects.filter(
-                                usuario=request.user
-                            ).aggregate(total=Sum('monto_original'))['total'] or Decimal('0')
-                            estado.saldo_actual = total_pagado - total_deudas
-                            estado.save(update_fields=['monto_deuda_mensual', 'saldo_actual'])
+                            estado.save(update_fields=['monto_deuda_mensual'])
                         except EstadoPagoCliente.DoesNotExist:
                             pass
                 elif dia_actual <= 9:
@@ -4150,15 +4529,8 @@ def cancelar_plan(request, plan_id):
                         deuda_actual.save()
                         try:
                             estado = request.user.estado_pago
-                            total_pagado = RegistroPago.objects.filter(
-                                cliente=request.user, estado='confirmado'
-                            ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-                            total_deudas = DeudaMensual.objects.filter(
-                                usuario=request.user
-                            ).aggregate(total=Sum('monto_original'))['total'] or Decimal('0')
                             estado.monto_deuda_mensual = monto_medio
-                            estado.saldo_actual = total_pagado - total_deudas
-                            estado.save(update_fields=['monto_deuda_mensual', 'saldo_actual'])
+                            estado.save(update_fields=['monto_deuda_mensual'])
                         except EstadoPagoCliente.DoesNotExist:
                             pass
             except DeudaMensual.DoesNotExist:
@@ -4168,8 +4540,12 @@ def cancelar_plan(request, plan_id):
             # La política según el día del mes solo afecta cuánto se le cobra (arriba),
             # no cuándo se cancelan las reservas: al confirmar la baja se cancelan todas ya mismo.
             reservas_activas = request.user.reservas_pilates.filter(activa=True)
-            canceladas = reservas_activas.count()
+            ids_canceladas = list(reservas_activas.values_list('id', flat=True))
+            canceladas = len(ids_canceladas)
+            clases_afectadas = list(reservas_activas.order_by().values_list('clase_id', flat=True).distinct())
             reservas_activas.update(activa=False)
+            reconstruir_ocupacion(clases_afectadas)
+            liberar_creditos_de_reservas(ids_canceladas)
             plan.reservas_canceladas = True
 
             # Cancelar el plan
@@ -4221,8 +4597,9 @@ def cancelar_plan(request, plan_id):
         return redirect('gravity:mis_planes')
 
     # --- GET: preparar contexto ---
-    clases_disponibles_sin_plan, _ = PlanUsuario.obtener_clases_disponibles_usuario(request.user)
-    reservas_actuales = Reserva.contar_reservas_usuario_semana(request.user)
+    cuota = cuota_usuario(request.user)
+    clases_disponibles_sin_plan = cuota.clases_plan
+    reservas_actuales = cuota.reservas_semana
     total_reservas_activas = request.user.reservas_pilates.filter(activa=True).count()
 
     hoy = timezone.localtime(timezone.now()).date()
@@ -4408,7 +4785,11 @@ def admin_solicitud_plan_aprobar(request, solicitud_id):
             estado_cliente.generar_deuda_mes_actual()
 
         if solicitud.reservas_a_cancelar.exists():
+            clases_afectadas = list(solicitud.reservas_a_cancelar.order_by().values_list('clase_id', flat=True).distinct())
+            ids_canceladas = list(solicitud.reservas_a_cancelar.values_list('id', flat=True))
             solicitud.reservas_a_cancelar.update(activa=False)
+            reconstruir_ocupacion(clases_afectadas)
+            liberar_creditos_de_reservas(ids_canceladas)
 
         solicitud.estado = 'aprobada'
         solicitud.fecha_resolucion = timezone.localtime(timezone.now())